@@ -84,6 +84,8 @@ func NewMessageStore() (*MessageStore, error) {
 			PRIMARY KEY (id, chat_jid),
 			FOREIGN KEY (chat_jid) REFERENCES chats(jid)
 		);
+
+		CREATE INDEX IF NOT EXISTS messages_chat_timestamp ON messages (chat_jid, timestamp);
 	`)
 	if err != nil {
 		db.Close()
@@ -737,7 +739,7 @@ func startRESTServer(client *whatsmeow.Client, messageStore *MessageStore, port
 
 		// Send response
 		json.NewEncoder(w).Encode(map[string]string{
-			"status": "healthy",
+			"status":  "healthy",
 			"service": "whatsapp-bridge",
 		})
 	})
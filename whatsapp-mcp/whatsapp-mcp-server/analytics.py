@@ -0,0 +1,194 @@
+"""
+Activity analytics for a chat, computed with NumPy.
+
+A chat's timestamps, senders and is_from_me flags are loaded in one query,
+walking the (chat_jid, timestamp) index, into flat arrays: seconds since
+the epoch as float64, one int32 code per sender and a boolean per message.
+Every metric is then a handful of vectorized operations over those arrays
+rather than a Python loop over Message objects:
+
+    heatmap        messages per weekday (Monday first) and hour of day
+    active hours   the hours of day with the most messages
+    top senders    messages per sender number, most active first
+    response times how long each side takes to answer the other
+
+A response is the first message of a turn, a run of consecutive messages
+from the same side (mine or theirs). Its response time is measured from
+the first message of the previous turn, the oldest message left
+unanswered. In a group, "theirs" is everybody but me.
+
+Needs numpy (pip install "whatsapp-mcp-server[analytics]").
+"""
+import sqlite3
+from typing import Any, Dict, Optional, Tuple
+
+np = None  # imported on first use, keeping numpy out of the server's startup
+
+import contacts
+import whatsapp
+
+WEEKDAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+MAX_TOP_SENDERS = 500
+ACTIVE_HOURS = 5
+# 1970-01-01 was a Thursday
+EPOCH_WEEKDAY = 3
+FETCH_BATCH_SIZE = 10_000
+ACTIVITY_DTYPE = [("seconds", "f8"), ("sender", "i4"), ("from_me", "?")]
+
+
+def _require_numpy():
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            raise RuntimeError('Chat activity analytics need numpy: pip install "whatsapp-mcp-server[analytics]"')
+        np = numpy
+
+
+def load_activity(
+    chat_jid: str,
+    after: Optional[str] = None,
+    before: Optional[str] = None
+) -> Tuple["np.ndarray", "np.ndarray", "np.ndarray", list]:
+    """Load a chat's messages in time order as arrays.
+
+    Returns:
+        The timestamps in seconds since the epoch (float64), a sender code
+        per message (int32), the is_from_me flags (bool) and the sender
+        number of each code
+    """
+    _require_numpy()
+    where_clauses = ["chat_jid = ?", "julianday(timestamp) IS NOT NULL"]
+    params = [chat_jid]
+    if after:
+        where_clauses.append("timestamp > ?")
+        params.append(whatsapp.parse_time_filter("after", after))
+    if before:
+        where_clauses.append("timestamp < ?")
+        params.append(whatsapp.parse_time_filter("before", before))
+
+    # Senders are coded by number, as in get_chat_stats: the bridge stores
+    # one person both as a bare number and as a JID
+    codes: Dict[str, int] = {}
+    raw_codes: Dict[Optional[str], int] = {}
+
+    def coded(cursor):
+        # fetchmany rather than iterating the cursor, which is timed row by row
+        while True:
+            rows = cursor.fetchmany(FETCH_BATCH_SIZE)
+            if not rows:
+                return
+            for seconds, sender, from_me in rows:
+                code = raw_codes.get(sender)
+                if code is None:
+                    number = contacts.normalize_number(sender or "")
+                    code = codes.get(number)
+                    if code is None:
+                        code = codes[number] = len(codes)
+                    raw_codes[sender] = code
+                yield seconds, code, from_me
+
+    conn = whatsapp.connect_db("chat_activity", heavy=True)
+    try:
+        # Rows go straight from the cursor into one record array, without a list of tuples in between
+        records = np.fromiter(coded(conn.execute(f"""
+            SELECT (julianday(timestamp) - 2440587.5) * 86400.0, sender, is_from_me
+            FROM messages
+            WHERE {" AND ".join(where_clauses)}
+            ORDER BY timestamp
+        """, params)), ACTIVITY_DTYPE)
+    finally:
+        conn.close()
+    return records["seconds"], records["sender"], records["from_me"], list(codes)
+
+
+def _summary(seconds: "np.ndarray") -> Dict[str, Any]:
+    if not len(seconds):
+        return {"responses": 0, "median_seconds": None, "p90_seconds": None}
+    median, p90 = np.percentile(seconds, (50, 90))
+    return {"responses": int(len(seconds)), "median_seconds": round(float(median), 1), "p90_seconds": round(float(p90), 1)}
+
+
+def response_times(seconds: "np.ndarray", from_me: "np.ndarray") -> Dict[str, Dict[str, Any]]:
+    """Response time summaries for my answers ("mine") and for theirs ("theirs")."""
+    # The first message of every turn, then the delay from the previous turn's first message
+    turns = np.concatenate(([0], np.flatnonzero(from_me[1:] != from_me[:-1]) + 1))
+    delays = seconds[turns[1:]] - seconds[turns[:-1]]
+    mine = from_me[turns[1:]]
+    return {"mine": _summary(delays[mine]), "theirs": _summary(delays[~mine])}
+
+
+def chat_activity(
+    chat_jid: str,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    utc_offset_hours: float = 0,
+    top_senders: int = 10
+) -> Dict[str, Any]:
+    """Activity heatmap, active hours, top senders and response times of a chat.
+
+    Args:
+        chat_jid: The JID of the chat
+        after: Optional ISO-8601 formatted string to only count messages after this date
+        before: Optional ISO-8601 formatted string to only count messages before this date
+        utc_offset_hours: Offset from UTC of the local time used for hours and weekdays (default 0)
+        top_senders: Number of most active senders to list (default 10)
+    """
+    top_senders = max(0, min(top_senders, MAX_TOP_SENDERS))
+    seconds, sender_codes, from_me, senders = load_activity(chat_jid, after, before)
+
+    local = seconds + utc_offset_hours * 3600
+    days = np.floor_divide(local, 86400)
+    weekday = ((days + EPOCH_WEEKDAY) % 7).astype(np.int64)
+    hour = ((local - days * 86400) // 3600).astype(np.int64)
+    heatmap = np.bincount(weekday * 24 + hour, minlength=7 * 24).reshape(7, 24)
+
+    per_hour = heatmap.sum(axis=0)
+    busiest_hours = np.argsort(-per_hour, kind="stable")[:ACTIVE_HOURS]
+    per_sender = np.bincount(sender_codes, minlength=len(senders))
+    busiest_senders = np.argsort(-per_sender, kind="stable")[:top_senders]
+
+    return {
+        "chat_jid": chat_jid,
+        "messages": int(len(seconds)),
+        "from_me": int(from_me.sum()),
+        "first_message_time": _iso(seconds[0]) if len(seconds) else None,
+        "last_message_time": _iso(seconds[-1]) if len(seconds) else None,
+        "utc_offset_hours": utc_offset_hours,
+        "heatmap": {
+            "weekdays": list(WEEKDAYS),
+            "counts": heatmap.tolist()
+        },
+        "active_hours": [
+            {"hour": int(h), "messages": int(per_hour[h])} for h in busiest_hours if per_hour[h]
+        ],
+        "top_senders": [
+            {
+                "sender": senders[code],
+                "name": whatsapp.get_sender_name(senders[code]) if senders[code] else None,
+                "messages": int(per_sender[code])
+            }
+            for code in busiest_senders
+        ],
+        "response_times": response_times(seconds, from_me)
+    }
+
+
+def _iso(seconds: float) -> str:
+    # julianday() keeps milliseconds
+    return str(np.datetime64(int(round(seconds * 1000)), "ms")) + "Z"
+
+
+def get_chat_activity(
+    chat_jid: str,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    utc_offset_hours: float = 0,
+    top_senders: int = 10
+) -> Dict[str, Any]:
+    """Return a chat's activity analytics, or an error message when they cannot be computed."""
+    try:
+        return chat_activity(chat_jid, after, before, utc_offset_hours, top_senders)
+    except sqlite3.Error as e:
+        return {"chat_jid": chat_jid, "error": f"Database error: {e}"}
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Measure get_chat_activity on one very large chat against a Python loop.
+
+Generates a single group chat (a million messages by default), then times
+analytics.chat_activity and the same heatmap, response times and sender
+counts computed by looping over the Message objects of iter_chat_messages.
+Needs numpy.
+
+Usage:
+    python benchmarks/bench_analytics.py --messages 1000000
+    python benchmarks/bench_analytics.py --db /tmp/messages.db --chat 120363...@g.us
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analytics
+import contacts
+import whatsapp
+from run_benchmarks import percentile
+from synthetic_db import generate
+
+
+def python_activity(chat_jid):
+    heatmap = [[0] * 24 for _ in range(7)]
+    senders = Counter()
+    mine, theirs = [], []
+    turn_start = previous = None
+    for batch in whatsapp.iter_chat_messages(chat_jid):
+        for message in batch:
+            heatmap[message.timestamp.weekday()][message.timestamp.hour] += 1
+            senders[contacts.normalize_number(message.sender or "")] += 1
+            if previous is None or bool(message.is_from_me) != bool(previous.is_from_me):
+                if turn_start is not None:
+                    delay = (message.timestamp - turn_start.timestamp).total_seconds()
+                    (mine if message.is_from_me else theirs).append(delay)
+                turn_start = message
+            previous = message
+    return heatmap, senders.most_common(10), sorted(mine)[len(mine) // 2] if mine else None
+
+
+def timed(fn, iterations):
+    durations = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - started)
+    return sorted(durations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", help="Existing messages.db (generated when omitted)")
+    parser.add_argument("--chat", help="Chat to analyse (default: the busiest chat)")
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--iterations", type=int, default=3)
+    args = parser.parse_args()
+
+    workdir = tempfile.TemporaryDirectory()
+    db_path = args.db
+    if not db_path:
+        db_path = os.path.join(workdir.name, "messages.db")
+        generate(db_path, chats=1, messages=args.messages, group_ratio=1.0)
+        print(f"Generated a group chat with {args.messages} messages")
+    whatsapp.MESSAGES_DB_PATH = db_path
+    chat_jid = args.chat
+    if not chat_jid:
+        conn = sqlite3.connect(db_path)
+        chat_jid = conn.execute(
+            "SELECT chat_jid FROM messages GROUP BY chat_jid ORDER BY COUNT(*) DESC LIMIT 1"
+        ).fetchone()[0]
+        conn.close()
+
+    result = analytics.chat_activity(chat_jid)  # also creates the (chat_jid, timestamp) index
+    print(f"{chat_jid}: {result['messages']} messages, median response {result['response_times']['mine']['median_seconds']}s")
+    print(f"{'implementation':<16} {'p50 ms':>10} {'p95 ms':>10}")
+    for name, fn in (
+        ("numpy", lambda: analytics.chat_activity(chat_jid)),
+        ("python loop", lambda: python_activity(chat_jid)),
+    ):
+        durations = timed(fn, args.iterations)
+        print(f"{name:<16} {percentile(durations, 0.5) * 1000:>10.0f} {percentile(durations, 0.95) * 1000:>10.0f}")
+
+    workdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Measure the columnar export and analytics reads from it against SQLite.
+
+Exports a messages database in full, then times an incremental catch-up
+after new messages arrive, and compares two analytics reads done on
+messages.db and on the memory-mapped Arrow files:
+
+    timestamps   load every message's timestamp and chat into arrays
+    per chat     count messages per chat and month
+
+Needs pyarrow.
+
+Usage:
+    python benchmarks/bench_columnar.py --messages 200000
+    python benchmarks/bench_columnar.py --db /tmp/messages.db --new 5000
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import columnar
+import whatsapp
+from run_benchmarks import percentile
+from synthetic_db import generate
+
+
+def timed(fn, iterations):
+    durations = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - started)
+    return sorted(durations)
+
+
+def add_messages(db_path, count):
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        with conn:
+            chat_jid = conn.execute("SELECT jid FROM chats LIMIT 1").fetchone()[0]
+            conn.executemany(
+                "INSERT OR REPLACE INTO messages (id, chat_jid, sender, content, timestamp, is_from_me, media_type) "
+                "VALUES (?, ?, '15550000000', 'bench', datetime('now'), 0, '')",
+                [(f"bench-columnar-{n}", chat_jid) for n in range(count)]
+            )
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", help="Existing messages.db (a copy is used; generated when omitted)")
+    parser.add_argument("--chats", type=int, default=300)
+    parser.add_argument("--messages", type=int, default=200_000)
+    parser.add_argument("--new", type=int, default=1000, help="Messages added before the incremental catch-up")
+    parser.add_argument("--iterations", type=int, default=5)
+    args = parser.parse_args()
+
+    workdir = tempfile.TemporaryDirectory()
+    db_path = os.path.join(workdir.name, "messages.db")
+    if args.db:
+        source, target = sqlite3.connect(args.db), sqlite3.connect(db_path)
+        source.backup(target)
+        source.close()
+        target.close()
+    else:
+        generate(db_path, chats=args.chats, messages=args.messages)
+        print(f"Generated {args.messages} messages in {args.chats} chats")
+    whatsapp.MESSAGES_DB_PATH = db_path
+    export = columnar.ColumnarExport(os.path.join(workdir.name, "columnar"), db_path)
+
+    started = time.perf_counter()
+    exported = export.catch_up()
+    full = time.perf_counter() - started
+    add_messages(db_path, args.new)
+    started = time.perf_counter()
+    appended = export.catch_up()
+    incremental = time.perf_counter() - started
+    status = export.status()
+    print(f"Full export:        {exported} messages in {full * 1000:.0f}ms, {status['bytes'] / 1e6:.1f} MB "
+          f"in {len(status['months'])} months")
+    print(f"Catch-up:           {appended} new messages in {incremental * 1000:.1f}ms")
+
+    def sqlite_timestamps():
+        conn = sqlite3.connect(db_path)
+        rows = conn.execute("SELECT timestamp, chat_jid FROM messages").fetchall()
+        conn.close()
+        return rows
+
+    def sqlite_per_chat():
+        conn = sqlite3.connect(db_path)
+        rows = conn.execute(
+            "SELECT chat_jid, substr(timestamp, 1, 7) AS month, COUNT(*) FROM messages GROUP BY chat_jid, month"
+        ).fetchall()
+        conn.close()
+        return rows
+
+    def arrow_timestamps():
+        table = export.read_messages(columns=["timestamp", "chat_jid"], latest_only=False)
+        return table.column("timestamp").combine_chunks().to_numpy(), table.column("chat_jid")
+
+    def arrow_per_chat():
+        table = export.read_messages(columns=["timestamp", "chat_jid"], latest_only=False)
+        months = columnar.pc.floor_temporal(table["timestamp"], unit="month")
+        return table.append_column("month", months).group_by(["chat_jid", "month"]).aggregate([("month", "count")])
+
+    print(f"{'read':<22} {'sqlite p50 ms':>14} {'arrow p50 ms':>13} {'speedup':>8}")
+    for name, on_sqlite, on_arrow in (
+        ("timestamps", sqlite_timestamps, arrow_timestamps),
+        ("per chat and month", sqlite_per_chat, arrow_per_chat),
+    ):
+        sqlite_ms = percentile(timed(on_sqlite, args.iterations), 0.5) * 1000
+        arrow_ms = percentile(timed(on_arrow, args.iterations), 0.5) * 1000
+        print(f"{name:<22} {sqlite_ms:>14.1f} {arrow_ms:>13.1f} {sqlite_ms / arrow_ms:>7.1f}x")
+
+    workdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Measure memory per message for the record types in whatsapp.py.
+
+Rows are read from an in-memory SQLite table shaped like the bridge's
+messages table, turned into records and the row tuples dropped, so the
+figures include everything a record keeps alive (including the raw
+timestamp string). The original dataclass with a parsed datetime is
+measured alongside for comparison.
+
+Usage: python benchmarks/bench_memory.py [--messages 200000]
+"""
+import argparse
+import gc
+import os
+import sqlite3
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_serialization import LegacyMessage, make_rows
+from whatsapp import Message
+
+
+def load_rows(count):
+    conn = sqlite3.connect(":memory:")
+    conn.execute("""
+        CREATE TABLE messages (
+            timestamp TIMESTAMP, sender TEXT, content TEXT, is_from_me BOOLEAN,
+            chat_jid TEXT, id TEXT, chat_name TEXT, media_type TEXT
+        )
+    """)
+    conn.executemany("INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?, ?, ?)", make_rows(count))
+    return conn
+
+
+def legacy(row):
+    return LegacyMessage(datetime.fromisoformat(row[0]), *row[1:])
+
+
+def slotted(row):
+    return Message(*row)
+
+
+def slotted_parsed(row):
+    message = Message(*row)
+    message.timestamp
+    return message
+
+
+def slotted_frozen(row):
+    return Message.Frozen(*row)
+
+
+def measure(name, build, conn, count):
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    records = [build(row) for row in conn.execute("SELECT * FROM messages")]
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<28} {retained / count:>8.1f} bytes/msg {count / elapsed:>12,.0f} msg/s")
+    del records
+    return retained / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=200000)
+    args = parser.parse_args()
+
+    conn = load_rows(args.messages)
+    print(f"Building {args.messages} messages from SQLite rows")
+    baseline = measure("dataclass + datetime", legacy, conn, args.messages)
+    for name, build in (
+        ("slotted, lazy timestamp", slotted),
+        ("slotted, timestamp parsed", slotted_parsed),
+        ("slotted frozen", slotted_frozen),
+    ):
+        per_message = measure(name, build, conn, args.messages)
+        print(f"{'':<28} {1 - per_message / baseline:>8.0%} smaller")
+
+
+if __name__ == "__main__":
+    main()
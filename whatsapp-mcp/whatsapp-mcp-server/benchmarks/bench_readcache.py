@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Measure request coalescing and the read cache under bursts of identical calls.
+
+Each burst starts --concurrency threads at once, all calling the same read
+function with the same arguments, the way n8n executions triggered by one
+webhook do. Bursts run with the read cache off and then on. With
+--write-every N, a message is committed to the database before every Nth
+burst, which invalidates the cache, so some bursts have to run the queries.
+
+Usage:
+    python benchmarks/bench_readcache.py --messages 200000 --concurrency 16
+    python benchmarks/bench_readcache.py --db /tmp/messages.db --case list_messages --write-every 5
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import readcache
+import whatsapp
+from run_benchmarks import percentile
+from synthetic_db import generate
+
+CASES = {
+    "list_chats": lambda: whatsapp.list_chats(limit=20),
+    "list_messages": lambda: whatsapp.list_messages(limit=20),
+    "search_contacts": lambda: whatsapp.search_contacts("Contact 1"),
+}
+
+
+def write_message(db_path, n):
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        with conn:
+            chat_jid = conn.execute("SELECT jid FROM chats LIMIT 1").fetchone()[0]
+            conn.execute(
+                "INSERT OR REPLACE INTO messages (id, chat_jid, sender, content, timestamp, is_from_me, media_type) "
+                "VALUES (?, ?, '15550000000', 'bench', datetime('now'), 0, '')",
+                (f"bench-readcache-{n}", chat_jid)
+            )
+    finally:
+        conn.close()
+
+
+def run(fn, db_path, bursts, concurrency, write_every):
+    """Return the burst latencies (first call start to last call end) in seconds."""
+    barrier = threading.Barrier(concurrency)
+
+    def call():
+        barrier.wait()
+        fn()
+
+    latencies = []
+    with ThreadPoolExecutor(concurrency) as pool:
+        for burst in range(bursts):
+            if write_every and burst % write_every == 0:
+                write_message(db_path, burst)
+            started = time.perf_counter()
+            for future in [pool.submit(call) for _ in range(concurrency)]:
+                future.result()
+            latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", help="Existing messages.db (a copy is written to with --write-every; generated when omitted)")
+    parser.add_argument("--chats", type=int, default=300)
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--case", choices=sorted(CASES), default="list_chats")
+    parser.add_argument("--bursts", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--write-every", type=int, default=0, help="Commit a message before every Nth burst")
+    args = parser.parse_args()
+
+    workdir = tempfile.TemporaryDirectory()
+    db_path = args.db
+    if not db_path:
+        db_path = os.path.join(workdir.name, "messages.db")
+        generate(db_path, chats=args.chats, messages=args.messages)
+        print(f"Generated {args.messages} messages in {args.chats} chats")
+    elif args.write_every:
+        copy_path = os.path.join(workdir.name, "messages.db")
+        source, target = sqlite3.connect(db_path), sqlite3.connect(copy_path)
+        source.backup(target)
+        source.close()
+        target.close()
+        db_path = copy_path
+    whatsapp.MESSAGES_DB_PATH = db_path
+    fn = CASES[args.case]
+    fn()  # warm up the contact index and the page cache
+
+    print(f"{args.bursts} bursts of {args.concurrency} identical {args.case} calls"
+          + (f", a write before every {args.write_every}" if args.write_every else ""))
+    print(f"{'cache':<6} {'p50 ms':>9} {'p95 ms':>9} {'calls/s':>10} {'queries run':>12} {'hit rate':>9}")
+    for label, ttl in (("off", 0), ("on", readcache.DEFAULT_TTL)):
+        readcache.configure(ttl=ttl)
+        readcache.CACHE.reset()
+        latencies = sorted(run(fn, db_path, args.bursts, args.concurrency, args.write_every))
+        status = readcache.CACHE.status()["functions"].get(args.case)
+        executed = status["miss"] + status["bypass"] if status else args.bursts * args.concurrency
+        hit_rate = f"{status['hit_rate']:.1%}" if status else "-"
+        print(f"{label:<6} {percentile(latencies, 0.5) * 1000:>9.2f} {percentile(latencies, 0.95) * 1000:>9.2f} "
+              f"{args.bursts * args.concurrency / sum(latencies):>10.1f} {executed:>12} {hit_rate:>9}")
+
+    workdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Measure scan_messages throughput with different numbers of worker processes.
+
+Each run scans the whole messages table for a pattern that matches nothing
+(so no early stop) and reports rows read per second. The first pooled run
+also pays for starting the workers, so every worker count is warmed up
+once before it is timed. Speedups need as many free CPUs as workers.
+
+Usage:
+    python benchmarks/bench_scan.py --messages 200000 --workers 1 2 4
+    python benchmarks/bench_scan.py --db /tmp/messages.db --pattern "invoice\\s+#?\\d+"
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scan
+import whatsapp
+from run_benchmarks import percentile
+from synthetic_db import generate
+
+
+def run(spec, workers, iterations):
+    durations = []
+    scanned = 0
+    for _ in range(iterations):
+        stats = {}
+        started = time.perf_counter()
+        for _ in scan.iter_scan(spec, limit=scan.MAX_LIMIT, workers=workers, stats=stats):
+            pass
+        durations.append(time.perf_counter() - started)
+        scanned = stats.get("scanned", 0)
+    return sorted(durations), scanned
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", help="Existing messages.db (generated when omitted)")
+    parser.add_argument("--chats", type=int, default=300)
+    parser.add_argument("--messages", type=int, default=200_000)
+    parser.add_argument("--pattern", default=r"\bno such word\b")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--iterations", type=int, default=5)
+    args = parser.parse_args()
+
+    workdir = tempfile.TemporaryDirectory()
+    db_path = args.db
+    if not db_path:
+        db_path = os.path.join(workdir.name, "messages.db")
+        generate(db_path, chats=args.chats, messages=args.messages)
+        print(f"Generated {args.messages} messages in {args.chats} chats")
+    whatsapp.MESSAGES_DB_PATH = db_path
+    spec = (args.pattern, (), (), (), True, True)
+
+    print(f"Full scans for /{args.pattern}/ on {os.cpu_count()} CPUs")
+    print(f"{'workers':<8} {'p50 ms':>9} {'p95 ms':>9} {'rows/s':>12}")
+    for workers in args.workers:
+        scan.shutdown()  # size the pool for this run
+        run(spec, workers, 1)
+        durations, scanned = run(spec, workers, args.iterations)
+        print(f"{workers:<8} {percentile(durations, 0.5) * 1000:>9.1f} {percentile(durations, 0.95) * 1000:>9.1f} "
+              f"{scanned / percentile(durations, 0.5):>12.0f}")
+    scan.shutdown()
+
+    workdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
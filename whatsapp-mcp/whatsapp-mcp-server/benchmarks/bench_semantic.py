@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Measure the semantic index and semantic_search_messages.
+
+Builds the TF-IDF index of a messages database from scratch, times the
+incremental catch-up after new messages arrive, then times ranked queries
+of one to three words across all chats and within one chat, next to a
+list_messages LIKE search for the same words. Needs numpy.
+
+Usage:
+    python benchmarks/bench_semantic.py --messages 1000000
+    python benchmarks/bench_semantic.py --db /tmp/messages.db --new 5000
+"""
+import argparse
+import itertools
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import readcache
+import semantic
+import whatsapp
+from run_benchmarks import percentile
+from synthetic_db import generate
+
+WORDS = ["invoice", "meeting", "tomorrow", "delivery", "birthday"]
+
+
+def timed(fn, iterations):
+    durations = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - started)
+    return sorted(durations)
+
+
+def add_messages(db_path, count):
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        with conn:
+            chat_jid = conn.execute("SELECT jid FROM chats LIMIT 1").fetchone()[0]
+            conn.executemany(
+                "INSERT OR REPLACE INTO messages (id, chat_jid, sender, content, timestamp, is_from_me, media_type) "
+                "VALUES (?, ?, '15550000000', ?, datetime('now'), 0, '')",
+                [(f"bench-semantic-{n}", chat_jid, f"parcel {n} is out for delivery") for n in range(count)]
+            )
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", help="Existing messages.db (a copy is used; generated when omitted)")
+    parser.add_argument("--chats", type=int, default=300)
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--new", type=int, default=1000, help="Messages added before the incremental catch-up")
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    workdir = tempfile.TemporaryDirectory()
+    db_path = os.path.join(workdir.name, "messages.db")
+    if args.db:
+        source, target = sqlite3.connect(args.db), sqlite3.connect(db_path)
+        source.backup(target)
+        source.close()
+        target.close()
+    else:
+        generate(db_path, chats=args.chats, messages=args.messages)
+        print(f"Generated {args.messages} messages in {args.chats} chats")
+    whatsapp.MESSAGES_DB_PATH = db_path
+    readcache.configure(ttl=0)
+    index = semantic.SemanticIndex(os.path.join(workdir.name, "semantic"), db_path)
+
+    started = time.perf_counter()
+    built = index.update()
+    full = time.perf_counter() - started
+    add_messages(db_path, args.new)
+    started = time.perf_counter()
+    added = index.update()
+    incremental = time.perf_counter() - started
+    status = index.status()
+    print(f"Build:              {built} messages in {full:.1f}s ({built / full:.0f}/s), "
+          f"{status['documents']} indexed, {status['bytes'] / 1e6:.1f} MB in {len(status['segments'])} segments")
+    print(f"Catch-up:           {added} new messages in {incremental * 1000:.1f}ms")
+
+    conn = sqlite3.connect(db_path)
+    chat_jid = conn.execute(
+        "SELECT chat_jid FROM messages GROUP BY chat_jid ORDER BY COUNT(*) DESC LIMIT 1"
+    ).fetchone()[0]
+    conn.close()
+    one, two, three = (itertools.cycle([" ".join(c) for c in itertools.combinations(WORDS, n)]) for n in (1, 2, 3))
+    like = itertools.cycle(WORDS)
+
+    print(f"{'query':<28} {'p50 ms':>10} {'p95 ms':>10}")
+    for name, fn in (
+        ("semantic 1 word", lambda: index.search(next(one))),
+        ("semantic 2 words", lambda: index.search(next(two))),
+        ("semantic 3 words", lambda: index.search(next(three))),
+        ("semantic 2 words, 1 chat", lambda: index.search(next(two), chat_jid=chat_jid)),
+        ("list_messages LIKE", lambda: whatsapp.list_messages(query=next(like), include_context=False)),
+    ):
+        durations = timed(fn, args.iterations)
+        print(f"{name:<28} {percentile(durations, 0.5) * 1000:>10.1f} {percentile(durations, 0.95) * 1000:>10.1f}")
+
+    workdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Benchmark JSON serialization of tool responses.
+
+Compares the serialization layer against the paths it replaces:
+FastMCP's generic pydantic reflection over the returned dataclasses and
+the HTTP bridge's hand-built dicts passed to json.dumps. The baselines use
+a copy of the original Message dataclass with parsed datetimes.
+
+Usage: python benchmarks/bench_serialization.py [--messages 1000] [--rounds 50]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import serialization
+from whatsapp import Message
+
+
+@dataclass
+class LegacyMessage:
+    timestamp: datetime
+    sender: str
+    content: str
+    is_from_me: bool
+    chat_jid: str
+    id: str
+    chat_name: Optional[str] = None
+    media_type: Optional[str] = None
+
+
+def make_rows(count):
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    return [
+        (
+            str(start + timedelta(seconds=i * 30)),
+            f"1555000{i % 500:04d}",
+            f"Message number {i} with some ordinary chat text in it",
+            int(i % 3 == 0),
+            f"1203630{i % 40:04d}@g.us",
+            f"3EB0{i:016X}",
+            f"Group {i % 40}",
+            "image" if i % 10 == 0 else None
+        )
+        for i in range(count)
+    ]
+
+
+def make_messages(rows, cls=Message):
+    if cls is LegacyMessage:
+        return [LegacyMessage(datetime.fromisoformat(r[0]), *r[1:]) for r in rows]
+    return [Message(*row) for row in rows]
+
+
+def fastmcp_reflection(messages):
+    # FastMCP converts each list item separately with an indented pydantic dump
+    import pydantic_core
+    return [pydantic_core.to_json(m, fallback=str, indent=2).decode() for m in messages]
+
+
+def bridge_hand_built(messages):
+    return json.dumps([{
+        "timestamp": m.timestamp.isoformat(),
+        "sender": m.sender,
+        "content": m.content,
+        "is_from_me": m.is_from_me,
+        "chat_jid": m.chat_jid,
+        "id": m.id,
+        "chat_name": m.chat_name
+    } for m in messages]).encode()
+
+
+def layer_json(messages):
+    data = serialization.to_records(messages, compact=False)
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def layer_default(messages):
+    return serialization.dumps_bytes(messages, compact=False)
+
+
+def layer_compact(messages):
+    return serialization.dumps_bytes(messages, compact=True)
+
+
+def run(name, fn, messages, rounds):
+    output = fn(messages)
+    size = sum(len(part) for part in output) if isinstance(output, list) else len(output)
+    started = time.perf_counter()
+    for _ in range(rounds):
+        fn(messages)
+    elapsed = time.perf_counter() - started
+    rate = len(messages) * rounds / elapsed
+    print(f"{name:<28} {rate:>12,.0f} msg/s {elapsed / rounds * 1000:>9.2f} ms/call {size:>10,} bytes")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    rows = make_rows(args.messages)
+    legacy = make_messages(rows, LegacyMessage)
+    messages = make_messages(rows)
+    print(f"Serializing {args.messages} messages x {args.rounds} rounds (backend: {serialization.JSON_BACKEND})")
+
+    cases = [("bridge json.dumps", bridge_hand_built, legacy), ("serializer + json", layer_json, messages)]
+    try:
+        import pydantic_core  # noqa: F401
+        cases.insert(0, ("fastmcp reflection", fastmcp_reflection, legacy))
+    except ImportError:
+        print("pydantic_core not installed, skipping FastMCP reflection baseline")
+    if serialization.orjson is not None:
+        cases.append(("serializer + orjson", layer_default, messages))
+    cases.append((f"serializer compact ({serialization.JSON_BACKEND})", layer_compact, messages))
+
+    baseline = None
+    for name, fn, records in cases:
+        rate = run(name, fn, records, args.rounds)
+        if baseline is None:
+            baseline = rate
+        else:
+            print(f"{'':<28} {rate / baseline:>11.1f}x vs {cases[0][0]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Measure the session index and get_conversation.
+
+Builds the conversation sessions of a messages database from scratch,
+times the incremental catch-up after new messages arrive (appended and
+out of order), then times get_conversation for random messages against
+what a client does without it: fetch a wide get_message_context window
+and cut the conversation out of it by time gaps. Needs numpy.
+
+Usage:
+    python benchmarks/bench_sessions.py --messages 1000000
+    python benchmarks/bench_sessions.py --db /tmp/messages.db --window 1000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import readcache
+import sessions
+import whatsapp
+from run_benchmarks import percentile
+from synthetic_db import generate
+
+
+def timed(fn, iterations):
+    durations = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - started)
+    return sorted(durations)
+
+
+def add_messages(db_path, count):
+    """Add count messages to random chats, half now and half at random times in the past."""
+    rng = random.Random(0)
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        with conn:
+            chats = [row[0] for row in conn.execute("SELECT jid FROM chats LIMIT 100")]
+            conn.executemany(
+                "INSERT OR REPLACE INTO messages (id, chat_jid, sender, content, timestamp, is_from_me, media_type) "
+                "VALUES (?, ?, '15550000000', 'bench', datetime('now', ?), 0, '')",
+                [
+                    (f"bench-sessions-{n}", rng.choice(chats), f"-{0 if n % 2 else rng.randrange(365 * 86400)} seconds")
+                    for n in range(count)
+                ]
+            )
+    finally:
+        conn.close()
+
+
+def client_side(message_id, chat_jid, window):
+    """Cut the conversation around a message out of a get_message_context window."""
+    context = whatsapp.get_message_context(message_id, before=window, after=window, chat_jid=chat_jid)
+    # before is newest first
+    messages = context.before[::-1] + [context.message] + context.after
+    position = len(context.before)
+    start, end = position, position
+    while start > 0 and (messages[start].timestamp - messages[start - 1].timestamp).total_seconds() <= sessions.SESSION_GAP_SECONDS:
+        start -= 1
+    while end < len(messages) - 1 and (messages[end + 1].timestamp - messages[end].timestamp).total_seconds() <= sessions.SESSION_GAP_SECONDS:
+        end += 1
+    return messages[start:end + 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", help="Existing messages.db (a copy is used; generated when omitted)")
+    parser.add_argument("--chats", type=int, default=300)
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--new", type=int, default=1000, help="Messages added before the incremental catch-up")
+    parser.add_argument("--window", type=int, default=500, help="Messages on each side of the client-side window")
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    workdir = tempfile.TemporaryDirectory()
+    db_path = os.path.join(workdir.name, "messages.db")
+    if args.db:
+        source, target = sqlite3.connect(args.db), sqlite3.connect(db_path)
+        source.backup(target)
+        source.close()
+        target.close()
+    else:
+        generate(db_path, chats=args.chats, messages=args.messages)
+        print(f"Generated {args.messages} messages in {args.chats} chats")
+    whatsapp.MESSAGES_DB_PATH = db_path
+    readcache.configure(ttl=0)
+    index_path = os.path.join(workdir.name, "sessions.db")
+    index = sessions.SessionIndex(index_path, db_path)
+
+    started = time.perf_counter()
+    built = index.update()
+    full = time.perf_counter() - started
+    add_messages(db_path, args.new)
+    started = time.perf_counter()
+    added = index.update()
+    incremental = time.perf_counter() - started
+    conn = sqlite3.connect(index_path)
+    count = conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+    conn.close()
+    print(f"Build:              {built} messages in {full:.1f}s ({built / full:.0f}/s), {count} sessions")
+    print(f"Catch-up:           {added} new messages in {incremental * 1000:.1f}ms")
+
+    conn = sqlite3.connect(db_path)
+    max_rowid = conn.execute("SELECT MAX(rowid) FROM messages").fetchone()[0]
+    rng = random.Random(1)
+    targets = [
+        conn.execute("SELECT id, chat_jid FROM messages WHERE rowid >= ? LIMIT 1", (rng.randint(1, max_rowid),)).fetchone()
+        for _ in range(args.iterations)
+    ]
+    conn.close()
+    served = [len(index.conversation(*target)["messages"]) for target in targets]
+    cut = [len(client_side(*target, args.window)) for target in targets]
+    print(f"Messages per conversation: median {sorted(served)[len(served) // 2]}, max {max(served)}; "
+          f"client-side windows cut short: {sum(a > b for a, b in zip(served, cut))} of {len(targets)}")
+
+    print(f"{'read':<28} {'p50 ms':>10} {'p95 ms':>10}")
+    for name, fn in (
+        ("get_conversation", lambda: index.conversation(*rng.choice(targets))),
+        (f"context window {args.window} + cut", lambda: client_side(*rng.choice(targets), args.window)),
+    ):
+        durations = timed(fn, args.iterations)
+        print(f"{name:<28} {percentile(durations, 0.5) * 1000:>10.1f} {percentile(durations, 0.95) * 1000:>10.1f}")
+
+    workdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
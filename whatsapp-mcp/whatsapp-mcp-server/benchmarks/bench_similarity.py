@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Measure the similarity index and find_similar_messages.
+
+Builds the MinHash index of a messages database from scratch, adds a flood
+of near-identical messages and times the incremental catch-up, then times
+the near-duplicates of one message found through the LSH buckets against
+comparing it with every stored signature, and the clusters of the last day.
+Needs numpy.
+
+Usage:
+    python benchmarks/bench_similarity.py --messages 200000
+    python benchmarks/bench_similarity.py --db /tmp/messages.db --flood 1000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import similarity
+import whatsapp
+from run_benchmarks import percentile
+from synthetic_db import generate
+
+FLOOD_TEXT = (
+    "Forward this to everyone you know: the bank closes every account tomorrow "
+    "unless you confirm your details at the link below today"
+)
+
+
+def timed(fn, iterations):
+    durations = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - started)
+    return sorted(durations)
+
+
+def add_flood(db_path, count):
+    """Insert count edited copies of one message into random chats, sent in the last hour."""
+    rng = random.Random(0)
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        with conn:
+            chats = [row[0] for row in conn.execute("SELECT jid FROM chats LIMIT 100")]
+            rows = []
+            for n in range(count):
+                words = FLOOD_TEXT.split()
+                words[rng.randrange(len(words))] += rng.choice(("!", "!!", " 🙏", " pls"))
+                rows.append((f"bench-flood-{n}", rng.choice(chats), " ".join(words), f"-{rng.randrange(3600)} seconds"))
+            conn.executemany(
+                "INSERT OR REPLACE INTO messages (id, chat_jid, sender, content, timestamp, is_from_me, media_type) "
+                "VALUES (?, ?, '15550000000', ?, datetime('now', ?), 0, '')",
+                rows
+            )
+        return rows[0][:2]
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", help="Existing messages.db (a copy is used; generated when omitted)")
+    parser.add_argument("--chats", type=int, default=300)
+    parser.add_argument("--messages", type=int, default=200_000)
+    parser.add_argument("--flood", type=int, default=500, help="Near-identical messages added before the catch-up")
+    parser.add_argument("--iterations", type=int, default=10)
+    args = parser.parse_args()
+
+    workdir = tempfile.TemporaryDirectory()
+    db_path = os.path.join(workdir.name, "messages.db")
+    if args.db:
+        source, target = sqlite3.connect(args.db), sqlite3.connect(db_path)
+        source.backup(target)
+        source.close()
+        target.close()
+    else:
+        generate(db_path, chats=args.chats, messages=args.messages)
+        print(f"Generated {args.messages} messages in {args.chats} chats")
+    whatsapp.MESSAGES_DB_PATH = db_path
+    index_path = os.path.join(workdir.name, "similarity.db")
+    index = similarity.SimilarityIndex(index_path, db_path)
+
+    started = time.perf_counter()
+    built = index.update()
+    full = time.perf_counter() - started
+    message_id, chat_jid = add_flood(db_path, args.flood)
+    started = time.perf_counter()
+    added = index.update()
+    incremental = time.perf_counter() - started
+    print(f"Build:              {built} messages in {full:.1f}s ({built / full:.0f}/s), "
+          f"{os.path.getsize(index_path) / 1e6:.1f} MB")
+    print(f"Catch-up:           {added} new messages in {incremental * 1000:.1f}ms")
+
+    def brute_force():
+        conn = sqlite3.connect(index_path)
+        try:
+            target = conn.execute(
+                "SELECT signature FROM signatures WHERE chat_jid = ? AND id = ?", (chat_jid, message_id)
+            ).fetchone()[0]
+            rows = conn.execute("SELECT message_rowid, signature FROM signatures").fetchall()
+        finally:
+            conn.close()
+        scores = similarity._similarity(
+            similarity._from_blobs([blob for _, blob in rows]), similarity.np.frombuffer(target, similarity.np.uint32)
+        )
+        return int((scores >= 0.7).sum())
+
+    found = index.similar_to(message_id, chat_jid)
+    print(f"Near-duplicates:    {found['matches']} from {found['candidates']} candidates, "
+          f"{brute_force() - 1} comparing every signature")
+    print(f"{'query':<24} {'p50 ms':>10} {'p95 ms':>10}")
+    for name, fn in (
+        ("similar_to (LSH)", lambda: index.similar_to(message_id, chat_jid)),
+        ("similar_to (all)", brute_force),
+        ("clusters (last day)", lambda: index.clusters()),
+    ):
+        durations = timed(fn, args.iterations)
+        print(f"{name:<24} {percentile(durations, 0.5) * 1000:>10.1f} {percentile(durations, 0.95) * 1000:>10.1f}")
+
+    workdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
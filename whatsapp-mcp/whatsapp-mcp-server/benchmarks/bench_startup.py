@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark for the stdio MCP server (main.py).
+
+Spawns a fresh `python main.py` per run, speaks JSON-RPC to it over stdio
+the way an MCP client does and measures, from the moment the process is
+started:
+
+    initialize  time to the initialize response (time to first response)
+    tools/list  time to the tools/list response
+    first call  time to the response of a first read tool call (list_chats)
+
+The server reads a synthetic messages.db (generated in a temp dir unless
+--db is given) and talks to a stub bridge started in this process, so bridge
+latency can be controlled. --bridge-latency-ms slows the stub's health check,
+--unreachable points the server at an address that never answers and
+--discover leaves WHATSAPP_API_URL unset so the server probes for the bridge.
+None of these should delay the first response.
+
+Exits with status 1 when the median time to first response exceeds
+--target-ms.
+
+Usage:
+    python benchmarks/bench_startup.py --runs 10 --target-ms 1500
+    python benchmarks/bench_startup.py --unreachable
+"""
+import argparse
+import json
+import os
+import select
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+from stub_bridge import StubBridgeHandler, StubConfig, make_server
+from synthetic_db import generate
+
+# A non-routable address: connections to it hang until the client times out
+UNREACHABLE_API_URL = "http://10.255.255.1:8080/api"
+
+
+class SlowHealthConfig(StubConfig):
+    def __init__(self, health_latency_ms: float, **kwargs):
+        super().__init__(**kwargs)
+        self.health_latency_ms = health_latency_ms
+
+
+class SlowHealthHandler(StubBridgeHandler):
+    def do_GET(self):
+        if self.path == "/api/health":
+            time.sleep(self.config.health_latency_ms / 1000)
+        super().do_GET()
+
+
+class StdioClient:
+    def __init__(self, env):
+        self.started = time.perf_counter()
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.join(SERVER_DIR, "main.py")],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            cwd=SERVER_DIR,
+            env=env
+        )
+        self.buffer = b""
+        self.next_id = 1
+
+    def send(self, method, params=None, notification=False):
+        message = {"jsonrpc": "2.0", "method": method}
+        if params is not None:
+            message["params"] = params
+        if not notification:
+            message["id"] = self.next_id
+            self.next_id += 1
+        self.process.stdin.write(json.dumps(message).encode() + b"\n")
+        self.process.stdin.flush()
+        return message.get("id")
+
+    def receive(self, request_id, timeout):
+        """Wait for the response to request_id; returns seconds since the process started."""
+        deadline = time.perf_counter() + timeout
+        fd = self.process.stdout.fileno()
+        while True:
+            while b"\n" in self.buffer:
+                line, self.buffer = self.buffer.split(b"\n", 1)
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    continue
+                if message.get("id") == request_id:
+                    if "error" in message:
+                        raise RuntimeError(f"request {request_id} failed: {message['error']}")
+                    return time.perf_counter() - self.started
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                raise TimeoutError(f"no response to request {request_id} within {timeout:g}s")
+            ready, _, _ = select.select([fd], [], [], remaining)
+            if ready:
+                chunk = os.read(fd, 65536)
+                if not chunk:
+                    raise RuntimeError(f"server exited with status {self.process.wait()}")
+                self.buffer += chunk
+
+    def request(self, method, params, timeout):
+        return self.receive(self.send(method, params), timeout)
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+
+
+def run_once(env, timeout):
+    client = StdioClient(env)
+    try:
+        first = client.request("initialize", {
+            "protocolVersion": "2024-11-05",
+            "capabilities": {},
+            "clientInfo": {"name": "bench_startup", "version": "1.0"}
+        }, timeout)
+        client.send("notifications/initialized", notification=True)
+        tools = client.request("tools/list", {}, timeout)
+        call = client.request("tools/call", {"name": "list_chats", "arguments": {"limit": 1}}, timeout)
+        return {"initialize": first, "tools/list": tools, "first call": call}
+    finally:
+        client.close()
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", help="Existing messages.db to serve (generated in a temp dir when omitted)")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--target-ms", type=float, default=1500.0, help="Budget for the median time to first response")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Seconds to wait for any one response")
+    parser.add_argument("--bridge-latency-ms", type=float, default=0.0, help="Delay of the stub bridge's /api/health")
+    bridge = parser.add_mutually_exclusive_group()
+    bridge.add_argument("--unreachable", action="store_true", help="Point WHATSAPP_API_URL at an address that never answers")
+    bridge.add_argument("--discover", action="store_true", help="Leave WHATSAPP_API_URL unset so the server probes for the bridge")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    tmpdir = tempfile.TemporaryDirectory(prefix="whatsapp-startup-bench-")
+    db_path = args.db
+    if not db_path:
+        db_path = os.path.join(tmpdir.name, "messages.db")
+        generate(db_path, chats=50, messages=5_000)
+
+    config = SlowHealthConfig(args.bridge_latency_ms, send_latency_ms=0, jitter_ms=0)
+    handler = type("ConfiguredSlowHealthHandler", (SlowHealthHandler,), {"config": config})
+    server = make_server("127.0.0.1", 0, config)
+    server.RequestHandlerClass = handler
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    env = dict(os.environ, WHATSAPP_DB_PATH=db_path, PYTHONDONTWRITEBYTECODE="1")
+    env.pop("WHATSAPP_PROFILE", None)
+    if args.discover:
+        env.pop("WHATSAPP_API_URL", None)
+    elif args.unreachable:
+        env["WHATSAPP_API_URL"] = UNREACHABLE_API_URL
+    else:
+        env["WHATSAPP_API_URL"] = f"http://127.0.0.1:{server.server_port}/api"
+
+    # One unmeasured run so every measured run sees warm .pyc and page caches
+    run_once(env, args.timeout)
+
+    samples = {"initialize": [], "tools/list": [], "first call": []}
+    try:
+        for _ in range(args.runs):
+            for name, seconds in run_once(env, args.timeout).items():
+                samples[name].append(seconds * 1000)
+    finally:
+        server.shutdown()
+        server.server_close()
+        tmpdir.cleanup()
+
+    print(f"{'milestone':<12} {'p50 ms':>9} {'min ms':>9} {'max ms':>9}")
+    results = {}
+    for name, values in samples.items():
+        ordered = sorted(values)
+        results[name] = {"p50_ms": percentile(ordered, 0.5), "min_ms": ordered[0], "max_ms": ordered[-1]}
+        print(f"{name:<12} {results[name]['p50_ms']:9.1f} {ordered[0]:9.1f} {ordered[-1]:9.1f}")
+
+    first_response = results["initialize"]["p50_ms"]
+    within_target = first_response <= args.target_ms
+    print(f"\nTime to first response: {first_response:.1f} ms "
+          f"({'within' if within_target else 'OVER'} the {args.target_ms:g} ms target)")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"runs": args.runs, "target_ms": args.target_ms, "milestones": results}, f, indent=2)
+    sys.exit(0 if within_target else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Open-loop load generator for the send and download path.
+
+Drives send_message, send_file, send_audio_message and download_media at a
+target request rate through either entry point:
+
+    mcp   the FastMCP tools in this process (FastMCP.call_tool)
+    http  the HTTP bridge (mcp_bridge.py, POST {"command", "arguments"})
+
+Requests are started on a fixed schedule whether or not earlier ones have
+finished, and latency is measured from the scheduled start, so queueing
+behind a slow bridge shows up in the tail instead of silently lowering the
+rate. Reports throughput, p50/p95/p99/max latency and a breakdown of errors
+per operation.
+
+Usage:
+    python benchmarks/stub_bridge.py --error-rate 0.02 &
+    python benchmarks/load_send.py --api-url http://127.0.0.1:8080/api --rps 50 --duration 30
+    python benchmarks/load_send.py --entry http --bridge-url http://127.0.0.1:8090 --rps 50
+    python benchmarks/load_send.py --stub --rps 100   # in-process stub bridge with default settings
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+OPERATIONS = ("send_message", "send_file", "send_audio_message", "download_media")
+
+
+def parse_mix(text):
+    """Parse "send_message=4,download_media=1" into cumulative weights."""
+    mix = []
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"Unknown operation {name!r}; expected one of {', '.join(OPERATIONS)}")
+        mix.append((name, float(weight or 1)))
+    return mix
+
+
+def classify(result):
+    """Reduce a tool result to None (success) or a short error category."""
+    if not isinstance(result, dict):
+        return "unexpected response"
+    if "error" in result:
+        return f"bridge error: {str(result['error'])[:60]}"
+    if result.get("success"):
+        return None
+    message = str(result.get("message", ""))
+    if message.startswith("Error: HTTP "):
+        return message.split(" - ")[0][len("Error: "):]
+    lowered = message.lower()
+    if "timed out" in lowered:
+        return "timeout"
+    if "connection" in lowered and message.startswith("Request error"):
+        return "connection error"
+    return message[:60] or "failed"
+
+
+class McpEntry:
+    """Call the tools through FastMCP in this process, one event loop per worker thread."""
+
+    def __init__(self):
+        from main import mcp
+        self.mcp = mcp
+        self.local = threading.local()
+
+    def call(self, tool, arguments):
+        loop = getattr(self.local, "loop", None)
+        if loop is None:
+            loop = self.local.loop = asyncio.new_event_loop()
+        result = loop.run_until_complete(self.mcp.call_tool(tool, arguments))
+        content = result[0] if isinstance(result, tuple) else result
+        return json.loads(content[0].text)
+
+
+class HttpEntry:
+    """Call the tools through the HTTP bridge."""
+
+    def __init__(self, bridge_url, timeout):
+        self.url = bridge_url.rstrip("/") + "/"
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def call(self, tool, arguments):
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = self.local.session = requests.Session()
+        response = session.post(self.url, json={"command": tool, "arguments": arguments}, timeout=self.timeout)
+        if response.status_code != 200:
+            return {"error": f"HTTP {response.status_code}"}
+        return response.json()
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.service_times = defaultdict(list)
+        self.errors = defaultdict(Counter)
+        self.completed = 0
+
+    def record(self, operation, latency, service_time, error):
+        with self.lock:
+            self.latencies[operation].append(latency)
+            self.service_times[operation].append(service_time)
+            if error:
+                self.errors[operation][error] += 1
+            self.completed += 1
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def make_arguments(operation, index, args, files):
+    if operation == "send_message":
+        return {"recipient": args.recipient, "message": f"load test message {index}"}
+    if operation == "send_file":
+        return {"recipient": args.recipient, "media_path": files["file"]}
+    if operation == "send_audio_message":
+        return {"recipient": args.recipient, "media_path": files["audio"]}
+    return {"message_id": f"LOAD{index:010d}", "chat_jid": f"{args.recipient}@s.whatsapp.net"}
+
+
+def run(entry, args, files):
+    mix = args.mix
+    total_weight = sum(weight for _, weight in mix)
+    # Deterministic interleaving that follows the weights
+    schedule = []
+    credit = {name: 0.0 for name, _ in mix}
+    for _ in range(max(1, int(round(total_weight * 10)))):
+        for name, weight in mix:
+            credit[name] += weight / total_weight
+        name = max(credit, key=credit.get)
+        credit[name] -= 1
+        schedule.append(name)
+
+    recorder = Recorder()
+    total = int(args.rps * args.duration)
+    interval = 1 / args.rps
+
+    def execute(index, operation, scheduled):
+        started = time.perf_counter()
+        try:
+            error = classify(entry.call(operation, make_arguments(operation, index, args, files)))
+        except Exception as e:
+            error = f"exception: {type(e).__name__}"
+        finished = time.perf_counter()
+        recorder.record(operation, finished - scheduled, finished - started, error)
+
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        begin = time.perf_counter()
+        for index in range(total):
+            scheduled = begin + index * interval
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(execute, index, schedule[index % len(schedule)], scheduled)
+        issued = time.perf_counter() - begin
+    elapsed = time.perf_counter() - begin
+    return recorder, total, issued, elapsed
+
+
+def report(recorder, total, issued, elapsed, args):
+    print(f"\nIssued {total} requests in {issued:.1f}s (target {args.rps:g}/s, "
+          f"achieved {total / issued if issued else 0:.1f}/s); all finished after {elapsed:.1f}s")
+    print(f"\n{'operation':<20} {'count':>7} {'ok/s':>8} {'err %':>7} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'p99 ms':>9} {'max ms':>9} {'svc p50':>9}")
+    all_latencies = []
+    for operation in OPERATIONS:
+        latencies = sorted(recorder.latencies.get(operation, ()))
+        if not latencies:
+            continue
+        all_latencies.extend(latencies)
+        service = sorted(recorder.service_times[operation])
+        failed = sum(recorder.errors[operation].values())
+        print(f"{operation:<20} {len(latencies):>7} {(len(latencies) - failed) / elapsed:>8.1f} "
+              f"{failed / len(latencies):>7.1%} {percentile(latencies, 0.5) * 1000:>9.1f} "
+              f"{percentile(latencies, 0.95) * 1000:>9.1f} {percentile(latencies, 0.99) * 1000:>9.1f} "
+              f"{latencies[-1] * 1000:>9.1f} {percentile(service, 0.5) * 1000:>9.1f}")
+    all_latencies.sort()
+    failed = sum(sum(errors.values()) for errors in recorder.errors.values())
+    if all_latencies:
+        print(f"{'all':<20} {len(all_latencies):>7} {(len(all_latencies) - failed) / elapsed:>8.1f} "
+              f"{failed / len(all_latencies):>7.1%} {percentile(all_latencies, 0.5) * 1000:>9.1f} "
+              f"{percentile(all_latencies, 0.95) * 1000:>9.1f} {percentile(all_latencies, 0.99) * 1000:>9.1f} "
+              f"{all_latencies[-1] * 1000:>9.1f}")
+
+    if failed:
+        print("\nErrors:")
+        for operation in OPERATIONS:
+            for category, count in recorder.errors.get(operation, Counter()).most_common():
+                print(f"  {operation:<20} {count:>7}  {category}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entry", choices=("mcp", "http"), default="mcp")
+    parser.add_argument("--api-url", help="WhatsApp bridge API URL for the mcp entry (e.g. http://127.0.0.1:8080/api)")
+    parser.add_argument("--bridge-url", default="http://127.0.0.1:8090", help="HTTP bridge URL for the http entry")
+    parser.add_argument("--stub", action="store_true", help="Start a stub bridge in this process and send to it")
+    parser.add_argument("--rps", type=float, default=20.0, help="Target requests per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to generate load for")
+    parser.add_argument("--workers", type=int, default=64, help="Maximum concurrent requests")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("send_message=4,send_file=2,send_audio_message=1,download_media=3"),
+                        help="Weighted operation mix (default: send_message=4,send_file=2,send_audio_message=1,download_media=3)")
+    parser.add_argument("--recipient", default="15550109999")
+    parser.add_argument("--file-size", type=int, default=256 * 1024, help="Size of the file sent by send_file and send_audio_message")
+    parser.add_argument("--timeout", type=float, default=60.0, help="HTTP timeout for the http entry")
+    args = parser.parse_args()
+
+    stub = None
+    if args.stub:
+        from stub_bridge import make_server
+        stub = make_server(port=0)
+        threading.Thread(target=stub.serve_forever, daemon=True).start()
+        args.api_url = f"http://127.0.0.1:{stub.server_port}/api"
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # send_audio_message skips the ffmpeg conversion for .ogg files
+        files = {"file": os.path.join(workdir, "load.jpg"), "audio": os.path.join(workdir, "load.ogg")}
+        for path in files.values():
+            with open(path, "wb") as f:
+                f.write(os.urandom(args.file_size))
+
+        if args.entry == "mcp":
+            import whatsapp
+            if args.api_url:
+                whatsapp.WHATSAPP_API_BASE_URL = args.api_url
+            entry = McpEntry()
+            target = whatsapp.get_api_url()
+        else:
+            if args.stub:
+                print("The stub only serves the mcp entry; start mcp_bridge.py with "
+                      f"WHATSAPP_API_URL={args.api_url} to route the http entry to it", file=sys.stderr)
+            entry = HttpEntry(args.bridge_url, args.timeout)
+            target = args.bridge_url
+
+        print(f"Sending {args.rps:g} req/s for {args.duration:g}s through the {args.entry} entry to {target}")
+        recorder, total, issued, elapsed = run(entry, args, files)
+        report(recorder, total, issued, elapsed, args)
+
+    if stub is not None:
+        stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
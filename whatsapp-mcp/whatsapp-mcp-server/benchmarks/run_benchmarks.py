@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Offline latency benchmarks for the whatsapp.py read functions and MCP tools.
+
+Runs every read function directly, and every read tool end to end through
+FastMCP's call_tool (argument validation, the tool body and response
+conversion), against a synthetic messages.db. Reports p50/p95/p99 latency
+and throughput per case. Results can be saved as JSON and compared with a
+previous run to catch regressions.
+
+The read cache (readcache.py) is turned off so every iteration does the
+work; pass --cache to measure with it on.
+
+Usage:
+    python benchmarks/run_benchmarks.py --messages 200000 --json results.json
+    python benchmarks/run_benchmarks.py --db /tmp/messages.db --baseline results.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analytics
+import chatstats
+import indexing
+import readcache
+import scan
+import semantic
+import sessions
+import similarity
+import whatsapp
+from synthetic_db import generate
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(durations):
+    ordered = sorted(durations)
+    total = sum(ordered)
+    return {
+        "iterations": len(ordered),
+        "p50_ms": percentile(ordered, 0.50) * 1000,
+        "p95_ms": percentile(ordered, 0.95) * 1000,
+        "p99_ms": percentile(ordered, 0.99) * 1000,
+        "mean_ms": total / len(ordered) * 1000 if ordered else 0.0,
+        "ops_per_s": len(ordered) / total if total else 0.0
+    }
+
+
+def collect_samples(db_path, rng, count=50):
+    """Pick real ids, chats and senders from the database to drive the cases."""
+    conn = sqlite3.connect(db_path)
+    try:
+        busiest = conn.execute(
+            "SELECT chat_jid FROM messages GROUP BY chat_jid ORDER BY COUNT(*) DESC LIMIT 5"
+        ).fetchall()
+        groups = [row[0] for row in conn.execute("SELECT jid FROM chats WHERE jid LIKE '%@g.us' LIMIT 50")]
+        contacts = [row[0] for row in conn.execute("SELECT jid FROM chats WHERE jid NOT LIKE '%@g.us' LIMIT 200")]
+        max_rowid = conn.execute("SELECT MAX(rowid) FROM messages").fetchone()[0] or 0
+        messages = []
+        while len(messages) < count and max_rowid:
+            row = conn.execute(
+                "SELECT id, chat_jid, sender, timestamp FROM messages WHERE rowid >= ? LIMIT 1",
+                (rng.randint(1, max_rowid),)
+            ).fetchone()
+            if row:
+                messages.append(row)
+        # Messages with enough text to have a similarity signature
+        long_messages = conn.execute(
+            "SELECT id, chat_jid FROM messages WHERE length(content) >= 40 ORDER BY rowid DESC LIMIT 50"
+        ).fetchall()
+        group_senders = [
+            row[0] for row in conn.execute(
+                "SELECT DISTINCT sender FROM messages WHERE chat_jid LIKE '%@g.us' AND is_from_me = 0 LIMIT 200"
+            )
+        ]
+    finally:
+        conn.close()
+
+    return {
+        "busiest_chats": [row[0] for row in busiest],
+        "groups": groups or contacts,
+        "contacts": contacts or groups,
+        "messages": messages,
+        "long_messages": long_messages or [m[:2] for m in messages],
+        "senders": group_senders or [m[2] for m in messages],
+        "max_rowid": max_rowid,
+        "words": ["invoice", "meeting", "tomorrow", "delivery", "birthday"]
+    }
+
+
+def read_function_cases(s):
+    """(name, callable) pairs calling whatsapp.py read functions directly."""
+    messages = itertools.cycle(s["messages"])
+    long_messages = itertools.cycle(s["long_messages"])
+    contacts = itertools.cycle(s["contacts"])
+    senders = itertools.cycle(s["senders"])
+    words = itertools.cycle(s["words"])
+    chats = itertools.cycle(s["busiest_chats"])
+
+    def context_in_chat(window):
+        message_id, chat_jid = next(messages)[:2]
+        return whatsapp.get_message_context(message_id, window, window, chat_jid=chat_jid)
+
+    def drain_export():
+        return sum(len(batch) for batch in whatsapp.iter_chat_messages(s["busiest_chats"][-1]))
+
+    def filtered_search():
+        return whatsapp.list_messages(
+            sender_phone_number=next(senders), query=next(words),
+            after="2024-03-01", before="2024-12-01", include_context=False
+        )
+
+    return [
+        ("list_messages", lambda: whatsapp.list_messages()),
+        ("list_messages no context", lambda: whatsapp.list_messages(include_context=False)),
+        ("list_messages chat", lambda: whatsapp.list_messages(chat_jid=next(chats), include_context=False)),
+        ("list_messages query", lambda: whatsapp.list_messages(query=next(words), include_context=False)),
+        ("list_messages sender+query+dates", filtered_search),
+        ("search_facets query", lambda: whatsapp.search_facets(query=next(words))),
+        ("search_facets chat", lambda: whatsapp.search_facets(chat_jid=next(chats))),
+        ("list_messages page 50", lambda: whatsapp.list_messages(page=50, include_context=False)),
+        ("format_messages_list 20", lambda: whatsapp.format_messages_list(whatsapp.list_messages(include_context=False))),
+        ("get_message_context", lambda: whatsapp.get_message_context(next(messages)[0])),
+        ("get_message_context chat 50", lambda: context_in_chat(50)),
+        ("get_message_context chat 500", lambda: context_in_chat(500)),
+        ("get_conversation", lambda: sessions.get_conversation(*next(messages)[:2])),
+        ("list_chats", lambda: whatsapp.list_chats()),
+        ("list_chats query", lambda: whatsapp.list_chats(query="Group 1")),
+        ("search_contacts", lambda: whatsapp.search_contacts("Contact 1")),
+        ("get_chat", lambda: whatsapp.get_chat(next(contacts))),
+        ("get_direct_chat_by_contact", lambda: whatsapp.get_direct_chat_by_contact(next(contacts).split("@")[0])),
+        ("get_contact_chats", lambda: whatsapp.get_contact_chats(next(senders))),
+        ("get_last_interaction", lambda: whatsapp.get_last_interaction(next(contacts))),
+        ("get_sender_name", lambda: whatsapp.get_sender_name(next(senders))),
+        ("iter_chat_messages full chat", drain_export),
+        ("chat_activity", lambda: analytics.chat_activity(next(chats))),
+        ("scan_messages regex", lambda: scan.scan_messages(pattern=rf"\b{next(words)}\b")),
+        ("scan_messages keywords chat", lambda: scan.scan_messages(any_keywords=[next(words), next(words)], chat_jid=next(chats))),
+        ("find_similar_messages", lambda: similarity.find_similar_messages(*next(long_messages))),
+        ("semantic_search_messages", lambda: semantic.semantic_search_messages(f"{next(words)} {next(words)}")),
+        ("semantic_search_messages chat", lambda: semantic.semantic_search_messages(next(words), chat_jid=next(chats))),
+        ("find_similar_messages clusters", lambda: similarity.find_similar_messages(after="2000-01-01", chat_jid=next(chats))),
+    ]
+
+
+def tool_cases(s):
+    """(name, tool, arguments factory) triples for end-to-end MCP tool calls."""
+    messages = itertools.cycle(s["messages"])
+    long_messages = itertools.cycle(s["long_messages"])
+    contacts = itertools.cycle(s["contacts"])
+    senders = itertools.cycle(s["senders"])
+    words = itertools.cycle(s["words"])
+    chats = itertools.cycle(s["busiest_chats"])
+
+    return [
+        ("tool list_messages text", "list_messages", lambda: {}),
+        ("tool list_messages json", "list_messages", lambda: {"output_format": "json", "include_context": False, "limit": 100}),
+        ("tool list_messages query", "list_messages", lambda: {"query": next(words), "include_context": False}),
+        ("tool search_facets", "search_facets", lambda: {"query": next(words)}),
+        ("tool get_message_context", "get_message_context", lambda: {"message_id": next(messages)[0]}),
+        ("tool get_message_context chat 500", "get_message_context",
+         lambda: dict(zip(("message_id", "chat_jid"), next(messages)[:2]), before=500, after=500)),
+        ("tool get_conversation", "get_conversation", lambda: dict(zip(("message_id", "chat_jid"), next(messages)[:2]))),
+        ("tool list_chats", "list_chats", lambda: {}),
+        ("tool search_contacts", "search_contacts", lambda: {"query": "Contact 1"}),
+        ("tool get_chat", "get_chat", lambda: {"chat_jid": next(contacts)}),
+        ("tool get_direct_chat_by_contact", "get_direct_chat_by_contact", lambda: {"sender_phone_number": next(contacts).split("@")[0]}),
+        ("tool get_contact_chats", "get_contact_chats", lambda: {"jid": next(senders)}),
+        ("tool get_last_interaction", "get_last_interaction", lambda: {"jid": next(contacts)}),
+        ("tool get_message_changes", "get_message_changes", lambda: {"cursor": max(0, s["max_rowid"] - 50)}),
+        ("tool get_chat_stats", "get_chat_stats", lambda: {"chat_jid": next(chats), "start_date": "2024-01-01"}),
+        ("tool get_chat_activity", "get_chat_activity", lambda: {"chat_jid": next(chats)}),
+        ("tool scan_messages", "scan_messages", lambda: {"pattern": rf"\b{next(words)}\b"}),
+        ("tool semantic_search_messages", "semantic_search_messages", lambda: {"query": f"{next(words)} {next(words)}"}),
+        ("tool find_similar_messages", "find_similar_messages", lambda: dict(zip(("message_id", "chat_jid"), next(long_messages)))),
+    ]
+
+
+def run_function(fn, iterations, warmup):
+    for _ in range(warmup):
+        fn()
+    durations = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - started)
+    return durations
+
+
+async def run_tool(mcp, tool, arguments, iterations, warmup):
+    for _ in range(warmup):
+        await mcp.call_tool(tool, arguments())
+    durations = []
+    for _ in range(iterations):
+        args = arguments()
+        started = time.perf_counter()
+        await mcp.call_tool(tool, args)
+        durations.append(time.perf_counter() - started)
+    return durations
+
+
+def print_row(name, stats, baseline=None):
+    line = (f"{name:<34} {stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f} {stats['p99_ms']:>9.2f} "
+            f"{stats['ops_per_s']:>10,.1f}")
+    if baseline:
+        change = (stats["p50_ms"] - baseline["p50_ms"]) / baseline["p50_ms"] if baseline["p50_ms"] else 0.0
+        line += f" {change:>+8.0%}"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", help="Existing messages.db to benchmark (generated in a temp dir when omitted)")
+    parser.add_argument("--chats", type=int, default=300)
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--filter", default="", help="Only run cases whose name contains this text")
+    parser.add_argument("--no-tools", action="store_true", help="Skip the end-to-end MCP tool cases")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    parser.add_argument("--baseline", help="Compare p50 latency with a previous --json file")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--cache", action="store_true", help="Keep the read cache on (repeated calls become hits)")
+    args = parser.parse_args()
+
+    if not args.cache:
+        readcache.configure(ttl=0)
+
+    workdir = None
+    db_path = args.db
+    if not db_path:
+        workdir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(workdir.name, "messages.db")
+        started = time.perf_counter()
+        generate(db_path, chats=args.chats, messages=args.messages, seed=args.seed)
+        print(f"Generated {args.messages} messages in {args.chats} chats in {time.perf_counter() - started:.1f}s")
+    whatsapp.MESSAGES_DB_PATH = db_path
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+
+    # Tools answer from the sidecar indexes only once they are built
+    for name, updater in indexing.UPDATERS.items():
+        started = time.perf_counter()
+        updater.update()
+        print(f"Built the {name} index in {time.perf_counter() - started:.1f}s")
+
+    samples = collect_samples(db_path, random.Random(args.seed))
+    results = {}
+    print(f"{'case':<34} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'ops/s':>10}" + (" p50 vs base" if baseline else ""))
+
+    for name, fn in read_function_cases(samples):
+        if args.filter in name:
+            results[name] = summarize(run_function(fn, args.iterations, args.warmup))
+            print_row(name, results[name], baseline.get(name))
+
+    if not args.no_tools:
+        from main import mcp
+
+        async def run_tools():
+            for name, tool, arguments in tool_cases(samples):
+                if args.filter in name:
+                    results[name] = summarize(await run_tool(mcp, tool, arguments, args.iterations, args.warmup))
+                    print_row(name, results[name], baseline.get(name))
+
+        asyncio.run(run_tools())
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "db": {"path": db_path, "chats": args.chats, "messages": args.messages} if workdir else {"path": db_path},
+                "iterations": args.iterations,
+                "results": results
+            }, f, indent=2)
+        print(f"Results written to {args.json}")
+
+    if workdir:
+        workdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Stand-in for the Go WhatsApp bridge's REST API, for load-testing the send
+and download path without a paired phone.
+
+Implements POST /api/send, POST /api/download and GET /api/health with the
+same request validation, status codes and response bodies as
+whatsapp-bridge/main.go. Latency, failure rates and the size of downloaded
+files are configurable. GET /api/stats returns request counters.
+
+Point the MCP server at it with WHATSAPP_API_URL=http://127.0.0.1:8080/api.
+
+Usage:
+    python benchmarks/stub_bridge.py --port 8080 --send-latency-ms 80 --error-rate 0.02
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubConfig:
+    def __init__(
+        self,
+        send_latency_ms: float = 80.0,
+        download_latency_ms: float = 150.0,
+        jitter_ms: float = 20.0,
+        error_rate: float = 0.0,
+        hang_rate: float = 0.0,
+        hang_seconds: float = 30.0,
+        download_size: int = 256 * 1024,
+        media_dir: str = None,
+        seed: int = None
+    ):
+        self.send_latency_ms = send_latency_ms
+        self.download_latency_ms = download_latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self.download_size = download_size
+        self.media_dir = media_dir or tempfile.mkdtemp(prefix="stub-bridge-media-")
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.stats = Counter()
+        self.stats_lock = threading.Lock()
+        self.payload = bytes(range(256)) * (download_size // 256 + 1)
+
+    def delay(self, base_ms: float) -> float:
+        """Base latency plus an exponential tail, or a hang for a share of requests."""
+        with self.rng_lock:
+            if self.hang_rate and self.rng.random() < self.hang_rate:
+                return self.hang_seconds
+            jitter = self.rng.expovariate(1 / self.jitter_ms) if self.jitter_ms > 0 else 0.0
+        return (base_ms + jitter) / 1000
+
+    def fails(self) -> bool:
+        with self.rng_lock:
+            return self.error_rate > 0 and self.rng.random() < self.error_rate
+
+    def count(self, key: str):
+        with self.stats_lock:
+            self.stats[key] += 1
+
+
+class StubBridgeHandler(BaseHTTPRequestHandler):
+    # Keep-alive and TCP_NODELAY, like Go's net/http
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    config: StubConfig = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status: int, body: dict):
+        data = json.dumps(body).encode() + b"\n"
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_text_error(self, status: int, text: str):
+        # http.Error writes a plain-text body
+        data = text.encode() + b"\n"
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            return json.loads(self.rfile.read(length) or b"null")
+        except ValueError:
+            return None
+
+    def do_GET(self):
+        if self.path == "/api/health":
+            self.config.count("health")
+            self.send_json(200, {"status": "healthy", "service": "whatsapp-bridge"})
+        elif self.path == "/api/stats":
+            with self.config.stats_lock:
+                self.send_json(200, dict(self.config.stats))
+        elif self.path in ("/api/send", "/api/download"):
+            self.send_text_error(405, "Method not allowed")
+        else:
+            self.send_text_error(404, "404 page not found")
+
+    def do_POST(self):
+        if self.path == "/api/send":
+            self.handle_send()
+        elif self.path == "/api/download":
+            self.handle_download()
+        elif self.path == "/api/health":
+            self.read_json()
+            self.send_text_error(405, "Method not allowed")
+        else:
+            self.read_json()
+            self.send_text_error(404, "404 page not found")
+
+    def handle_send(self):
+        config = self.config
+        request = self.read_json()
+        if not isinstance(request, dict):
+            config.count("send_invalid")
+            self.send_text_error(400, "Invalid request format")
+            return
+        if not request.get("recipient"):
+            config.count("send_invalid")
+            self.send_text_error(400, "Recipient is required")
+            return
+        message = request.get("message") or ""
+        media_path = request.get("media_path") or ""
+        if not message and not media_path:
+            config.count("send_invalid")
+            self.send_text_error(400, "Message or media path is required")
+            return
+
+        if media_path:
+            # The bridge reads the whole file before uploading it
+            try:
+                with open(media_path, "rb") as f:
+                    while f.read(1 << 20):
+                        pass
+            except OSError as e:
+                config.count("send_failed")
+                self.send_json(500, {"success": False, "message": f"Error reading media file: {e}"})
+                return
+
+        time.sleep(config.delay(config.send_latency_ms))
+        if config.fails():
+            config.count("send_failed")
+            self.send_json(500, {"success": False, "message": "Error sending message: stub failure"})
+            return
+
+        config.count("send_media" if media_path else "send_text")
+        self.send_json(200, {"success": True, "message": f"Message sent to {request['recipient']}"})
+
+    def handle_download(self):
+        config = self.config
+        request = self.read_json()
+        if not isinstance(request, dict):
+            config.count("download_invalid")
+            self.send_text_error(400, "Invalid request format")
+            return
+        message_id = request.get("message_id") or ""
+        chat_jid = request.get("chat_jid") or ""
+        if not message_id or not chat_jid:
+            config.count("download_invalid")
+            self.send_text_error(400, "Message ID and Chat JID are required")
+            return
+
+        time.sleep(config.delay(config.download_latency_ms))
+        if config.fails():
+            config.count("download_failed")
+            self.send_json(500, {"success": False, "message": "Failed to download media: stub failure"})
+            return
+
+        chat_dir = os.path.join(config.media_dir, chat_jid.replace(":", "_"))
+        os.makedirs(chat_dir, exist_ok=True)
+        filename = f"{message_id}.bin"
+        path = os.path.join(chat_dir, filename)
+        with open(path, "wb") as f:
+            f.write(memoryview(config.payload)[:config.download_size])
+
+        config.count("download")
+        self.send_json(200, {
+            "success": True,
+            "message": "Successfully downloaded document media",
+            "filename": filename,
+            "path": path
+        })
+
+
+def make_server(host: str = "127.0.0.1", port: int = 8080, config: StubConfig = None) -> ThreadingHTTPServer:
+    """Build (but do not start) a stub bridge server; port 0 picks a free port."""
+    handler = type("ConfiguredStubBridgeHandler", (StubBridgeHandler,), {"config": config or StubConfig()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--send-latency-ms", type=float, default=80.0, help="Base latency of /api/send")
+    parser.add_argument("--download-latency-ms", type=float, default=150.0, help="Base latency of /api/download")
+    parser.add_argument("--jitter-ms", type=float, default=20.0, help="Mean of the exponential latency tail added to every request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of sends and downloads that fail with HTTP 500")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="Share of requests that stall for --hang-seconds")
+    parser.add_argument("--hang-seconds", type=float, default=30.0)
+    parser.add_argument("--download-size", type=int, default=256 * 1024, help="Bytes written per downloaded file")
+    parser.add_argument("--media-dir", help="Where downloaded files are written (a temp dir by default)")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    config = StubConfig(
+        send_latency_ms=args.send_latency_ms,
+        download_latency_ms=args.download_latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        hang_rate=args.hang_rate,
+        hang_seconds=args.hang_seconds,
+        download_size=args.download_size,
+        media_dir=args.media_dir,
+        seed=args.seed
+    )
+    server = make_server(args.host, args.port, config)
+    print(f"Stub bridge listening on http://{args.host}:{server.server_port}/api "
+          f"(media in {config.media_dir})", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Generate a synthetic messages.db with the WhatsApp bridge's exact schema.
+
+The schema and value formats follow whatsapp-bridge/main.go: timestamps
+are written the way go-sqlite3 stores time.Time values, text messages carry
+an empty media_type, and media rows have a filename, URL, keys and length.
+Activity is skewed so a few chats carry most of the traffic, groups have
+many senders, and an optional share of rows is re-stored with INSERT OR
+REPLACE the way history sync does, with the sender as a full JID the way
+the bridge stores history-synced senders (live ones are bare numbers).
+
+Usage:
+    python benchmarks/synthetic_db.py /tmp/messages.db --chats 500 --messages 200000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+# Copied from whatsapp-bridge/main.go (NewMessageStore)
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chats (
+    jid TEXT PRIMARY KEY,
+    name TEXT,
+    last_message_time TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS messages (
+    id TEXT,
+    chat_jid TEXT,
+    sender TEXT,
+    content TEXT,
+    timestamp TIMESTAMP,
+    is_from_me BOOLEAN,
+    media_type TEXT,
+    filename TEXT,
+    url TEXT,
+    media_key BLOB,
+    file_sha256 BLOB,
+    file_enc_sha256 BLOB,
+    file_length INTEGER,
+    PRIMARY KEY (id, chat_jid),
+    FOREIGN KEY (chat_jid) REFERENCES chats(jid)
+);
+
+CREATE INDEX IF NOT EXISTS messages_chat_timestamp ON messages (chat_jid, timestamp);
+"""
+
+OWN_NUMBER = "15550100000"
+
+WORDS = (
+    "hello hi thanks ok sure yes no maybe tomorrow today tonight meeting call later please "
+    "invoice payment order delivery address price discount sent received photo video document "
+    "where when why how what great good fine busy free weekend monday friday office home "
+    "project deadline update review report client support ticket issue fixed working problem "
+    "lunch dinner coffee birthday party trip flight hotel booking confirmed cancelled"
+).split()
+
+MEDIA_TYPES = (("image", 0.6, ".jpg"), ("video", 0.15, ".mp4"), ("audio", 0.15, ".ogg"), ("document", 0.1, ".pdf"))
+
+
+def go_timestamp(value: datetime) -> str:
+    """Format a datetime the way go-sqlite3 stores time.Time ("2006-01-02 15:04:05.999999999-07:00")."""
+    text = value.strftime("%Y-%m-%d %H:%M:%S")
+    if value.microsecond:
+        text += f".{value.microsecond:06d}".rstrip("0")
+    offset = value.strftime("%z")
+    return f"{text}{offset[:3]}:{offset[3:]}"
+
+
+def make_chats(rng, count, group_ratio):
+    chats = []
+    for i in range(count):
+        if rng.random() < group_ratio:
+            jid = f"1203634{rng.randrange(10**11):011d}@g.us"
+            members = [f"1{rng.randrange(10**10):010d}" for _ in range(rng.randint(3, 60))]
+            chats.append((jid, f"Group {i}", members))
+        else:
+            number = f"1{rng.randrange(10**10):010d}"
+            chats.append((f"{number}@s.whatsapp.net", f"Contact {i}", [number]))
+    return chats
+
+
+def message_row(rng, index, chat, timestamp, media_ratio):
+    jid, _, members = chat
+    is_from_me = rng.random() < 0.35
+    sender = OWN_NUMBER if is_from_me else rng.choice(members)
+    content = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 25)))
+
+    media_type, filename, url, key, sha, enc_sha, length = "", "", "", None, None, None, 0
+    if rng.random() < media_ratio:
+        pick = rng.random()
+        for kind, weight, extension in MEDIA_TYPES:
+            pick -= weight
+            if pick <= 0:
+                break
+        media_type = kind
+        filename = f"{kind}_{timestamp:%Y%m%d_%H%M%S}{extension}"
+        url = f"https://mmg.whatsapp.net/v/t62.{index}-24/{rng.randrange(10**12)}.enc"
+        key, sha, enc_sha = rng.randbytes(32), rng.randbytes(32), rng.randbytes(32)
+        length = rng.randint(10_000, 20_000_000)
+        if rng.random() < 0.6:
+            content = ""
+
+    return (
+        f"3EB0{index:016X}", jid, sender, content, go_timestamp(timestamp), is_from_me,
+        media_type, filename, url, key, sha, enc_sha, length
+    )
+
+
+def generate(
+    path: str,
+    chats: int = 200,
+    messages: int = 100_000,
+    group_ratio: float = 0.2,
+    media_ratio: float = 0.12,
+    replace_ratio: float = 0.02,
+    days: int = 365,
+    seed: int = 42
+) -> dict:
+    """Create (or overwrite) a synthetic messages.db and return a summary of its contents."""
+    rng = random.Random(seed)
+    if os.path.exists(path):
+        os.remove(path)
+
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    conn.execute("PRAGMA synchronous = OFF")
+
+    chat_list = make_chats(rng, chats, group_ratio)
+    # Zipf-like weights so a handful of chats carry most of the traffic
+    weights = [1 / (rank + 1) ** 0.9 for rank in range(len(chat_list))]
+    chosen = rng.choices(range(len(chat_list)), weights=weights, k=messages)
+
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    step = days * 86400 / max(messages, 1)
+    last_message_time = {}
+    insert = """
+        INSERT OR REPLACE INTO messages
+        (id, chat_jid, sender, content, timestamp, is_from_me, media_type, filename, url, media_key, file_sha256, file_enc_sha256, file_length)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+
+    batch = []
+    stored = []
+    for index, chat_index in enumerate(chosen):
+        timestamp = start + timedelta(seconds=index * step + rng.random() * step, microseconds=rng.randrange(10**6))
+        row = message_row(rng, index, chat_list[chat_index], timestamp, media_ratio)
+        batch.append(row)
+        if replace_ratio and len(stored) < 100_000:
+            stored.append(row)
+        last_message_time[row[1]] = row[4]
+        if len(batch) >= 10_000:
+            conn.executemany(insert, batch)
+            batch.clear()
+    conn.executemany(insert, batch)
+
+    # History sync re-stores already known messages, which moves them to new rowids
+    replays = rng.sample(stored, int(len(stored) * replace_ratio)) if stored else []
+    conn.executemany(insert, [row[:2] + (f"{row[2]}@s.whatsapp.net",) + row[3:] for row in replays])
+
+    conn.executemany(
+        "INSERT OR REPLACE INTO chats (jid, name, last_message_time) VALUES (?, ?, ?)",
+        [(jid, name, last_message_time.get(jid)) for jid, name, _ in chat_list]
+    )
+    conn.commit()
+    conn.close()
+
+    return {
+        "path": path,
+        "chats": chats,
+        "groups": sum(1 for jid, _, _ in chat_list if jid.endswith("@g.us")),
+        "messages": messages,
+        "replayed": len(replays)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="Where to write the database (overwritten if it exists)")
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--group-ratio", type=float, default=0.2, help="Share of chats that are groups")
+    parser.add_argument("--media-ratio", type=float, default=0.12, help="Share of messages carrying media")
+    parser.add_argument("--replace-ratio", type=float, default=0.02, help="Share of messages re-stored by history sync")
+    parser.add_argument("--days", type=int, default=365, help="Time span covered by the messages")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    summary = generate(
+        args.path, args.chats, args.messages, args.group_ratio,
+        args.media_ratio, args.replace_ratio, args.days, args.seed
+    )
+    print(f"Wrote {summary['messages']} messages in {summary['chats']} chats ({summary['groups']} groups, "
+          f"{summary['replayed']} replayed) to {args.path} in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for an n8n Webhook node, for trying out webhooks.py.
+
+Accepts POSTed webhook batches, prints a one-line summary of each and can
+reject a share of requests to exercise the dispatcher's retry path.
+
+Usage:
+    python benchmarks/webhook_sink.py --port 8099 --fail-rate 0.2
+    WHATSAPP_WEBHOOK_URLS=http://localhost:8099/hook python webhooks.py
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class SinkHandler(BaseHTTPRequestHandler):
+    fail_rate = 0.0
+    lock = threading.Lock()
+    batches = 0
+    messages = 0
+    last_cursor = None
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if random.random() < self.fail_rate:
+            self.send_response(503)
+            self.end_headers()
+            print("Rejected a batch (simulated failure)", file=sys.stderr)
+            return
+
+        payload = json.loads(body)
+        count = sum(len(event["messages"]) for event in payload["events"])
+        cls = type(self)
+        with cls.lock:
+            if cls.last_cursor is not None and payload["cursor"] <= cls.last_cursor:
+                print(f"Out of order or repeated batch: cursor {payload['cursor']} after {cls.last_cursor}", file=sys.stderr)
+            cls.last_cursor = payload["cursor"]
+            cls.batches += 1
+            cls.messages += count
+            print(f"Batch {cls.batches}: {count} messages in {len(payload['events'])} chats, "
+                  f"cursor {payload['cursor']} (total {cls.messages})", file=sys.stderr)
+
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        self.end_headers()
+        self.wfile.write(b'{"ok":true}')
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Share of requests answered with HTTP 503")
+    args = parser.parse_args()
+
+    SinkHandler.fail_rate = args.fail_rate
+    server = ThreadingHTTPServer(('0.0.0.0', args.port), SinkHandler)
+    print(f"Webhook sink listening on port {args.port}", file=sys.stderr)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Incremental "messages since" change feed for polling workflows.
+
+The bridge stores messages with INSERT OR REPLACE, which gives a replaced
+row a new rowid, so every message inserted or updated after a given rowid
+has a larger rowid. Callers keep the rowid cursor returned by each call and
+pass it back on the next one.
+
+A long-lived connection is kept so PRAGMA data_version can tell whether
+another connection has committed anything since the last poll. When nothing
+changed, a poll costs one PRAGMA and no query against the messages table.
+"""
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import whatsapp
+from whatsapp import Message
+
+MAX_WAIT_SECONDS = 30
+MAX_LIMIT = 1000
+
+
+class ChangeFeed:
+    """Messages inserted or replaced after a rowid high-water mark."""
+
+    def __init__(self, db_path: Optional[str] = None, poll_interval: float = 0.25):
+        self.db_path = db_path
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._conn = None
+        self._data_version = None
+        self._high_water = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = whatsapp.connect_db(
+                "changefeed",
+                self.db_path,
+                isolation_level=None,
+                check_same_thread=False
+            )
+        return self._conn
+
+    def high_water_mark(self) -> int:
+        """Return the largest message rowid, re-reading it only after a commit elsewhere."""
+        with self._lock:
+            conn = self._connection()
+            version = conn.execute("PRAGMA data_version").fetchone()[0]
+            if version != self._data_version:
+                self._high_water = conn.execute("SELECT MAX(rowid) FROM messages").fetchone()[0] or 0
+                self._data_version = version
+            return self._high_water
+
+    def fetch(self, cursor: int, limit: int, chat_jid: Optional[str] = None) -> List[tuple]:
+        """Return up to limit (rowid, Message) pairs with rowid greater than cursor."""
+        query = """
+            SELECT m.rowid, m.timestamp, m.sender, c.name, m.content, m.is_from_me, m.chat_jid, m.id, m.media_type
+            FROM messages m
+            LEFT JOIN chats c ON c.jid = m.chat_jid
+            WHERE m.rowid > ?
+        """
+        params = [cursor]
+        if chat_jid:
+            query += " AND m.chat_jid = ?"
+            params.append(chat_jid)
+        query += " ORDER BY m.rowid LIMIT ?"
+        params.append(limit)
+
+        with self._lock:
+            rows = self._connection().execute(query, tuple(params)).fetchall()
+
+        return [
+            (row[0], Message(
+                timestamp=row[1],
+                sender=row[2],
+                chat_name=row[3],
+                content=row[4],
+                is_from_me=row[5],
+                chat_jid=row[6],
+                id=row[7],
+                media_type=row[8]
+            ))
+            for row in rows
+        ]
+
+    def changes(
+        self,
+        cursor: Optional[int] = None,
+        limit: int = 100,
+        chat_jid: Optional[str] = None,
+        wait_seconds: float = 0
+    ) -> Dict[str, Any]:
+        """Return messages inserted or updated after cursor.
+
+        Args:
+            cursor: The cursor returned by the previous call. When omitted, no
+                    messages are returned and the cursor starts at the newest message.
+            limit: Maximum number of messages to return (capped at MAX_LIMIT)
+            chat_jid: Optional chat JID to only return changes in this chat
+            wait_seconds: Long-poll for up to this many seconds when there are no
+                          new messages (capped at MAX_WAIT_SECONDS)
+
+        Returns:
+            A dictionary with the messages in change order, the cursor to pass
+            to the next call and whether more changes are immediately available
+        """
+        limit = max(1, min(limit, MAX_LIMIT))
+        deadline = time.monotonic() + max(0, min(wait_seconds, MAX_WAIT_SECONDS))
+
+        while True:
+            high_water = self.high_water_mark()
+            if cursor is None:
+                return {"cursor": high_water, "messages": [], "has_more": False}
+
+            if high_water > cursor:
+                rows = self.fetch(cursor, limit + 1, chat_jid)
+                has_more = len(rows) > limit
+                rows = rows[:limit]
+                if rows or not chat_jid:
+                    next_cursor = rows[-1][0] if rows else high_water
+                    if not has_more:
+                        next_cursor = max(next_cursor, high_water)
+                    return {
+                        "cursor": next_cursor,
+                        "messages": [message for _, message in rows],
+                        "has_more": has_more
+                    }
+                # Changes landed in other chats only; skip past them
+                cursor = high_water
+
+            if time.monotonic() >= deadline:
+                return {"cursor": cursor, "messages": [], "has_more": False}
+            time.sleep(self.poll_interval)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_default_feed = ChangeFeed()
+
+
+def get_message_changes(
+    cursor: Optional[int] = None,
+    limit: int = 100,
+    chat_jid: Optional[str] = None,
+    wait_seconds: float = 0
+) -> Dict[str, Any]:
+    """Return messages inserted or updated after cursor using the shared feed."""
+    return _default_feed.changes(cursor, limit, chat_jid, wait_seconds)
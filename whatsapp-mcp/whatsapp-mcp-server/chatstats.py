@@ -0,0 +1,709 @@
+#!/usr/bin/env python3
+"""
+Per-chat message statistics kept in a sidecar database.
+
+The bridge owns messages.db, so the aggregates live in a database of their
+own (WHATSAPP_STATS_DB_PATH, by default chat_stats.db next to messages.db).
+They are brought up to date from the rows added to messages since the last
+update, the same rowid high-water mark the change feed uses, so an update
+costs in proportion to the new messages only:
+
+    chat_days        messages, messages from me and media messages per chat
+                     and day, plus running totals up to and including that day
+    sender_days      messages per chat, sender number and day, plus the
+                     sender's running total in the chat
+    media_days       messages per chat, media type and day, plus the media
+                     type's running total in the chat
+    chat_senders     the senders and media types of each chat, with their
+    chat_media_types message counts
+    chat_members     the chats each contact takes part in, with their message
+                     count, first and last message time and last message id
+
+A contact is a member of a chat when they sent a message in it; my own
+messages in a direct chat make the other party a member too, so a direct
+chat counts as involving its contact even before they reply. Members are
+kept as bare numbers (contacts.normalize_number): the bridge stores
+history-synced senders as full JIDs, sometimes with a device suffix, and
+live ones as bare numbers, and both are the same person.
+
+The bridge stores messages with INSERT OR REPLACE, which gives a replaced
+row a new rowid. To count every message once, a ledger (counted) remembers
+what each message contributed; when a message shows up again its old
+contribution is subtracted before the new one is added. The ledger also
+keeps each message's time, so a member whose first or last message was
+replaced gets their times from it again.
+
+get_contact_chats and get_last_interaction read chat_members instead of
+scanning messages; the last message of a chat is the last message of its
+most recently active member, fetched by primary key. When the sidecar
+cannot be opened or written (a read-only directory, a full disk), they
+fall back to scanning messages and say so on stderr.
+
+Totals for a date range are the difference of two running totals, two
+index lookups whatever the range. Sender and media breakdowns are the same
+difference per sender and media type of the chat, so their cost grows with
+the number of senders, never with the length of the range; only the daily
+series (include_daily) reads one row per day.
+
+A background thread keeps the statistics up to date and calls answer from
+the last completed update (see indexing.py). Build or rebuild them ahead of
+the first call with:
+    python chatstats.py [--rebuild]
+"""
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
+import contacts
+import indexing
+import whatsapp
+from indexing import IndexNotReady
+
+UPDATE_BATCH_SIZE = 5000
+# Bumped when the tables change, so existing sidecars are rebuilt
+SCHEMA_VERSION = 4
+MAX_TOP_SENDERS = 500
+# Bounds of an open-ended date range
+FIRST_DAY = "0000-01-01"
+LAST_DAY = "9999-12-31"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value
+);
+CREATE TABLE IF NOT EXISTS counted (
+    chat_jid TEXT,
+    id TEXT,
+    day TEXT,
+    sender TEXT,
+    media_type TEXT,
+    is_from_me INTEGER,
+    member TEXT,
+    timestamp TEXT,
+    PRIMARY KEY (chat_jid, id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS counted_member ON counted (member, chat_jid, timestamp);
+CREATE TABLE IF NOT EXISTS chat_days (
+    chat_jid TEXT,
+    day TEXT,
+    messages INTEGER NOT NULL DEFAULT 0,
+    from_me INTEGER NOT NULL DEFAULT 0,
+    media INTEGER NOT NULL DEFAULT 0,
+    total_messages INTEGER NOT NULL DEFAULT 0,
+    total_from_me INTEGER NOT NULL DEFAULT 0,
+    total_media INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (chat_jid, day)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sender_days (
+    chat_jid TEXT,
+    sender TEXT,
+    day TEXT,
+    messages INTEGER NOT NULL DEFAULT 0,
+    total INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (chat_jid, sender, day)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS media_days (
+    chat_jid TEXT,
+    media_type TEXT,
+    day TEXT,
+    messages INTEGER NOT NULL DEFAULT 0,
+    total INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (chat_jid, media_type, day)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS chat_senders (
+    chat_jid TEXT,
+    sender TEXT,
+    messages INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (chat_jid, sender)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS chat_media_types (
+    chat_jid TEXT,
+    media_type TEXT,
+    messages INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (chat_jid, media_type)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS chat_members (
+    member TEXT,
+    chat_jid TEXT,
+    messages INTEGER NOT NULL DEFAULT 0,
+    first_seen TEXT,
+    last_seen TEXT,
+    last_message_id TEXT,
+    PRIMARY KEY (member, chat_jid)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS chat_members_last_seen ON chat_members (member, last_seen);
+CREATE INDEX IF NOT EXISTS chat_members_chat ON chat_members (chat_jid, last_seen);
+"""
+
+TABLES = (
+    "counted", "chat_days", "sender_days", "media_days", "chat_senders", "chat_media_types", "chat_members", "state"
+)
+# (per-day table, per-chat table, column) of each breakdown
+BREAKDOWNS = (("sender_days", "chat_senders", "sender"), ("media_days", "chat_media_types", "media_type"))
+
+
+def default_stats_db_path() -> str:
+    return os.environ.get("WHATSAPP_STATS_DB_PATH") or os.path.join(
+        os.path.dirname(whatsapp.MESSAGES_DB_PATH), "chat_stats.db"
+    )
+
+
+def member_of(chat_jid: str, sender: Optional[str], is_from_me) -> str:
+    """The number of the contact a message involves: its sender, or the other party of a direct chat for my messages."""
+    if is_from_me and not chat_jid.endswith("@g.us"):
+        return contacts.normalize_number(chat_jid)
+    return contacts.normalize_number(sender or "")
+
+
+# Timestamped messages with the contact each involves (see member_of): a
+# number, possibly with a server or device suffix
+_INVOLVED = """
+    SELECT chat_jid, id, timestamp,
+        CASE WHEN is_from_me AND chat_jid NOT LIKE '%@g.us' THEN chat_jid ELSE sender END AS contact
+    FROM messages
+    WHERE timestamp != ''
+"""
+
+
+def scan_contact_chats(jid: str, db_path: Optional[str] = None) -> List[Tuple[str, Optional[str]]]:
+    """ChatStats.contact_chats computed from the messages table, for when the sidecar is unavailable."""
+    conn = whatsapp.connect_db("contact_chats_scan", db_path, heavy=db_path is None)
+    try:
+        if contacts.is_group(jid):
+            chat_jids = [jid]
+        else:
+            number = contacts.normalize_number(jid)
+            chat_jids = [row[0] for row in conn.execute(f"""
+                SELECT DISTINCT chat_jid FROM ({_INVOLVED})
+                WHERE contact = ?1 OR contact GLOB ?1 || '[@:]*'
+            """, (number,)).fetchall()] if number else []
+        return [
+            (chat_jid, row[0] if row else None)
+            for chat_jid in chat_jids
+            for row in [conn.execute(
+                "SELECT id FROM messages WHERE chat_jid = ? AND timestamp != '' ORDER BY timestamp DESC LIMIT 1",
+                (chat_jid,)
+            ).fetchone()]
+        ]
+    finally:
+        conn.close()
+
+
+def scan_last_interaction(jid: str, db_path: Optional[str] = None) -> Optional[Tuple[str, str]]:
+    """ChatStats.last_interaction computed from the messages table, for when the sidecar is unavailable."""
+    conn = whatsapp.connect_db("last_interaction_scan", db_path, heavy=db_path is None)
+    try:
+        if contacts.is_group(jid):
+            return conn.execute(
+                "SELECT chat_jid, id FROM messages WHERE chat_jid = ? AND timestamp != '' ORDER BY timestamp DESC LIMIT 1",
+                (jid,)
+            ).fetchone()
+        number = contacts.normalize_number(jid)
+        if not number:
+            return None
+        return conn.execute(f"""
+            SELECT chat_jid, id FROM ({_INVOLVED})
+            WHERE contact = ?1 OR contact GLOB ?1 || '[@:]*'
+            ORDER BY timestamp DESC LIMIT 1
+        """, (number,)).fetchone()
+    finally:
+        conn.close()
+
+
+def _parse_date(name: str, value: Optional[str]) -> Optional[str]:
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value[:10]).isoformat()
+    except ValueError:
+        raise ValueError(f"Invalid date format for '{name}': {value}. Please use YYYY-MM-DD.")
+
+
+class ChatStats:
+    """Incrementally maintained per-chat statistics over the messages table."""
+
+    def __init__(self, stats_db_path: Optional[str] = None, db_path: Optional[str] = None):
+        self.stats_db_path = stats_db_path
+        self.db_path = db_path
+        self._update_lock = threading.Lock()
+        self._initialized = set()
+
+    def _connect(self) -> sqlite3.Connection:
+        path = self.stats_db_path or default_stats_db_path()
+        conn = whatsapp.connect_db("chat_stats", path, isolation_level=None, timeout=30)
+        if path not in self._initialized:
+            conn.execute("PRAGMA journal_mode=WAL").fetchone()
+            try:
+                state = dict(conn.execute("SELECT key, value FROM state").fetchall())
+            except sqlite3.OperationalError:
+                state = {}
+            if state and state.get("version") != SCHEMA_VERSION:
+                # Tables of an older layout; they are rebuilt on the next update
+                conn.executescript("".join(f"DROP TABLE IF EXISTS {table};" for table in TABLES))
+            conn.executescript(SCHEMA)
+            self._initialized.add(path)
+        return conn
+
+    def update(self, batch_size: int = UPDATE_BATCH_SIZE) -> int:
+        """Fold the messages added since the last update into the statistics.
+
+        Returns:
+            The number of message rows processed
+        """
+        with self._update_lock:
+            stats = self._connect()
+            source = whatsapp.connect_db("chat_stats_source", self.db_path)
+            try:
+                # Without taking the write lock, check whether there is anything to do
+                state = dict(stats.execute("SELECT key, value FROM state"))
+                max_rowid = source.execute("SELECT MAX(rowid) FROM messages").fetchone()[0] or 0
+                if (state.get("cursor") == max_rowid and state.get("version") == SCHEMA_VERSION
+                        and state.get("source") == (self.db_path or whatsapp.MESSAGES_DB_PATH)
+                        and state.get("built")):
+                    return 0
+
+                processed = 0
+                while True:
+                    count = self._update_batch(stats, source, batch_size)
+                    processed += count
+                    if count < batch_size:
+                        # Caught up with messages: from now on the statistics can be served
+                        stats.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('built', 1)")
+                        return processed
+            finally:
+                source.close()
+                stats.close()
+
+    def _update_batch(self, stats: sqlite3.Connection, source: sqlite3.Connection, batch_size: int) -> int:
+        # The write lock is taken before reading the cursor, so processes
+        # sharing the sidecar never fold in the same rows twice
+        stats.execute("BEGIN IMMEDIATE")
+        try:
+            state = dict(stats.execute("SELECT key, value FROM state"))
+            cursor = state.get("cursor", 0)
+            source_path = self.db_path or whatsapp.MESSAGES_DB_PATH
+            max_rowid = source.execute("SELECT MAX(rowid) FROM messages").fetchone()[0] or 0
+            if (state.get("source") != source_path or state.get("version") != SCHEMA_VERSION
+                    or max_rowid < cursor):
+                # A different or recreated messages.db, or older tables: start over
+                for table in TABLES:
+                    stats.execute(f"DELETE FROM {table}")
+                stats.executemany("INSERT INTO state (key, value) VALUES (?, ?)", (
+                    ("source", source_path),
+                    ("version", SCHEMA_VERSION)
+                ))
+                cursor = 0
+
+            rows = source.execute("""
+                SELECT rowid, chat_jid, id, timestamp, sender, media_type, is_from_me
+                FROM messages
+                WHERE rowid > ?
+                ORDER BY rowid
+                LIMIT ?
+            """, (cursor, batch_size)).fetchall()
+            if not rows:
+                stats.execute("COMMIT")
+                return 0
+
+            day_deltas = defaultdict(lambda: [0, 0, 0])
+            # column -> (chat, sender or media type, day) -> messages
+            breakdown_deltas = {column: defaultdict(int) for _, _, column in BREAKDOWNS}
+            # (member, chat) -> [messages, first seen, last seen, last message id]
+            member_deltas = defaultdict(lambda: [0, None, None, None])
+
+            def add(chat_jid, day, sender, media_type, is_from_me, sign):
+                totals = day_deltas[(chat_jid, day)]
+                totals[0] += sign
+                totals[1] += sign if is_from_me else 0
+                totals[2] += sign if media_type else 0
+                breakdown_deltas["sender"][(chat_jid, contacts.normalize_number(sender or ""), day)] += sign
+                if media_type:
+                    breakdown_deltas["media_type"][(chat_jid, media_type, day)] += sign
+                member_deltas[(member_of(chat_jid, sender, is_from_me), chat_jid)][0] += sign
+
+            ledger = []
+            replaced_members = set()
+            for _, chat_jid, message_id, timestamp, sender, media_type, is_from_me in rows:
+                if not timestamp:
+                    continue
+                old = stats.execute(
+                    "SELECT day, sender, media_type, is_from_me, member FROM counted WHERE chat_jid = ? AND id = ?",
+                    (chat_jid, message_id)
+                ).fetchone()
+                if old:
+                    add(chat_jid, *old[:4], -1)
+                    replaced_members.add((old[4], chat_jid))
+                timestamp = str(timestamp)
+                day = timestamp[:10]
+                media_type = media_type or ""
+                is_from_me = 1 if is_from_me else 0
+                member = member_of(chat_jid, sender, is_from_me)
+                add(chat_jid, day, sender, media_type, is_from_me, 1)
+                ledger.append((chat_jid, message_id, day, sender, media_type, is_from_me, member, timestamp))
+
+                seen = member_deltas[(member, chat_jid)]
+                if seen[1] is None or timestamp < seen[1]:
+                    seen[1] = timestamp
+                if seen[2] is None or timestamp >= seen[2]:
+                    seen[2] = timestamp
+                    seen[3] = message_id
+
+            stats.executemany("""
+                INSERT OR REPLACE INTO counted (chat_jid, id, day, sender, media_type, is_from_me, member, timestamp)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, ledger)
+            stats.executemany("""
+                INSERT INTO chat_days (chat_jid, day, messages, from_me, media) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (chat_jid, day) DO UPDATE SET
+                    messages = messages + excluded.messages,
+                    from_me = from_me + excluded.from_me,
+                    media = media + excluded.media
+            """, [key + tuple(values) for key, values in day_deltas.items() if any(values)])
+            for day_table, chat_table, column in BREAKDOWNS:
+                deltas = breakdown_deltas[column]
+                per_chat = defaultdict(int)
+                for (chat_jid, key, _), value in deltas.items():
+                    per_chat[(chat_jid, key)] += value
+                stats.executemany(f"""
+                    INSERT INTO {day_table} (chat_jid, {column}, day, messages) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (chat_jid, {column}, day) DO UPDATE SET messages = messages + excluded.messages
+                """, [key + (value,) for key, value in deltas.items() if value])
+                stats.executemany(f"""
+                    INSERT INTO {chat_table} (chat_jid, {column}, messages) VALUES (?, ?, ?)
+                    ON CONFLICT (chat_jid, {column}) DO UPDATE SET messages = messages + excluded.messages
+                """, [key + (value,) for key, value in per_chat.items() if value])
+            stats.executemany("""
+                INSERT INTO chat_members (member, chat_jid, messages, first_seen, last_seen, last_message_id)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (member, chat_jid) DO UPDATE SET
+                    messages = messages + excluded.messages,
+                    first_seen = MIN(first_seen, COALESCE(excluded.first_seen, first_seen)),
+                    last_seen = MAX(last_seen, COALESCE(excluded.last_seen, last_seen)),
+                    last_message_id = CASE WHEN excluded.last_seen >= last_seen
+                        THEN excluded.last_message_id ELSE last_message_id END
+            """, [key + tuple(values) for key, values in member_deltas.items()])
+
+            # Rows that lost their last message; only keys with a negative
+            # delta can have dropped to zero
+            stats.executemany(
+                "DELETE FROM chat_days WHERE chat_jid = ? AND day = ? AND messages = 0",
+                [key for key, values in day_deltas.items() if values[0] < 0]
+            )
+            for day_table, chat_table, column in BREAKDOWNS:
+                deltas = breakdown_deltas[column]
+                stats.executemany(
+                    f"DELETE FROM {day_table} WHERE chat_jid = ? AND {column} = ? AND day = ? AND messages = 0",
+                    [key for key, value in deltas.items() if value < 0]
+                )
+                stats.executemany(
+                    f"DELETE FROM {chat_table} WHERE chat_jid = ? AND {column} = ? AND messages <= 0",
+                    {key[:2] for key, value in deltas.items() if value < 0}
+                )
+            stats.executemany(
+                "DELETE FROM chat_members WHERE member = ? AND chat_jid = ? AND messages <= 0",
+                [key for key, values in member_deltas.items() if values[0] < 0]
+            )
+            # A replaced message may have been a member's first or last one;
+            # take their times from the ledger again
+            stats.executemany("""
+                UPDATE chat_members SET
+                    first_seen = (SELECT MIN(timestamp) FROM counted WHERE member = ?1 AND chat_jid = ?2),
+                    (last_seen, last_message_id) = (
+                        SELECT timestamp, id FROM counted WHERE member = ?1 AND chat_jid = ?2
+                        ORDER BY timestamp DESC LIMIT 1
+                    )
+                WHERE member = ?1 AND chat_jid = ?2
+            """, replaced_members)
+
+            first_changed_day = {}
+            for chat_jid, day in day_deltas:
+                first_changed_day[chat_jid] = min(day, first_changed_day.get(chat_jid, LAST_DAY))
+            for chat_jid, day in first_changed_day.items():
+                self._update_running_totals(stats, chat_jid, day)
+            for day_table, _, column in BREAKDOWNS:
+                first_changed_day = {}
+                for chat_jid, key, day in breakdown_deltas[column]:
+                    first_changed_day[(chat_jid, key)] = min(day, first_changed_day.get((chat_jid, key), LAST_DAY))
+                for (chat_jid, key), day in first_changed_day.items():
+                    self._update_breakdown_totals(stats, day_table, column, chat_jid, key, day)
+
+            stats.execute(
+                "INSERT OR REPLACE INTO state (key, value) VALUES ('cursor', ?)", (rows[-1][0],)
+            )
+            stats.execute("COMMIT")
+            return len(rows)
+        except BaseException:
+            stats.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _update_running_totals(stats: sqlite3.Connection, chat_jid: str, from_day: str):
+        """Recompute the running totals of a chat's days from from_day on.
+
+        New messages are almost always from today, so this usually touches
+        one row; a history sync touches the days after the oldest one synced.
+        """
+        previous = stats.execute("""
+            SELECT total_messages, total_from_me, total_media FROM chat_days
+            WHERE chat_jid = ? AND day < ?
+            ORDER BY day DESC LIMIT 1
+        """, (chat_jid, from_day)).fetchone() or (0, 0, 0)
+        total_messages, total_from_me, total_media = previous
+        updates = []
+        for day, messages, from_me, media in stats.execute("""
+            SELECT day, messages, from_me, media FROM chat_days
+            WHERE chat_jid = ? AND day >= ?
+            ORDER BY day
+        """, (chat_jid, from_day)).fetchall():
+            total_messages += messages
+            total_from_me += from_me
+            total_media += media
+            updates.append((total_messages, total_from_me, total_media, chat_jid, day))
+        stats.executemany("""
+            UPDATE chat_days SET total_messages = ?, total_from_me = ?, total_media = ?
+            WHERE chat_jid = ? AND day = ?
+        """, updates)
+
+    @staticmethod
+    def _update_breakdown_totals(
+        stats: sqlite3.Connection, table: str, column: str, chat_jid: str, key: str, from_day: str
+    ):
+        """Recompute the running totals of one sender or media type of a chat from from_day on."""
+        previous = stats.execute(f"""
+            SELECT total FROM {table}
+            WHERE chat_jid = ? AND {column} = ? AND day < ?
+            ORDER BY day DESC LIMIT 1
+        """, (chat_jid, key, from_day)).fetchone()
+        total = previous[0] if previous else 0
+        updates = []
+        for day, messages in stats.execute(f"""
+            SELECT day, messages FROM {table}
+            WHERE chat_jid = ? AND {column} = ? AND day >= ?
+            ORDER BY day
+        """, (chat_jid, key, from_day)).fetchall():
+            total += messages
+            updates.append((total, chat_jid, key, day))
+        stats.executemany(f"UPDATE {table} SET total = ? WHERE chat_jid = ? AND {column} = ? AND day = ?", updates)
+
+    def rebuild(self) -> int:
+        """Drop the statistics and build them again from every message."""
+        with self._update_lock:
+            stats = self._connect()
+            try:
+                stats.execute("DELETE FROM state")
+            finally:
+                stats.close()
+        return self.update()
+
+    def _connect_built(self) -> sqlite3.Connection:
+        """Connect to statistics that have been built for the current messages.db.
+
+        Raises:
+            IndexNotReady: If they are still being built
+        """
+        conn = self._connect()
+        state = dict(conn.execute("SELECT key, value FROM state"))
+        if not (state.get("built") and state.get("version") == SCHEMA_VERSION
+                and state.get("source") == (self.db_path or whatsapp.MESSAGES_DB_PATH)):
+            conn.close()
+            raise IndexNotReady(
+                "The chat statistics are still being built; try again shortly "
+                "(python chatstats.py builds them ahead of time)"
+            )
+        return conn
+
+    def contact_chats(self, jid: str) -> List[Tuple[str, Optional[str]]]:
+        """(chat JID, id of the chat's last message) for every chat involving a contact.
+
+        A group JID stands for the group itself. Until the statistics are
+        built, or when they cannot be read, messages are scanned instead.
+        """
+        try:
+            return self._contact_chats(jid)
+        except IndexNotReady:
+            pass
+        except sqlite3.Error as e:
+            print(f"Chat membership unavailable, scanning messages instead: {e}", file=sys.stderr)
+        return scan_contact_chats(jid, self.db_path)
+
+    def _contact_chats(self, jid: str) -> List[Tuple[str, Optional[str]]]:
+        conn = self._connect_built()
+        try:
+            if contacts.is_group(jid):
+                chat_jids = [jid]
+            else:
+                chat_jids = [row[0] for row in conn.execute(
+                    "SELECT chat_jid FROM chat_members WHERE member = ?", (contacts.normalize_number(jid),)
+                )]
+            return [
+                (chat_jid, row[0] if row else None)
+                for chat_jid in chat_jids
+                for row in [conn.execute(
+                    "SELECT last_message_id FROM chat_members WHERE chat_jid = ? ORDER BY last_seen DESC LIMIT 1",
+                    (chat_jid,)
+                ).fetchone()]
+            ]
+        finally:
+            conn.close()
+
+    def last_interaction(self, jid: str) -> Optional[Tuple[str, str]]:
+        """(chat JID, message id) of the most recent message involving a contact or group.
+
+        Until the statistics are built, or when they cannot be read, messages
+        are scanned instead.
+        """
+        try:
+            return self._last_interaction(jid)
+        except IndexNotReady:
+            pass
+        except sqlite3.Error as e:
+            print(f"Chat membership unavailable, scanning messages instead: {e}", file=sys.stderr)
+        return scan_last_interaction(jid, self.db_path)
+
+    def _last_interaction(self, jid: str) -> Optional[Tuple[str, str]]:
+        conn = self._connect_built()
+        try:
+            if contacts.is_group(jid):
+                return conn.execute(
+                    "SELECT chat_jid, last_message_id FROM chat_members WHERE chat_jid = ? ORDER BY last_seen DESC LIMIT 1",
+                    (jid,)
+                ).fetchone()
+            return conn.execute(
+                "SELECT chat_jid, last_message_id FROM chat_members WHERE member = ? ORDER BY last_seen DESC LIMIT 1",
+                (contacts.normalize_number(jid),)
+            ).fetchone()
+        finally:
+            conn.close()
+
+    def stats(
+        self,
+        chat_jid: str,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        top_senders: int = 10,
+        include_daily: bool = False
+    ) -> Dict[str, Any]:
+        """Message statistics of a chat between two dates (inclusive).
+
+        Raises:
+            IndexNotReady: If the statistics are still being built
+        """
+        start = _parse_date("start_date", start_date)
+        end = _parse_date("end_date", end_date)
+        top_senders = max(0, min(top_senders, MAX_TOP_SENDERS))
+
+        low, high = start or FIRST_DAY, end or LAST_DAY
+        conn = self._connect_built()
+        try:
+            def running_total(condition, bound):
+                return conn.execute(f"""
+                    SELECT total_messages, total_from_me, total_media FROM chat_days
+                    WHERE chat_jid = ? AND day {condition} ?
+                    ORDER BY day DESC LIMIT 1
+                """, (chat_jid, bound)).fetchone() or (0, 0, 0)
+
+            upto_end = running_total("<=", high)
+            before_start = running_total("<", low)
+            messages, from_me, media = (a - b for a, b in zip(upto_end, before_start))
+
+            first = conn.execute(
+                "SELECT day FROM chat_days WHERE chat_jid = ? AND day BETWEEN ? AND ? ORDER BY day LIMIT 1",
+                (chat_jid, low, high)
+            ).fetchone()
+            last = conn.execute(
+                "SELECT day FROM chat_days WHERE chat_jid = ? AND day BETWEEN ? AND ? ORDER BY day DESC LIMIT 1",
+                (chat_jid, low, high)
+            ).fetchone()
+
+            def breakdown(day_table, chat_table, column):
+                # Two running totals per sender or media type of the chat
+                return conn.execute(f"""
+                    SELECT {column}, count FROM (
+                        SELECT k.{column},
+                            COALESCE((
+                                SELECT total FROM {day_table} d
+                                WHERE d.chat_jid = k.chat_jid AND d.{column} = k.{column} AND d.day <= ?3
+                                ORDER BY d.day DESC LIMIT 1
+                            ), 0) - COALESCE((
+                                SELECT total FROM {day_table} d
+                                WHERE d.chat_jid = k.chat_jid AND d.{column} = k.{column} AND d.day < ?2
+                                ORDER BY d.day DESC LIMIT 1
+                            ), 0) AS count
+                        FROM {chat_table} k
+                        WHERE k.chat_jid = ?1
+                    )
+                    WHERE count > 0
+                    ORDER BY count DESC, {column}
+                """, (chat_jid, low, high)).fetchall()
+
+            senders, media_types = (breakdown(*tables) for tables in BREAKDOWNS)
+
+            result = {
+                "chat_jid": chat_jid,
+                "start_date": start,
+                "end_date": end,
+                "messages": messages,
+                "from_me": from_me,
+                "media": media,
+                "first_active_day": first[0] if first else None,
+                "last_active_day": last[0] if last else None,
+                "active_senders": len(senders),
+                "top_senders": [{"sender": sender, "messages": count} for sender, count in senders[:top_senders]],
+                "media_types": dict(media_types)
+            }
+            if include_daily:
+                result["daily"] = [
+                    {"day": day, "messages": count, "from_me": mine, "media": media_count}
+                    for day, count, mine, media_count in conn.execute("""
+                        SELECT day, messages, from_me, media FROM chat_days
+                        WHERE chat_jid = ? AND day BETWEEN ? AND ?
+                        ORDER BY day
+                    """, (chat_jid, low, high))
+                ]
+            return result
+        finally:
+            conn.close()
+
+
+_default_stats = ChatStats()
+_updates = indexing.register("chat_stats", _default_stats.update)
+
+
+def get_chat_stats(
+    chat_jid: str,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    top_senders: int = 10,
+    include_daily: bool = False
+) -> Dict[str, Any]:
+    """Return a chat's message statistics using the shared sidecar database."""
+    _updates.ensure_started()
+    return _default_stats.stats(chat_jid, start_date, end_date, top_senders, include_daily)
+
+
+def get_contact_chats(jid: str) -> List[Tuple[str, Optional[str]]]:
+    """Return the chats involving a contact using the shared sidecar database."""
+    _updates.ensure_started()
+    return _default_stats.contact_chats(jid)
+
+
+def get_last_interaction(jid: str) -> Optional[Tuple[str, str]]:
+    """Return the latest message involving a contact using the shared sidecar database."""
+    _updates.ensure_started()
+    return _default_stats.last_interaction(jid)
+
+
+if __name__ == "__main__":
+    started = time.perf_counter()
+    if "--rebuild" in sys.argv[1:]:
+        processed = _default_stats.rebuild()
+    else:
+        processed = _default_stats.update()
+    print(f"Processed {processed} messages into {default_stats_db_path()} "
+          f"in {time.perf_counter() - started:.1f}s", file=sys.stderr)
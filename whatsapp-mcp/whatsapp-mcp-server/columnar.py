@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+"""
+Columnar copies of the messages and chats tables for analytics.
+
+Reading history through the tools returns it row by row as formatted text.
+Analytics jobs can instead read Arrow IPC files kept in a directory of
+their own (WHATSAPP_COLUMNAR_DIR, by default columnar/ next to messages.db):
+
+    messages/month=YYYY-MM/part-<rowid>.arrow
+                 messages added since the previous catch-up, split by the
+                 month of their timestamp (UTC); named by their first rowid
+    chats.arrow  the chats table, rewritten on every catch-up
+    state.json   the rowid high-water mark and the source database
+
+catch_up() appends the rows added to messages since the last catch-up, the
+same rowid high-water mark the change feed uses, so it costs in proportion
+to the new messages only. Each batch's files are written under a temporary
+name and renamed, and the mark is saved after them; an interrupted
+catch-up repeats the batch and overwrites the same files. When the
+highest rowid in messages is below the mark, messages.db was recreated and
+the export starts over.
+
+The bridge stores messages with INSERT OR REPLACE, which gives a replaced
+row a new rowid, so a replaced message appears again in a later part.
+read_messages keeps only the newest copy of each message unless asked not
+to, and compact() merges each month's parts into one file without the
+replaced copies.
+
+The files are uncompressed so that read_messages can memory-map them: the
+columns are used in place from the page cache, without copying and without
+opening messages.db. Needs pyarrow (pip install "whatsapp-mcp-server[analytics]").
+
+Export ahead of time, or from cron, with:
+    python columnar.py [--compact] [--rebuild]
+"""
+import contextlib
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.ipc as ipc
+except ImportError:
+    pa = None
+
+try:
+    import fcntl
+except ImportError:  # Windows: exports are only serialized within a process
+    fcntl = None
+
+import whatsapp
+
+EXPORT_BATCH_SIZE = 100_000
+# Bumped when the file layout changes, so existing exports are rebuilt
+FORMAT_VERSION = 1
+NO_MONTH = "none"
+
+MESSAGE_COLUMNS = ("rowid", "id", "chat_jid", "sender", "content", "timestamp", "is_from_me", "media_type")
+CHAT_COLUMNS = ("jid", "name", "last_message_time")
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise RuntimeError('The columnar export needs pyarrow: pip install "whatsapp-mcp-server[analytics]"')
+
+
+def message_schema() -> "pa.Schema":
+    _require_pyarrow()
+    labels = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([
+        ("rowid", pa.int64()),
+        ("id", pa.string()),
+        ("chat_jid", labels),
+        ("sender", labels),
+        ("content", pa.string()),
+        ("timestamp", pa.timestamp("us", tz="UTC")),
+        ("is_from_me", pa.bool_()),
+        ("media_type", labels),
+    ])
+
+
+def chat_schema() -> "pa.Schema":
+    _require_pyarrow()
+    return pa.schema([
+        ("jid", pa.string()),
+        ("name", pa.string()),
+        ("last_message_time", pa.timestamp("us", tz="UTC")),
+    ])
+
+
+def default_columnar_dir() -> str:
+    return os.environ.get("WHATSAPP_COLUMNAR_DIR") or os.path.join(
+        os.path.dirname(whatsapp.MESSAGES_DB_PATH), "columnar"
+    )
+
+
+def _parse_timestamp(value) -> Optional[datetime]:
+    try:
+        parsed = datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _timestamps(values: Sequence[Optional[str]]) -> "pa.Array":
+    """Timestamps in UTC; times without an offset are taken as UTC and unparseable ones become null."""
+    try:
+        # Arrow parses the bridge's "YYYY-MM-DD HH:MM:SS.ffffff+00:00" itself
+        return pa.array(values, pa.string()).cast(pa.timestamp("us", tz="UTC"))
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.array([None if v is None else _parse_timestamp(v) for v in values], pa.timestamp("us", tz="UTC"))
+
+
+def _labels(values: Sequence[Optional[str]]) -> "pa.Array":
+    return pa.array(values, pa.string()).dictionary_encode()
+
+
+def _write_table(table: "pa.Table", path: str):
+    """Write an uncompressed Arrow IPC file under a temporary name and rename it into place."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f"{path}.tmp"
+    with pa.OSFile(temporary, "wb") as sink:
+        with ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(temporary, path)
+
+
+def _read_table(path: str, columns: Optional[Sequence[str]] = None) -> "pa.Table":
+    """Read an Arrow IPC file through a memory map; the columns reference the mapped pages."""
+    with pa.memory_map(path, "r") as source:
+        table = ipc.open_file(source).read_all()
+    return table.select(list(columns)) if columns else table
+
+
+def _month_dir(root: str, month: str) -> str:
+    return os.path.join(root, "messages", f"month={month}")
+
+
+class ColumnarExport:
+    """Month-partitioned Arrow IPC files appended to from the messages table."""
+
+    def __init__(self, directory: Optional[str] = None, db_path: Optional[str] = None):
+        self.directory = directory
+        self.db_path = db_path
+        self._lock = threading.Lock()
+
+    @property
+    def root(self) -> str:
+        return self.directory or default_columnar_dir()
+
+    def _source(self) -> str:
+        return self.db_path or whatsapp.MESSAGES_DB_PATH
+
+    def _load_state(self) -> Dict[str, Any]:
+        try:
+            with open(os.path.join(self.root, "state.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self, state: Dict[str, Any]):
+        path = os.path.join(self.root, "state.json")
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(state, f)
+        os.replace(f"{path}.tmp", path)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Serialize exports within this process and, where flock exists, across processes."""
+        with self._lock:
+            os.makedirs(self.root, exist_ok=True)
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.root, ".lock"), "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                yield
+
+    def catch_up(self, batch_size: int = EXPORT_BATCH_SIZE) -> int:
+        """Append the messages added since the last catch-up and rewrite the chats file.
+
+        Returns:
+            The number of message rows exported
+        """
+        _require_pyarrow()
+        with self._locked():
+            conn = whatsapp.connect_db("columnar_export", self.db_path, heavy=self.db_path is None)
+            try:
+                max_rowid = conn.execute("SELECT MAX(rowid) FROM messages").fetchone()[0] or 0
+                state = self._load_state()
+                if (state.get("version") != FORMAT_VERSION or state.get("source") != self._source()
+                        or max_rowid < state.get("cursor", 0)):
+                    # A different or recreated messages.db, or an older format: start over
+                    self._clear()
+                    state = {"version": FORMAT_VERSION, "source": self._source(), "cursor": 0}
+
+                exported = 0
+                while True:
+                    rows = conn.execute(f"""
+                        SELECT {", ".join(MESSAGE_COLUMNS)} FROM messages
+                        WHERE rowid > ? ORDER BY rowid LIMIT ?
+                    """, (state["cursor"], batch_size)).fetchall()
+                    if not rows:
+                        break
+                    self._write_batch(rows)
+                    state["cursor"] = rows[-1][0]
+                    self._save_state(state)
+                    exported += len(rows)
+                    if len(rows) < batch_size:
+                        break
+
+                chats = conn.execute(f"SELECT {', '.join(CHAT_COLUMNS)} FROM chats").fetchall()
+            finally:
+                conn.close()
+
+            jids, names, times = zip(*chats) if chats else ((), (), ())
+            _write_table(
+                pa.table([pa.array(jids, pa.string()), pa.array(names, pa.string()), _timestamps(times)],
+                         schema=chat_schema()),
+                os.path.join(self.root, "chats.arrow")
+            )
+            state["updated_at"] = time.time()
+            self._save_state(state)
+            return exported
+
+    def _write_batch(self, rows: List[tuple]):
+        rowids, ids, chat_jids, senders, contents, timestamps, from_me, media_types = zip(*rows)
+        table = pa.table([
+            pa.array(rowids, pa.int64()),
+            pa.array(ids, pa.string()),
+            _labels(chat_jids),
+            _labels(senders),
+            pa.array(contents, pa.string()),
+            _timestamps(timestamps),
+            pa.array([None if v is None else bool(v) for v in from_me], pa.bool_()),
+            _labels(media_types),
+        ], schema=message_schema())
+
+        months = pc.fill_null(pc.strftime(table["timestamp"], format="%Y-%m"), NO_MONTH)
+        for month in pc.unique(months).to_pylist():
+            part = table.filter(pc.equal(months, month))
+            first_rowid = part["rowid"][0].as_py()
+            _write_table(part, os.path.join(_month_dir(self.root, month), f"part-{first_rowid:012d}.arrow"))
+
+    def _clear(self):
+        shutil.rmtree(os.path.join(self.root, "messages"), ignore_errors=True)
+        for name in ("chats.arrow", "state.json"):
+            try:
+                os.remove(os.path.join(self.root, name))
+            except FileNotFoundError:
+                pass
+
+    def rebuild(self) -> int:
+        """Delete the exported files and export everything again."""
+        with self._locked():
+            self._clear()
+        return self.catch_up()
+
+    def months(self) -> List[str]:
+        """The exported months, oldest first ("none" for messages without a timestamp)."""
+        try:
+            entries = os.listdir(os.path.join(self.root, "messages"))
+        except FileNotFoundError:
+            return []
+        return sorted(entry.split("=", 1)[1] for entry in entries if entry.startswith("month="))
+
+    def _parts(self, month: str) -> List[str]:
+        directory = _month_dir(self.root, month)
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            return []
+        return [os.path.join(directory, name) for name in sorted(names) if name.endswith(".arrow")]
+
+    def read_messages(
+        self,
+        start_month: Optional[str] = None,
+        end_month: Optional[str] = None,
+        columns: Optional[Sequence[str]] = None,
+        latest_only: bool = True
+    ) -> "pa.Table":
+        """Memory-map the exported messages of a range of months (YYYY-MM, inclusive).
+
+        Args:
+            start_month: Optional first month to read
+            end_month: Optional last month to read
+            columns: Optional columns to keep (see MESSAGE_COLUMNS)
+            latest_only: Drop copies of messages that were replaced later (default True)
+
+        Returns:
+            A pyarrow Table; Table.column(name).to_numpy() gives NumPy arrays,
+            zero-copy for the numeric and timestamp columns without nulls
+        """
+        _require_pyarrow()
+        wanted = list(columns) if columns else list(MESSAGE_COLUMNS)
+        read_columns = list(dict.fromkeys(wanted + (["rowid", "id", "chat_jid"] if latest_only else [])))
+
+        tables = []
+        for month in self.months():
+            if month != NO_MONTH and ((start_month and month < start_month) or (end_month and month > end_month)):
+                continue
+            if month == NO_MONTH and (start_month or end_month):
+                continue
+            tables.extend(_read_table(path, read_columns) for path in self._parts(month))
+        if not tables:
+            return message_schema().empty_table().select(wanted)
+        # One dictionary per column across parts, so codes mean the same in every chunk
+        table = pa.concat_tables(tables).unify_dictionaries()
+        if latest_only:
+            table = _latest_copies(table)
+        return table.select(wanted)
+
+    def read_chats(self) -> "pa.Table":
+        """Memory-map the exported chats table."""
+        _require_pyarrow()
+        path = os.path.join(self.root, "chats.arrow")
+        if not os.path.exists(path):
+            return chat_schema().empty_table()
+        return _read_table(path)
+
+    def compact(self) -> int:
+        """Merge each month's parts into one file, dropping replaced copies of messages.
+
+        Returns:
+            The number of replaced copies dropped
+        """
+        _require_pyarrow()
+        with self._locked():
+            everything = []
+            for month in self.months():
+                everything.extend(_read_table(path, ["rowid", "id", "chat_jid"]) for path in self._parts(month))
+            if not everything:
+                return 0
+            keep = _latest_copies(pa.concat_tables(everything).unify_dictionaries())["rowid"]
+
+            dropped = 0
+            for month in self.months():
+                parts = self._parts(month)
+                table = pa.concat_tables([_read_table(path) for path in parts])
+                merged = table.filter(pc.is_in(table["rowid"], value_set=keep)).sort_by("rowid")
+                dropped += table.num_rows - merged.num_rows
+                if len(parts) == 1 and merged.num_rows == table.num_rows:
+                    continue
+                if merged.num_rows:
+                    # Unify the dictionaries of the merged parts into one per column
+                    merged = merged.combine_chunks().unify_dictionaries()
+                    target = os.path.join(_month_dir(self.root, month), f"part-{merged['rowid'][0].as_py():012d}.arrow")
+                    _write_table(merged, target)
+                else:
+                    target = None
+                for path in parts:
+                    if path != target:
+                        os.remove(path)
+            return dropped
+
+    def status(self) -> Dict[str, Any]:
+        """The high-water mark, the exported months and the size of the files."""
+        state = self._load_state()
+        size = 0
+        for directory, _, names in os.walk(self.root):
+            size += sum(os.path.getsize(os.path.join(directory, name)) for name in names)
+        return {
+            "directory": self.root,
+            "cursor": state.get("cursor"),
+            "updated_at": state.get("updated_at"),
+            "months": self.months(),
+            "bytes": size
+        }
+
+
+def _latest_copies(table: "pa.Table") -> "pa.Table":
+    """Keep the row with the highest rowid of each (id, chat_jid)."""
+    latest = table.select(["id", "chat_jid", "rowid"]).group_by(["id", "chat_jid"], use_threads=False).aggregate(
+        [("rowid", "max")]
+    )
+    if latest.num_rows == table.num_rows:
+        return table
+    return table.filter(pc.is_in(table["rowid"], value_set=latest["rowid_max"]))
+
+
+_default_export = ColumnarExport()
+
+
+def catch_up() -> int:
+    """Bring the shared columnar export up to date."""
+    return _default_export.catch_up()
+
+
+def read_messages(
+    start_month: Optional[str] = None,
+    end_month: Optional[str] = None,
+    columns: Optional[Sequence[str]] = None,
+    latest_only: bool = True
+) -> "pa.Table":
+    """Memory-map messages from the shared columnar export."""
+    return _default_export.read_messages(start_month, end_month, columns, latest_only)
+
+
+def read_chats() -> "pa.Table":
+    """Memory-map the chats of the shared columnar export."""
+    return _default_export.read_chats()
+
+
+if __name__ == "__main__":
+    started = time.perf_counter()
+    if "--rebuild" in sys.argv[1:]:
+        exported = _default_export.rebuild()
+    else:
+        exported = _default_export.catch_up()
+    print(f"Exported {exported} messages to {_default_export.root} "
+          f"in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    if "--compact" in sys.argv[1:]:
+        dropped = _default_export.compact()
+        print(f"Compacted, dropping {dropped} replaced copies", file=sys.stderr)
@@ -0,0 +1,236 @@
+"""
+In-memory contact index for resolving phone numbers, JIDs and names.
+
+Resolving a sender used to run `jid LIKE '%<number>%'` against chats, a
+full scan that also matches the wrong contact when one number is contained
+in another. The index instead maps:
+
+    JID        every chat's JID to its name (exact)
+    number     the digits of each direct chat's user part, for phone number
+               JIDs (@s.whatsapp.net) and LIDs (@lid) alike (exact)
+    trigram    every three-character substring of a direct chat's folded
+               name and number, for substring and fuzzy search
+
+The bridge writes chats with INSERT OR REPLACE, which gives an updated row
+a new rowid, so the index catches up by reading only the rows past the
+largest rowid it has seen. PRAGMA data_version on a long-lived connection
+tells whether anything was committed since the last lookup; when nothing
+was, a lookup costs one PRAGMA.
+"""
+import re
+import threading
+import unicodedata
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
+
+# Share of a query's trigrams a name must contain to count as a fuzzy match
+FUZZY_THRESHOLD = 0.5
+
+_NON_DIGITS = re.compile(r"\D")
+_EMPTY = array("i")
+
+
+def normalize_number(value: str) -> str:
+    """Digits of a phone number, JID or LID, e.g. "+1 (555) 010-9999" -> "15550109999"."""
+    user = value.strip().split("@")[0].split(":")[0]
+    digits = _NON_DIGITS.sub("", user)
+    if user.startswith("00"):
+        digits = digits[2:]
+    return digits
+
+
+def fold(text: str) -> str:
+    """Lowercase and strip accents, so "José" matches "jose"."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def trigrams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def is_group(jid: str) -> bool:
+    return jid.endswith("@g.us")
+
+
+class ContactIndex:
+    """Chats indexed by JID, normalized number and name trigrams."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._conn = None
+        self._db_path = None
+        self._data_version = None
+        self._reset()
+
+    def _reset(self):
+        self._high_water = 0
+        self._names: Dict[str, Optional[str]] = {}
+        self._by_number: Dict[str, Tuple[str, ...]] = {}
+        # Direct chats get a small integer id; a trigram's posting is a
+        # sorted array of ids, 4 bytes an entry
+        self._ids: Dict[str, int] = {}
+        self._jids: List[str] = []
+        self._keys: List[str] = []
+        self._by_trigram: Dict[str, array] = {}
+
+    def refresh(self):
+        """Catch up with chats added or updated since the last call."""
+        import whatsapp
+
+        with self._lock:
+            if self._conn is None or self._db_path != whatsapp.MESSAGES_DB_PATH:
+                if self._conn is not None:
+                    self._conn.close()
+                self._db_path = whatsapp.MESSAGES_DB_PATH
+                self._conn = whatsapp.connect_db(
+                    "contact_index", self._db_path, isolation_level=None, check_same_thread=False
+                )
+                self._data_version = None
+                self._reset()
+
+            version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if version == self._data_version:
+                return
+            self._data_version = version
+
+            max_rowid = self._conn.execute("SELECT MAX(rowid) FROM chats").fetchone()[0] or 0
+            if max_rowid < self._high_water:
+                self._reset()  # the database was recreated
+            for rowid, jid, name in self._conn.execute(
+                "SELECT rowid, jid, name FROM chats WHERE rowid > ? ORDER BY rowid", (self._high_water,)
+            ):
+                self._add(jid, name)
+                self._high_water = rowid
+
+    def _add(self, jid: str, name: Optional[str]):
+        if jid in self._names and self._names[jid] == name:
+            return  # the bridge rewrites a chat's row on every message
+        self._names[jid] = name
+        if is_group(jid):
+            return
+
+        number = normalize_number(jid)
+        contact_id = self._ids.get(jid)
+        if contact_id is None:
+            contact_id = self._ids[jid] = len(self._jids)
+            self._jids.append(jid)
+            self._keys.append("")
+            if number:
+                self._by_number[number] = self._by_number.get(number, ()) + (jid,)
+        else:
+            self._unindex(contact_id)
+
+        key = f"{fold(name or '')} {number}"
+        self._keys[contact_id] = key
+        for trigram in trigrams(key):
+            posting = self._by_trigram.get(trigram)
+            if posting is None:
+                self._by_trigram[trigram] = array("i", (contact_id,))
+            elif posting[-1] < contact_id:
+                posting.append(contact_id)
+            else:
+                posting.insert(bisect_left(posting, contact_id), contact_id)
+
+    def _unindex(self, contact_id: int):
+        for trigram in trigrams(self._keys[contact_id]):
+            posting = self._by_trigram[trigram]
+            del posting[bisect_left(posting, contact_id)]
+            if not posting:
+                del self._by_trigram[trigram]
+
+    def resolve(self, value: str) -> Optional[Tuple[str, Optional[str]]]:
+        """Find the chat of a JID, LID or phone number; returns (jid, name) or None.
+
+        An exact JID wins. Otherwise the digits must equal a direct chat's
+        number exactly; a phone number JID is preferred over a LID.
+        """
+        self.refresh()
+        with self._lock:
+            if value in self._names:
+                return value, self._names[value]
+            number = normalize_number(value)
+            jids = self._by_number.get(number) if number else None
+            if not jids:
+                return None
+            jid = min(jids, key=lambda j: (not j.endswith("@s.whatsapp.net"), j))
+            return jid, self._names.get(jid)
+
+    def search(self, query: str, limit: int = 50) -> List[Tuple[str, Optional[str]]]:
+        """Direct chats matching query, best first, as (jid, name) pairs.
+
+        Exact JID and number matches come first, then names and numbers
+        containing the query (ordered by name), then fuzzy matches sharing
+        most of the query's trigrams (ordered by similarity).
+        """
+        self.refresh()
+        folded = fold(query.strip())
+        if not folded:
+            return []
+
+        with self._lock:
+            exact = []
+            resolved = folded if folded in self._names else None
+            if resolved and not is_group(resolved):
+                exact.append(resolved)
+            number = "" if any(c.isalpha() for c in folded) else normalize_number(folded)
+            exact.extend(sorted(self._by_number.get(number, ())))
+
+            query_trigrams = trigrams(folded)
+            if "@" in folded or not query_trigrams:
+                # Too short for trigrams, or part of a JID: check every contact
+                substring = [jid for jid, contact_id in self._ids.items()
+                             if folded in self._keys[contact_id] or folded in jid]
+                fuzzy = []
+            else:
+                postings = sorted((self._by_trigram.get(t, _EMPTY) for t in query_trigrams), key=len)
+                # A name containing the query contains all of its trigrams,
+                # so the shortest posting holds every substring match
+                contained = [contact_id for contact_id in postings[0] if folded in self._keys[contact_id]]
+                substring = [self._jids[contact_id] for contact_id in contained]
+
+                fuzzy = []
+                if len(exact) + len(substring) < limit:
+                    shared = Counter()
+                    for posting in postings:
+                        shared.update(posting)
+                    for contact_id in contained:
+                        del shared[contact_id]
+                    needed = FUZZY_THRESHOLD * len(query_trigrams)
+                    fuzzy = [
+                        self._jids[contact_id] for contact_id in sorted(
+                            (contact_id for contact_id, count in shared.items() if count >= needed),
+                            key=lambda contact_id: (-shared[contact_id], len(self._keys[contact_id]), contact_id)
+                        )
+                    ]
+
+            substring.sort(key=lambda jid: (self._names.get(jid) or "", jid))
+            results, seen = [], set()
+            for jid in exact + substring + fuzzy:
+                if jid not in seen:
+                    seen.add(jid)
+                    results.append((jid, self._names.get(jid)))
+                    if len(results) == limit:
+                        break
+            return results
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_default_index = ContactIndex()
+
+
+def resolve(value: str) -> Optional[Tuple[str, Optional[str]]]:
+    """Resolve a JID, LID or phone number using the shared index."""
+    return _default_index.resolve(value)
+
+
+def search(query: str, limit: int = 50) -> List[Tuple[str, Optional[str]]]:
+    """Search direct chats by name or number using the shared index."""
+    return _default_index.search(query, limit)
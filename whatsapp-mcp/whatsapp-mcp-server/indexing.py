@@ -0,0 +1,123 @@
+"""
+Background upkeep of the sidecar indexes.
+
+The chat statistics (chatstats.py), the similarity index (similarity.py),
+the semantic index (semantic.py) and the conversation sessions
+(sessions.py) are brought up to date from the rows added to messages
+since their last update. Building one from scratch reads every message,
+which takes from seconds to minutes on a large database, and even a
+catch-up is work a tool call should not wait for: the stdio server would
+not answer anything else meanwhile.
+
+So tool calls never update an index. Each index has a thread of its own
+that updates it every WHATSAPP_INDEX_INTERVAL seconds (default 2), started
+the first time one of its tools is called, or at startup for the indexes
+listed in WHATSAPP_BUILD_INDEXES (comma-separated names, or "all"). Calls
+answer from the last completed update, so they may miss the messages of
+the last few seconds. Until an index has been built once, its tools raise
+IndexNotReady; running the index's module (e.g. python chatstats.py)
+builds it ahead of time.
+"""
+import importlib
+import os
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+DEFAULT_INTERVAL = 2.0
+
+# The module that registers each index, imported to start its updater
+INDEX_MODULES = {
+    "chat_stats": "chatstats",
+    "similarity": "similarity",
+    "semantic": "semantic",
+    "sessions": "sessions",
+}
+
+
+class IndexNotReady(RuntimeError):
+    """An index has not been built yet."""
+
+
+class BackgroundUpdater:
+    """A daemon thread calling an index's update() every interval seconds."""
+
+    def __init__(self, name: str, update: Callable[[], int], interval: Optional[float] = None):
+        self.name = name
+        self.update = update
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._wake = threading.Event()
+        self.updates = 0
+        self.processed = 0
+        self.last_update: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def ensure_started(self):
+        """Start the thread unless it is running."""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"index-{self.name}", daemon=True)
+                self._thread.start()
+
+    def wake(self):
+        """Run the next update now rather than at the end of the interval."""
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            try:
+                self.processed += self.update()
+                self.updates += 1
+                self.last_update = time.time()
+                if self.last_error is not None:
+                    print(f"Updating the {self.name} index works again", file=sys.stderr)
+                self.last_error = None
+            except Exception as e:
+                # Logged once per distinct error; the update is retried every interval
+                if str(e) != self.last_error:
+                    print(f"Updating the {self.name} index failed: {e}", file=sys.stderr)
+                self.last_error = str(e)
+            self._wake.wait(self.interval if self.interval is not None else interval_from_env())
+            self._wake.clear()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "running": self._thread is not None,
+            "updates": self.updates,
+            "processed": self.processed,
+            "last_update": self.last_update,
+            "last_error": self.last_error
+        }
+
+
+UPDATERS: Dict[str, BackgroundUpdater] = {}
+
+
+def interval_from_env() -> float:
+    try:
+        return float(os.environ.get("WHATSAPP_INDEX_INTERVAL", str(DEFAULT_INTERVAL)))
+    except ValueError:
+        return DEFAULT_INTERVAL
+
+
+def register(name: str, update: Callable[[], int]) -> BackgroundUpdater:
+    """Create the shared updater of an index."""
+    updater = UPDATERS[name] = BackgroundUpdater(name, update)
+    return updater
+
+
+def start_from_env():
+    """Start the updaters named in WHATSAPP_BUILD_INDEXES."""
+    names = [name.strip() for name in os.environ.get("WHATSAPP_BUILD_INDEXES", "").split(",") if name.strip()]
+    for name in (list(INDEX_MODULES) if names == ["all"] else names):
+        if name not in INDEX_MODULES:
+            print(f"Unknown index '{name}' in WHATSAPP_BUILD_INDEXES; expected one of: "
+                  f"{', '.join(INDEX_MODULES)} or all", file=sys.stderr)
+            continue
+        importlib.import_module(INDEX_MODULES[name])
+        UPDATERS[name].ensure_started()
@@ -3,33 +3,49 @@ from mcp.server.fastmcp import FastMCP
 import sys
 import traceback
 import os
+import sqlite3
 from whatsapp import (
     search_contacts as whatsapp_search_contacts,
     list_messages as whatsapp_list_messages,
+    search_facets as whatsapp_search_facets,
+    format_messages_list as whatsapp_format_messages_list,
     list_chats as whatsapp_list_chats,
     get_chat as whatsapp_get_chat,
     get_direct_chat_by_contact as whatsapp_get_direct_chat_by_contact,
     get_contact_chats as whatsapp_get_contact_chats,
     get_last_interaction as whatsapp_get_last_interaction,
     get_message_context as whatsapp_get_message_context,
+    export_chat as whatsapp_export_chat,
+    resolve_export_path as whatsapp_resolve_export_path,
     send_message as whatsapp_send_message,
     send_file as whatsapp_send_file,
     send_audio_message as whatsapp_audio_voice_message,
     download_media as whatsapp_download_media
 )
+from changefeed import get_message_changes as whatsapp_get_message_changes
+from chatstats import get_chat_stats as whatsapp_get_chat_stats
+from analytics import get_chat_activity as whatsapp_get_chat_activity
+from scan import scan_messages as whatsapp_scan_messages
+from similarity import find_similar_messages as whatsapp_find_similar_messages
+from semantic import semantic_search_messages as whatsapp_semantic_search_messages
+from sessions import get_conversation as whatsapp_get_conversation
+from serialization import dumps
+import indexing
+import metrics
+import profiling
 
-# Initialize FastMCP server
-mcp = FastMCP("whatsapp")
+# Initialize FastMCP server; every tool records calls, errors and latency
+mcp = metrics.instrument_tools(FastMCP("whatsapp"))
 
 @mcp.tool()
-def search_contacts(query: str) -> List[Dict[str, Any]]:
+def search_contacts(query: str) -> str:
     """Search WhatsApp contacts by name or phone number.
     
     Args:
         query: Search term to match against contact names or phone numbers
     """
     contacts = whatsapp_search_contacts(query)
-    return contacts
+    return dumps(contacts)
 
 @mcp.tool()
 def list_messages(
@@ -42,8 +58,9 @@ def list_messages(
     page: int = 0,
     include_context: bool = True,
     context_before: int = 1,
-    context_after: int = 1
-) -> List[Dict[str, Any]]:
+    context_after: int = 1,
+    output_format: str = "text"
+) -> str:
     """Get WhatsApp messages matching specified criteria with optional context.
     
     Args:
@@ -57,7 +74,12 @@ def list_messages(
         include_context: Whether to include messages before and after matches (default True)
         context_before: Number of messages to include before each match (default 1)
         context_after: Number of messages to include after each match (default 1)
+        output_format: "text" for human-readable lines or "json" for a compact JSON array
+                       of message records (default "text")
     """
+    if output_format not in ("text", "json"):
+        raise ValueError(f"Invalid output_format: {output_format}. Use 'text' or 'json'.")
+
     messages = whatsapp_list_messages(
         after=after,
         before=before,
@@ -70,7 +92,39 @@ def list_messages(
         context_before=context_before,
         context_after=context_after
     )
-    return messages
+    if output_format == "json":
+        return dumps(messages)
+    return whatsapp_format_messages_list(messages, show_chat_info=True)
+
+@mcp.tool()
+def search_facets(
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    sender_phone_number: Optional[str] = None,
+    chat_jid: Optional[str] = None,
+    query: Optional[str] = None,
+    limit: int = 20,
+    page: int = 0,
+    facet_limit: int = 10
+) -> str:
+    """Search WhatsApp messages and count the matches per chat, sender, media type and day in one call.
+    
+    Args:
+        after: Optional ISO-8601 formatted string to only match messages after this date
+        before: Optional ISO-8601 formatted string to only match messages before this date
+        sender_phone_number: Optional phone number to filter messages by sender
+        chat_jid: Optional chat JID to filter messages by chat
+        query: Optional search term to filter messages by content
+        limit: Maximum number of messages to return (default 20, at most 200)
+        page: Page number for pagination (default 0)
+        facet_limit: Number of chats and senders with the most matches to count (default 10, at most 100)
+    
+    Returns:
+        JSON with the total number of matches, the page of messages (newest first) and the
+        counts per chat, sender, media type and day (newest first)
+    """
+    result = whatsapp_search_facets(after, before, sender_phone_number, chat_jid, query, limit, page, facet_limit)
+    return dumps(result)
 
 @mcp.tool()
 def list_chats(
@@ -79,7 +133,7 @@ def list_chats(
     page: int = 0,
     include_last_message: bool = True,
     sort_by: str = "last_active"
-) -> List[Dict[str, Any]]:
+) -> str:
     """Get WhatsApp chats matching specified criteria.
     
     Args:
@@ -96,10 +150,10 @@ def list_chats(
         include_last_message=include_last_message,
         sort_by=sort_by
     )
-    return chats
+    return dumps(chats)
 
 @mcp.tool()
-def get_chat(chat_jid: str, include_last_message: bool = True) -> Dict[str, Any]:
+def get_chat(chat_jid: str, include_last_message: bool = True) -> str:
     """Get WhatsApp chat metadata by JID.
     
     Args:
@@ -107,20 +161,20 @@ def get_chat(chat_jid: str, include_last_message: bool = True) -> Dict[str, Any]
         include_last_message: Whether to include the last message (default True)
     """
     chat = whatsapp_get_chat(chat_jid, include_last_message)
-    return chat
+    return dumps(chat)
 
 @mcp.tool()
-def get_direct_chat_by_contact(sender_phone_number: str) -> Dict[str, Any]:
+def get_direct_chat_by_contact(sender_phone_number: str) -> str:
     """Get WhatsApp chat metadata by sender phone number.
     
     Args:
         sender_phone_number: The phone number to search for
     """
     chat = whatsapp_get_direct_chat_by_contact(sender_phone_number)
-    return chat
+    return dumps(chat)
 
 @mcp.tool()
-def get_contact_chats(jid: str, limit: int = 20, page: int = 0) -> List[Dict[str, Any]]:
+def get_contact_chats(jid: str, limit: int = 20, page: int = 0) -> str:
     """Get all WhatsApp chats involving the contact.
     
     Args:
@@ -129,7 +183,7 @@ def get_contact_chats(jid: str, limit: int = 20, page: int = 0) -> List[Dict[str
         page: Page number for pagination (default 0)
     """
     chats = whatsapp_get_contact_chats(jid, limit, page)
-    return chats
+    return dumps(chats)
 
 @mcp.tool()
 def get_last_interaction(jid: str) -> str:
@@ -145,17 +199,260 @@ def get_last_interaction(jid: str) -> str:
 def get_message_context(
     message_id: str,
     before: int = 5,
-    after: int = 5
-) -> Dict[str, Any]:
+    after: int = 5,
+    chat_jid: Optional[str] = None
+) -> str:
     """Get context around a specific WhatsApp message.
     
     Args:
         message_id: The ID of the message to get context for
         before: Number of messages to include before the target message (default 5)
         after: Number of messages to include after the target message (default 5)
+        chat_jid: Optional JID of the message's chat; required when the ID exists in several chats
+    """
+    context = whatsapp_get_message_context(message_id, before, after, chat_jid)
+    return dumps(context)
+
+@mcp.tool()
+def get_conversation(
+    message_id: Optional[str] = None,
+    chat_jid: Optional[str] = None,
+    at: Optional[str] = None,
+    limit: int = 2000
+) -> str:
+    """Get a whole WhatsApp conversation: a run of a chat's messages with no gap longer than an hour.
+    
+    Pass message_id to get the conversation the message belongs to, or chat_jid alone for the
+    chat's latest conversation, or chat_jid and at for the conversation going on at that time
+    (the one before it when at falls between two).
+    
+    Args:
+        message_id: Optional ID of a message in the conversation
+        chat_jid: Optional chat JID; required without message_id
+        at: Optional ISO-8601 formatted string of a time in the conversation
+        limit: Maximum number of messages to return, oldest first (default 2000, at most 2000)
+    
+    Returns:
+        JSON with the conversation's messages, its first and last message time, whether it was
+        cut at limit, and the end of the previous and the start of the next conversation in the
+        chat (pass either as at to move between conversations)
+    """
+    conversation = whatsapp_get_conversation(message_id, chat_jid, at, limit)
+    return dumps(conversation)
+
+@mcp.tool()
+def get_message_changes(
+    cursor: Optional[int] = None,
+    limit: int = 100,
+    chat_jid: Optional[str] = None,
+    wait_seconds: float = 0
+) -> str:
+    """Get WhatsApp messages received, sent or updated since a previous call, for polling workflows.
+    
+    Call once without a cursor to get the current position, then pass the returned
+    cursor back on every call. A message that was updated is returned again.
+    
+    Args:
+        cursor: The cursor returned by the previous call (omit to start from now)
+        limit: Maximum number of messages to return (default 100, at most 1000)
+        chat_jid: Optional chat JID to only return changes in this chat
+        wait_seconds: Wait up to this many seconds for new messages when there are none (default 0, at most 30)
+    
+    Returns:
+        JSON with the messages, the next cursor and whether more changes are available
+    """
+    changes = whatsapp_get_message_changes(cursor, limit, chat_jid, wait_seconds)
+    return dumps(changes)
+
+@mcp.tool()
+def get_chat_stats(
+    chat_jid: str,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    top_senders: int = 10,
+    include_daily: bool = False
+) -> str:
+    """Get message statistics for a WhatsApp chat without paging through its messages.
+    
+    Args:
+        chat_jid: The JID of the chat
+        start_date: Optional first day to include, as YYYY-MM-DD
+        end_date: Optional last day to include, as YYYY-MM-DD
+        top_senders: Number of most active senders to list (default 10)
+        include_daily: Whether to include the message count of every active day (default False)
+    
+    Returns:
+        JSON with message, from-me and media counts, the first and last active day,
+        the number of active senders, the top senders and counts per media type
+    """
+    stats = whatsapp_get_chat_stats(chat_jid, start_date, end_date, top_senders, include_daily)
+    return dumps(stats)
+
+@mcp.tool()
+def get_chat_activity(
+    chat_jid: str,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    utc_offset_hours: float = 0,
+    top_senders: int = 10
+) -> str:
+    """Get when a WhatsApp chat is active and how quickly each side replies.
+    
+    Args:
+        chat_jid: The JID of the chat
+        after: Optional ISO-8601 formatted string to only count messages after this date
+        before: Optional ISO-8601 formatted string to only count messages before this date
+        utc_offset_hours: Offset from UTC of the local time for hours and weekdays (default 0)
+        top_senders: Number of most active senders to list (default 10)
+    
+    Returns:
+        JSON with a weekday by hour heatmap of message counts, the most active hours,
+        the top senders and the median and p90 time in seconds for me to reply to the
+        other side and for them to reply to me
+    """
+    activity = whatsapp_get_chat_activity(chat_jid, after, before, utc_offset_hours, top_senders)
+    return dumps(activity)
+
+@mcp.tool()
+def scan_messages(
+    pattern: Optional[str] = None,
+    all_keywords: Optional[List[str]] = None,
+    any_keywords: Optional[List[str]] = None,
+    none_keywords: Optional[List[str]] = None,
+    ignore_case: bool = True,
+    ignore_diacritics: bool = True,
+    chat_jid: Optional[str] = None,
+    sender_phone_number: Optional[str] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    limit: int = 100,
+    cursor: Optional[int] = None
+) -> str:
+    """Scan WhatsApp messages for a regular expression and/or keywords.
+    
+    Use this instead of list_messages when a plain substring query is not enough.
+    Each page holds the most recently stored matches, sorted newest first; messages
+    loaded later by history sync can appear on a later page than their date suggests.
+    
+    Args:
+        pattern: Optional regular expression to search for in message content
+        all_keywords: Optional keywords that must all appear
+        any_keywords: Optional keywords of which at least one must appear
+        none_keywords: Optional keywords that must not appear
+        ignore_case: Match regardless of case (default True)
+        ignore_diacritics: Match regardless of accents, so "cafe" matches "café" (default True)
+        chat_jid: Optional chat JID to only scan this chat
+        sender_phone_number: Optional phone number to only scan messages from this sender
+        after: Optional ISO-8601 formatted string to only scan messages after this date
+        before: Optional ISO-8601 formatted string to only scan messages before this date
+        limit: Maximum number of messages to return (default 100, at most 1000)
+        cursor: The cursor returned by a previous call, to continue that scan
+    
+    Returns:
+        JSON with the matching messages, the cursor to continue from, whether more
+        matches may follow and the number of messages read. Fails if the pattern is
+        too slow to match (WHATSAPP_SCAN_CHUNK_SECONDS per range of messages)
     """
-    context = whatsapp_get_message_context(message_id, before, after)
-    return context
+    result = whatsapp_scan_messages(
+        pattern, all_keywords, any_keywords, none_keywords, ignore_case, ignore_diacritics,
+        chat_jid, sender_phone_number, after, before, limit, cursor
+    )
+    return dumps(result)
+
+@mcp.tool()
+def find_similar_messages(
+    message_id: Optional[str] = None,
+    chat_jid: Optional[str] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    threshold: float = 0.7,
+    limit: int = 20
+) -> str:
+    """Find near-duplicate WhatsApp messages, such as a forwarded message with small edits.
+    
+    With message_id, returns the messages most similar to that message. Without it,
+    returns clusters of near-identical messages sent in a time window (the last 24
+    hours when after and before are omitted), largest first.
+    
+    Args:
+        message_id: Optional ID of the message to find near-duplicates of
+        chat_jid: Optional chat of message_id, or the chat to look for clusters in
+        after: Optional ISO-8601 formatted string to only cluster messages after this date
+        before: Optional ISO-8601 formatted string to only cluster messages before this date
+        threshold: Minimum estimated similarity of the text, from 0 to 1 (default 0.7)
+        limit: Maximum number of messages or clusters to return (default 20)
+    
+    Returns:
+        JSON with the similar messages and their similarity, or the clusters with their size,
+        number of chats, first and last message time and a few of their messages
+    """
+    result = whatsapp_find_similar_messages(message_id, chat_jid, after, before, threshold, limit)
+    return dumps(result)
+
+@mcp.tool()
+def semantic_search_messages(
+    query: str,
+    chat_jid: Optional[str] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    limit: int = 20
+) -> str:
+    """Search WhatsApp messages by relevance to a question or description, across all chats.
+    
+    Unlike list_messages' query, messages do not need to contain the query verbatim: they are
+    ranked by how many of its words (or words sharing their stem) they use, rare words counting most.
+    
+    Args:
+        query: Words or a question describing the messages to find
+        chat_jid: Optional chat JID to only search one chat
+        after: Optional ISO-8601 formatted string to only return messages after this date
+        before: Optional ISO-8601 formatted string to only return messages before this date
+        limit: Maximum number of messages to return (default 20, at most 200)
+    
+    Returns:
+        JSON with the number of messages searched and matched, and the best matches with
+        their score (from 0 to 1), most relevant first
+    """
+    result = whatsapp_semantic_search_messages(query, chat_jid, after, before, limit)
+    return dumps(result)
+
+@mcp.tool()
+def export_chat(
+    chat_jid: str,
+    output_path: str,
+    format: str = "ndjson",
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    sender_phone_number: Optional[str] = None
+) -> Dict[str, Any]:
+    """Export the full message history of a WhatsApp chat to a file, oldest first.
+    
+    Args:
+        chat_jid: The JID of the chat to export
+        output_path: The file to write, relative to the server's export directory
+            (WHATSAPP_EXPORT_DIR); absolute paths and ".." are rejected
+        format: "ndjson" (one JSON message per line) or "csv" (default "ndjson")
+        after: Optional ISO-8601 formatted string to only export messages after this date
+        before: Optional ISO-8601 formatted string to only export messages before this date
+        sender_phone_number: Optional phone number to only export messages from this sender
+    
+    Returns:
+        A dictionary containing success status, a status message, the file path and the message count
+    """
+    try:
+        file_path = whatsapp_resolve_export_path(output_path)
+        count = whatsapp_export_chat(chat_jid, output_path, format, after, before, sender_phone_number)
+    except (ValueError, OSError, sqlite3.Error) as e:
+        return {
+            "success": False,
+            "message": str(e)
+        }
+    return {
+        "success": True,
+        "message": f"Exported {count} messages",
+        "file_path": file_path,
+        "count": count
+    }
 
 @mcp.tool()
 def send_message(
@@ -249,6 +546,16 @@ def download_media(message_id: str, chat_jid: str) -> Dict[str, Any]:
             "message": "Failed to download media"
         }
 
+@mcp.tool()
+def get_server_stats() -> str:
+    """Get this server process's metrics since it started.
+    
+    Returns:
+        JSON with calls, errors and p50/p95/p99 latency per tool, per database
+        operation and per WhatsApp bridge endpoint
+    """
+    return dumps(metrics.REGISTRY.snapshot())
+
 if __name__ == "__main__":
     print("Starting WhatsApp MCP Server...", file=sys.stderr)
     
@@ -261,16 +568,19 @@ if __name__ == "__main__":
         else:
             print(f"Database found at {MESSAGES_DB_PATH}", file=sys.stderr)
         
-        # Test API connection
+        # Test API connection in the background so a slow or missing bridge
+        # does not delay the first response to the client
         print("Testing API connection...", file=sys.stderr)
-        import requests
-        from whatsapp import get_api_url
-        try:
-            api_url = get_api_url()
-            response = requests.get(f"{api_url}/health", timeout=5)
-            print(f"API connection test: {response.status_code}", file=sys.stderr)
-        except Exception as api_e:
-            print(f"API connection failed: {api_e}", file=sys.stderr)
+        from whatsapp import check_bridge_in_background
+        check_bridge_in_background()
+        
+        # Profiling sessions: WHATSAPP_PROFILE at startup or SIGUSR1 at runtime
+        profiling.install_signal_handler()
+        profiling.start_from_env()
+        
+        # Sidecar indexes named in WHATSAPP_BUILD_INDEXES are built right away
+        # rather than on the first call of one of their tools
+        indexing.start_from_env()
         
         # Initialize and run the server
         print("Starting MCP server...", file=sys.stderr)
@@ -7,11 +7,16 @@ import json
 import sys
 import asyncio
 import traceback
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs
 import threading
+import time
 import subprocess
 import os
+from serialization import dumps_bytes
+import indexing
+import metrics
+import profiling
 
 class MCPBridgeHandler(BaseHTTPRequestHandler):
     def do_GET(self):
@@ -24,6 +29,15 @@ class MCPBridgeHandler(BaseHTTPRequestHandler):
                 "status": "healthy",
                 "service": "whatsapp-mcp-bridge"
             }).encode())
+        elif self.path == '/admin/profile':
+            self.handle_profile({'action': 'status'})
+        elif self.path == '/metrics':
+            body = metrics.REGISTRY.render().encode()
+            self.send_response(200)
+            self.send_header('Content-type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
         else:
             self.send_response(404)
             self.end_headers()
@@ -35,6 +49,14 @@ class MCPBridgeHandler(BaseHTTPRequestHandler):
             post_data = self.rfile.read(content_length)
             request_data = json.loads(post_data.decode())
             
+            if self.path == '/export':
+                self.stream_export(request_data)
+                return
+            
+            if self.path == '/admin/profile':
+                self.handle_profile(request_data)
+                return
+            
             # Extract command and arguments
             command = request_data.get('command')
             arguments = request_data.get('arguments', {})
@@ -44,20 +66,113 @@ class MCPBridgeHandler(BaseHTTPRequestHandler):
                 return
             
             # Call the MCP server directly
-            result = self.call_mcp_tool(command, arguments)
+            started = time.perf_counter()
+            result = profiling.run(command, self.call_mcp_tool, command, arguments)
+            metrics.record_tool(
+                command,
+                time.perf_counter() - started,
+                isinstance(result, dict) and ('error' in result or result.get('success') is False)
+            )
             
             # Send response
             self.send_response(200)
             self.send_header('Content-type', 'application/json')
             self.send_header('Access-Control-Allow-Origin', '*')
             self.end_headers()
-            self.wfile.write(json.dumps(result).encode())
+            self.wfile.write(dumps_bytes(result, compact=request_data.get('compact')))
             
         except Exception as e:
             print(f"Error handling request: {e}", file=sys.stderr)
             traceback.print_exc(file=sys.stderr)
             self.send_error(500, str(e))
     
+    def handle_profile(self, request_data):
+        """Start, stop or inspect a profiling session (requires WHATSAPP_ADMIN_TOKEN)."""
+        token = os.environ.get('WHATSAPP_ADMIN_TOKEN')
+        if not token:
+            self.send_error(403, "Admin endpoints are disabled; set WHATSAPP_ADMIN_TOKEN to enable them")
+            return
+        if self.headers.get('X-Admin-Token') != token:
+            self.send_error(401, "Invalid admin token")
+            return
+        
+        action = request_data.get('action', 'status')
+        try:
+            if action == 'start':
+                result = profiling.start(
+                    mode=request_data.get('mode', 'all'),
+                    seconds=request_data.get('seconds', 60),
+                    tool=request_data.get('tool'),
+                    invocations=request_data.get('invocations')
+                )
+            elif action == 'stop':
+                result = profiling.stop()
+            elif action == 'status':
+                result = profiling.status()
+            else:
+                self.send_error(400, f"Unknown action: {action}")
+                return
+        except (OSError, ValueError) as e:
+            self.send_error(409 if profiling.active() else 400, str(e))
+            return
+        
+        body = dumps_bytes(result)
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def stream_export(self, request_data):
+        """Stream a chat export as a chunked NDJSON or CSV response."""
+        from whatsapp import iter_export_chunks
+        
+        chat_jid = request_data.get('chat_jid')
+        export_format = request_data.get('format', 'ndjson')
+        if not chat_jid:
+            self.send_error(400, "chat_jid is required")
+            return
+        
+        try:
+            chunks = iter_export_chunks(
+                chat_jid,
+                format=export_format,
+                after=request_data.get('after'),
+                before=request_data.get('before'),
+                sender_phone_number=request_data.get('sender_phone_number')
+            )
+            first_chunk = next(chunks, None)
+        except ValueError as e:
+            self.send_error(400, str(e))
+            return
+        
+        # Chunked transfer encoding needs HTTP/1.1 for this response only
+        self.protocol_version = 'HTTP/1.1'
+        self.close_connection = True
+        self.send_response(200)
+        self.send_header('Content-type', 'text/csv' if export_format == 'csv' else 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.send_header('Connection', 'close')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        
+        try:
+            if first_chunk is not None:
+                self.write_chunk(first_chunk[1])
+            for _, data in chunks:
+                self.write_chunk(data)
+            self.wfile.write(b"0\r\n\r\n")
+        except Exception as e:
+            # Headers are already sent; dropping the connection without the
+            # terminating chunk tells the client the export is incomplete
+            print(f"Error streaming export for {chat_jid}: {e}", file=sys.stderr)
+        finally:
+            chunks.close()
+    
+    def write_chunk(self, data):
+        if data:
+            self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+    
     def call_mcp_tool(self, tool_name, arguments):
         """Call an MCP tool directly."""
         try:
@@ -72,6 +187,36 @@ class MCPBridgeHandler(BaseHTTPRequestHandler):
                 success, msg = send_message(recipient, message)
                 return {"success": success, "message": msg}
                 
+            elif tool_name == 'send_file':
+                from whatsapp import send_file
+                success, msg = send_file(arguments.get('recipient'), arguments.get('media_path'))
+                return {"success": success, "message": msg}
+                
+            elif tool_name == 'send_audio_message':
+                from whatsapp import send_audio_message
+                success, msg = send_audio_message(arguments.get('recipient'), arguments.get('media_path'))
+                return {"success": success, "message": msg}
+                
+            elif tool_name == 'download_media':
+                from whatsapp import download_media
+                file_path = download_media(arguments.get('message_id'), arguments.get('chat_jid'))
+                if file_path:
+                    return {"success": True, "message": "Media downloaded successfully", "file_path": file_path}
+                return {"success": False, "message": "Failed to download media"}
+                
+            elif tool_name == 'search_facets':
+                from whatsapp import search_facets
+                return search_facets(
+                    after=arguments.get('after'),
+                    before=arguments.get('before'),
+                    sender_phone_number=arguments.get('sender_phone_number'),
+                    chat_jid=arguments.get('chat_jid'),
+                    query=arguments.get('query'),
+                    limit=arguments.get('limit', 20),
+                    page=arguments.get('page', 0),
+                    facet_limit=arguments.get('facet_limit', 10)
+                )
+                
             elif tool_name == 'list_chats':
                 from whatsapp import list_chats
                 chats = list_chats(
@@ -81,7 +226,7 @@ class MCPBridgeHandler(BaseHTTPRequestHandler):
                     include_last_message=arguments.get('include_last_message', True),
                     sort_by=arguments.get('sort_by', 'last_active')
                 )
-                return [{"jid": c.jid, "name": c.name, "last_message_time": c.last_message_time.isoformat() if c.last_message_time else None, "last_message": c.last_message} for c in chats]
+                return chats
                 
             elif tool_name == 'list_messages':
                 from whatsapp import list_messages
@@ -97,13 +242,109 @@ class MCPBridgeHandler(BaseHTTPRequestHandler):
                     context_before=arguments.get('context_before', 1),
                     context_after=arguments.get('context_after', 1)
                 )
-                return [{"timestamp": m.timestamp.isoformat(), "sender": m.sender, "content": m.content, "is_from_me": m.is_from_me, "chat_jid": m.chat_jid, "id": m.id, "chat_name": m.chat_name} for m in messages]
+                if arguments.get('output_format') == 'text':
+                    from whatsapp import format_messages_list
+                    return {"text": format_messages_list(messages)}
+                return messages
+                
+            elif tool_name == 'export_chat':
+                from whatsapp import export_chat, resolve_export_path
+                output_path = arguments.get('output_path')
+                file_path = resolve_export_path(output_path)
+                count = export_chat(
+                    arguments.get('chat_jid'),
+                    output_path,
+                    format=arguments.get('format', 'ndjson'),
+                    after=arguments.get('after'),
+                    before=arguments.get('before'),
+                    sender_phone_number=arguments.get('sender_phone_number')
+                )
+                return {"success": True, "file_path": file_path, "count": count}
+                
+            elif tool_name == 'get_message_changes':
+                from changefeed import get_message_changes
+                return get_message_changes(
+                    cursor=arguments.get('cursor'),
+                    limit=arguments.get('limit', 100),
+                    chat_jid=arguments.get('chat_jid'),
+                    wait_seconds=arguments.get('wait_seconds', 0)
+                )
+                
+            elif tool_name == 'get_chat_stats':
+                from chatstats import get_chat_stats
+                return get_chat_stats(
+                    arguments.get('chat_jid'),
+                    start_date=arguments.get('start_date'),
+                    end_date=arguments.get('end_date'),
+                    top_senders=arguments.get('top_senders', 10),
+                    include_daily=arguments.get('include_daily', False)
+                )
+                
+            elif tool_name == 'get_chat_activity':
+                from analytics import get_chat_activity
+                return get_chat_activity(
+                    arguments.get('chat_jid'),
+                    after=arguments.get('after'),
+                    before=arguments.get('before'),
+                    utc_offset_hours=arguments.get('utc_offset_hours', 0),
+                    top_senders=arguments.get('top_senders', 10)
+                )
+                
+            elif tool_name == 'scan_messages':
+                from scan import scan_messages
+                return scan_messages(
+                    pattern=arguments.get('pattern'),
+                    all_keywords=arguments.get('all_keywords'),
+                    any_keywords=arguments.get('any_keywords'),
+                    none_keywords=arguments.get('none_keywords'),
+                    ignore_case=arguments.get('ignore_case', True),
+                    ignore_diacritics=arguments.get('ignore_diacritics', True),
+                    chat_jid=arguments.get('chat_jid'),
+                    sender_phone_number=arguments.get('sender_phone_number'),
+                    after=arguments.get('after'),
+                    before=arguments.get('before'),
+                    limit=arguments.get('limit', 100),
+                    cursor=arguments.get('cursor')
+                )
+                
+            elif tool_name == 'find_similar_messages':
+                from similarity import find_similar_messages
+                return find_similar_messages(
+                    message_id=arguments.get('message_id'),
+                    chat_jid=arguments.get('chat_jid'),
+                    after=arguments.get('after'),
+                    before=arguments.get('before'),
+                    threshold=arguments.get('threshold', 0.7),
+                    limit=arguments.get('limit', 20)
+                )
+                
+            elif tool_name == 'semantic_search_messages':
+                from semantic import semantic_search_messages
+                return semantic_search_messages(
+                    arguments.get('query'),
+                    chat_jid=arguments.get('chat_jid'),
+                    after=arguments.get('after'),
+                    before=arguments.get('before'),
+                    limit=arguments.get('limit', 20)
+                )
+                
+            elif tool_name == 'get_conversation':
+                from sessions import get_conversation
+                return get_conversation(
+                    message_id=arguments.get('message_id'),
+                    chat_jid=arguments.get('chat_jid'),
+                    at=arguments.get('at'),
+                    limit=arguments.get('limit', 2000)
+                )
+                
+            elif tool_name == 'get_server_stats':
+                return metrics.REGISTRY.snapshot()
                 
             elif tool_name == 'search_contacts':
                 from whatsapp import search_contacts
                 query = arguments.get('query')
                 contacts = search_contacts(query)
-                return [{"phone_number": c.phone_number, "name": c.name, "jid": c.jid} for c in contacts]
+                return contacts
                 
             else:
                 return {"error": f"Unknown tool: {tool_name}"}
@@ -125,19 +366,27 @@ def main():
         else:
             print(f"Database found at {MESSAGES_DB_PATH}", file=sys.stderr)
         
-        # Test API connection
+        # Test API connection in the background so a slow or missing bridge
+        # does not delay accepting connections
         print("Testing API connection...", file=sys.stderr)
-        import requests
-        from whatsapp import get_api_url
-        try:
-            api_url = get_api_url()
-            response = requests.get(f"{api_url}/health", timeout=5)
-            print(f"API connection test: {response.status_code}", file=sys.stderr)
-        except Exception as api_e:
-            print(f"API connection failed: {api_e}", file=sys.stderr)
+        from whatsapp import check_bridge_in_background
+        check_bridge_in_background()
+        
+        # Profiling sessions: WHATSAPP_PROFILE at startup, SIGUSR1 or POST /admin/profile at runtime
+        profiling.install_signal_handler()
+        profiling.start_from_env()
+        
+        # Sidecar indexes named in WHATSAPP_BUILD_INDEXES are built right away
+        indexing.start_from_env()
+        
+        # Push new messages to webhooks when configured
+        from webhooks import dispatcher_from_env
+        dispatcher = dispatcher_from_env()
+        if dispatcher is not None:
+            dispatcher.start()
         
         # Start HTTP server
-        server = HTTPServer(('0.0.0.0', 8090), MCPBridgeHandler)
+        server = ThreadingHTTPServer(('0.0.0.0', 8090), MCPBridgeHandler)
         print(f"WhatsApp MCP HTTP Bridge running on port 8090", file=sys.stderr)
         print("n8n can now connect via HTTP requests", file=sys.stderr)
         server.serve_forever()
@@ -0,0 +1,469 @@
+"""
+In-process metrics for the MCP server and the HTTP bridge.
+
+Counts, error counts and latency histograms are kept for three kinds of
+work: MCP tool calls, SQLite queries (labelled with the whatsapp.py
+function that ran them) and HTTP calls to the Go bridge. They are rendered
+in the Prometheus text format for the HTTP bridge's /metrics endpoint and
+summarised as a dictionary for the get_server_stats tool.
+
+Metrics live in the process that recorded them: the HTTP bridge and each
+stdio MCP server process have their own.
+"""
+import bisect
+import functools
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import profiling
+import readcache
+import replica
+import slowlog
+
+# Seconds; SQLite lookups are often well under a millisecond
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+FAMILIES = {
+    "whatsapp_tool_calls_total": ("counter", "MCP tool calls."),
+    "whatsapp_tool_errors_total": ("counter", "MCP tool calls that raised or returned success false."),
+    "whatsapp_tool_duration_seconds": ("histogram", "MCP tool call latency."),
+    "whatsapp_db_queries_total": ("counter", "SQLite statements executed."),
+    "whatsapp_db_errors_total": ("counter", "SQLite statements that failed."),
+    "whatsapp_db_rows_total": ("counter", "Rows fetched from SQLite."),
+    "whatsapp_db_query_duration_seconds": ("histogram", "SQLite statement latency, including fetching rows."),
+    "whatsapp_bridge_requests_total": ("counter", "HTTP requests to the WhatsApp bridge by response status."),
+    "whatsapp_bridge_errors_total": ("counter", "HTTP requests to the WhatsApp bridge that failed or returned a non-200 status."),
+    "whatsapp_bridge_request_duration_seconds": ("histogram", "HTTP request latency to the WhatsApp bridge."),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile by linear interpolation within its bucket."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+
+class Registry:
+    """Thread-safe counters and histograms keyed by metric name and labels."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self.started = time.time()
+
+    def inc(self, name: str, labels: Labels, value: float = 1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, labels: Labels, value: float):
+        key = (name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self.started = time.time()
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                (key, (list(h.counts), h.sum, h.count, h.buckets))
+                for key, h in self._histograms.items()
+            )
+
+        lines = [
+            "# HELP whatsapp_process_start_time_seconds Start time of the process since the Unix epoch.",
+            "# TYPE whatsapp_process_start_time_seconds gauge",
+            f"whatsapp_process_start_time_seconds {self.started:.3f}",
+        ]
+        lines.extend(_replica_lines())
+        lines.extend(_read_cache_lines())
+        by_family = {}
+        for (name, labels), value in counters:
+            by_family.setdefault(name, []).append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        for (name, labels), (counts, total, count, buckets) in histograms:
+            samples = by_family.setdefault(name, [])
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                samples.append(f"{name}_bucket{_format_labels(labels + (('le', repr(bound)),))} {cumulative}")
+            samples.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {count}")
+            samples.append(f"{name}_sum{_format_labels(labels)} {total!r}")
+            samples.append(f"{name}_count{_format_labels(labels)} {count}")
+
+        for name, (kind, help_text) in FAMILIES.items():
+            if name in by_family:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.extend(by_family[name])
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Summarise calls, errors and latency per tool, query and bridge endpoint."""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: (h.count, h.sum, h.quantile(0.5), h.quantile(0.95), h.quantile(0.99))
+                          for key, h in self._histograms.items()}
+
+        def section(errors_metric, duration_metric, label, extra=None):
+            result = {}
+            for (name, labels), (count, total, p50, p95, p99) in sorted(histograms.items()):
+                if name != duration_metric:
+                    continue
+                key = dict(labels)[label]
+                errors = sum(value for (n, l), value in counters.items() if n == errors_metric and dict(l).get(label) == key)
+                entry = {
+                    "calls": count,
+                    "errors": int(errors),
+                    "mean_ms": round(total / count * 1000, 3) if count else 0.0,
+                    "p50_ms": round(p50 * 1000, 3),
+                    "p95_ms": round(p95 * 1000, 3),
+                    "p99_ms": round(p99 * 1000, 3)
+                }
+                if extra:
+                    entry.update(extra(key))
+                result[key] = entry
+            return result
+
+        def rows(operation):
+            return {"rows": int(counters.get(("whatsapp_db_rows_total", (("operation", operation),)), 0))}
+
+        def statuses(endpoint):
+            return {"status": {
+                dict(labels)["status"]: int(value)
+                for (name, labels), value in sorted(counters.items())
+                if name == "whatsapp_bridge_requests_total" and dict(labels)["endpoint"] == endpoint
+            }}
+
+        return {
+            "pid": os.getpid(),
+            "uptime_seconds": round(time.time() - self.started, 1),
+            "tools": section("whatsapp_tool_errors_total", "whatsapp_tool_duration_seconds", "tool"),
+            "db": section("whatsapp_db_errors_total", "whatsapp_db_query_duration_seconds", "operation", rows),
+            "bridge": section("whatsapp_bridge_errors_total", "whatsapp_bridge_request_duration_seconds", "endpoint", statuses),
+            "replica": replica.status(),
+            "read_cache": readcache.CACHE.status()
+        }
+
+
+def _replica_lines() -> List[str]:
+    """Gauges and counters of the read replica, when one is configured."""
+    status = replica.status()
+    if not status["enabled"]:
+        return []
+    lines = [
+        "# HELP whatsapp_replica_max_staleness_seconds Staleness bound of the read replica.",
+        "# TYPE whatsapp_replica_max_staleness_seconds gauge",
+        f"whatsapp_replica_max_staleness_seconds {_format_value(status['max_staleness_seconds'])}",
+    ]
+    if status["staleness_seconds"] is not None:
+        lines += [
+            "# HELP whatsapp_replica_staleness_seconds Age of the read replica's snapshot.",
+            "# TYPE whatsapp_replica_staleness_seconds gauge",
+            f"whatsapp_replica_staleness_seconds {_format_value(status['staleness_seconds'])}",
+        ]
+    lines += [
+        "# HELP whatsapp_replica_refreshes_total Read replica refreshes by result.",
+        "# TYPE whatsapp_replica_refreshes_total counter",
+    ]
+    lines.extend(f'whatsapp_replica_refreshes_total{{result="{result}"}} {count}'
+                 for result, count in status["refreshes"].items())
+    lines += [
+        "# HELP whatsapp_replica_reads_total Heavy reads by the database they were served from.",
+        "# TYPE whatsapp_replica_reads_total counter",
+    ]
+    lines.extend(f'whatsapp_replica_reads_total{{database="{database}"}} {count}'
+                 for database, count in status["reads"].items())
+    return lines
+
+
+def _read_cache_lines() -> List[str]:
+    """Size, requests by result and evictions of the read cache."""
+    status = readcache.CACHE.status()
+    lines = [
+        "# HELP whatsapp_read_cache_entries Results held by the read cache.",
+        "# TYPE whatsapp_read_cache_entries gauge",
+        f"whatsapp_read_cache_entries {status['entries']}",
+        "# HELP whatsapp_read_cache_bytes Estimated size of the results held by the read cache.",
+        "# TYPE whatsapp_read_cache_bytes gauge",
+        f"whatsapp_read_cache_bytes {status['bytes']}",
+        "# HELP whatsapp_read_cache_requests_total Cached read calls by function and result (hit, miss, coalesced, bypass).",
+        "# TYPE whatsapp_read_cache_requests_total counter",
+    ]
+    for function, counts in status["functions"].items():
+        lines.extend(f'whatsapp_read_cache_requests_total{{function="{_escape(function)}",result="{result}"}} {counts[result]}'
+                     for result in readcache.RESULTS)
+    lines += [
+        "# HELP whatsapp_read_cache_evictions_total Results dropped from the read cache by reason.",
+        "# TYPE whatsapp_read_cache_evictions_total counter",
+    ]
+    lines.extend(f'whatsapp_read_cache_evictions_total{{reason="{reason}"}} {count}'
+                 for reason, count in status["evictions"].items())
+    return lines
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+REGISTRY = Registry()
+
+
+def record_tool(tool: str, seconds: float, failed: bool):
+    labels = (("tool", tool),)
+    REGISTRY.inc("whatsapp_tool_calls_total", labels)
+    if failed:
+        REGISTRY.inc("whatsapp_tool_errors_total", labels)
+    REGISTRY.observe("whatsapp_tool_duration_seconds", labels, seconds)
+
+
+def record_query(operation: str, seconds: float, rows: int, failed: bool = False):
+    labels = (("operation", operation),)
+    REGISTRY.inc("whatsapp_db_queries_total", labels)
+    if failed:
+        REGISTRY.inc("whatsapp_db_errors_total", labels)
+    if rows:
+        REGISTRY.inc("whatsapp_db_rows_total", labels, rows)
+    REGISTRY.observe("whatsapp_db_query_duration_seconds", labels, seconds)
+
+
+def record_bridge_request(endpoint: str, status: str, seconds: float):
+    REGISTRY.inc("whatsapp_bridge_requests_total", (("endpoint", endpoint), ("status", status)))
+    if status != "200":
+        REGISTRY.inc("whatsapp_bridge_errors_total", (("endpoint", endpoint),))
+    REGISTRY.observe("whatsapp_bridge_request_duration_seconds", (("endpoint", endpoint),), seconds)
+
+
+def timed_tool(fn: Callable, name: Optional[str] = None) -> Callable:
+    """Wrap a tool function to record its calls, errors and latency.
+
+    A call counts as an error when it raises or returns a dictionary with
+    success set to False, which is how the send and download tools report
+    failures.
+    """
+    tool = name or fn.__name__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = profiling.run(tool, fn, *args, **kwargs)
+            failed = isinstance(result, dict) and result.get("success") is False
+            return result
+        finally:
+            record_tool(tool, time.perf_counter() - started, failed)
+
+    return wrapper
+
+
+def instrument_tools(server):
+    """Make server.tool() register every tool through timed_tool, run in a worker thread.
+
+    FastMCP calls synchronous tools directly on its event loop, so a tool
+    that blocks (a long poll, a slow query) would hold up every other request
+    of the stdio server until it returns. Registered as coroutines that hand
+    the call to a worker thread, tools run side by side instead.
+    """
+    register = server.tool
+
+    @functools.wraps(register)
+    def tool(*args, **kwargs):
+        decorator = register(*args, **kwargs)
+
+        def decorate(fn):
+            timed = timed_tool(fn, kwargs.get("name"))
+
+            @functools.wraps(fn)
+            async def in_worker_thread(*call_args, **call_kwargs):
+                import anyio.to_thread
+                return await anyio.to_thread.run_sync(functools.partial(timed, *call_args, **call_kwargs))
+
+            return decorator(in_worker_thread)
+
+        return decorate
+
+    server.tool = tool
+    return server
+
+
+class TrackedCursor(sqlite3.Cursor):
+    """Cursor that records each statement's latency and row count.
+
+    A statement's time covers execute() and every fetch until its rows are
+    exhausted, the cursor runs another statement or is closed, or its
+    connection is closed.
+    """
+
+    operation = "unknown"
+
+    def __init__(self, connection):
+        super().__init__(connection)
+        self.operation = getattr(connection, "operation", "unknown")
+        self._elapsed = None
+        self._rows = 0
+        self._sql = None
+        self._parameters = None
+
+    def _start(self, sql, parameters):
+        self._finish()
+        self._elapsed = 0.0
+        self._rows = 0
+        self._sql = sql
+        self._parameters = parameters
+
+    def _finish(self, error: Optional[sqlite3.Error] = None):
+        if self._elapsed is not None:
+            elapsed, self._elapsed = self._elapsed, None
+            record_query(self.operation, elapsed, self._rows, failed=error is not None)
+            threshold = slowlog.threshold
+            if threshold is not None and elapsed >= threshold:
+                slowlog.record(self.connection, self.operation, self._sql, self._parameters, elapsed, self._rows, error)
+
+    def _timed(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        except sqlite3.Error as e:
+            self._elapsed += time.perf_counter() - started
+            self._finish(e)
+            raise
+        finally:
+            if self._elapsed is not None:
+                self._elapsed += time.perf_counter() - started
+
+    def execute(self, sql, parameters=()):
+        self._start(sql, parameters)
+        self._timed(super().execute, sql, parameters)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        # Only the statement is kept for the slow-query log, not every parameter set
+        self._start(sql, None)
+        self._timed(super().executemany, sql, seq_of_parameters)
+        return self
+
+    def fetchone(self):
+        if self._elapsed is None:
+            return super().fetchone()
+        row = self._timed(super().fetchone)
+        if row is None:
+            self._finish()
+        else:
+            self._rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        if size is None:
+            size = self.arraysize
+        if self._elapsed is None:
+            return super().fetchmany(size)
+        rows = self._timed(super().fetchmany, size)
+        self._rows += len(rows)
+        if len(rows) < size:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        if self._elapsed is None:
+            return super().fetchall()
+        rows = self._timed(super().fetchall)
+        self._rows += len(rows)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        if self._elapsed is None:
+            return super().__next__()
+        try:
+            row = self._timed(super().__next__)
+        except StopIteration:
+            self._finish()
+            raise
+        self._rows += 1
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+
+class TrackedConnection(sqlite3.Connection):
+    """Connection whose cursors are TrackedCursors labelled with an operation name."""
+
+    operation = "unknown"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cursors = []
+
+    def cursor(self, factory=TrackedCursor):
+        cursor = super().cursor(factory)
+        if isinstance(cursor, TrackedCursor):
+            if len(self._cursors) >= 32:
+                # Long-lived connections: record statements whose rows were never exhausted
+                for pending in self._cursors:
+                    pending._finish()
+                self._cursors = []
+            self._cursors.append(cursor)
+        return cursor
+
+    # Connection.execute() would otherwise use a plain sqlite3.Cursor
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def close(self):
+        for cursor in self._cursors:
+            cursor._finish()
+        self._cursors = []
+        super().close()
@@ -0,0 +1,312 @@
+"""
+Runtime profiling for the MCP server, the TCP server and the HTTP bridge.
+
+A profiling session runs for a time window, or until a number of
+invocations of one tool have been profiled, and then writes its results to
+WHATSAPP_PROFILE_DIR:
+
+    cpu     tool invocations in the session run under cProfile, in whichever
+            thread serves them, one at a time: Python 3.12 and later allow
+            a single active profiler per process, so invocations that
+            overlap a profiled one run unprofiled and are counted as
+            skipped. The profiles are merged into one .prof file (load it
+            with pstats or snakeviz) plus a text summary
+    memory  tracemalloc runs for the session; a snapshot is dumped at the
+            end along with the top allocation sites and the growth since
+            the session started
+
+Sessions can be started and stopped at runtime without a restart:
+
+    signal      SIGUSR1 starts a session with the environment's settings,
+                a second SIGUSR1 stops it early
+    environment WHATSAPP_PROFILE=cpu|memory|all starts a session at startup
+                (WHATSAPP_PROFILE_SECONDS, default 60; WHATSAPP_PROFILE_TOOL
+                and WHATSAPP_PROFILE_INVOCATIONS to profile one tool instead)
+    HTTP        POST /admin/profile on the HTTP bridge (see mcp_bridge.py)
+"""
+import cProfile
+import io
+import os
+import pstats
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+
+DEFAULT_PROFILE_DIR = "/app/store/profiles"
+MODES = ("cpu", "memory", "all")
+
+
+class ProfileSession:
+    def __init__(
+        self,
+        mode: str,
+        seconds: Optional[float],
+        tool: Optional[str],
+        invocations: Optional[int],
+        directory: str
+    ):
+        self.mode = mode
+        self.cpu = mode in ("cpu", "all")
+        self.memory = mode in ("memory", "all")
+        self.seconds = seconds
+        self.tool = tool
+        self.remaining = invocations
+        self.directory = directory
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.stats: Optional[pstats.Stats] = None
+        self.profiled = 0
+        self.skipped = 0
+        self.in_flight = 0
+        self.closed = False
+        self.start_snapshot = None
+        self.started_tracemalloc = False
+        self.timer: Optional[threading.Timer] = None
+
+    def claim(self, tool: str) -> bool:
+        """Whether this invocation of tool should be profiled."""
+        if not self.cpu or (self.tool and tool != self.tool):
+            return False
+        with self.lock:
+            if self.closed or self.remaining == 0:
+                return False
+            if self.in_flight:
+                self.skipped += 1
+                return False
+            if self.remaining is not None:
+                self.remaining -= 1
+            self.in_flight += 1
+            return True
+
+    def release(self):
+        """Give back a claim that could not be profiled."""
+        with self.lock:
+            self.in_flight -= 1
+            self.skipped += 1
+            if self.remaining is not None:
+                self.remaining += 1
+
+    def add(self, profile: cProfile.Profile) -> bool:
+        """Merge a finished invocation; returns True when the invocation budget is used up."""
+        with self.lock:
+            self.in_flight -= 1
+            if self.closed:
+                return False
+            if self.stats is None:
+                self.stats = pstats.Stats(profile)
+            else:
+                self.stats.add(profile)
+            self.profiled += 1
+            return self.remaining == 0 and self.in_flight == 0
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "active": not self.closed,
+            "mode": self.mode,
+            "tool": self.tool,
+            "seconds": self.seconds,
+            "elapsed_seconds": round(time.time() - self.started, 1),
+            "profiled_invocations": self.profiled,
+            "skipped_invocations": self.skipped,
+            "remaining_invocations": self.remaining
+        }
+
+
+_lock = threading.RLock()
+_session: Optional[ProfileSession] = None
+
+
+def active() -> bool:
+    return _session is not None
+
+
+def start(
+    mode: str = "all",
+    seconds: Optional[float] = 60,
+    tool: Optional[str] = None,
+    invocations: Optional[int] = None,
+    directory: Optional[str] = None
+) -> Dict[str, Any]:
+    """Start a profiling session.
+
+    Args:
+        mode: "cpu", "memory" or "all"
+        seconds: Stop after this many seconds (None to run until stop())
+        tool: Only profile invocations of this tool
+        invocations: Stop after profiling this many invocations
+        directory: Where to write results (default WHATSAPP_PROFILE_DIR)
+
+    Raises:
+        ValueError: If the mode is unknown or a session is already running
+    """
+    global _session
+    if mode not in MODES:
+        raise ValueError(f"Invalid profiling mode '{mode}'. Expected one of: {', '.join(MODES)}")
+
+    with _lock:
+        if _session is not None:
+            raise ValueError("A profiling session is already running")
+        directory = directory or os.environ.get("WHATSAPP_PROFILE_DIR", DEFAULT_PROFILE_DIR)
+        os.makedirs(directory, exist_ok=True)
+        session = ProfileSession(mode, seconds, tool, invocations, directory)
+
+        if session.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(int(os.environ.get("WHATSAPP_PROFILE_FRAMES", "10")))
+                session.started_tracemalloc = True
+            session.start_snapshot = tracemalloc.take_snapshot()
+
+        if seconds:
+            session.timer = threading.Timer(seconds, _stop_session, args=(session,))
+            session.timer.daemon = True
+            session.timer.start()
+
+        _session = session
+        print(f"Profiling started ({mode}"
+              f"{f', tool {tool}' if tool else ''}{f', {seconds:g}s' if seconds else ''})", file=sys.stderr)
+        return session.status()
+
+
+def stop() -> Dict[str, Any]:
+    """Stop the running session and write its results.
+
+    Returns:
+        The session's status and the files written, or {"active": False} if
+        no session was running
+    """
+    session = _session
+    if session is None:
+        return {"active": False, "files": []}
+    return _stop_session(session)
+
+
+def _stop_session(session: ProfileSession) -> Dict[str, Any]:
+    global _session
+    with _lock:
+        if _session is not session:
+            return {"active": False, "files": []}
+        _session = None
+    with session.lock:
+        session.closed = True
+    if session.timer is not None:
+        session.timer.cancel()
+
+    prefix = os.path.join(
+        session.directory,
+        f"profile-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S', time.localtime(session.started))}"
+        + (f"-{session.tool}" if session.tool else "")
+    )
+    files = []
+    try:
+        if session.cpu and session.stats is not None:
+            files.extend(_write_cpu(session, prefix))
+        if session.memory:
+            files.extend(_write_memory(session, prefix))
+    except OSError as e:
+        print(f"Could not write profiling results: {e}", file=sys.stderr)
+    finally:
+        if session.started_tracemalloc:
+            tracemalloc.stop()
+
+    result = session.status()
+    result["files"] = files
+    print(f"Profiling stopped; wrote {', '.join(files) or 'nothing'}", file=sys.stderr)
+    return result
+
+
+def _write_cpu(session: ProfileSession, prefix: str) -> List[str]:
+    session.stats.dump_stats(f"{prefix}.prof")
+    summary = io.StringIO()
+    stats = pstats.Stats(f"{prefix}.prof", stream=summary)
+    summary.write(f"{session.profiled} profiled invocation(s), {session.skipped} skipped while another was profiled\n")
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(40)
+    stats.sort_stats(pstats.SortKey.TIME).print_stats(20)
+    with open(f"{prefix}-cpu.txt", "w") as f:
+        f.write(summary.getvalue())
+    return [f"{prefix}.prof", f"{prefix}-cpu.txt"]
+
+
+def _write_memory(session: ProfileSession, prefix: str) -> List[str]:
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, pstats.__file__),
+        tracemalloc.Filter(False, cProfile.__file__),
+        tracemalloc.Filter(False, __file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ))
+    snapshot.dump(f"{prefix}.tracemalloc")
+    current, peak = tracemalloc.get_traced_memory()
+
+    lines = [f"Traced memory: current {current / 1024:.1f} KiB, peak {peak / 1024:.1f} KiB", "", "Top allocation sites:"]
+    lines.extend(str(stat) for stat in snapshot.statistics("lineno")[:30])
+    if session.start_snapshot is not None:
+        lines += ["", "Growth since the session started:"]
+        lines.extend(str(stat) for stat in snapshot.compare_to(session.start_snapshot, "lineno")[:30])
+    with open(f"{prefix}-memory.txt", "w") as f:
+        f.write("\n".join(lines) + "\n")
+    return [f"{prefix}.tracemalloc", f"{prefix}-memory.txt"]
+
+
+def status() -> Dict[str, Any]:
+    session = _session
+    return session.status() if session is not None else {"active": False}
+
+
+def run(tool: str, fn: Callable, *args, **kwargs):
+    """Call fn, under cProfile if the running session covers this invocation of tool."""
+    session = _session
+    if session is None or not session.claim(tool):
+        return fn(*args, **kwargs)
+
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        # Another profiler is active in this process (Python 3.12+)
+        session.release()
+        return fn(*args, **kwargs)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        profile.disable()
+        if session.add(profile):
+            _stop_session(session)
+
+
+def _settings_from_env() -> Dict[str, Any]:
+    invocations = os.environ.get("WHATSAPP_PROFILE_INVOCATIONS")
+    return {
+        "mode": os.environ.get("WHATSAPP_PROFILE") or "all",
+        "seconds": float(os.environ.get("WHATSAPP_PROFILE_SECONDS", "60")) or None,
+        "tool": os.environ.get("WHATSAPP_PROFILE_TOOL") or None,
+        "invocations": int(invocations) if invocations else None
+    }
+
+
+def start_from_env():
+    """Start a session at startup when WHATSAPP_PROFILE is set."""
+    if not os.environ.get("WHATSAPP_PROFILE"):
+        return
+    try:
+        start(**_settings_from_env())
+    except (OSError, ValueError) as e:
+        print(f"Profiling not started: {e}", file=sys.stderr)
+
+
+def _toggle(signum, frame):
+    try:
+        if active():
+            stop()
+        else:
+            start(**_settings_from_env())
+    except (OSError, ValueError) as e:
+        print(f"Profiling toggle failed: {e}", file=sys.stderr)
+
+
+def install_signal_handler():
+    """Toggle profiling sessions with SIGUSR1 (main thread only, POSIX only)."""
+    if hasattr(signal, "SIGUSR1") and threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGUSR1, _toggle)
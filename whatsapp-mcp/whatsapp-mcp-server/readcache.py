@@ -0,0 +1,316 @@
+"""
+Request coalescing and a short-lived result cache for the read functions.
+
+n8n workflows often fire the same read at the same moment, for example
+list_chats(limit=20) on every inbound webhook. The read functions in
+whatsapp.py are wrapped with cached_read, which:
+
+    coalesces   identical calls that arrive while one is running: they wait
+                for it and share its result instead of running their own
+                queries (single flight)
+    caches      each result for WHATSAPP_CACHE_TTL seconds, keyed by the
+                function and its arguments
+
+Both are tied to PRAGMA data_version of messages.db, which changes whenever
+another connection (the bridge, or this process) commits a write. A cached
+result is only reused, and a running call only joined, while the version
+is the one the result was computed at, so a cached read never returns
+anything older than the last commit it could have seen. Reads served from
+the read replica (see replica.py) are as stale as the replica, cached or
+not.
+
+Coalescing needs calls that overlap in time. The HTTP bridge handles
+requests in threads, and the MCP server, over stdio or TCP, runs each tool
+call in a worker thread (see metrics.instrument_tools), so identical calls
+arriving together share one execution in either.
+
+Results are frozen (see whatsapp._Record.freeze) before they are shared,
+and every caller gets its own list, so callers cannot change what others
+see. Memory is bounded by entry count and by an estimate of the results'
+size; the least recently used entries are evicted first, and a result too
+large for a quarter of the budget is not cached.
+
+Configuration (environment variables):
+    WHATSAPP_CACHE_TTL          Seconds a result is reused (default 2; 0 turns caching and coalescing off)
+    WHATSAPP_CACHE_MAX_ENTRIES  Maximum number of cached results (default 256)
+    WHATSAPP_CACHE_MAX_BYTES    Approximate memory budget of cached results (default 32 MiB)
+"""
+import functools
+import inspect
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+DEFAULT_TTL = 2.0
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+RESULTS = ("hit", "miss", "coalesced", "bypass")
+EVICTIONS = ("expired", "invalidated", "capacity")
+
+
+class _Flight:
+    """A call in progress that identical calls can wait for."""
+
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class _Entry:
+    __slots__ = ("value", "version", "expires", "size")
+
+    def __init__(self, value, version, expires, size):
+        self.value = value
+        self.version = version
+        self.expires = expires
+        self.size = size
+
+
+def _freeze(value):
+    """An immutable copy of a result: frozen records, lists as tuples."""
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    freeze = getattr(value, "freeze", None)
+    return freeze() if freeze is not None else value
+
+
+def _thaw(value, result_type):
+    """A result as the function returns it; each caller gets its own list."""
+    return list(value) if result_type is list else value
+
+
+def _estimate_size(value) -> int:
+    """Rough size in bytes of a result made of records, strings and sequences."""
+    if value is None or isinstance(value, (bool, int, float)):
+        return 0
+    if isinstance(value, str):
+        return 49 + len(value)
+    if isinstance(value, (list, tuple)):
+        return 56 + 8 * len(value) + sum(_estimate_size(item) for item in value)
+    record_type = getattr(type(value), "_record_type", None)
+    if record_type is not None:
+        names = record_type.__slots__
+        return 16 + 8 * len(names) + sum(_estimate_size(getattr(value, name, None)) for name in names)
+    return sys.getsizeof(value)
+
+
+class ReadCache:
+    """Single-flight call sharing and a TTL cache invalidated by PRAGMA data_version."""
+
+    def __init__(
+        self,
+        ttl: float = DEFAULT_TTL,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        max_bytes: int = DEFAULT_MAX_BYTES
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Any, _Entry]" = OrderedDict()
+        self._flights: Dict[Any, _Flight] = {}
+        self._bytes = 0
+        self._version = None
+        self._requests: Dict[Tuple[str, str], int] = {}
+        self._evictions = dict.fromkeys(EVICTIONS, 0)
+        self._version_lock = threading.Lock()
+        self._version_conn = None
+        self._version_path = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_entries > 0
+
+    def data_version(self) -> Tuple[str, int]:
+        """The messages database and its data_version, read on a long-lived connection."""
+        import whatsapp
+
+        with self._version_lock:
+            if self._version_conn is None or self._version_path != whatsapp.MESSAGES_DB_PATH:
+                if self._version_conn is not None:
+                    self._version_conn.close()
+                self._version_path = whatsapp.MESSAGES_DB_PATH
+                self._version_conn = whatsapp.connect_db(
+                    "read_cache", self._version_path, isolation_level=None, check_same_thread=False
+                )
+            return self._version_path, self._version_conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def call(self, name: str, key, fn: Callable, *args, **kwargs):
+        """Return fn(*args, **kwargs), shared with identical calls and cached under key."""
+        if not self.enabled:
+            return fn(*args, **kwargs)
+        try:
+            version = self.data_version()
+        except sqlite3.Error:
+            self._count(name, "bypass")
+            return fn(*args, **kwargs)
+        key = (key, version)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self._count_locked(name, "hit")
+                    return _thaw(*entry.value)
+                self._remove_locked(key, "expired")
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                leader = True
+                self._count_locked(name, "miss")
+            else:
+                leader = False
+                self._count_locked(name, "coalesced")
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return _thaw(*flight.value)
+
+        try:
+            value = fn(*args, **kwargs)
+            flight.value = (_freeze(value), type(value))
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+                if flight.error is None:
+                    self._store_locked(key, flight.value)
+            flight.done.set()
+        return _thaw(*flight.value)
+
+    def _store_locked(self, key, value):
+        size = _estimate_size(value[0])
+        if size > self.max_bytes // 4:
+            return
+        version = self._version
+        if version is not None and key[1][0] == version[0] and key[1][1] < version[1]:
+            return  # a write was committed while this call ran
+        if key[1] != version:
+            # Results of an older data_version can never be hit again
+            self._version = key[1]
+            for stale in [k for k, entry in self._entries.items() if entry.version != key[1]]:
+                self._remove_locked(stale, "invalidated")
+        self._entries[key] = _Entry(value, key[1], time.monotonic() + self.ttl, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._remove_locked(next(iter(self._entries)), "capacity")
+
+    def _remove_locked(self, key, reason: str):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        self._evictions[reason] += 1
+
+    def _count(self, name: str, result: str):
+        with self._lock:
+            self._count_locked(name, result)
+
+    def _count_locked(self, name: str, result: str):
+        self._requests[(name, result)] = self._requests.get((name, result), 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def reset(self):
+        """Drop every result and zero the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._requests.clear()
+            self._evictions = dict.fromkeys(EVICTIONS, 0)
+
+    def status(self) -> Dict[str, Any]:
+        """Configuration, size, per-function request counts and hit rates."""
+        with self._lock:
+            requests = dict(self._requests)
+            evictions = dict(self._evictions)
+            entries, size = len(self._entries), self._bytes
+
+        functions = {}
+        for (name, result), count in sorted(requests.items()):
+            functions.setdefault(name, dict.fromkeys(RESULTS, 0))[result] = count
+        for counts in functions.values():
+            total = sum(counts.values())
+            counts["hit_rate"] = round((counts["hit"] + counts["coalesced"]) / total, 4) if total else 0.0
+        total = sum(requests.values())
+        shared = sum(count for (_, result), count in requests.items() if result in ("hit", "coalesced"))
+        return {
+            "enabled": self.enabled,
+            "ttl_seconds": self.ttl,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "entries": entries,
+            "bytes": size,
+            "hit_rate": round(shared / total, 4) if total else 0.0,
+            "evictions": evictions,
+            "functions": functions
+        }
+
+
+def _from_env() -> ReadCache:
+    try:
+        return ReadCache(
+            ttl=float(os.environ.get("WHATSAPP_CACHE_TTL", str(DEFAULT_TTL))),
+            max_entries=int(os.environ.get("WHATSAPP_CACHE_MAX_ENTRIES", str(DEFAULT_MAX_ENTRIES))),
+            max_bytes=int(os.environ.get("WHATSAPP_CACHE_MAX_BYTES", str(DEFAULT_MAX_BYTES)))
+        )
+    except ValueError as e:
+        print(f"Read cache disabled: {e}", file=sys.stderr)
+        return ReadCache(ttl=0)
+
+
+CACHE = _from_env()
+
+
+def configure(ttl: Optional[float] = None, max_entries: Optional[int] = None, max_bytes: Optional[int] = None):
+    """Change the shared cache's limits; a ttl of 0 turns caching and coalescing off."""
+    if ttl is not None:
+        CACHE.ttl = ttl
+    if max_entries is not None:
+        CACHE.max_entries = max_entries
+    if max_bytes is not None:
+        CACHE.max_bytes = max_bytes
+    CACHE.clear()
+
+
+def cached_read(fn: Callable) -> Callable:
+    """Share and briefly cache the results of a read function through CACHE.
+
+    Calls are identical when their arguments, with defaults filled in, are
+    equal; calls with unhashable arguments always run.
+    """
+    name = fn.__name__
+    signature = inspect.signature(fn)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not CACHE.enabled:
+            return fn(*args, **kwargs)
+        try:
+            bound = signature.bind(*args, **kwargs)
+        except TypeError:
+            return fn(*args, **kwargs)  # raises the usual error
+        bound.apply_defaults()
+        key = (name, tuple(bound.arguments.values()))
+        try:
+            hash(key)
+        except TypeError:
+            CACHE._count(name, "bypass")
+            return fn(*args, **kwargs)
+        return CACHE.call(name, key, fn, *args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,276 @@
+"""
+Local read replica of messages.db for the heavy read tools.
+
+The Go bridge writes messages.db continuously. Long scans on the same file
+hold a shared lock that makes the bridge's writes wait, and a scan that
+starts while a write holds the file fails with "database is locked". With a
+replica configured, a background thread copies the database with the SQLite
+online backup API into a local file every WHATSAPP_REPLICA_INTERVAL seconds,
+and the heavy read functions in whatsapp.py (searching and listing messages,
+listing chats, contact lookups and exports) read the copy instead. Point
+lookups and the change feed keep reading the live database.
+
+The copy runs in steps of WHATSAPP_REPLICA_PAGES pages, releasing the read
+lock between steps so the bridge can write. A write restarts the copy; after
+a few restarts the rest is copied in one step. The copy is written next to
+the replica and renamed over it, so readers always open a complete snapshot.
+The replica's modification time is the time of its snapshot, which lets
+every server process sharing the replica tell how stale it is; a lock file
+makes sure only one of them refreshes it at a time.
+
+Reads go to the replica only while its snapshot is at most
+WHATSAPP_REPLICA_MAX_STALENESS seconds old, and to the live database
+otherwise, so results are never older than that bound.
+
+Configuration (environment variables):
+    WHATSAPP_REPLICA_PATH           Path of the replica; the replica is off when unset
+    WHATSAPP_REPLICA_INTERVAL       Seconds between refreshes (default 30)
+    WHATSAPP_REPLICA_MAX_STALENESS  Staleness bound in seconds (default three intervals)
+    WHATSAPP_REPLICA_PAGES          Pages copied per backup step (default 1024)
+"""
+import os
+import sqlite3
+import sys
+import threading
+import time
+from typing import Any, Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: refreshes are only serialized within a process
+    fcntl = None
+
+DEFAULT_INTERVAL = 30.0
+DEFAULT_PAGES = 1024
+MAX_RESTARTS = 3
+
+
+class _Restarted(Exception):
+    pass
+
+
+class ReplicaConfig:
+    def __init__(
+        self,
+        path: str,
+        interval: float = DEFAULT_INTERVAL,
+        max_staleness: Optional[float] = None,
+        pages: int = DEFAULT_PAGES
+    ):
+        self.path = path
+        self.interval = interval
+        self.max_staleness = max_staleness if max_staleness is not None else 3 * interval
+        self.pages = pages
+
+
+_config: Optional[ReplicaConfig] = None
+_primary: Optional[str] = None
+_thread: Optional[threading.Thread] = None
+_wake = threading.Event()
+_lock = threading.Lock()
+_stats = {
+    "copied": 0,
+    "unchanged": 0,
+    "skipped": 0,
+    "failed": 0,
+    "restarts": 0,
+    "replica_reads": 0,
+    "primary_reads": 0
+}
+_last_copy_seconds: Optional[float] = None
+_last_error: Optional[str] = None
+
+
+def enabled() -> bool:
+    return _config is not None
+
+
+def configure(config: Optional[ReplicaConfig]):
+    """Use config for the replica, or turn the replica off when config is None."""
+    global _config, _primary
+    with _lock:
+        _config = config
+        _primary = None
+    _wake.set()
+
+
+def configure_from_env():
+    """Turn the replica on when WHATSAPP_REPLICA_PATH is set."""
+    path = os.environ.get("WHATSAPP_REPLICA_PATH")
+    if not path:
+        return
+    try:
+        max_staleness = os.environ.get("WHATSAPP_REPLICA_MAX_STALENESS")
+        configure(ReplicaConfig(
+            path,
+            interval=float(os.environ.get("WHATSAPP_REPLICA_INTERVAL", str(DEFAULT_INTERVAL))),
+            max_staleness=float(max_staleness) if max_staleness else None,
+            pages=int(os.environ.get("WHATSAPP_REPLICA_PAGES", str(DEFAULT_PAGES)))
+        ))
+    except ValueError as e:
+        print(f"Read replica disabled: {e}", file=sys.stderr)
+
+
+def staleness(config: Optional[ReplicaConfig] = None) -> Optional[float]:
+    """Seconds since the replica's snapshot was taken, or None when there is no replica yet."""
+    config = config or _config
+    if config is None:
+        return None
+    try:
+        return max(0.0, time.time() - os.stat(config.path).st_mtime)
+    except OSError:
+        return None
+
+
+def read_path(primary: str) -> str:
+    """Path heavy reads of primary should open: the replica while it is fresh enough, else primary."""
+    config = _config
+    if config is None:
+        return primary
+    _ensure_refreshing(primary)
+    age = staleness(config)
+    if _primary != primary or age is None or age > config.max_staleness:
+        _count("primary_reads")
+        return primary
+    _count("replica_reads")
+    return config.path
+
+
+def _ensure_refreshing(primary: str):
+    global _primary, _thread
+    if _primary is not None and _thread is not None:
+        return
+    with _lock:
+        if _primary is None:
+            _primary = primary
+        if _thread is None:
+            _thread = threading.Thread(target=_refresh_loop, name="replica-refresh", daemon=True)
+            _thread.start()
+
+
+def _refresh_loop():
+    while True:
+        config, primary = _config, _primary
+        if config is not None and primary is not None:
+            refresh(config, primary)
+        _wake.wait(config.interval if config is not None else DEFAULT_INTERVAL)
+        _wake.clear()
+
+
+def _source_mtime(primary: str) -> float:
+    """Last time the database or its WAL was written."""
+    mtime = os.stat(primary).st_mtime
+    try:
+        mtime = max(mtime, os.stat(f"{primary}-wal").st_mtime)
+    except OSError:
+        pass
+    return mtime
+
+
+def refresh(config: ReplicaConfig, primary: str) -> str:
+    """Bring the replica up to date; returns "copied", "unchanged", "skipped" or "failed"."""
+    global _last_copy_seconds, _last_error
+    lock_file = None
+    try:
+        if fcntl is not None:
+            lock_file = open(f"{config.path}.lock", "a")
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+        started = time.time()
+        age = staleness(config)
+        if age is not None and age < config.interval / 2:
+            result = "skipped"  # another process refreshed it just now
+        elif age is not None and _source_mtime(primary) < os.stat(config.path).st_mtime:
+            # Nothing was written since the snapshot, so it is current as of now
+            os.utime(config.path, (started, started))
+            result = "unchanged"
+        else:
+            copy_started = time.perf_counter()
+            _copy(config, primary)
+            _last_copy_seconds = time.perf_counter() - copy_started
+            result = "copied"
+        _last_error = None
+    except BlockingIOError:
+        result = "skipped"  # another process is refreshing it
+    except (OSError, sqlite3.Error) as e:
+        _last_error = str(e)
+        print(f"Read replica refresh failed: {e}", file=sys.stderr)
+        result = "failed"
+    finally:
+        if lock_file is not None:
+            lock_file.close()
+    _count(result)
+    return result
+
+
+def _count(key: str):
+    with _lock:
+        _stats[key] += 1
+
+
+def _copy(config: ReplicaConfig, primary: str):
+    temp_path = f"{config.path}.tmp-{os.getpid()}"
+    snapshot = last_step = time.time()
+    last_remaining = None
+    restarts = 0
+
+    def progress(status, remaining, total):
+        nonlocal snapshot, last_step, last_remaining, restarts
+        now = time.time()
+        if last_remaining is not None and remaining > last_remaining:
+            # The bridge wrote to the database and the copy started over; it
+            # is consistent as of some point after the previous step
+            snapshot = last_step
+            restarts += 1
+            _count("restarts")
+            if restarts >= MAX_RESTARTS:
+                raise _Restarted()
+        last_remaining = remaining
+        last_step = now
+
+    source = sqlite3.connect(primary, timeout=30)
+    target = sqlite3.connect(temp_path)
+    try:
+        try:
+            source.backup(target, pages=config.pages, progress=progress)
+        except _Restarted:
+            # Writes keep arriving: copy the rest under a single read lock
+            snapshot = time.time()
+            source.backup(target, pages=-1)
+        target.close()
+    except BaseException:
+        target.close()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    finally:
+        source.close()
+
+    os.utime(temp_path, (snapshot, snapshot))
+    os.replace(temp_path, config.path)
+
+
+def status() -> Dict[str, Any]:
+    """Configuration, staleness and refresh counters of the replica."""
+    config = _config
+    if config is None:
+        return {"enabled": False}
+    age = staleness(config)
+    with _lock:
+        stats = dict(_stats)
+    return {
+        "enabled": True,
+        "path": config.path,
+        "interval_seconds": config.interval,
+        "max_staleness_seconds": config.max_staleness,
+        "staleness_seconds": round(age, 1) if age is not None else None,
+        "serving": "replica" if age is not None and age <= config.max_staleness else "primary",
+        "last_copy_seconds": round(_last_copy_seconds, 3) if _last_copy_seconds is not None else None,
+        "last_error": _last_error,
+        "refreshes": {key: stats[key] for key in ("copied", "unchanged", "skipped", "failed")},
+        "restarts": stats["restarts"],
+        "reads": {"replica": stats["replica_reads"], "primary": stats["primary_reads"]}
+    }
+
+
+configure_from_env()
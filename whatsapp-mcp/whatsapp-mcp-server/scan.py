@@ -0,0 +1,409 @@
+"""
+Regex and keyword scans over the whole message history.
+
+SQL LIKE cannot express regular expressions, boolean keyword logic or
+accent-insensitive matching, so scan_messages reads message content and
+matches it in Python instead. The messages table is split into rowid ranges
+of CHUNK_ROWS rows that are scanned newest first by a pool of worker
+processes (WHATSAPP_SCAN_WORKERS, default up to four, one per CPU). Each
+chunk opens its own read-only connection, so a scan reads the replica
+snapshot that is current when it runs rather than the one a worker first
+opened; workers keep their compiled matchers.
+
+Chunks are handed out a few at a time and their matches are consumed in
+order, so memory stays bounded by the chunks in flight, and the scan stops
+handing out chunks once the limit is reached. A page therefore holds the
+most recently stored matches, which are then sorted by timestamp, newest
+first. Stored order is mostly time order, but history sync stores old
+messages late, so a later page can hold messages newer than the end of an
+earlier one. The returned cursor continues the scan where it stopped.
+
+A chunk may take at most WHATSAPP_SCAN_CHUNK_SECONDS (default 5) seconds,
+so a pattern that backtracks badly fails with ScanTimeout instead of
+holding a worker. The deadline is checked between messages; with the
+optional regex module installed (the scan extra), it also interrupts a
+search within one message.
+
+With one worker, or for small scans, chunks are scanned in this process.
+"""
+import multiprocessing
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import quote
+
+try:
+    import regex
+except ImportError:
+    regex = None
+
+import replica
+import whatsapp
+from whatsapp import Message
+
+CHUNK_ROWS = 20_000
+# Scans of fewer rows than this run in-process; starting work in the pool costs more
+MIN_POOL_ROWS = 4 * CHUNK_ROWS
+MAX_LIMIT = 1000
+MAX_KEYWORDS = 50
+DEFAULT_CHUNK_SECONDS = 5.0
+# How much longer than a chunk's deadline the server waits for a worker
+# before giving up on the pool
+POOL_GRACE_SECONDS = 5.0
+
+_re = regex if regex is not None else re
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# Per worker process: compiled matchers by spec
+_worker_matchers: Dict[tuple, "Matcher"] = {}
+
+
+class ScanTimeout(ValueError):
+    """A chunk of the scan took longer than its deadline."""
+
+
+def strip_diacritics(text: str) -> str:
+    """Remove accents, so "Café" becomes "Cafe"."""
+    if text.isascii():
+        return text
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+class Matcher:
+    """A regex and keyword conditions that message content must all satisfy.
+
+    Content matches when the pattern (if any) is found in it, it contains
+    every keyword in all_keywords, at least one in any_keywords (when
+    given) and none in none_keywords.
+    """
+
+    def __init__(
+        self,
+        pattern: Optional[str] = None,
+        all_keywords: Sequence[str] = (),
+        any_keywords: Sequence[str] = (),
+        none_keywords: Sequence[str] = (),
+        ignore_case: bool = True,
+        ignore_diacritics: bool = True
+    ):
+        self.ignore_case = ignore_case
+        self.ignore_diacritics = ignore_diacritics
+        flags = _re.IGNORECASE if ignore_case else 0
+        try:
+            self.regex = _re.compile(pattern, flags) if pattern else None
+        except _re.error as e:
+            raise ValueError(f"Invalid pattern {pattern!r}: {e}")
+        self.all_keywords = [self._normalize(k) for k in all_keywords if k]
+        self.any_keywords = [self._normalize(k) for k in any_keywords if k]
+        self.none_keywords = [self._normalize(k) for k in none_keywords if k]
+        if not (self.regex or self.all_keywords or self.any_keywords):
+            raise ValueError("Provide a pattern, all_keywords or any_keywords to scan for")
+
+    def _normalize(self, text: str) -> str:
+        if self.ignore_diacritics:
+            text = strip_diacritics(text)
+        return text.casefold() if self.ignore_case else text
+
+    def __call__(self, content: str, deadline: Optional[float] = None) -> bool:
+        """Whether content matches; deadline (time.monotonic()) bounds the regex search with the regex module."""
+        text = strip_diacritics(content) if self.ignore_diacritics else content
+        if self.all_keywords or self.any_keywords or self.none_keywords:
+            folded = text.casefold() if self.ignore_case else text
+            if any(k not in folded for k in self.all_keywords):
+                return False
+            if self.any_keywords and not any(k in folded for k in self.any_keywords):
+                return False
+            if any(k in folded for k in self.none_keywords):
+                return False
+        if self.regex is None:
+            return True
+        if deadline is not None and regex is not None:
+            return self.regex.search(text, timeout=max(0.0, deadline - time.monotonic())) is not None
+        return self.regex.search(text) is not None
+
+
+def scan_range(
+    db_path: str,
+    spec: tuple,
+    filters: Tuple[str, tuple],
+    low: int,
+    high: int,
+    limit: int,
+    seconds: float = DEFAULT_CHUNK_SECONDS
+) -> Tuple[List[tuple], int]:
+    """Scan rowids low..high, newest first, for up to limit matches.
+
+    Runs in the worker processes (and in-process for small scans). Raises
+    ScanTimeout once the scan has taken more than seconds.
+
+    Returns:
+        The matching rows (rowid, timestamp, sender, content, is_from_me,
+        chat_jid, id, media_type) and the number of rows read
+    """
+    matcher = _worker_matchers.get(spec)
+    if matcher is None:
+        if len(_worker_matchers) >= 32:
+            _worker_matchers.clear()
+        matcher = _worker_matchers[spec] = Matcher(*spec)
+    where, params = filters
+    # Not cached: the replica is replaced with a new file on every refresh,
+    # and a kept connection would go on reading the old one
+    conn = sqlite3.connect(f"file:{quote(db_path)}?mode=ro", uri=True)
+    cursor = conn.execute(f"""
+        SELECT rowid, timestamp, sender, content, is_from_me, chat_jid, id, media_type
+        FROM messages
+        WHERE rowid BETWEEN ? AND ? AND content IS NOT NULL AND content != ''{where}
+        ORDER BY rowid DESC
+    """, (low, high) + params)
+    matches = []
+    scanned = 0
+    deadline = time.monotonic() + seconds
+    try:
+        for row in cursor:
+            scanned += 1
+            if matcher(row[3], deadline):
+                matches.append(row)
+                if len(matches) >= limit:
+                    break
+            if time.monotonic() > deadline:
+                raise TimeoutError
+    except TimeoutError:
+        raise ScanTimeout(
+            f"Scanning messages {low}..{high} took longer than {seconds:g} seconds; "
+            "simplify the pattern or narrow the scan"
+        ) from None
+    finally:
+        cursor.close()
+        conn.close()
+    return matches, scanned
+
+
+def _workers() -> int:
+    try:
+        workers = int(os.environ.get("WHATSAPP_SCAN_WORKERS", "0"))
+    except ValueError:
+        workers = 0
+    return workers if workers > 0 else min(4, os.cpu_count() or 1)
+
+
+def _chunk_seconds() -> float:
+    try:
+        seconds = float(os.environ.get("WHATSAPP_SCAN_CHUNK_SECONDS", str(DEFAULT_CHUNK_SECONDS)))
+    except ValueError:
+        seconds = 0
+    return seconds if seconds > 0 else DEFAULT_CHUNK_SECONDS
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    """The shared worker pool, started on first use and kept for later scans."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Forking a process that runs threads (the server's event loop,
+            # the replica refresh) is unsafe; start workers from a clean one
+            if "forkserver" in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context("forkserver")
+                context.set_forkserver_preload([__name__])
+            else:
+                context = multiprocessing.get_context("spawn")
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+        return _pool
+
+
+def shutdown(wait: bool = True):
+    """Stop the worker pool, if one was started."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=wait, cancel_futures=True)
+            _pool = None
+
+
+def iter_scan(
+    matcher_spec: tuple,
+    chat_jid: Optional[str] = None,
+    sender_phone_number: Optional[str] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    before_rowid: Optional[int] = None,
+    limit: int = 100,
+    workers: Optional[int] = None,
+    stats: Optional[Dict[str, int]] = None
+) -> Iterator[tuple]:
+    """Yield up to limit matching rows (see scan_range), newest rowid first.
+
+    Closing the generator stops the scan; chunks not yet started are
+    cancelled.
+    """
+    Matcher(*matcher_spec)  # report an invalid pattern here rather than in a worker
+    where, params = "", []
+    if chat_jid:
+        where += " AND chat_jid = ?"
+        params.append(chat_jid)
+    if sender_phone_number:
+        where += " AND sender = ?"
+        params.append(sender_phone_number)
+    if after:
+        where += " AND timestamp > ?"
+        params.append(whatsapp.parse_time_filter("after", after))
+    if before:
+        where += " AND timestamp < ?"
+        params.append(whatsapp.parse_time_filter("before", before))
+    filters = (where, tuple(params))
+
+    db_path = replica.read_path(whatsapp.MESSAGES_DB_PATH)
+    conn = whatsapp.connect_db("scan_messages", db_path)
+    try:
+        low, high = conn.execute("SELECT MIN(rowid), MAX(rowid) FROM messages").fetchone()
+    finally:
+        conn.close()
+    if low is None:
+        return
+    if before_rowid is not None:
+        high = min(high, before_rowid - 1)
+    chunks = [(max(low, top - CHUNK_ROWS + 1), top) for top in range(high, low - 1, -CHUNK_ROWS)]
+    if stats is not None:
+        stats.update(chunks=len(chunks), scanned=0)
+
+    workers = workers or _workers()
+    seconds = _chunk_seconds()
+    remaining = limit
+    if workers <= 1 or high - low + 1 < MIN_POOL_ROWS:
+        for chunk_low, chunk_high in chunks:
+            matches, scanned = scan_range(db_path, matcher_spec, filters, chunk_low, chunk_high, remaining, seconds)
+            if stats is not None:
+                stats["scanned"] += scanned
+            for row in matches:
+                yield row
+                remaining -= 1
+            if remaining <= 0:
+                return
+        return
+
+    pool = _get_pool(workers)
+    pending = []
+    next_chunk = 0
+    try:
+        while remaining > 0 and (pending or next_chunk < len(chunks)):
+            # Keep a couple of chunks per worker in flight, consumed in order
+            while next_chunk < len(chunks) and len(pending) < 2 * workers:
+                chunk_low, chunk_high = chunks[next_chunk]
+                pending.append(pool.submit(
+                    scan_range, db_path, matcher_spec, filters, chunk_low, chunk_high, remaining, seconds
+                ))
+                next_chunk += 1
+            try:
+                matches, scanned = pending.pop(0).result(timeout=seconds + POOL_GRACE_SECONDS)
+            except FutureTimeout:
+                # A worker is stuck inside one search (without the regex
+                # module); leave it to finish and start a fresh pool next time
+                shutdown(wait=False)
+                raise ScanTimeout(
+                    f"Scanning messages took longer than {seconds:g} seconds; "
+                    "simplify the pattern or narrow the scan"
+                ) from None
+            except BrokenProcessPool:
+                shutdown()  # the next scan starts a fresh pool
+                raise
+            if stats is not None:
+                stats["scanned"] += scanned
+            for row in matches:
+                yield row
+                remaining -= 1
+                if remaining <= 0:
+                    break
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def scan_messages(
+    pattern: Optional[str] = None,
+    all_keywords: Optional[List[str]] = None,
+    any_keywords: Optional[List[str]] = None,
+    none_keywords: Optional[List[str]] = None,
+    ignore_case: bool = True,
+    ignore_diacritics: bool = True,
+    chat_jid: Optional[str] = None,
+    sender_phone_number: Optional[str] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    limit: int = 100,
+    cursor: Optional[int] = None
+) -> Dict[str, Any]:
+    """Scan message content for a regex and/or keyword conditions.
+
+    Args:
+        pattern: Optional regular expression searched for in each message
+        all_keywords: Optional keywords that must all appear
+        any_keywords: Optional keywords of which at least one must appear
+        none_keywords: Optional keywords that must not appear
+        ignore_case: Match regardless of case (default True)
+        ignore_diacritics: Match regardless of accents, e.g. "cafe" matches "café" (default True)
+        chat_jid, sender_phone_number, after, before: Optional filters as in list_messages
+        limit: Maximum number of messages to return (capped at MAX_LIMIT)
+        cursor: The cursor returned by a previous call, to continue that scan
+
+    Returns:
+        A dictionary with the most recently stored matching messages, sorted
+        newest first, the cursor to continue from, whether the scan stopped at the limit and
+        the number of messages read
+    """
+    limit = max(1, min(limit, MAX_LIMIT))
+    keywords = [tuple(k or ())[:MAX_KEYWORDS] for k in (all_keywords, any_keywords, none_keywords)]
+    spec = (pattern or None, *keywords, bool(ignore_case), bool(ignore_diacritics))
+
+    stats: Dict[str, int] = {}
+    rows = list(iter_scan(
+        spec,
+        chat_jid=chat_jid,
+        sender_phone_number=sender_phone_number,
+        after=after,
+        before=before,
+        before_rowid=cursor,
+        limit=limit,
+        stats=stats
+    ))
+
+    chat_names: Dict[str, Optional[str]] = {}
+    if rows:
+        jids = sorted({row[5] for row in rows})
+        conn = whatsapp.connect_db("scan_messages")
+        try:
+            chat_names.update(conn.execute(
+                f"SELECT jid, name FROM chats WHERE jid IN ({', '.join('?' for _ in jids)})", jids
+            ).fetchall())
+        finally:
+            conn.close()
+
+    has_more = len(rows) >= limit
+    # The cursor follows stored order; the page itself reads newest first
+    cursor = rows[-1][0] if has_more else None
+    rows.sort(key=lambda row: row[1] or "", reverse=True)
+    return {
+        "messages": [
+            Message(
+                timestamp=row[1],
+                sender=row[2],
+                content=row[3],
+                is_from_me=row[4],
+                chat_jid=row[5],
+                id=row[6],
+                chat_name=chat_names.get(row[5]),
+                media_type=row[7]
+            )
+            for row in rows
+        ],
+        "cursor": cursor,
+        "has_more": has_more,
+        "scanned": stats.get("scanned", 0)
+    }
@@ -0,0 +1,571 @@
+#!/usr/bin/env python3
+"""
+Local ranked search over message content with TF-IDF vectors.
+
+A LIKE search returns the messages containing the query verbatim, so a
+question worded differently from the messages it is about finds nothing.
+Here every message is a sparse vector of its terms and a query returns the
+messages whose vectors are closest to the query's, across all chats.
+
+Terms are the folded words of the content (lowercase, no accents) cut to
+their first STEM_LENGTH characters, so "deliver", "delivered" and
+"delivery" are one term in any language. Each term is hashed to one of
+FEATURES features rather than kept in a vocabulary. Weights follow the
+lnc.ltc scheme: a message weighs its terms by 1 + log(term frequency) and
+is normalized to unit length when it is indexed. A query also multiplies
+by each term's inverse document frequency, taken from the index as it is
+at query time, so stored weights never change as the index grows. The
+score of a message is the cosine of the two vectors.
+
+The index lives in a directory of its own (WHATSAPP_SEMANTIC_DIR, by
+default semantic/ next to messages.db):
+
+    segments/<first rowid>-<last rowid>/
+        rowids.npy    messages.db rowid of each indexed message
+        chats.npy     chat of each message, as a code into state.json's chats
+        seconds.npy   message time in seconds since the epoch (NaN if unknown)
+        features.npy  the feature of every (message, term) pair, sorted
+        docs.npy      the message (position in rowids) of each pair
+        weights.npy   the normalized weight of each pair
+    state.json  the rowid high-water mark, the segments and the chats
+
+update() indexes the rows added to messages since the last update, the
+same rowid high-water mark the change feed uses, into a new segment. A
+segment's postings are sorted by feature, so the messages containing a
+term are one contiguous slice found by binary search, and its document
+frequency is the length of that slice. Segments are immutable numpy files
+read through memory maps. While the newest segment holds at least
+1 / MERGE_RATIO as many messages as the one before it, the two are merged,
+which keeps the number of segments logarithmic in the number of messages.
+
+A background thread keeps the index up to date (see indexing.py), and a
+search reads the state and segments of the last completed update. Merged
+segments are deleted only after state.json stops listing them; a search
+that mapped its segments before they were deleted keeps reading them, and
+one that finds a segment gone reads state.json again and retries once.
+
+A message the bridge replaced (INSERT OR REPLACE gives it a new rowid) is
+indexed again under its new rowid; its old rowid no longer exists in
+messages, so the old entry drops out of results when they are read.
+
+Needs numpy (pip install "whatsapp-mcp-server[analytics]").
+
+Build or rebuild the index ahead of the first call with:
+    python semantic.py [--rebuild]
+"""
+import contextlib
+import json
+import math
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: updates are only serialized within a process
+    fcntl = None
+
+import contacts
+import indexing
+import whatsapp
+from indexing import IndexNotReady
+from whatsapp import Message
+
+np = None  # imported on first use, keeping numpy out of the server's startup
+
+UPDATE_BATCH_SIZE = 50_000
+# Bumped when the file layout or the weighting changes, so existing indexes are rebuilt
+FORMAT_VERSION = 1
+FEATURES = 1 << 20
+STEM_LENGTH = 6
+MIN_TERM_LENGTH = 2
+MERGE_RATIO = 2
+# Query terms in more than this share of messages are skipped when the query has rarer ones
+COMMON_TERM_SHARE = 0.1
+MAX_LIMIT = 200
+# Extra results read to make up for replaced messages dropping out
+CANDIDATE_FACTOR = 2
+MAX_CACHED_TERMS = 500_000
+SEGMENT_ARRAYS = ("rowids", "chats", "seconds", "features", "docs", "weights")
+
+_TERM = re.compile(r"\w+")
+_feature_cache: Dict[str, int] = {}
+
+
+def default_semantic_dir() -> str:
+    return os.environ.get("WHATSAPP_SEMANTIC_DIR") or os.path.join(
+        os.path.dirname(whatsapp.MESSAGES_DB_PATH), "semantic"
+    )
+
+
+def _require_numpy():
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            raise RuntimeError('Semantic search needs numpy: pip install "whatsapp-mcp-server[analytics]"')
+        np = numpy
+
+
+def terms(content: Optional[str]) -> List[str]:
+    """The terms of a text: its folded words of at least MIN_TERM_LENGTH characters, cut to STEM_LENGTH."""
+    content = content or ""
+    folded = content.casefold() if content.isascii() else contacts.fold(content)
+    return [word[:STEM_LENGTH] for word in _TERM.findall(folded) if len(word) >= MIN_TERM_LENGTH]
+
+
+def feature(term: str) -> int:
+    """The hashed feature of a term, the same in every process."""
+    hashed = _feature_cache.get(term)
+    if hashed is None:
+        if len(_feature_cache) >= MAX_CACHED_TERMS:
+            _feature_cache.clear()
+        hashed = _feature_cache[term] = zlib.crc32(term.encode()) & (FEATURES - 1)
+    return hashed
+
+
+def _seconds(value: str) -> float:
+    parsed = datetime.fromisoformat(value)
+    return (parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)).timestamp()
+
+
+def vectorize(contents: List[Optional[str]]) -> Tuple["np.ndarray", "np.ndarray", "np.ndarray"]:
+    """The lnc weights of some texts, as (features, docs, weights) sorted by feature.
+
+    A text without terms has no entries.
+    """
+    _require_numpy()
+    features, lengths = [], []
+    for content in contents:
+        text_features = [feature(term) for term in terms(content)]
+        features.extend(text_features)
+        lengths.append(len(text_features))
+    features = np.fromiter(features, np.int64, len(features))
+    docs = np.repeat(np.arange(len(contents), dtype=np.int64), lengths)
+
+    # Term frequencies per (doc, feature) pair, then 1 + log(tf) normalized per doc
+    pairs, frequencies = np.unique(docs * FEATURES + features, return_counts=True)
+    docs, features = np.divmod(pairs, FEATURES)
+    weights = 1 + np.log(frequencies)
+    norms = np.sqrt(np.bincount(docs, weights * weights, minlength=len(contents)))
+    weights /= norms[docs]
+
+    order = np.argsort(features, kind="stable")
+    return features[order].astype(np.uint32), docs[order].astype(np.uint32), weights[order].astype(np.float32)
+
+
+def _save_segment(directory: str, arrays: Dict[str, "np.ndarray"]):
+    """Write a segment's arrays into a temporary directory and rename it into place."""
+    temporary = os.path.join(os.path.dirname(directory), f".tmp-{os.path.basename(directory)}")
+    shutil.rmtree(temporary, ignore_errors=True)
+    os.makedirs(temporary)
+    for name in SEGMENT_ARRAYS:
+        np.save(os.path.join(temporary, f"{name}.npy"), arrays[name])
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(temporary, directory)
+
+
+def _load_segment(directory: str) -> Dict[str, "np.ndarray"]:
+    return {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r") for name in SEGMENT_ARRAYS}
+
+
+class SemanticIndex:
+    """Segments of TF-IDF postings appended to from the messages table."""
+
+    def __init__(self, directory: Optional[str] = None, db_path: Optional[str] = None):
+        self.directory = directory
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        # Guards the cached state and segment maps, which searches share
+        # with updates; never held while indexing
+        self._cache_lock = threading.Lock()
+        self._segments: Dict[str, Dict[str, "np.ndarray"]] = {}
+        self._state: Dict[str, Any] = {}
+        self._state_mtime = None
+
+    @property
+    def root(self) -> str:
+        return self.directory or default_semantic_dir()
+
+    def _source(self) -> str:
+        return self.db_path or whatsapp.MESSAGES_DB_PATH
+
+    def _load_state(self) -> Dict[str, Any]:
+        try:
+            with open(os.path.join(self.root, "state.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self, state: Dict[str, Any]):
+        path = os.path.join(self.root, "state.json")
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(state, f)
+        os.replace(f"{path}.tmp", path)
+
+    def _current_state(self) -> Dict[str, Any]:
+        """state.json, read again only when another update has replaced it; needs _cache_lock."""
+        try:
+            mtime = os.stat(os.path.join(self.root, "state.json")).st_mtime_ns
+        except FileNotFoundError:
+            return {}
+        if mtime != self._state_mtime:
+            self._state, self._state_mtime = self._load_state(), mtime
+        return self._state
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Serialize updates within this process and, where flock exists, across processes."""
+        with self._lock:
+            os.makedirs(self.root, exist_ok=True)
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.root, ".lock"), "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                yield
+
+    def _segment_dir(self, name: str) -> str:
+        return os.path.join(self.root, "segments", name)
+
+    def _segment(self, name: str) -> Dict[str, "np.ndarray"]:
+        """A segment's memory-mapped arrays; needs _cache_lock."""
+        arrays = self._segments.get(name)
+        if arrays is None:
+            arrays = self._segments[name] = _load_segment(self._segment_dir(name))
+        return arrays
+
+    def _snapshot(self) -> Tuple[Dict[str, Any], List[Dict[str, "np.ndarray"]]]:
+        """The state of the last completed update and its segments, memory-mapped.
+
+        Raises:
+            IndexNotReady: If the index is still being built
+        """
+        for attempt in range(2):
+            with self._cache_lock:
+                if attempt:
+                    self._state_mtime = None  # read state.json again
+                state = self._current_state()
+                if not (state.get("built") and state.get("version") == FORMAT_VERSION
+                        and state.get("source") == self._source()):
+                    raise IndexNotReady(
+                        "The semantic index is still being built; try again shortly "
+                        "(python semantic.py builds it ahead of time)"
+                    )
+                names = [segment["name"] for segment in state["segments"]]
+                try:
+                    segments = [self._segment(name) for name in names]
+                except FileNotFoundError:
+                    # Merged away after state.json was read
+                    if attempt:
+                        raise
+                    continue
+                for name in set(self._segments) - set(names):
+                    del self._segments[name]
+                return state, segments
+
+    def _remove_segments(self, names: List[str]):
+        with self._cache_lock:
+            for name in names:
+                self._segments.pop(name, None)
+        for name in names:
+            shutil.rmtree(self._segment_dir(name), ignore_errors=True)
+
+    def update(self, batch_size: int = UPDATE_BATCH_SIZE) -> int:
+        """Index the messages added since the last update.
+
+        Returns:
+            The number of message rows processed
+        """
+        _require_numpy()
+        conn = whatsapp.connect_db("semantic_index", self.db_path, heavy=self.db_path is None)
+        try:
+            # Without taking the lock, check whether there is anything to do
+            max_rowid = conn.execute("SELECT MAX(rowid) FROM messages").fetchone()[0] or 0
+            with self._cache_lock:
+                state = self._current_state()
+            if (state.get("cursor") == max_rowid and state.get("version") == FORMAT_VERSION
+                    and state.get("source") == self._source() and state.get("built")):
+                return 0
+
+            with self._locked():
+                state = self._load_state()
+                if (state.get("version") != FORMAT_VERSION or state.get("source") != self._source()
+                        or max_rowid < state.get("cursor", 0)):
+                    # A different or recreated messages.db, or an older index: start over
+                    shutil.rmtree(os.path.join(self.root, "segments"), ignore_errors=True)
+                    with self._cache_lock:
+                        self._segments.clear()
+                    state = {"version": FORMAT_VERSION, "source": self._source(), "cursor": 0,
+                             "documents": 0, "segments": [], "chats": []}
+                self._remove_orphans(state)
+
+                processed = 0
+                while True:
+                    rows = conn.execute("""
+                        SELECT rowid, chat_jid, (julianday(timestamp) - 2440587.5) * 86400.0, content
+                        FROM messages
+                        WHERE rowid > ?
+                        ORDER BY rowid
+                        LIMIT ?
+                    """, (state["cursor"], batch_size)).fetchall()
+                    if not rows:
+                        break
+                    merged = self._add_segment(state, rows)
+                    state["cursor"] = rows[-1][0]
+                    self._save_state(state)
+                    # Searches that read the previous state.json may still map these
+                    self._remove_segments(merged)
+                    processed += len(rows)
+                    if len(rows) < batch_size:
+                        break
+                if not state.get("built"):
+                    # Caught up with messages: from now on the index can be served
+                    state["built"] = True
+                    self._save_state(state)
+                return processed
+        finally:
+            conn.close()
+
+    def _add_segment(self, state: Dict[str, Any], rows: List[tuple]) -> List[str]:
+        """Index a batch of rows as a new segment, then merge segments of similar size.
+
+        Returns:
+            The segments merged into others, which state no longer lists
+        """
+        features, docs, weights = vectorize([row[3] for row in rows])
+        # Only rows with terms are kept; docs are renumbered to their positions among them
+        indexed = np.flatnonzero(np.bincount(docs, minlength=len(rows)))
+        if not len(indexed):
+            return []
+        renumbered = np.zeros(len(rows), np.uint32)
+        renumbered[indexed] = np.arange(len(indexed), dtype=np.uint32)
+
+        codes = {jid: code for code, jid in enumerate(state["chats"])}
+        chats = []
+        for position in indexed:
+            jid = rows[position][1]
+            code = codes.get(jid)
+            if code is None:
+                code = codes[jid] = len(state["chats"])
+                state["chats"].append(jid)
+            chats.append(code)
+
+        segment = {
+            "rowids": np.fromiter((rows[i][0] for i in indexed), np.int64, len(indexed)),
+            "chats": np.array(chats, np.int32),
+            "seconds": np.fromiter((math.nan if rows[i][2] is None else rows[i][2] for i in indexed),
+                                   np.float64, len(indexed)),
+            "features": features,
+            "docs": renumbered[docs],
+            "weights": weights
+        }
+        name = f"{rows[0][0]:012d}-{rows[-1][0]:012d}"
+        _save_segment(self._segment_dir(name), segment)
+        state["segments"].append({"name": name, "documents": int(len(indexed))})
+        state["documents"] += int(len(indexed))
+
+        segments = state["segments"]
+        merged = []
+        while len(segments) >= 2 and segments[-2]["documents"] < MERGE_RATIO * segments[-1]["documents"]:
+            merged.extend(segment["name"] for segment in segments[-2:])
+            segments[-2:] = [self._merge(segments[-2], segments[-1])]
+        listed = {segment["name"] for segment in segments}
+        return [name for name in merged if name not in listed]
+
+    def _merge(self, older: Dict[str, Any], newer: Dict[str, Any]) -> Dict[str, Any]:
+        first, second = _load_segment(self._segment_dir(older["name"])), _load_segment(self._segment_dir(newer["name"]))
+        features = np.concatenate((first["features"], second["features"]))
+        # Stable, so each feature keeps the older segment's docs first and in order
+        order = np.argsort(features, kind="stable")
+        merged = {
+            name: np.concatenate((first[name], second[name])) for name in ("rowids", "chats", "seconds")
+        }
+        merged["features"] = features[order]
+        merged["docs"] = np.concatenate((first["docs"], second["docs"] + np.uint32(older["documents"])))[order]
+        merged["weights"] = np.concatenate((first["weights"], second["weights"]))[order]
+        del first, second
+
+        name = f"{older['name'].split('-')[0]}-{newer['name'].split('-')[1]}"
+        _save_segment(self._segment_dir(name), merged)
+        with self._cache_lock:
+            self._segments.pop(name, None)
+        return {"name": name, "documents": older["documents"] + newer["documents"]}
+
+    def _remove_orphans(self, state: Dict[str, Any]):
+        """Delete segments an interrupted update wrote but never recorded."""
+        listed = {segment["name"] for segment in state["segments"]}
+        try:
+            entries = os.listdir(os.path.join(self.root, "segments"))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            if entry not in listed:
+                shutil.rmtree(self._segment_dir(entry), ignore_errors=True)
+
+    def rebuild(self) -> int:
+        """Delete the index and build it again from every message."""
+        with self._locked():
+            shutil.rmtree(os.path.join(self.root, "segments"), ignore_errors=True)
+            try:
+                os.remove(os.path.join(self.root, "state.json"))
+            except FileNotFoundError:
+                pass
+            with self._cache_lock:
+                self._segments.clear()
+        return self.update()
+
+    def _messages(self, rowids: List[int]) -> Dict[int, Message]:
+        """Messages by rowid, read from messages.db."""
+        if not rowids:
+            return {}
+        conn = whatsapp.connect_db("semantic_messages", self.db_path)
+        try:
+            return {
+                row[0]: Message(*row[1:])
+                for row in conn.execute("""
+                    SELECT messages.rowid, messages.timestamp, messages.sender, messages.content, messages.is_from_me,
+                        messages.chat_jid, messages.id, chats.name, messages.media_type
+                    FROM messages LEFT JOIN chats ON messages.chat_jid = chats.jid
+                    WHERE messages.rowid IN (SELECT value FROM json_each(?))
+                """, (json.dumps(rowids),))
+            }
+        finally:
+            conn.close()
+
+    def search(
+        self,
+        query: str,
+        chat_jid: Optional[str] = None,
+        after: Optional[str] = None,
+        before: Optional[str] = None,
+        limit: int = 20
+    ) -> Dict[str, Any]:
+        """Messages ranked by the cosine similarity of their TF-IDF vector to the query's.
+
+        Raises:
+            IndexNotReady: If the index is still being built
+        """
+        _require_numpy()
+        limit = max(1, min(limit, MAX_LIMIT))
+        after_seconds = _seconds(whatsapp.parse_time_filter("after", after)) if after else None
+        before_seconds = _seconds(whatsapp.parse_time_filter("before", before)) if before else None
+
+        state, segments = self._snapshot()
+        documents = state.get("documents", 0)
+        result = {"query": query, "documents": documents, "matches": 0, "messages": []}
+
+        chat_code = None
+        if chat_jid:
+            if chat_jid not in state.get("chats", []):
+                return result
+            chat_code = state["chats"].index(chat_jid)
+
+        query_features, query_counts = np.unique(
+            np.fromiter((feature(term) for term in terms(query)), np.uint32), return_counts=True
+        )
+        if not len(query_features) or not documents:
+            return result
+
+        # Each term's postings in each segment, and its document frequency across them
+        ranges = [
+            (np.searchsorted(arrays["features"], query_features, "left"),
+             np.searchsorted(arrays["features"], query_features, "right"))
+            for arrays in segments
+        ]
+        frequencies = sum(high - low for low, high in ranges)
+        used = frequencies > 0
+        rarer = used & (frequencies <= COMMON_TERM_SHARE * documents)
+        if rarer.any():
+            used = rarer
+        if not used.any():
+            return result
+        query_weights = np.where(
+            used, (1 + np.log(query_counts)) * np.log(documents / np.maximum(frequencies, 1)), 0.0
+        )
+        norm = np.sqrt((query_weights * query_weights).sum())
+        if not norm:
+            return result
+        query_weights /= norm
+
+        best_scores, best_rowids, matches = [], [], 0
+        wanted = limit * CANDIDATE_FACTOR
+        for arrays, (low, high) in zip(segments, ranges):
+            slices = [(low[t], high[t], query_weights[t]) for t in np.flatnonzero(used) if high[t] > low[t]]
+            if not slices:
+                continue
+            docs = np.concatenate([arrays["docs"][start:end] for start, end, _ in slices])
+            contributions = np.concatenate([arrays["weights"][start:end] * weight for start, end, weight in slices])
+            scores = np.bincount(docs, contributions, minlength=len(arrays["rowids"]))
+            hits = np.flatnonzero(scores)
+            if chat_code is not None:
+                hits = hits[arrays["chats"][hits] == chat_code]
+            if after_seconds is not None:
+                hits = hits[arrays["seconds"][hits] > after_seconds]
+            if before_seconds is not None:
+                hits = hits[arrays["seconds"][hits] < before_seconds]
+            matches += len(hits)
+            if len(hits) > wanted:
+                hits = hits[np.argpartition(-scores[hits], wanted)[:wanted]]
+            best_scores.append(scores[hits])
+            best_rowids.append(arrays["rowids"][hits])
+        result["matches"] = int(matches)
+        if not best_scores:
+            return result
+
+        scores, rowids = np.concatenate(best_scores), np.concatenate(best_rowids)
+        order = np.lexsort((-rowids, -scores))[:wanted]
+        messages = self._messages([int(rowid) for rowid in rowids[order]])
+        for i in order:
+            message = messages.get(int(rowids[i]))
+            if message is not None and len(result["messages"]) < limit:
+                result["messages"].append({"score": round(float(scores[i]), 4), "message": message})
+        return result
+
+    def status(self) -> Dict[str, Any]:
+        """The high-water mark, the segments and the size of the files."""
+        state = self._load_state()
+        size = 0
+        for directory, _, names in os.walk(self.root):
+            size += sum(os.path.getsize(os.path.join(directory, name)) for name in names)
+        return {
+            "directory": self.root,
+            "cursor": state.get("cursor"),
+            "documents": state.get("documents", 0),
+            "segments": [segment["documents"] for segment in state.get("segments", [])],
+            "bytes": size
+        }
+
+
+_default_index = SemanticIndex()
+_updates = indexing.register("semantic", _default_index.update)
+
+
+def semantic_search_messages(
+    query: str,
+    chat_jid: Optional[str] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    limit: int = 20
+) -> Dict[str, Any]:
+    """Rank messages by similarity to a query using the shared index."""
+    _updates.ensure_started()
+    return _default_index.search(query, chat_jid, after, before, limit)
+
+
+if __name__ == "__main__":
+    started = time.perf_counter()
+    if "--rebuild" in sys.argv[1:]:
+        processed = _default_index.rebuild()
+    else:
+        processed = _default_index.update()
+    status = _default_index.status()
+    print(f"Processed {processed} messages into {status['directory']} ({status['documents']} indexed, "
+          f"{len(status['segments'])} segments) in {time.perf_counter() - started:.1f}s", file=sys.stderr)
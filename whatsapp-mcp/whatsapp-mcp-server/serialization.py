@@ -0,0 +1,164 @@
+"""
+Compact JSON serialization for WhatsApp records.
+
+Tool responses are built from Message, Chat, Contact and MessageContext
+records. Rather than letting FastMCP reflect over every instance, each type
+has a serializer with a precomputed field list, and the encoded output goes
+through orjson when it is installed and the standard json module otherwise.
+"""
+import json
+import os
+from operator import attrgetter
+from typing import Any, Dict, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from whatsapp import Message, Chat, Contact, MessageContext
+
+JSON_BACKEND = "orjson" if orjson is not None else "json"
+
+# Drop null fields, and empty optional strings, from tool responses unless
+# a caller asks otherwise
+COMPACT_JSON = os.environ.get("WHATSAPP_COMPACT_JSON", "0") == "1"
+
+
+class RecordSerializer:
+    """Convert instances of one record type to plain dicts.
+
+    The field list is fixed when the serializer is created: one
+    operator.attrgetter reads every field of a record at once, and only the
+    fields that need it (booleans, nested records) go through a converter.
+    In compact mode, None values are dropped, and so are empty strings in
+    the optional fields: text messages carry media_type "" rather than None.
+    Timestamps are read through the records' *_iso accessors, which forward
+    the stored string without parsing it.
+    """
+
+    __slots__ = ("names", "to_dict")
+
+    def __init__(
+        self,
+        names: Tuple[str, ...],
+        sources: Optional[Dict[str, str]] = None,
+        bools: Tuple[str, ...] = (),
+        nested: Optional[Dict[str, "RecordSerializer"]] = None,
+        optional: Tuple[str, ...] = ()
+    ):
+        self.names = names
+        self.to_dict = self._build(names, sources or {}, bools, nested or {}, optional)
+
+    @staticmethod
+    def _build(names, sources, bools, nested, optional):
+        read = attrgetter(*(sources.get(name, name) for name in names))
+        if len(names) == 1:
+            read_one = read
+            read = lambda record: (read_one(record),)
+
+        def convert_nested(serializer):
+            def convert(value, compact):
+                if isinstance(value, (list, tuple)):
+                    return [serializer.to_dict(item, compact) for item in value]
+                return serializer.to_dict(value, compact)
+            return convert
+
+        converters = tuple(
+            (lambda value, compact: bool(value)) if name in bools
+            else convert_nested(nested[name]) if name in nested
+            else None
+            for name in names
+        )
+        plain = not any(converters)
+        droppable = tuple(name in optional for name in names)
+
+        def to_dict(record, compact=False):
+            values = read(record)
+            if plain and not compact:
+                return dict(zip(names, values))
+            data = {}
+            for name, convert, can_drop, value in zip(names, converters, droppable, values):
+                if compact and (value is None or (can_drop and value == "")):
+                    continue
+                if value is not None and convert is not None:
+                    value = convert(value, compact)
+                data[name] = value
+            return data
+
+        return to_dict
+
+
+MESSAGE_SERIALIZER = RecordSerializer(
+    ("timestamp", "sender", "content", "is_from_me", "chat_jid", "id", "chat_name", "media_type"),
+    sources={"timestamp": "timestamp_iso"},
+    bools=("is_from_me",),
+    optional=("chat_name", "media_type")
+)
+
+CHAT_SERIALIZER = RecordSerializer(
+    ("jid", "name", "last_message_time", "last_message", "last_sender", "last_is_from_me", "is_group"),
+    sources={"last_message_time": "last_message_time_iso"},
+    bools=("last_is_from_me",),
+    optional=("name", "last_message", "last_sender")
+)
+
+CONTACT_SERIALIZER = RecordSerializer(("phone_number", "name", "jid"), optional=("name",))
+
+MESSAGE_CONTEXT_SERIALIZER = RecordSerializer(
+    ("message", "before", "after"),
+    nested={
+        "message": MESSAGE_SERIALIZER,
+        "before": MESSAGE_SERIALIZER,
+        "after": MESSAGE_SERIALIZER
+    }
+)
+
+SERIALIZERS = {}
+for record_type, serializer in (
+    (Message, MESSAGE_SERIALIZER),
+    (Chat, CHAT_SERIALIZER),
+    (Contact, CONTACT_SERIALIZER),
+    (MessageContext, MESSAGE_CONTEXT_SERIALIZER)
+):
+    SERIALIZERS[record_type] = SERIALIZERS[record_type.Frozen] = serializer
+
+
+def to_records(obj: Any, compact: Optional[bool] = None) -> Any:
+    """Convert records, lists of records and dicts containing them to plain data.
+
+    Args:
+        obj: A record, a list or tuple of records, a dict, or a plain value
+        compact: Whether to drop fields whose value is None, and optional fields
+            that are empty (default from WHATSAPP_COMPACT_JSON)
+    """
+    if compact is None:
+        compact = COMPACT_JSON
+
+    if isinstance(obj, (list, tuple)):
+        return [to_records(item, compact) for item in obj]
+
+    serializer = SERIALIZERS.get(type(obj))
+    if serializer is not None:
+        return serializer.to_dict(obj, compact)
+
+    if isinstance(obj, dict):
+        return {key: to_records(value, compact) for key, value in obj.items()}
+
+    return obj
+
+
+def dumps_bytes(obj: Any, compact: Optional[bool] = None) -> bytes:
+    """Serialize records to compact UTF-8 encoded JSON."""
+    data = to_records(obj, compact)
+    if orjson is not None:
+        return orjson.dumps(data, default=str)
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False, default=str).encode("utf-8")
+
+
+def dumps(obj: Any, compact: Optional[bool] = None) -> str:
+    """Serialize records to a compact JSON string."""
+    data = to_records(obj, compact)
+    if orjson is not None:
+        return orjson.dumps(data, default=str).decode("utf-8")
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False, default=str)
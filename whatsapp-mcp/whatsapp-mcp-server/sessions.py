@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+"""
+Conversation sessions of each chat, kept in a sidecar database.
+
+A session is a run of a chat's messages in which no two consecutive
+messages are more than SESSION_GAP_SECONDS apart. get_conversation returns
+the whole session around a message (or a time) in one read of the
+(chat_jid, timestamp) index, where list_messages' context windows return
+a fixed number of messages on either side.
+
+Sessions live in a database of their own (WHATSAPP_SESSIONS_DB_PATH, by
+default sessions.db next to messages.db), one row per session with its
+first and last message time and rowid. They are brought up to date from
+the rows added to messages since the last update, the rowid high-water mark
+the change feed uses, so an update costs in proportion to the new messages.
+
+Any time between a session's first and last message is within the gap of
+one of its messages, so a session is fully described by that interval: a
+new message joins every session whose interval, widened by the gap on both
+sides, contains its time, and sessions it bridges become one. An update
+therefore reads only the sessions touching the new messages' times, sorts
+them together with the new messages by start time and splits the result
+where a start lies more than the gap after the running maximum of the ends
+before it. Messages arriving out of order, such as a history sync, merge in
+the same way.
+
+The bridge stores messages with INSERT OR REPLACE, which gives a replaced
+row a new rowid. A replaced message comes back with its own time and joins
+its session again; where it is the first or last message, the session
+takes its new rowid.
+
+A background thread keeps the sessions up to date and calls answer from
+the last completed update (see indexing.py), so a message stored in the
+last few seconds may not be part of its conversation yet.
+
+Build or rebuild the index ahead of the first call with:
+    python sessions.py [--rebuild]
+"""
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import indexing
+import whatsapp
+from indexing import IndexNotReady
+from whatsapp import Message
+
+np = None  # imported on first use, keeping numpy out of the server's startup
+
+UPDATE_BATCH_SIZE = 50_000
+# Bumped when the tables change, so existing sidecars are rebuilt
+SCHEMA_VERSION = 1
+SESSION_GAP_SECONDS = 3600
+MAX_CONVERSATION_MESSAGES = 2000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    chat_jid TEXT,
+    start_seconds REAL,
+    end_seconds REAL,
+    start_time TEXT,
+    end_time TEXT,
+    start_rowid INTEGER,
+    end_rowid INTEGER,
+    PRIMARY KEY (chat_jid, start_seconds)
+) WITHOUT ROWID;
+"""
+
+TABLES = ("sessions", "state")
+
+
+def default_sessions_db_path() -> str:
+    return os.environ.get("WHATSAPP_SESSIONS_DB_PATH") or os.path.join(
+        os.path.dirname(whatsapp.MESSAGES_DB_PATH), "sessions.db"
+    )
+
+
+def _require_numpy():
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            raise RuntimeError('Conversation sessions need numpy: pip install "whatsapp-mcp-server[analytics]"')
+        np = numpy
+
+
+def _seconds(value: str) -> float:
+    parsed = datetime.fromisoformat(value)
+    return (parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)).timestamp()
+
+
+def merge_intervals(starts: "np.ndarray", ends: "np.ndarray", gap: float) -> "np.ndarray":
+    """Group intervals sorted by start into sessions.
+
+    Returns:
+        The position of the first interval of each session
+    """
+    reach = np.maximum.accumulate(ends)
+    return np.concatenate(([0], np.flatnonzero(starts[1:] - reach[:-1] > gap) + 1))
+
+
+class SessionIndex:
+    """Incrementally maintained conversation sessions of every chat."""
+
+    def __init__(self, index_db_path: Optional[str] = None, db_path: Optional[str] = None):
+        self.index_db_path = index_db_path
+        self.db_path = db_path
+        self._update_lock = threading.Lock()
+        self._initialized = set()
+
+    def _connect(self) -> sqlite3.Connection:
+        path = self.index_db_path or default_sessions_db_path()
+        conn = whatsapp.connect_db("sessions", path, isolation_level=None, timeout=30)
+        if path not in self._initialized:
+            conn.execute("PRAGMA journal_mode=WAL").fetchone()
+            conn.executescript(SCHEMA)
+            self._initialized.add(path)
+        return conn
+
+    def update(self, batch_size: int = UPDATE_BATCH_SIZE) -> int:
+        """Add the messages stored since the last update to their chats' sessions.
+
+        Returns:
+            The number of message rows processed
+        """
+        _require_numpy()
+        with self._update_lock:
+            index = self._connect()
+            source = whatsapp.connect_db("sessions_source", self.db_path, heavy=self.db_path is None)
+            try:
+                # Without taking the write lock, check whether there is anything to do
+                state = dict(index.execute("SELECT key, value FROM state"))
+                max_rowid = source.execute("SELECT MAX(rowid) FROM messages").fetchone()[0] or 0
+                if (state.get("cursor") == max_rowid and state.get("version") == SCHEMA_VERSION
+                        and state.get("gap") == SESSION_GAP_SECONDS
+                        and state.get("source") == (self.db_path or whatsapp.MESSAGES_DB_PATH)
+                        and state.get("built")):
+                    return 0
+
+                processed = 0
+                while True:
+                    count = self._update_batch(index, source, batch_size)
+                    processed += count
+                    if count < batch_size:
+                        # Caught up with messages: from now on the sessions can be served
+                        index.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('built', 1)")
+                        return processed
+            finally:
+                source.close()
+                index.close()
+
+    def _update_batch(self, index: sqlite3.Connection, source: sqlite3.Connection, batch_size: int) -> int:
+        # The write lock is taken before reading the cursor, so processes
+        # sharing the sidecar never add the same rows twice
+        index.execute("BEGIN IMMEDIATE")
+        try:
+            state = dict(index.execute("SELECT key, value FROM state"))
+            cursor = state.get("cursor", 0)
+            source_path = self.db_path or whatsapp.MESSAGES_DB_PATH
+            max_rowid = source.execute("SELECT MAX(rowid) FROM messages").fetchone()[0] or 0
+            if (state.get("source") != source_path or state.get("version") != SCHEMA_VERSION
+                    or state.get("gap") != SESSION_GAP_SECONDS or max_rowid < cursor):
+                # A different or recreated messages.db, or sessions cut differently: start over
+                for table in TABLES:
+                    index.execute(f"DELETE FROM {table}")
+                index.executemany("INSERT INTO state (key, value) VALUES (?, ?)", (
+                    ("source", source_path),
+                    ("version", SCHEMA_VERSION),
+                    ("gap", SESSION_GAP_SECONDS)
+                ))
+                cursor = 0
+
+            rows = source.execute("""
+                SELECT rowid, chat_jid, (julianday(timestamp) - 2440587.5) * 86400.0, timestamp
+                FROM messages
+                WHERE rowid > ?
+                ORDER BY rowid
+                LIMIT ?
+            """, (cursor, batch_size)).fetchall()
+            if not rows:
+                index.execute("COMMIT")
+                return 0
+
+            # Messages without a usable timestamp belong to no session
+            timed = [row for row in rows if row[2] is not None]
+            if timed:
+                self._merge(index, timed)
+
+            index.execute(
+                "INSERT OR REPLACE INTO state (key, value) VALUES ('cursor', ?)", (rows[-1][0],)
+            )
+            index.execute("COMMIT")
+            return len(rows)
+        except BaseException:
+            index.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _merge(index: sqlite3.Connection, rows: List[tuple]):
+        """Merge new messages (rowid, chat_jid, seconds, timestamp) into the sessions they touch."""
+        codes: Dict[str, int] = {}
+        chats = np.fromiter((codes.setdefault(row[1], len(codes)) for row in rows), np.int64, len(rows))
+        seconds = np.fromiter((row[2] for row in rows), np.float64, len(rows))
+        jids = list(codes)
+
+        # The new messages' own sessions, then the stored sessions within the gap of each
+        order = np.lexsort((seconds, chats))
+        ordered_chats, ordered_seconds = chats[order], seconds[order]
+        firsts = np.flatnonzero(np.concatenate((
+            [True],
+            (ordered_chats[1:] != ordered_chats[:-1]) | (ordered_seconds[1:] - ordered_seconds[:-1] > SESSION_GAP_SECONDS)
+        )))
+        lasts = np.concatenate((firsts[1:], [len(order)])) - 1
+        windows = [
+            [jids[ordered_chats[first]], ordered_seconds[first] - SESSION_GAP_SECONDS, ordered_seconds[last] + SESSION_GAP_SECONDS]
+            for first, last in zip(firsts.tolist(), lasts.tolist())
+        ]
+        # Sessions are disjoint, so those touching a window start within it, apart from at
+        # most one starting before it; both are ranges of the primary key
+        touched = index.execute("""
+            WITH windows AS (
+                SELECT json_extract(value, '$[0]') AS chat_jid, json_extract(value, '$[1]') AS low,
+                    json_extract(value, '$[2]') AS high
+                FROM json_each(?)
+            )
+            SELECT sessions.chat_jid, sessions.start_seconds, sessions.end_seconds, sessions.start_time,
+                sessions.end_time, sessions.start_rowid, sessions.end_rowid
+            FROM windows
+            JOIN sessions
+                ON sessions.chat_jid = windows.chat_jid
+                AND sessions.start_seconds BETWEEN windows.low AND windows.high
+            UNION
+            SELECT sessions.chat_jid, sessions.start_seconds, sessions.end_seconds, sessions.start_time,
+                sessions.end_time, sessions.start_rowid, sessions.end_rowid
+            FROM windows
+            JOIN sessions
+                ON sessions.chat_jid = windows.chat_jid
+                AND sessions.start_seconds = (
+                    SELECT MAX(start_seconds) FROM sessions AS earlier
+                    WHERE earlier.chat_jid = windows.chat_jid AND earlier.start_seconds < windows.low
+                )
+            WHERE sessions.end_seconds >= windows.low
+        """, (json.dumps(windows),)).fetchall()
+        index.executemany(
+            "DELETE FROM sessions WHERE chat_jid = ? AND start_seconds = ?",
+            [(session[0], session[1]) for session in touched]
+        )
+
+        # Every new message is an interval of its own; sort them with the touched sessions
+        intervals = touched + [
+            (chat_jid, seconds, seconds, timestamp, timestamp, rowid, rowid)
+            for rowid, chat_jid, seconds, timestamp in rows
+        ]
+        chats = np.concatenate((
+            np.fromiter((codes[session[0]] for session in touched), np.int64, len(touched)), chats
+        ))
+        starts = np.fromiter((interval[1] for interval in intervals), np.float64, len(intervals))
+        ends = np.fromiter((interval[2] for interval in intervals), np.float64, len(intervals))
+        start_rowids = np.fromiter((interval[5] for interval in intervals), np.int64, len(intervals))
+        # Among equal starts the newest row comes first, so a replaced first message gives way to its new copy
+        order = np.lexsort((-start_rowids, starts, chats))
+        chats, starts, ends = chats[order], starts[order], ends[order]
+
+        merged = []
+        chat_starts = np.concatenate(([0], np.flatnonzero(chats[1:] != chats[:-1]) + 1, [len(order)]))
+        for low, high in zip(chat_starts[:-1].tolist(), chat_starts[1:].tolist()):
+            firsts = merge_intervals(starts[low:high], ends[low:high], SESSION_GAP_SECONDS) + low
+            for first, last in zip(firsts.tolist(), np.concatenate((firsts[1:], [high])).tolist()):
+                # The session ends with its interval that ends last, the newest row among equal ends
+                ending = max(range(first, last), key=lambda i: (ends[i], intervals[order[i]][6]))
+                opening, closing = intervals[order[first]], intervals[order[ending]]
+                merged.append((opening[0], opening[1], closing[2], opening[3], closing[4], opening[5], closing[6]))
+        index.executemany("""
+            INSERT INTO sessions (chat_jid, start_seconds, end_seconds, start_time, end_time, start_rowid, end_rowid)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, merged)
+
+    def rebuild(self) -> int:
+        """Drop the sessions and cut them again from every message."""
+        with self._update_lock:
+            index = self._connect()
+            try:
+                index.execute("DELETE FROM state")
+            finally:
+                index.close()
+        return self.update()
+
+    def _connect_built(self) -> sqlite3.Connection:
+        """Connect to sessions that have been built for the current messages.db.
+
+        Raises:
+            IndexNotReady: If they are still being built
+        """
+        conn = self._connect()
+        state = dict(conn.execute("SELECT key, value FROM state"))
+        if not (state.get("built") and state.get("version") == SCHEMA_VERSION
+                and state.get("gap") == SESSION_GAP_SECONDS
+                and state.get("source") == (self.db_path or whatsapp.MESSAGES_DB_PATH)):
+            conn.close()
+            raise IndexNotReady(
+                "The conversation sessions are still being built; try again shortly "
+                "(python sessions.py builds them ahead of time)"
+            )
+        return conn
+
+    def _target(self, message_id: str, chat_jid: Optional[str]) -> tuple:
+        """The chat and time in seconds of a message."""
+        conn = whatsapp.connect_db("get_conversation_target", self.db_path)
+        try:
+            query = "SELECT chat_jid, (julianday(timestamp) - 2440587.5) * 86400.0 FROM messages WHERE id = ?"
+            if chat_jid is None:
+                targets = conn.execute(query + " LIMIT 2", (message_id,)).fetchall()
+            else:
+                targets = conn.execute(query + " AND chat_jid = ?", (message_id, chat_jid)).fetchall()
+        finally:
+            conn.close()
+        if not targets:
+            raise ValueError(f"Message with ID {message_id} not found")
+        if len(targets) > 1:
+            raise ValueError(f"Message ID {message_id} exists in several chats; pass chat_jid to choose one")
+        if targets[0][1] is None:
+            raise ValueError(f"Message with ID {message_id} has no valid timestamp")
+        return targets[0]
+
+    def conversation(
+        self,
+        message_id: Optional[str] = None,
+        chat_jid: Optional[str] = None,
+        at: Optional[str] = None,
+        limit: int = MAX_CONVERSATION_MESSAGES
+    ) -> Dict[str, Any]:
+        """The session containing a message, or a chat's session at a time (its latest by default).
+
+        A time between two sessions gives the one before it.
+
+        Raises:
+            IndexNotReady: If the sessions are still being built
+        """
+        if not message_id and not chat_jid:
+            raise ValueError("Provide message_id, or chat_jid with an optional time")
+        limit = max(1, min(limit, MAX_CONVERSATION_MESSAGES))
+        if message_id:
+            chat_jid, seconds = self._target(message_id, chat_jid)
+        elif at:
+            seconds = _seconds(whatsapp.parse_time_filter("at", at))
+        else:
+            seconds = float("inf")
+
+        index = self._connect_built()
+        try:
+            session = index.execute("""
+                SELECT start_seconds, end_seconds, start_time, end_time FROM sessions
+                WHERE chat_jid = ? AND start_seconds <= ?
+                ORDER BY start_seconds DESC
+                LIMIT 1
+            """, (chat_jid, seconds)).fetchone() or index.execute("""
+                SELECT start_seconds, end_seconds, start_time, end_time FROM sessions
+                WHERE chat_jid = ?
+                ORDER BY start_seconds
+                LIMIT 1
+            """, (chat_jid,)).fetchone()
+            if session is None:
+                return {"chat_jid": chat_jid, "start_time": None, "end_time": None, "previous_end_time": None,
+                        "next_start_time": None, "truncated": False, "messages": []}
+            neighbours = index.execute("""
+                SELECT
+                    (SELECT end_time FROM sessions WHERE chat_jid = ?1 AND start_seconds < ?2
+                     ORDER BY start_seconds DESC LIMIT 1),
+                    (SELECT start_time FROM sessions WHERE chat_jid = ?1 AND start_seconds > ?2
+                     ORDER BY start_seconds LIMIT 1)
+            """, (chat_jid, session[0])).fetchone()
+        finally:
+            index.close()
+
+        # The whole session is one range of the (chat_jid, timestamp) index
+        conn = whatsapp.connect_db("get_conversation", self.db_path)
+        try:
+            rows = conn.execute("""
+                SELECT messages.timestamp, messages.sender, messages.content, messages.is_from_me,
+                    messages.chat_jid, messages.id, chats.name, messages.media_type
+                FROM messages
+                LEFT JOIN chats ON messages.chat_jid = chats.jid
+                WHERE messages.chat_jid = ? AND messages.timestamp >= ? AND messages.timestamp <= ?
+                ORDER BY messages.timestamp
+                LIMIT ?
+            """, (chat_jid, session[2], session[3], limit + 1)).fetchall()
+        finally:
+            conn.close()
+
+        return {
+            "chat_jid": chat_jid,
+            "start_time": session[2],
+            "end_time": session[3],
+            "previous_end_time": neighbours[0],
+            "next_start_time": neighbours[1],
+            "truncated": len(rows) > limit,
+            "messages": [Message(*row) for row in rows[:limit]]
+        }
+
+
+_default_index = SessionIndex()
+_updates = indexing.register("sessions", _default_index.update)
+
+
+def get_conversation(
+    message_id: Optional[str] = None,
+    chat_jid: Optional[str] = None,
+    at: Optional[str] = None,
+    limit: int = MAX_CONVERSATION_MESSAGES
+) -> Dict[str, Any]:
+    """Return a whole conversation session using the shared sidecar database."""
+    _updates.ensure_started()
+    return _default_index.conversation(message_id, chat_jid, at, limit)
+
+
+if __name__ == "__main__":
+    started = time.perf_counter()
+    if "--rebuild" in sys.argv[1:]:
+        processed = _default_index.rebuild()
+    else:
+        processed = _default_index.update()
+    print(f"Processed {processed} messages into {default_sessions_db_path()} "
+          f"in {time.perf_counter() - started:.1f}s", file=sys.stderr)
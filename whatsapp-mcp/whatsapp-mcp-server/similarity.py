@@ -0,0 +1,553 @@
+#!/usr/bin/env python3
+"""
+Near-duplicate detection over message content with MinHash and LSH.
+
+Floods of forwarded messages differ in a word or an emoji, so exact
+matching misses them and comparing every pair of messages is quadratic.
+Instead each message with at least MIN_CONTENT_LENGTH characters of text
+gets a MinHash signature: the content is folded (lowercase, no accents,
+punctuation collapsed to spaces), cut into overlapping SHINGLE_SIZE
+character shingles, and for each of NUM_PERM hash functions the smallest
+hash of any shingle is kept. The share of equal positions in two
+signatures estimates the Jaccard similarity of their shingle sets.
+
+Signatures are split into BANDS bands of ROWS values; messages whose band
+values are all equal land in the same bucket of that band. Candidates for a
+message are the messages sharing at least one of its buckets, which finds
+pairs above roughly (1 / BANDS) ** (1 / ROWS) similarity without looking
+at any other message. Candidates are then ranked by their estimated
+similarity.
+
+Signatures and buckets live in a sidecar database
+(WHATSAPP_SIMILARITY_DB_PATH, by default similarity.db next to
+messages.db). They are brought up to date from the rows added to messages
+since the last update, the rowid high-water mark the change feed uses, so
+new messages are indexed as they arrive. A message the bridge replaced
+(INSERT OR REPLACE gives it a new rowid) is indexed again under its new
+rowid and its old entries are removed. A background thread keeps the
+index up to date and calls answer from the last completed update (see
+indexing.py).
+
+Hashing is vectorized with numpy (pip install "whatsapp-mcp-server[analytics]").
+
+Build or rebuild the index ahead of the first call with:
+    python similarity.py [--rebuild]
+"""
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import contacts
+import indexing
+import whatsapp
+from indexing import IndexNotReady
+from whatsapp import Message
+
+np = None  # imported on first use, keeping numpy out of the server's startup
+
+UPDATE_BATCH_SIZE = 5000
+# Signatures are computed for about this many characters at a time to bound memory
+HASH_CHUNK_CHARS = 200_000
+# Bumped when signatures change, so existing sidecars are rebuilt
+SCHEMA_VERSION = 1
+MIN_CONTENT_LENGTH = 20
+SHINGLE_SIZE = 5
+NUM_PERM = 32
+BANDS = 8
+ROWS = NUM_PERM // BANDS
+DEFAULT_WINDOW_HOURS = 24
+MAX_WINDOW_MESSAGES = 200_000
+MAX_LIMIT = 200
+CLUSTER_SAMPLE_SIZE = 5
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value
+);
+CREATE TABLE IF NOT EXISTS signatures (
+    message_rowid INTEGER PRIMARY KEY,
+    chat_jid TEXT,
+    id TEXT,
+    timestamp TEXT,
+    signature BLOB
+);
+CREATE UNIQUE INDEX IF NOT EXISTS signatures_message ON signatures (chat_jid, id);
+CREATE INDEX IF NOT EXISTS signatures_timestamp ON signatures (timestamp);
+CREATE TABLE IF NOT EXISTS buckets (
+    band INTEGER,
+    bucket INTEGER,
+    message_rowid INTEGER,
+    PRIMARY KEY (band, bucket, message_rowid)
+) WITHOUT ROWID;
+"""
+
+TABLES = ("signatures", "buckets", "state")
+
+
+def default_similarity_db_path() -> str:
+    return os.environ.get("WHATSAPP_SIMILARITY_DB_PATH") or os.path.join(
+        os.path.dirname(whatsapp.MESSAGES_DB_PATH), "similarity.db"
+    )
+
+
+def _require_numpy():
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            raise RuntimeError('Similarity search needs numpy: pip install "whatsapp-mcp-server[analytics]"')
+        np = numpy
+
+
+def normalize(content: Optional[str]) -> str:
+    """Content as it is shingled: folded, with punctuation and runs of spaces collapsed."""
+    content = content or ""
+    folded = content.casefold() if content.isascii() else contacts.fold(content)
+    return _NON_WORD.sub(" ", folded).strip()
+
+
+_permutations = None
+
+
+def _permutation_parameters():
+    """The odd a and the b of the NUM_PERM hash functions, fixed across runs.
+
+    Hash k of a 32-bit x is the high half of (a[k] * x + b[k]) mod 2**64
+    (multiply-shift hashing), which needs no division.
+    """
+    global _permutations
+    if _permutations is None:
+        rng = np.random.default_rng(0x5EED)
+        _permutations = (
+            (rng.integers(0, 1 << 63, NUM_PERM, dtype=np.uint64) << np.uint64(1) | np.uint64(1))[:, None],
+            rng.integers(0, 1 << 63, NUM_PERM, dtype=np.uint64)[:, None]
+        )
+    return _permutations
+
+
+def signatures(texts: List[str]) -> "np.ndarray":
+    """MinHash signatures (one row of NUM_PERM uint32 values per text) of normalized texts.
+
+    Every text must have at least SHINGLE_SIZE characters.
+    """
+    _require_numpy()
+    a, b = _permutation_parameters()
+    lengths = np.fromiter((len(t) for t in texts), np.int64, len(texts))
+    codes = np.frombuffer("".join(texts).encode("utf-32-le"), np.uint32).astype(np.uint64)
+
+    # A polynomial hash of every SHINGLE_SIZE window of the joined texts
+    windows = len(codes) - SHINGLE_SIZE + 1
+    hashes = np.zeros(windows, np.uint64)
+    for offset in range(SHINGLE_SIZE):
+        hashes = hashes * np.uint64(1_000_003) + codes[offset:offset + windows]
+    hashes ^= hashes >> np.uint64(29)
+    hashes &= np.uint64(0xFFFFFFFF)
+
+    # Keep the windows that lie within one text
+    starts = np.cumsum(lengths) - lengths
+    per_text = lengths - SHINGLE_SIZE + 1
+    first_shingle = np.cumsum(per_text) - per_text
+    shingles = hashes[np.arange(per_text.sum()) + np.repeat(starts - first_shingle, per_text)]
+
+    # One row per hash function, so the per-text minimums reduce contiguous runs.
+    # The smallest 64-bit value also has the smallest high half, so the shift
+    # is applied to the minimums only.
+    permuted = a * shingles
+    permuted += b
+    minimums = np.minimum.reduceat(permuted, first_shingle, axis=1) >> np.uint64(32)
+    return minimums.T.astype(np.uint32)
+
+
+def band_buckets(signature_rows: "np.ndarray") -> "np.ndarray":
+    """The bucket of every band of each signature, as int64 (n, BANDS)."""
+    bands = signature_rows.reshape(len(signature_rows), BANDS, ROWS).astype(np.uint64)
+    mixed = np.zeros(bands.shape[:2], np.uint64)
+    for row in range(ROWS):
+        mixed = (mixed ^ bands[:, :, row]) * np.uint64(0x9E3779B97F4A7C15)
+    return mixed.view(np.int64)
+
+
+def _similarity(signature_rows: "np.ndarray", target: "np.ndarray") -> "np.ndarray":
+    return (signature_rows == target).mean(axis=1)
+
+
+def _from_blobs(blobs) -> "np.ndarray":
+    return np.frombuffer(b"".join(blobs), np.uint32).reshape(-1, NUM_PERM)
+
+
+class SimilarityIndex:
+    """Incrementally maintained MinHash signatures and LSH buckets of message content."""
+
+    def __init__(self, index_db_path: Optional[str] = None, db_path: Optional[str] = None):
+        self.index_db_path = index_db_path
+        self.db_path = db_path
+        self._update_lock = threading.Lock()
+        self._initialized = set()
+
+    def _connect(self) -> sqlite3.Connection:
+        path = self.index_db_path or default_similarity_db_path()
+        conn = whatsapp.connect_db("similarity", path, isolation_level=None, timeout=30)
+        if path not in self._initialized:
+            conn.execute("PRAGMA journal_mode=WAL").fetchone()
+            conn.executescript(SCHEMA)
+            self._initialized.add(path)
+        return conn
+
+    def update(self, batch_size: int = UPDATE_BATCH_SIZE) -> int:
+        """Index the messages added since the last update.
+
+        Returns:
+            The number of message rows processed
+        """
+        _require_numpy()
+        with self._update_lock:
+            index = self._connect()
+            source = whatsapp.connect_db("similarity_source", self.db_path)
+            try:
+                # Without taking the write lock, check whether there is anything to do
+                state = dict(index.execute("SELECT key, value FROM state"))
+                max_rowid = source.execute("SELECT MAX(rowid) FROM messages").fetchone()[0] or 0
+                if (state.get("cursor") == max_rowid and state.get("version") == SCHEMA_VERSION
+                        and state.get("source") == (self.db_path or whatsapp.MESSAGES_DB_PATH)
+                        and state.get("built")):
+                    return 0
+
+                processed = 0
+                while True:
+                    count = self._update_batch(index, source, batch_size)
+                    processed += count
+                    if count < batch_size:
+                        # Caught up with messages: from now on the index can be served
+                        index.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('built', 1)")
+                        return processed
+            finally:
+                source.close()
+                index.close()
+
+    def _update_batch(self, index: sqlite3.Connection, source: sqlite3.Connection, batch_size: int) -> int:
+        # The write lock is taken before reading the cursor, so processes
+        # sharing the sidecar never index the same rows twice
+        index.execute("BEGIN IMMEDIATE")
+        try:
+            state = dict(index.execute("SELECT key, value FROM state"))
+            cursor = state.get("cursor", 0)
+            source_path = self.db_path or whatsapp.MESSAGES_DB_PATH
+            max_rowid = source.execute("SELECT MAX(rowid) FROM messages").fetchone()[0] or 0
+            if (state.get("source") != source_path or state.get("version") != SCHEMA_VERSION
+                    or max_rowid < cursor):
+                # A different or recreated messages.db, or older signatures: start over
+                for table in TABLES:
+                    index.execute(f"DELETE FROM {table}")
+                index.executemany("INSERT INTO state (key, value) VALUES (?, ?)", (
+                    ("source", source_path),
+                    ("version", SCHEMA_VERSION)
+                ))
+                cursor = 0
+
+            rows = source.execute("""
+                SELECT rowid, chat_jid, id, timestamp, content
+                FROM messages
+                WHERE rowid > ?
+                ORDER BY rowid
+                LIMIT ?
+            """, (cursor, batch_size)).fetchall()
+            if not rows:
+                index.execute("COMMIT")
+                return 0
+
+            # Drop what replaced messages were indexed as before
+            stale = index.execute("""
+                SELECT signatures.message_rowid, signatures.signature
+                FROM json_each(?) AS batch
+                JOIN signatures
+                    ON signatures.chat_jid = json_extract(batch.value, '$[0]')
+                    AND signatures.id = json_extract(batch.value, '$[1]')
+            """, (json.dumps([[chat_jid, message_id] for _, chat_jid, message_id, _, _ in rows]),)).fetchall()
+            if stale:
+                old_buckets = band_buckets(_from_blobs([signature for _, signature in stale]))
+                index.executemany(
+                    "DELETE FROM buckets WHERE band = ? AND bucket = ? AND message_rowid = ?",
+                    [
+                        (band, int(old_buckets[i, band]), rowid)
+                        for i, (rowid, _) in enumerate(stale) for band in range(BANDS)
+                    ]
+                )
+                index.executemany("DELETE FROM signatures WHERE message_rowid = ?", [(rowid,) for rowid, _ in stale])
+
+            indexed = [(row, text) for row in rows if len(text := normalize(row[4])) >= MIN_CONTENT_LENGTH]
+            if indexed:
+                self._insert(index, indexed)
+
+            index.execute(
+                "INSERT OR REPLACE INTO state (key, value) VALUES ('cursor', ?)", (rows[-1][0],)
+            )
+            index.execute("COMMIT")
+            return len(rows)
+        except BaseException:
+            index.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _insert(index: sqlite3.Connection, chunk: List[Tuple[tuple, str]]):
+        texts = [text for _, text in chunk]
+        pieces, start, chars = [], 0, 0
+        for end, text in enumerate(texts, 1):
+            chars += len(text)
+            if chars >= HASH_CHUNK_CHARS or end == len(texts):
+                pieces.append(signatures(texts[start:end]))
+                start, chars = end, 0
+        chunk_signatures = np.concatenate(pieces)
+        chunk_buckets = band_buckets(chunk_signatures)
+        index.executemany(
+            "INSERT INTO signatures (message_rowid, chat_jid, id, timestamp, signature) VALUES (?, ?, ?, ?, ?)",
+            [(row[0], row[1], row[2], row[3], chunk_signatures[i].tobytes()) for i, (row, _) in enumerate(chunk)]
+        )
+        # In key order, so the inserts walk the bucket index instead of hopping around it
+        bands = np.repeat(np.arange(BANDS)[None, :], len(chunk), axis=0).ravel()
+        buckets = chunk_buckets.ravel()
+        rowids = np.repeat(np.fromiter((row[0] for row, _ in chunk), np.int64, len(chunk)), BANDS)
+        order = np.lexsort((rowids, buckets, bands))
+        index.executemany(
+            "INSERT OR IGNORE INTO buckets (band, bucket, message_rowid) VALUES (?, ?, ?)",
+            zip(bands[order].tolist(), buckets[order].tolist(), rowids[order].tolist())
+        )
+
+    def rebuild(self) -> int:
+        """Drop the index and build it again from every message."""
+        with self._update_lock:
+            index = self._connect()
+            try:
+                index.execute("DELETE FROM state")
+            finally:
+                index.close()
+        return self.update()
+
+    def _connect_built(self) -> sqlite3.Connection:
+        """Connect to an index that has been built for the current messages.db.
+
+        Raises:
+            IndexNotReady: If it is still being built
+        """
+        _require_numpy()
+        conn = self._connect()
+        state = dict(conn.execute("SELECT key, value FROM state"))
+        if not (state.get("built") and state.get("version") == SCHEMA_VERSION
+                and state.get("source") == (self.db_path or whatsapp.MESSAGES_DB_PATH)):
+            conn.close()
+            raise IndexNotReady(
+                "The similarity index is still being built; try again shortly "
+                "(python similarity.py builds it ahead of time)"
+            )
+        return conn
+
+    def _messages(self, rowids: List[int]) -> Dict[int, Message]:
+        """Messages by rowid, read from messages.db."""
+        if not rowids:
+            return {}
+        conn = whatsapp.connect_db("similarity_messages", self.db_path)
+        try:
+            return {
+                row[0]: Message(*row[1:])
+                for row in conn.execute("""
+                    SELECT messages.rowid, messages.timestamp, messages.sender, messages.content, messages.is_from_me,
+                        messages.chat_jid, messages.id, chats.name, messages.media_type
+                    FROM messages LEFT JOIN chats ON messages.chat_jid = chats.jid
+                    WHERE messages.rowid IN (SELECT value FROM json_each(?))
+                """, (json.dumps(rowids),))
+            }
+        finally:
+            conn.close()
+
+    def similar_to(
+        self,
+        message_id: str,
+        chat_jid: Optional[str] = None,
+        threshold: float = 0.7,
+        limit: int = 20
+    ) -> Dict[str, Any]:
+        """Messages whose content is at least threshold similar to a message's, most similar first.
+
+        Raises:
+            IndexNotReady: If the index is still being built
+        """
+        limit = max(1, min(limit, MAX_LIMIT))
+        index = self._connect_built()
+        try:
+            if chat_jid:
+                targets = index.execute(
+                    "SELECT message_rowid, signature FROM signatures WHERE chat_jid = ? AND id = ?",
+                    (chat_jid, message_id)
+                ).fetchall()
+            else:
+                targets = index.execute(
+                    "SELECT message_rowid, signature FROM signatures WHERE id = ? LIMIT 2", (message_id,)
+                ).fetchall()
+            if len(targets) > 1:
+                raise ValueError(f"Message ID {message_id} exists in several chats; pass chat_jid to choose one")
+            if not targets:
+                raise ValueError(
+                    f"Message ID {message_id} not found, or it has less than {MIN_CONTENT_LENGTH} characters of text"
+                )
+            target_rowid, target_blob = targets[0]
+            target = np.frombuffer(target_blob, np.uint32)
+            target_buckets = band_buckets(target[None, :])[0]
+
+            candidates = index.execute("""
+                SELECT signatures.message_rowid, signatures.signature
+                FROM signatures
+                WHERE signatures.message_rowid IN (
+                    SELECT message_rowid FROM buckets
+                    WHERE (band, bucket) IN (
+                        SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]') FROM json_each(?)
+                    )
+                )
+            """, (json.dumps([[band, int(bucket)] for band, bucket in enumerate(target_buckets)]),)).fetchall()
+        finally:
+            index.close()
+
+        rowids = np.fromiter((rowid for rowid, _ in candidates), np.int64, len(candidates))
+        scores = _similarity(_from_blobs([blob for _, blob in candidates]), target) if candidates else np.empty(0)
+        matching = np.flatnonzero((scores >= threshold) & (rowids != target_rowid))
+        best = matching[np.argsort(-scores[matching], kind="stable")[:limit]]
+
+        messages = self._messages([target_rowid] + [int(rowids[i]) for i in best])
+        return {
+            "message": messages.get(target_rowid),
+            "candidates": len(candidates),
+            "matches": int(len(matching)),
+            "similar": [
+                {"similarity": round(float(scores[i]), 3), "message": messages[int(rowids[i])]}
+                for i in best if int(rowids[i]) in messages
+            ]
+        }
+
+    def clusters(
+        self,
+        after: Optional[str] = None,
+        before: Optional[str] = None,
+        chat_jid: Optional[str] = None,
+        threshold: float = 0.7,
+        limit: int = 20,
+        min_size: int = 2
+    ) -> Dict[str, Any]:
+        """Groups of near-identical messages sent within a time window, largest first.
+
+        Without after and before, the window is the last DEFAULT_WINDOW_HOURS hours.
+
+        Raises:
+            IndexNotReady: If the index is still being built
+        """
+        limit = max(1, min(limit, MAX_LIMIT))
+        if not after and not before:
+            after = (datetime.now(timezone.utc) - timedelta(hours=DEFAULT_WINDOW_HOURS)).replace(tzinfo=None).isoformat()
+        where_clauses, params = [], []
+        if after:
+            where_clauses.append("timestamp > ?")
+            params.append(whatsapp.parse_time_filter("after", after))
+        if before:
+            where_clauses.append("timestamp < ?")
+            params.append(whatsapp.parse_time_filter("before", before))
+        if chat_jid:
+            where_clauses.append("chat_jid = ?")
+            params.append(chat_jid)
+
+        index = self._connect_built()
+        try:
+            rows = index.execute(f"""
+                SELECT message_rowid, chat_jid, timestamp, signature FROM signatures
+                WHERE {" AND ".join(where_clauses)}
+                ORDER BY timestamp DESC
+                LIMIT ?
+            """, (*params, MAX_WINDOW_MESSAGES)).fetchall()
+        finally:
+            index.close()
+
+        result = {"after": after, "before": before, "messages": len(rows), "clusters": []}
+        if not rows:
+            return result
+        rowids = [row[0] for row in rows]
+        signature_rows = _from_blobs([row[3] for row in rows])
+        buckets = band_buckets(signature_rows)
+
+        # Within each bucket, join every member similar enough to the bucket's first member
+        parent = np.arange(len(rows))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for band in range(BANDS):
+            order = np.argsort(buckets[:, band], kind="stable")
+            ordered = buckets[order, band]
+            run_starts = np.flatnonzero(np.concatenate(([True], ordered[1:] != ordered[:-1])))
+            run_ends = np.concatenate((run_starts[1:], [len(order)]))
+            for start, end in zip(run_starts, run_ends):
+                if end - start < 2:
+                    continue
+                members = order[start:end]
+                leader = members[0]
+                similar = members[1:][_similarity(signature_rows[members[1:]], signature_rows[leader]) >= threshold]
+                root = find(leader)
+                for member in similar:
+                    other = find(member)
+                    if other != root:
+                        parent[other] = root
+
+        roots = np.array([find(i) for i in range(len(rows))])
+        labels, sizes = np.unique(roots, return_counts=True)
+        large = sizes >= max(2, min_size)
+        keep = labels[large][np.argsort(-sizes[large], kind="stable")][:limit]
+
+        groups = [np.flatnonzero(roots == label) for label in keep]
+        # Rows are newest first, so a group's first members are its latest messages
+        samples = self._messages([rowids[i] for members in groups for i in members[:CLUSTER_SAMPLE_SIZE]])
+        for members in groups:
+            result["clusters"].append({
+                "size": int(len(members)),
+                "chats": len({rows[i][1] for i in members}),
+                "first_message_time": rows[members[-1]][2],
+                "last_message_time": rows[members[0]][2],
+                "messages": [samples[rowids[i]] for i in members[:CLUSTER_SAMPLE_SIZE] if rowids[i] in samples]
+            })
+        return result
+
+
+_default_index = SimilarityIndex()
+_updates = indexing.register("similarity", _default_index.update)
+
+
+def find_similar_messages(
+    message_id: Optional[str] = None,
+    chat_jid: Optional[str] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    threshold: float = 0.7,
+    limit: int = 20
+) -> Dict[str, Any]:
+    """Near-duplicates of a message, or clusters of near-duplicates in a time window, using the shared index."""
+    _updates.ensure_started()
+    if message_id:
+        return _default_index.similar_to(message_id, chat_jid, threshold, limit)
+    return _default_index.clusters(after, before, chat_jid, threshold, limit)
+
+
+if __name__ == "__main__":
+    started = time.perf_counter()
+    if "--rebuild" in sys.argv[1:]:
+        processed = _default_index.rebuild()
+    else:
+        processed = _default_index.update()
+    print(f"Processed {processed} messages into {default_similarity_db_path()} "
+          f"in {time.perf_counter() - started:.1f}s", file=sys.stderr)
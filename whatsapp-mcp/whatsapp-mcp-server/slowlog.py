@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Opt-in slow-query log for the messages database.
+
+When enabled, every SQLite statement run through whatsapp.connect_db() that
+takes longer than the threshold (from execute() until its rows are
+exhausted) is written as one JSON object per line to a rotating log file.
+An entry has the operation (the whatsapp.py function), the normalized SQL
+and a fingerprint of it, the shapes of the parameters (types, lengths and
+LIKE patterns, never the values), the duration, the number of rows and the
+EXPLAIN QUERY PLAN output.
+
+Configuration (environment variables):
+    WHATSAPP_SLOW_QUERY_MS         Threshold in milliseconds; the log is off when unset
+    WHATSAPP_SLOW_QUERY_LOG        Log file path, or "-" for stderr (default /app/store/slow_queries.log)
+    WHATSAPP_SLOW_QUERY_LOG_BYTES  Rotate after this many bytes (default 10 MB, 5 backups kept)
+
+Summarise a log by fingerprint with:
+    python slowlog.py /app/store/slow_queries.log
+"""
+import hashlib
+import json
+import logging
+import logging.handlers
+import os
+import re
+import sqlite3
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+DEFAULT_LOG_PATH = "/app/store/slow_queries.log"
+
+# Seconds, or None when the slow-query log is off
+threshold: Optional[float] = None
+
+_logger = logging.getLogger("whatsapp.slow_queries")
+_logger.propagate = False
+_logger.setLevel(logging.INFO)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_sql(sql: str) -> str:
+    """Collapse whitespace and replace literals with ? so equal statements group together."""
+    sql = _STRING_LITERAL.sub("?", sql)
+    sql = _NUMBER_LITERAL.sub("?", sql)
+    sql = _PLACEHOLDER_LIST.sub("(?...)", sql)
+    return _WHITESPACE.sub(" ", sql).strip()
+
+
+def fingerprint(normalized_sql: str) -> str:
+    return hashlib.sha1(normalized_sql.encode()).hexdigest()[:12]
+
+
+def parameter_shape(value: Any) -> str:
+    """Describe a parameter without revealing it, e.g. "str[12]" or "like %...%"."""
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, (int, float)):
+        return type(value).__name__
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f"bytes[{len(value)}]"
+    if isinstance(value, str):
+        if len(value) > 1 and (value.startswith("%") or value.endswith("%")):
+            return f"like {'%' if value.startswith('%') else ''}...{'%' if value.endswith('%') else ''}"
+        return f"str[{len(value)}]"
+    return type(value).__name__
+
+
+def parameter_shapes(parameters) -> Any:
+    if parameters is None:
+        return None
+    if isinstance(parameters, dict):
+        return {key: parameter_shape(value) for key, value in parameters.items()}
+    return [parameter_shape(value) for value in parameters]
+
+
+def query_plan(conn: sqlite3.Connection, sql: str, parameters) -> List[str]:
+    """Return EXPLAIN QUERY PLAN output as indented lines."""
+    if not sql.lstrip().upper().startswith(("SELECT", "WITH")):
+        return []
+    try:
+        # A plain cursor, so the EXPLAIN itself is not measured or logged
+        cursor = conn.cursor(sqlite3.Cursor)
+        rows = cursor.execute("EXPLAIN QUERY PLAN " + sql, parameters if parameters is not None else ()).fetchall()
+        cursor.close()
+    except sqlite3.Error as e:
+        return [f"unavailable: {e}"]
+
+    depth = {0: -1}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, -1) + 1
+        lines.append("  " * depth[node_id] + detail)
+    return lines
+
+
+def record(
+    conn: sqlite3.Connection,
+    operation: str,
+    sql: Optional[str],
+    parameters,
+    seconds: float,
+    rows: int,
+    error: Optional[BaseException] = None
+):
+    """Write one slow statement to the log. Never raises."""
+    try:
+        normalized = normalize_sql(sql or "")
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime()) + "Z",
+            "pid": os.getpid(),
+            "operation": operation,
+            "fingerprint": fingerprint(normalized),
+            "sql": normalized,
+            "params": parameter_shapes(parameters),
+            "duration_ms": round(seconds * 1000, 3),
+            "rows": rows,
+            "plan": query_plan(conn, sql, parameters) if sql and error is None else []
+        }
+        if error is not None:
+            entry["error"] = str(error)
+        _logger.info(json.dumps(entry, ensure_ascii=False))
+    except Exception as e:
+        print(f"Could not write slow-query log entry: {e}", file=sys.stderr)
+
+
+def configure(
+    threshold_ms: Optional[float],
+    path: str = DEFAULT_LOG_PATH,
+    max_bytes: int = 10 * 1024 * 1024,
+    backup_count: int = 5
+):
+    """Enable the slow-query log at threshold_ms, or disable it when threshold_ms is None."""
+    global threshold
+    for handler in list(_logger.handlers):
+        _logger.removeHandler(handler)
+        handler.close()
+
+    if threshold_ms is None:
+        threshold = None
+        return
+
+    if path == "-":
+        handler = logging.StreamHandler(sys.stderr)
+    else:
+        handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True
+        )
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    _logger.addHandler(handler)
+    threshold = threshold_ms / 1000
+
+
+def configure_from_env():
+    """Enable the slow-query log when WHATSAPP_SLOW_QUERY_MS is set."""
+    value = os.environ.get("WHATSAPP_SLOW_QUERY_MS")
+    if not value:
+        return
+    try:
+        configure(
+            float(value),
+            os.environ.get("WHATSAPP_SLOW_QUERY_LOG", DEFAULT_LOG_PATH),
+            int(os.environ.get("WHATSAPP_SLOW_QUERY_LOG_BYTES", str(10 * 1024 * 1024)))
+        )
+    except (OSError, ValueError) as e:
+        print(f"Slow-query log disabled: {e}", file=sys.stderr)
+
+
+def summarize(paths: List[str]) -> List[Dict[str, Any]]:
+    """Group log entries by fingerprint, slowest total time first."""
+    groups = {}
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                group = groups.setdefault(entry["fingerprint"], {
+                    "fingerprint": entry["fingerprint"],
+                    "sql": entry["sql"],
+                    "operations": set(),
+                    "param_shapes": set(),
+                    "durations": [],
+                    "rows": 0,
+                    "plan": entry.get("plan", [])
+                })
+                group["operations"].add(entry["operation"])
+                group["param_shapes"].add(json.dumps(entry.get("params")))
+                group["durations"].append(entry["duration_ms"])
+                group["rows"] += entry.get("rows", 0)
+
+    summary = []
+    for group in groups.values():
+        durations = sorted(group.pop("durations"))
+        group.update({
+            "operations": sorted(group["operations"]),
+            "param_shapes": sorted(group["param_shapes"]),
+            "count": len(durations),
+            "total_ms": round(sum(durations), 1),
+            "p50_ms": durations[len(durations) // 2],
+            "max_ms": durations[-1]
+        })
+        summary.append(group)
+    return sorted(summary, key=lambda group: group["total_ms"], reverse=True)
+
+
+configure_from_env()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(f"Usage: python {sys.argv[0]} SLOW_QUERY_LOG [ROTATED_LOG ...]", file=sys.stderr)
+        sys.exit(1)
+    for group in summarize(sys.argv[1:]):
+        print(f"{group['fingerprint']}  {group['count']} slow, total {group['total_ms']} ms, "
+              f"p50 {group['p50_ms']} ms, max {group['max_ms']} ms, {group['rows']} rows")
+        print(f"  operations: {', '.join(group['operations'])}")
+        print(f"  sql: {group['sql']}")
+        for shapes in group["param_shapes"]:
+            print(f"  params: {shapes}")
+        for line in group["plan"]:
+            print(f"  plan: {line}")
+        print()
@@ -4,44 +4,86 @@ STDIO-over-TCP bridge for MCP protocol.
 This preserves the MCP stdio protocol but makes it accessible over TCP.
 """
 import asyncio
+import signal
 import sys
 import json
 import subprocess
 import os
 
 class StdioTCPBridge:
-    def __init__(self, port=9000):
+    def __init__(self, port=9000, warm_spare=True):
         self.port = port
-        self.mcp_process = None
+        # A pre-started MCP server process waiting for the next client, so a
+        # connection does not pay for the interpreter start and imports
+        self.warm_spare = warm_spare
+        # The spare is started in the background; this task returns it
+        self.spare_task = None
+    
+    async def spawn_mcp_process(self):
+        """Start an MCP server process speaking stdio."""
+        return await asyncio.create_subprocess_exec(
+            'python', '/app/main.py',
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd='/app'
+        )
+    
+    def start_spare(self):
+        """Start the next warm spare without waiting for it."""
+        if self.warm_spare and self.spare_task is None:
+            self.spare_task = asyncio.create_task(self.spawn_mcp_process())
+    
+    async def take_spare(self):
+        """The warm spare process, or None when there is none."""
+        task, self.spare_task = self.spare_task, None
+        if task is None:
+            return None
+        try:
+            return await task
+        except Exception as e:
+            print(f"Error starting spare MCP process: {e}", file=sys.stderr)
+            return None
+    
+    async def take_mcp_process(self):
+        """Hand out the warm spare if it is still running, and start the next one in the background."""
+        process = await self.take_spare()
+        if process is None or process.returncode is not None:
+            process = await self.spawn_mcp_process()
+        self.start_spare()
+        return process
+    
+    async def stop_spare(self):
+        """Terminate the warm spare, so it does not outlive the bridge."""
+        process = await self.take_spare()
+        if process is not None and process.returncode is None:
+            process.terminate()
+            await process.wait()
     
     async def handle_client(self, reader, writer):
         """Handle a client connection by bridging to MCP stdio."""
         client_addr = writer.get_extra_info('peername')
         print(f"MCP client connected: {client_addr}", file=sys.stderr)
         
+        # Every client gets its own process
+        mcp_process = None
         try:
-            # Start the MCP server process
-            self.mcp_process = await asyncio.create_subprocess_exec(
-                'python', '/app/main.py',
-                stdin=asyncio.subprocess.PIPE,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE,
-                cwd='/app'
-            )
+            mcp_process = await self.take_mcp_process()
             
             # Bridge data between TCP client and MCP process
             await asyncio.gather(
-                self.tcp_to_mcp(reader, self.mcp_process.stdin),
-                self.mcp_to_tcp(self.mcp_process.stdout, writer),
-                self.log_stderr(self.mcp_process.stderr)
+                self.tcp_to_mcp(reader, mcp_process.stdin),
+                self.mcp_to_tcp(mcp_process.stdout, writer),
+                self.log_stderr(mcp_process.stderr)
             )
             
         except Exception as e:
             print(f"Error handling client {client_addr}: {e}", file=sys.stderr)
         finally:
-            if self.mcp_process:
-                self.mcp_process.terminate()
-                await self.mcp_process.wait()
+            if mcp_process:
+                if mcp_process.returncode is None:
+                    mcp_process.terminate()
+                await mcp_process.wait()
             writer.close()
             await writer.wait_closed()
             print(f"MCP client disconnected: {client_addr}", file=sys.stderr)
@@ -95,22 +137,35 @@ class StdioTCPBridge:
         else:
             print(f"Database found at {MESSAGES_DB_PATH}", file=sys.stderr)
         
-        server = await asyncio.start_server(
-            self.handle_client,
-            '0.0.0.0',
-            self.port
-        )
-        
-        addr = server.sockets[0].getsockname()
-        print(f"MCP STDIO-TCP bridge running on {addr[0]}:{addr[1]}", file=sys.stderr)
-        print("n8n can connect with: nc whatsapp-mcp-server 9000", file=sys.stderr)
-        
-        async with server:
-            await server.serve_forever()
+        self.start_spare()
+        try:
+            server = await asyncio.start_server(
+                self.handle_client,
+                '0.0.0.0',
+                self.port
+            )
+            
+            addr = server.sockets[0].getsockname()
+            print(f"MCP STDIO-TCP bridge running on {addr[0]}:{addr[1]}", file=sys.stderr)
+            print("n8n can connect with: nc whatsapp-mcp-server 9000", file=sys.stderr)
+            
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.stop_spare()
 
 async def main():
-    bridge = StdioTCPBridge(port=9000)
-    await bridge.start_server()
+    warm_spare = os.environ.get("WHATSAPP_MCP_WARM_SPARE", "1").lower() not in ("0", "false", "no")
+    bridge = StdioTCPBridge(port=9000, warm_spare=warm_spare)
+    # Stop on SIGTERM (docker stop) the way Ctrl-C does, so the spare is terminated
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    except NotImplementedError:  # Windows
+        pass
+    try:
+        await bridge.start_server()
+    except asyncio.CancelledError:
+        pass
 
 if __name__ == "__main__":
     asyncio.run(main()) 
\ No newline at end of file
@@ -9,6 +9,8 @@ import traceback
 import os
 from mcp.server.fastmcp import FastMCP
 from main import mcp  # Import the configured MCP server from main.py
+import indexing
+import profiling
 
 async def tcp_server_handler(reader, writer):
     """Handle TCP client connections for MCP protocol."""
@@ -70,16 +72,18 @@ async def main():
         else:
             print(f"Database found at {MESSAGES_DB_PATH}", file=sys.stderr)
         
-        # Test API connection
+        # Test API connection in the background so a slow or missing bridge
+        # does not delay accepting connections
         print("Testing API connection...", file=sys.stderr)
-        import requests
-        from whatsapp import get_api_url
-        try:
-            api_url = get_api_url()
-            response = requests.get(f"{api_url}/health", timeout=5)
-            print(f"API connection test: {response.status_code}", file=sys.stderr)
-        except Exception as api_e:
-            print(f"API connection failed: {api_e}", file=sys.stderr)
+        from whatsapp import check_bridge_in_background
+        check_bridge_in_background()
+        
+        # Profiling sessions: WHATSAPP_PROFILE at startup or SIGUSR1 at runtime
+        profiling.install_signal_handler()
+        profiling.start_from_env()
+        
+        # Sidecar indexes named in WHATSAPP_BUILD_INDEXES are built right away
+        indexing.start_from_env()
         
         # Start TCP server
         server = await asyncio.start_server(
@@ -0,0 +1,62 @@
+"""
+Shared fixtures.
+
+Tests run against a small synthetic messages.db with the bridge's schema
+(benchmarks/synthetic_db.py), which whatsapp.py reads for the duration of a
+test. store() writes messages the way the bridge does, with INSERT OR
+REPLACE, so a message stored again moves to a new rowid.
+"""
+import os
+import sqlite3
+import sys
+
+import pytest
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+sys.path.insert(0, os.path.join(SERVER_DIR, "benchmarks"))
+
+import readcache
+import whatsapp
+from synthetic_db import generate
+
+
+@pytest.fixture
+def messages_db(tmp_path, monkeypatch):
+    """Path of a synthetic messages.db that whatsapp.py reads from."""
+    path = str(tmp_path / "messages.db")
+    generate(path, chats=20, messages=3000, days=30)
+    monkeypatch.setattr(whatsapp, "MESSAGES_DB_PATH", path)
+    monkeypatch.setattr(readcache.CACHE, "ttl", 0)
+    readcache.CACHE.clear()
+    return path
+
+
+@pytest.fixture
+def store(messages_db):
+    """Store messages in messages_db the way the bridge does.
+
+    Each message is a dict with id, chat_jid, sender, content and timestamp,
+    and optionally is_from_me and media_type.
+    """
+    def store(*messages):
+        conn = sqlite3.connect(messages_db)
+        try:
+            with conn:
+                for message in messages:
+                    conn.execute(
+                        "INSERT OR IGNORE INTO chats (jid, name, last_message_time) VALUES (?, ?, ?)",
+                        (message["chat_jid"], None, message["timestamp"])
+                    )
+                    conn.execute("""
+                        INSERT OR REPLACE INTO messages (id, chat_jid, sender, content, timestamp, is_from_me, media_type)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """, (
+                        message["id"], message["chat_jid"], message["sender"], message.get("content", ""),
+                        message["timestamp"], message.get("is_from_me", False), message.get("media_type", "")
+                    ))
+        finally:
+            conn.close()
+
+    return store
+
@@ -0,0 +1,34 @@
+import sqlite3
+
+import pytest
+
+pytest.importorskip("numpy")
+
+import analytics
+from chatstats import ChatStats
+
+NUMBER = "15551234567"
+
+
+def sender_counts(result):
+    return {item["sender"]: item["messages"] for item in result["top_senders"]}
+
+
+def test_senders_are_counted_by_number_like_chat_stats(store, messages_db, tmp_path):
+    chat = "120363000000000009@g.us"
+    store(*(
+        {"id": f"m{n}", "chat_jid": chat, "sender": sender, "timestamp": f"2030-01-01 10:{n:02d}:00+00:00"}
+        for n, sender in enumerate([NUMBER, f"{NUMBER}@s.whatsapp.net", f"{NUMBER}:3@s.whatsapp.net",
+                                    "15550100001", "15550100001@s.whatsapp.net"])
+    ))
+    activity = analytics.chat_activity(chat)
+    assert sender_counts(activity) == {NUMBER: 3, "15550100001": 2}
+
+    stats = ChatStats(str(tmp_path / "chat_stats.db"), messages_db)
+    stats.update()
+    conn = sqlite3.connect(messages_db)
+    busiest = conn.execute("SELECT chat_jid FROM messages GROUP BY chat_jid ORDER BY COUNT(*) DESC LIMIT 1").fetchone()[0]
+    conn.close()
+    for chat_jid in (chat, busiest):
+        assert sender_counts(analytics.chat_activity(chat_jid, top_senders=50)) == \
+            sender_counts(stats.stats(chat_jid, top_senders=50))
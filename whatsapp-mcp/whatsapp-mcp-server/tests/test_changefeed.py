@@ -0,0 +1,77 @@
+import asyncio
+import json
+import threading
+import time
+
+import changefeed
+from changefeed import ChangeFeed
+
+CHAT = "15550100001@s.whatsapp.net"
+OTHER_CHAT = "15550100002@s.whatsapp.net"
+
+
+def message(id, chat_jid=CHAT, content="hi"):
+    return {"id": id, "chat_jid": chat_jid, "sender": chat_jid.split("@")[0], "content": content,
+            "timestamp": "2025-03-01 10:00:00+00:00"}
+
+
+def test_changes_since_cursor(store, messages_db):
+    feed = ChangeFeed(messages_db)
+    start = feed.changes()
+    assert start["messages"] == [] and start["cursor"] > 0
+
+    store(message("A"), message("B"), message("C", OTHER_CHAT))
+    changes = feed.changes(start["cursor"])
+    assert [m.id for m in changes["messages"]] == ["A", "B", "C"]
+    assert not changes["has_more"]
+    assert feed.changes(changes["cursor"])["messages"] == []
+
+    # A message stored again comes back with its new content
+    store(message("A", content="edited"))
+    again = feed.changes(changes["cursor"])
+    assert [(m.id, m.content) for m in again["messages"]] == [("A", "edited")]
+
+
+def test_limit_and_chat_filter(store, messages_db):
+    feed = ChangeFeed(messages_db)
+    cursor = feed.changes()["cursor"]
+    store(*(message(f"M{n}") for n in range(5)), message("X", OTHER_CHAT))
+
+    first = feed.changes(cursor, limit=2)
+    assert [m.id for m in first["messages"]] == ["M0", "M1"] and first["has_more"]
+    rest = feed.changes(first["cursor"], limit=10, chat_jid=CHAT)
+    assert [m.id for m in rest["messages"]] == ["M2", "M3", "M4"]
+    assert feed.changes(rest["cursor"], chat_jid=CHAT)["messages"] == []
+
+
+def test_long_poll_returns_when_a_message_arrives(store, messages_db):
+    feed = ChangeFeed(messages_db, poll_interval=0.05)
+    cursor = feed.changes()["cursor"]
+    threading.Timer(0.3, store, [message("late")]).start()
+    started = time.monotonic()
+    changes = feed.changes(cursor, wait_seconds=5)
+    assert [m.id for m in changes["messages"]] == ["late"]
+    assert time.monotonic() - started < 3
+
+
+def test_long_poll_does_not_block_other_tools(messages_db, monkeypatch):
+    import main
+
+    monkeypatch.setattr(changefeed, "_default_feed", ChangeFeed(poll_interval=0.05))
+    finished = []
+
+    async def poll(cursor):
+        await main.mcp.call_tool("get_message_changes", {"cursor": cursor, "wait_seconds": 1.5})
+        finished.append("poll")
+
+    async def list_chats():
+        await asyncio.sleep(0.1)
+        await main.mcp.call_tool("list_chats", {"limit": 5})
+        finished.append("list_chats")
+
+    async def both():
+        cursor = json.loads(await main.get_message_changes())["cursor"]
+        await asyncio.gather(poll(cursor), list_chats())
+
+    asyncio.run(both())
+    assert finished == ["list_chats", "poll"]
@@ -0,0 +1,185 @@
+import random
+import sqlite3
+import time
+
+import pytest
+
+import chatstats
+import contacts
+from chatstats import ChatStats
+
+NUMBER = "15551234567"
+
+
+@pytest.fixture
+def stats(tmp_path, messages_db):
+    return ChatStats(str(tmp_path / "chat_stats.db"), messages_db)
+
+
+def members(db_path, count, seed=0):
+    conn = sqlite3.connect(db_path)
+    try:
+        senders = sorted({contacts.normalize_number(row[0]) for row in conn.execute("SELECT sender FROM messages")})
+    finally:
+        conn.close()
+    return random.Random(seed).sample(senders, count)
+
+
+def test_membership_matches_a_scan_of_messages(stats, store, messages_db):
+    stats.update()
+    for number in members(messages_db, 15):
+        for jid in (number, f"{number}@s.whatsapp.net"):
+            assert sorted(stats.contact_chats(jid)) == sorted(chatstats.scan_contact_chats(jid, messages_db))
+            assert stats.last_interaction(jid) == chatstats.scan_last_interaction(jid, messages_db)
+
+
+def test_bare_and_jid_senders_are_one_member(stats, store, messages_db):
+    store(
+        {"id": "old", "chat_jid": "120363000000000001@g.us", "sender": f"{NUMBER}@s.whatsapp.net",
+         "timestamp": "2030-01-01 10:00:00+00:00"},
+        {"id": "device", "chat_jid": "120363000000000002@g.us", "sender": f"{NUMBER}:12@s.whatsapp.net",
+         "timestamp": "2030-01-02 10:00:00+00:00"},
+        {"id": "new", "chat_jid": "120363000000000003@g.us", "sender": NUMBER,
+         "timestamp": "2030-01-03 10:00:00+00:00"},
+        {"id": "mine", "chat_jid": f"{NUMBER}@s.whatsapp.net", "sender": "15550100000", "is_from_me": True,
+         "timestamp": "2029-12-31 10:00:00+00:00"},
+    )
+    stats.update()
+    for jid in (NUMBER, f"{NUMBER}@s.whatsapp.net", f"+{NUMBER}"):
+        assert stats.last_interaction(jid) == ("120363000000000003@g.us", "new")
+        assert sorted(chat for chat, _ in stats.contact_chats(jid)) == [
+            "120363000000000001@g.us", "120363000000000002@g.us", "120363000000000003@g.us",
+            f"{NUMBER}@s.whatsapp.net"
+        ]
+
+
+def test_replaced_last_message_moves_the_member_back(stats, store, messages_db):
+    chat = "120363000000000001@g.us"
+    store(
+        {"id": "first", "chat_jid": chat, "sender": NUMBER, "timestamp": "2030-01-01 10:00:00+00:00"},
+        {"id": "second", "chat_jid": chat, "sender": NUMBER, "timestamp": "2030-01-02 10:00:00+00:00"},
+    )
+    stats.update()
+    assert stats.last_interaction(NUMBER) == (chat, "second")
+    # History sync re-stores the message with an older time and a different sender form
+    store({"id": "second", "chat_jid": chat, "sender": f"{NUMBER}@s.whatsapp.net",
+           "timestamp": "2029-12-31 10:00:00+00:00"})
+    stats.update()
+    assert stats.last_interaction(NUMBER) == (chat, "first")
+    assert stats.last_interaction(NUMBER) == chatstats.scan_last_interaction(NUMBER, messages_db)
+
+
+def test_unwritable_sidecar_falls_back_to_scanning(tmp_path, store, messages_db, capsys):
+    store({"id": "new", "chat_jid": "120363000000000003@g.us", "sender": f"{NUMBER}@s.whatsapp.net",
+           "timestamp": "2030-01-03 10:00:00+00:00"})
+    broken = ChatStats(str(tmp_path / "missing" / "chat_stats.db"), messages_db)
+    assert broken.last_interaction(NUMBER) == ("120363000000000003@g.us", "new")
+    assert broken.contact_chats(NUMBER) == [("120363000000000003@g.us", "new")]
+    assert "scanning messages instead" in capsys.readouterr().err
+
+
+def test_top_senders_count_one_person_once(stats, store):
+    chat = "120363000000000001@g.us"
+    store(
+        {"id": "a", "chat_jid": chat, "sender": NUMBER, "timestamp": "2030-01-01 10:00:00+00:00"},
+        {"id": "b", "chat_jid": chat, "sender": f"{NUMBER}@s.whatsapp.net", "timestamp": "2030-01-01 11:00:00+00:00"},
+    )
+    stats.update()
+    result = stats.stats(chat, "2030-01-01", "2030-01-01")
+    assert result["top_senders"] == [{"sender": NUMBER, "messages": 2}]
+
+
+def brute_force_stats(db_path, chat_jid, low, high):
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute("""
+            SELECT sender, is_from_me, media_type, substr(timestamp, 1, 10) FROM messages
+            WHERE chat_jid = ? AND timestamp != '' AND substr(timestamp, 1, 10) BETWEEN ? AND ?
+        """, (chat_jid, low, high)).fetchall()
+    finally:
+        conn.close()
+    senders, media_types = {}, {}
+    for sender, _, media_type, _ in rows:
+        number = contacts.normalize_number(sender or "")
+        senders[number] = senders.get(number, 0) + 1
+        if media_type:
+            media_types[media_type] = media_types.get(media_type, 0) + 1
+    days = sorted(day for *_, day in rows)
+    return {
+        "messages": len(rows),
+        "from_me": sum(1 for row in rows if row[1]),
+        "media": sum(1 for row in rows if row[2]),
+        "first_active_day": days[0] if days else None,
+        "last_active_day": days[-1] if days else None,
+        "senders": senders,
+        "media_types": media_types
+    }
+
+
+def served_stats(stats, chat_jid, low, high):
+    result = stats.stats(chat_jid, low, high, top_senders=500)
+    return {
+        "messages": result["messages"],
+        "from_me": result["from_me"],
+        "media": result["media"],
+        "first_active_day": result["first_active_day"],
+        "last_active_day": result["last_active_day"],
+        "senders": {entry["sender"]: entry["messages"] for entry in result["top_senders"]},
+        "media_types": result["media_types"]
+    }
+
+
+def test_stats_match_brute_force_over_any_range(stats, store, messages_db):
+    conn = sqlite3.connect(messages_db)
+    chats = [row[0] for row in conn.execute(
+        "SELECT chat_jid FROM messages GROUP BY chat_jid ORDER BY COUNT(*) DESC LIMIT 5"
+    )]
+    conn.close()
+    rng = random.Random(1)
+    stats.update()
+    # History sync re-stores a few messages with other days and senders
+    store(*(
+        {"id": f"late-{n}", "chat_jid": chats[0], "sender": f"{NUMBER}@s.whatsapp.net", "media_type": "image",
+         "timestamp": f"2024-01-{n + 10:02d} 08:00:00+00:00"}
+        for n in range(5)
+    ))
+    stats.update()
+    for chat_jid in chats:
+        for _ in range(10):
+            low, high = sorted(f"2024-01-{rng.randint(1, 31):02d}" for _ in range(2))
+            assert served_stats(stats, chat_jid, low, high) == brute_force_stats(messages_db, chat_jid, low, high)
+        assert served_stats(stats, chat_jid, None, None) == brute_force_stats(messages_db, chat_jid, "0", "9")
+
+
+def test_stats_are_not_served_before_the_first_build(stats, messages_db):
+    with pytest.raises(chatstats.IndexNotReady):
+        stats.stats("120363000000000001@g.us")
+    # Membership lookups scan messages meanwhile
+    number = members(messages_db, 1)[0]
+    assert stats.last_interaction(number) == chatstats.scan_last_interaction(number, messages_db)
+
+
+def test_background_updates_build_and_catch_up(stats, store, messages_db):
+    import indexing
+
+    updater = indexing.BackgroundUpdater("test_chat_stats", stats.update, interval=0.05)
+    updater.ensure_started()
+    deadline = time.monotonic() + 30
+    while updater.updates < 1:
+        assert time.monotonic() < deadline and updater.last_error is None
+        time.sleep(0.02)
+    chat = "120363000000000009@g.us"
+    store({"id": "bg", "chat_jid": chat, "sender": NUMBER, "timestamp": "2030-01-01 10:00:00+00:00"})
+    while stats.stats(chat)["messages"] != 1:
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+
+
+def test_build_indexes_from_env_starts_the_named_updaters(monkeypatch):
+    import indexing
+
+    started = []
+    monkeypatch.setenv("WHATSAPP_BUILD_INDEXES", "chat_stats, nonsense")
+    monkeypatch.setattr(indexing.BackgroundUpdater, "ensure_started", lambda self: started.append(self.name))
+    indexing.start_from_env()
+    assert started == ["chat_stats"]
@@ -0,0 +1,97 @@
+import os
+import sqlite3
+
+import pytest
+
+pytest.importorskip("pyarrow")
+
+import columnar
+from synthetic_db import generate
+
+
+@pytest.fixture
+def export(messages_db, tmp_path):
+    return columnar.ColumnarExport(str(tmp_path / "columnar"), messages_db)
+
+
+def stored_messages(db_path, where="1"):
+    conn = sqlite3.connect(db_path)
+    try:
+        return {
+            (id_, chat_jid): (content, sender)
+            for id_, chat_jid, content, sender in conn.execute(
+                f"SELECT id, chat_jid, content, sender FROM messages WHERE {where}"
+            )
+        }
+    finally:
+        conn.close()
+
+
+def exported_messages(table):
+    return {
+        (id_, chat_jid): (content, sender)
+        for id_, chat_jid, content, sender in zip(*(table[name].to_pylist() for name in ("id", "chat_jid", "content", "sender")))
+    }
+
+
+def test_export_matches_the_messages_table(export, messages_db):
+    assert export.catch_up(batch_size=700) > 0
+    table = export.read_messages()
+    assert table.num_rows == len(stored_messages(messages_db))
+    assert exported_messages(table) == stored_messages(messages_db)
+    assert export.months() == ["2024-01"]
+    assert export.read_chats().num_rows == sqlite3.connect(messages_db).execute("SELECT COUNT(*) FROM chats").fetchone()[0]
+
+
+def test_catch_up_appends_only_new_rows_and_keeps_the_latest_copy(export, store, messages_db):
+    export.catch_up()
+    assert export.catch_up() == 0
+    conn = sqlite3.connect(messages_db)
+    id_, chat_jid, timestamp = conn.execute("SELECT id, chat_jid, timestamp FROM messages LIMIT 1").fetchone()
+    conn.close()
+    store(
+        {"id": id_, "chat_jid": chat_jid, "sender": "15550109999", "content": "edited", "timestamp": timestamp},
+        {"id": "new", "chat_jid": chat_jid, "sender": "15550109999", "content": "new", "timestamp": "2024-02-01 09:00:00+00:00"},
+    )
+    assert export.catch_up() == 2
+    assert export.months() == ["2024-01", "2024-02"]
+    assert exported_messages(export.read_messages()) == stored_messages(messages_db)
+    copies = export.read_messages(latest_only=False)
+    assert copies.num_rows == len(stored_messages(messages_db)) + 1
+
+    assert export.compact() == 1
+    assert export.read_messages(latest_only=False).num_rows == len(stored_messages(messages_db))
+    assert exported_messages(export.read_messages()) == stored_messages(messages_db)
+
+
+def test_reads_select_months_and_columns(export, store, messages_db):
+    store({"id": "feb", "chat_jid": "120363000000000001@g.us", "sender": "15550109999", "content": "feb",
+           "timestamp": "2024-02-10 09:00:00+00:00"})
+    export.catch_up()
+    february = export.read_messages("2024-02", "2024-02", columns=["id", "timestamp"])
+    assert february.column_names == ["id", "timestamp"]
+    assert february["id"].to_pylist() == ["feb"]
+    assert export.read_messages(end_month="2024-01").num_rows == len(stored_messages(messages_db, "id != 'feb'"))
+
+
+def test_a_different_source_starts_over(export, tmp_path, messages_db):
+    export.catch_up()
+    other = str(tmp_path / "other.db")
+    conn, target = sqlite3.connect(messages_db), sqlite3.connect(other)
+    with target:
+        conn.backup(target)
+        target.execute("DELETE FROM messages WHERE rowid > 10")
+    conn.close()
+    target.close()
+    export.db_path = other
+    assert export.catch_up() == 10
+    assert export.read_messages().num_rows == 10
+
+
+def test_a_recreated_source_starts_over(export, messages_db):
+    export.catch_up()
+    # A new messages.db at the same path numbers its rows from 1 again
+    os.remove(messages_db)
+    generate(messages_db, chats=2, messages=10, days=1)
+    assert export.catch_up() == 10
+    assert exported_messages(export.read_messages()) == stored_messages(messages_db)
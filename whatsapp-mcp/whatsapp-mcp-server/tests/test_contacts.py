@@ -0,0 +1,85 @@
+import sqlite3
+
+import pytest
+
+import contacts
+
+
+@pytest.fixture
+def index(messages_db):
+    index = contacts.ContactIndex()
+    yield index
+    index.close()
+
+
+@pytest.fixture
+def add_chats(messages_db):
+    """Write chats the way the bridge does, so an updated chat gets a new rowid."""
+    def add_chats(*chats):
+        conn = sqlite3.connect(messages_db)
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO chats (jid, name, last_message_time) VALUES (?, ?, '2024-01-01 00:00:00+00:00')",
+                    chats
+                )
+        finally:
+            conn.close()
+
+    return add_chats
+
+
+@pytest.mark.parametrize("value, number", [
+    ("+1 (555) 010-9999", "15550109999"),
+    ("0015550109999", "15550109999"),
+    ("15550109999@s.whatsapp.net", "15550109999"),
+    ("15550109999:12@s.whatsapp.net", "15550109999"),
+    ("123456789012345@lid", "123456789012345"),
+])
+def test_normalize_number(value, number):
+    assert contacts.normalize_number(value) == number
+
+
+def test_resolve_matches_whole_numbers_only(index, add_chats):
+    add_chats(("15550109999@s.whatsapp.net", "Ana"), ("4415550109999@s.whatsapp.net", "Ben"))
+    assert index.resolve("15550109999") == ("15550109999@s.whatsapp.net", "Ana")
+    assert index.resolve("+44 1555 0109999") == ("4415550109999@s.whatsapp.net", "Ben")
+    assert index.resolve("5550109999") is None
+
+
+def test_resolve_prefers_an_exact_jid_then_a_phone_number_jid(index, add_chats):
+    add_chats(("15550109999@lid", "Ana (LID)"), ("15550109999@s.whatsapp.net", "Ana"))
+    assert index.resolve("15550109999@lid") == ("15550109999@lid", "Ana (LID)")
+    assert index.resolve("15550109999") == ("15550109999@s.whatsapp.net", "Ana")
+
+
+def test_search_orders_exact_then_substring_then_fuzzy(index, add_chats):
+    add_chats(
+        ("15550100001@s.whatsapp.net", "José Álvarez"),
+        ("15550100002@s.whatsapp.net", "Jose Alvares"),
+        ("15550100003@s.whatsapp.net", "Maria Jose"),
+        ("120363000000000077@g.us", "Jose's group"),
+    )
+    assert [jid for jid, _ in index.search("jose alvarez")] == [
+        "15550100001@s.whatsapp.net", "15550100002@s.whatsapp.net"
+    ]
+    assert [name for _, name in index.search("JOSE")][:3] == ["Jose Alvares", "José Álvarez", "Maria Jose"]
+    assert index.search("15550100003")[0] == ("15550100003@s.whatsapp.net", "Maria Jose")
+    assert all(not contacts.is_group(jid) for jid, _ in index.search("jose"))
+    assert index.search("   ") == []
+
+
+def test_index_follows_renames_and_recreated_databases(index, add_chats, messages_db):
+    add_chats(("15550109999@s.whatsapp.net", "Ana"))
+    assert index.search("ana")[0] == ("15550109999@s.whatsapp.net", "Ana")
+    add_chats(("15550109999@s.whatsapp.net", "Beatriz"))
+    assert index.resolve("15550109999") == ("15550109999@s.whatsapp.net", "Beatriz")
+    assert "15550109999@s.whatsapp.net" not in [jid for jid, _ in index.search("ana")]
+
+    conn = sqlite3.connect(messages_db)
+    with conn:
+        conn.execute("DELETE FROM chats")
+    conn.close()
+    add_chats(("15550108888@s.whatsapp.net", "Carla"))
+    assert index.resolve("15550109999") is None
+    assert index.resolve("15550108888") == ("15550108888@s.whatsapp.net", "Carla")
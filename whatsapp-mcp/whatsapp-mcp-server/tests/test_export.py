@@ -0,0 +1,42 @@
+import json
+import os
+import sqlite3
+
+import pytest
+
+import whatsapp
+
+
+@pytest.fixture
+def export_dir(messages_db, tmp_path, monkeypatch):
+    directory = tmp_path / "exports"
+    monkeypatch.setenv("WHATSAPP_EXPORT_DIR", str(directory))
+    return directory
+
+
+def test_export_writes_inside_the_export_directory(export_dir, messages_db):
+    conn = sqlite3.connect(messages_db)
+    chat_jid, stored = conn.execute(
+        "SELECT chat_jid, COUNT(*) FROM messages GROUP BY chat_jid ORDER BY chat_jid LIMIT 1"
+    ).fetchone()
+    conn.close()
+    assert whatsapp.export_chat(chat_jid, "chats/first.ndjson") == stored
+    path = export_dir / "chats" / "first.ndjson"
+    assert whatsapp.resolve_export_path("chats/first.ndjson") == os.path.realpath(path)
+    lines = path.read_text().splitlines()
+    assert len(lines) == stored and json.loads(lines[0])["chat_jid"] == chat_jid
+
+
+@pytest.mark.parametrize("output_path", ["", "/tmp/escape.ndjson", "../escape.ndjson", "a/../../escape.ndjson", "."])
+def test_paths_outside_the_export_directory_are_rejected(export_dir, tmp_path, output_path):
+    with pytest.raises(ValueError):
+        whatsapp.export_chat("120363000000000001@g.us", output_path)
+    assert not (tmp_path / "escape.ndjson").exists()
+
+
+def test_symlinks_cannot_leave_the_export_directory(export_dir, tmp_path):
+    export_dir.mkdir()
+    os.symlink(tmp_path, export_dir / "link")
+    with pytest.raises(ValueError):
+        whatsapp.export_chat("120363000000000001@g.us", "link/escape.ndjson")
+    assert not (tmp_path / "escape.ndjson").exists()
@@ -0,0 +1,38 @@
+import threading
+
+import profiling
+
+
+def test_overlapping_invocations_run_unprofiled(tmp_path):
+    profiling.start("cpu", seconds=None, directory=str(tmp_path))
+    try:
+        inside, release = threading.Event(), threading.Event()
+
+        def slow():
+            inside.set()
+            release.wait(5)
+            return "slow"
+
+        results = []
+        thread = threading.Thread(target=lambda: results.append(profiling.run("list_chats", slow)))
+        thread.start()
+        assert inside.wait(5)
+        # A second invocation while the first is profiled must not try to enable another profiler
+        assert profiling.run("list_chats", lambda: "fast") == "fast"
+        release.set()
+        thread.join(5)
+        assert results == ["slow"]
+        assert profiling.run("list_chats", lambda: "after") == "after"
+        status = profiling.status()
+        assert status["profiled_invocations"] == 2 and status["skipped_invocations"] == 1
+    finally:
+        result = profiling.stop()
+    assert any(path.endswith(".prof") for path in result["files"])
+
+
+def test_invocation_budget_stops_the_session(tmp_path):
+    profiling.start("cpu", seconds=None, tool="get_chat", invocations=1, directory=str(tmp_path))
+    assert profiling.run("list_chats", lambda: 1) == 1
+    assert profiling.active()
+    assert profiling.run("get_chat", lambda: 2) == 2
+    assert not profiling.active()
@@ -0,0 +1,138 @@
+import asyncio
+import functools
+import threading
+import time
+
+import pytest
+
+import readcache
+import whatsapp
+
+
+@pytest.fixture
+def cache(messages_db):
+    return readcache.ReadCache(ttl=60)
+
+
+def slow_read(calls, result, seconds=0.2):
+    def read(*args):
+        calls.append(args)
+        time.sleep(seconds)
+        return list(result)
+    return read
+
+
+def test_identical_concurrent_calls_share_one_execution(cache):
+    calls, results = [], []
+    read = slow_read(calls, [1, 2, 3])
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.call("read", ("read", 1), read, 1)))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert results == [[1, 2, 3]] * 8
+    # Every caller got its own list
+    results[0].append(4)
+    assert cache.call("read", ("read", 1), read, 1) == [1, 2, 3]
+    counts = cache.status()["functions"]["read"]
+    assert (counts["miss"], counts["coalesced"], counts["hit"]) == (1, 7, 1)
+
+
+def test_errors_are_shared_but_not_cached(cache):
+    calls = []
+
+    def failing():
+        calls.append(None)
+        time.sleep(0.1)
+        raise ValueError("boom")
+
+    errors = []
+
+    def call():
+        try:
+            cache.call("failing", ("failing",), failing)
+        except ValueError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1 and len(errors) == 4
+    with pytest.raises(ValueError):
+        cache.call("failing", ("failing",), failing)
+    assert len(calls) == 2
+
+
+def test_a_committed_write_invalidates_cached_results(cache, store):
+    calls = []
+    read = slow_read(calls, ["a"], seconds=0)
+    cache.call("read", ("read",), read)
+    cache.call("read", ("read",), read)
+    assert len(calls) == 1
+    store({"id": "new", "chat_jid": "15550109999@s.whatsapp.net", "sender": "15550109999",
+           "timestamp": "2030-01-01 00:00:00+00:00"})
+    cache.call("read", ("read",), read)
+    assert len(calls) == 2
+    assert cache.status()["evictions"]["invalidated"] == 1
+
+
+def test_results_expire_and_capacity_evicts_the_least_recently_used(cache):
+    calls = []
+    read = slow_read(calls, ["a"], seconds=0)
+    cache.max_entries = 2
+    for key in (1, 2, 1, 3):
+        cache.call("read", ("read", key), read, key)
+    assert [args[0] for args in calls] == [1, 2, 3]
+    cache.call("read", ("read", 1), read, 1)
+    assert len(calls) == 3
+    assert cache.status()["evictions"]["capacity"] == 1
+
+    cache.ttl = 0.01
+    cache.call("read", ("read", 4), read, 4)
+    time.sleep(0.02)
+    cache.call("read", ("read", 4), read, 4)
+    assert [args[0] for args in calls][-2:] == [4, 4]
+
+
+def test_cached_read_bypasses_unhashable_arguments(cache, monkeypatch):
+    monkeypatch.setattr(readcache, "CACHE", cache)
+    calls = []
+
+    @readcache.cached_read
+    def read(values, limit=10):
+        calls.append(values)
+        return values[:limit]
+
+    assert read([1, 2]) == [1, 2] and read([1, 2]) == [1, 2]
+    assert len(calls) == 2
+    assert read((1, 2)) == read((1, 2), limit=10)
+    assert len(calls) == 3
+
+
+def test_concurrent_tool_calls_coalesce_in_the_mcp_server(messages_db, monkeypatch):
+    import main
+
+    monkeypatch.setattr(readcache.CACHE, "ttl", 60)
+    readcache.CACHE.reset()
+    list_chats = whatsapp.list_chats.__wrapped__
+
+    @functools.wraps(list_chats)
+    def slow_list_chats(*args, **kwargs):
+        time.sleep(0.3)
+        return list_chats(*args, **kwargs)
+
+    monkeypatch.setattr(main, "whatsapp_list_chats", readcache.cached_read(slow_list_chats))
+
+    async def calls():
+        return await asyncio.gather(*(main.mcp.call_tool("list_chats", {"limit": 5}) for _ in range(4)))
+
+    asyncio.run(calls())
+    counts = readcache.CACHE.status()["functions"]["list_chats"]
+    assert counts["miss"] == 1 and counts["coalesced"] == 3
+    readcache.CACHE.reset()
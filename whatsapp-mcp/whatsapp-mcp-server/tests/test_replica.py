@@ -0,0 +1,61 @@
+import os
+import sqlite3
+import time
+
+import pytest
+
+import replica
+import whatsapp
+from replica import ReplicaConfig
+
+
+def count(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def config(tmp_path):
+    config = ReplicaConfig(str(tmp_path / "replica.db"), interval=3600, max_staleness=60, pages=16)
+    yield config
+    replica.configure(None)
+
+
+def test_refresh_copies_only_when_the_database_changed(config, store, messages_db):
+    assert replica.refresh(config, messages_db) == "copied"
+    assert count(config.path) == count(messages_db)
+
+    # Refreshed moments ago by this or another process
+    assert replica.refresh(config, messages_db) == "skipped"
+    stale = time.time() - 3600
+    os.utime(config.path, (stale, stale))
+    os.utime(messages_db, (stale - 10, stale - 10))
+    assert replica.refresh(config, messages_db) == "unchanged"
+    assert replica.staleness(config) < 5
+
+    os.utime(config.path, (stale, stale))
+    store({"id": "new", "chat_jid": "15550100001@s.whatsapp.net", "sender": "15550100001",
+           "timestamp": "2025-03-01 10:00:00+00:00"})
+    assert replica.refresh(config, messages_db) == "copied"
+    assert count(config.path) == count(messages_db)
+
+
+def test_heavy_reads_use_the_replica_only_while_fresh(config, messages_db, monkeypatch):
+    # Refreshes are driven by the test rather than the background thread
+    monkeypatch.setattr(replica, "_ensure_refreshing", lambda primary: setattr(replica, "_primary", primary))
+    replica.configure(config)
+    replica.refresh(config, messages_db)
+    assert replica.read_path(messages_db) == config.path
+    conn = whatsapp.connect_db("test", heavy=True)
+    try:
+        assert conn.execute("PRAGMA database_list").fetchone()[2] == config.path
+    finally:
+        conn.close()
+
+    stale = time.time() - config.max_staleness - 1
+    os.utime(config.path, (stale, stale))
+    assert replica.read_path(messages_db) == messages_db
+    assert replica.status()["serving"] == "primary"
@@ -0,0 +1,108 @@
+import os
+import re
+import sqlite3
+import time
+
+import pytest
+
+import replica
+import scan
+
+
+def brute_force(db_path, pattern):
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute("SELECT id, chat_jid, content FROM messages WHERE content != ''").fetchall()
+    finally:
+        conn.close()
+    regex = re.compile(pattern, re.IGNORECASE)
+    return {(row[0], row[1]) for row in rows if regex.search(row[2])}
+
+
+def scan_all(page_size, **kwargs):
+    pages, cursor = [], None
+    while True:
+        result = scan.scan_messages(limit=page_size, cursor=cursor, **kwargs)
+        pages.append(result["messages"])
+        cursor = result["cursor"]
+        if cursor is None:
+            return pages
+
+
+def test_paged_scan_finds_every_match_once(messages_db):
+    pages = scan_all(25, pattern=r"\binvoice\b.*\bpayment\b")
+    found = [(message.id, message.chat_jid) for page in pages for message in page]
+    assert len(found) == len(set(found))
+    assert set(found) == brute_force(messages_db, r"\binvoice\b.*\bpayment\b")
+
+
+def test_pages_are_sorted_newest_first(messages_db, store):
+    # A message re-stored by history sync is scanned with the newest rows
+    store({"id": "old", "chat_jid": "120363000000000001@g.us", "sender": "15550109999",
+           "content": "old invoice", "timestamp": "2023-06-01 12:00:00+00:00"})
+    page = scan.scan_messages(pattern="invoice", limit=20)["messages"]
+    assert "old" in [message.id for message in page]
+    timestamps = [message.timestamp_iso for message in page]
+    assert timestamps == sorted(timestamps, reverse=True)
+
+
+def test_keywords_ignore_case_and_accents(messages_db, store):
+    chat = "120363000000000002@g.us"
+    store(
+        {"id": "a", "chat_jid": chat, "sender": "15550109999", "content": "Réunion au CAFÉ demain", "timestamp": "2030-01-01 10:00:00+00:00"},
+        {"id": "b", "chat_jid": chat, "sender": "15550109999", "content": "reunion cancelled", "timestamp": "2030-01-01 11:00:00+00:00"},
+        {"id": "c", "chat_jid": chat, "sender": "15550109999", "content": "cafe tomorrow", "timestamp": "2030-01-01 12:00:00+00:00"},
+    )
+    ids = lambda **kwargs: [m.id for m in scan.scan_messages(chat_jid=chat, **kwargs)["messages"]]
+    assert ids(all_keywords=["reunion", "cafe"]) == ["a"]
+    assert ids(any_keywords=["café"], none_keywords=["tomorrow"]) == ["a"]
+    assert ids(all_keywords=["reunion"], ignore_diacritics=False) == ["b"]
+    assert ids(pattern="CAFE", ignore_case=False, ignore_diacritics=True) == ["a"]
+
+
+def test_invalid_requests_raise_value_error(messages_db):
+    with pytest.raises(ValueError):
+        scan.scan_messages(pattern="(unclosed")
+    with pytest.raises(ValueError):
+        scan.scan_messages(none_keywords=["only"])
+
+
+def test_slow_chunks_fail_with_scan_timeout(messages_db, monkeypatch):
+    monkeypatch.setenv("WHATSAPP_SCAN_CHUNK_SECONDS", "0.000001")
+    with pytest.raises(scan.ScanTimeout):
+        scan.scan_messages(pattern=r"(\w+\s?)+$")
+
+
+def test_worker_pool_matches_in_process_scan(messages_db, monkeypatch):
+    monkeypatch.setattr(scan, "CHUNK_ROWS", 500)
+    monkeypatch.setattr(scan, "MIN_POOL_ROWS", 1000)
+    spec = (r"\bdelivery\b", (), (), (), True, True)
+    try:
+        pooled = [row[0] for row in scan.iter_scan(spec, limit=scan.MAX_LIMIT, workers=2)]
+    finally:
+        scan.shutdown()
+    in_process = [row[0] for row in scan.iter_scan(spec, limit=scan.MAX_LIMIT, workers=1)]
+    assert pooled == in_process and pooled == sorted(pooled, reverse=True)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_scans_follow_replica_refreshes(messages_db, store, tmp_path, monkeypatch, workers):
+    monkeypatch.setattr(replica, "_ensure_refreshing", lambda primary: setattr(replica, "_primary", primary))
+    monkeypatch.setattr(scan, "CHUNK_ROWS", 500)
+    monkeypatch.setattr(scan, "MIN_POOL_ROWS", 1000)
+    monkeypatch.setenv("WHATSAPP_SCAN_WORKERS", str(workers))
+    config = replica.ReplicaConfig(str(tmp_path / "replica.db"), interval=3600, max_staleness=60)
+    replica.configure(config)
+    try:
+        replica.refresh(config, messages_db)
+        assert scan.scan_messages(pattern="zanzibar")["messages"] == []
+
+        store({"id": "new", "chat_jid": "120363000000000001@g.us", "sender": "15550109999",
+               "content": "zanzibar", "timestamp": "2030-01-01 10:00:00+00:00"})
+        stale = time.time() - 1800
+        os.utime(config.path, (stale, stale))
+        assert replica.refresh(config, messages_db) == "copied"
+        assert [m.id for m in scan.scan_messages(pattern="zanzibar")["messages"]] == ["new"]
+    finally:
+        replica.configure(None)
+        scan.shutdown()
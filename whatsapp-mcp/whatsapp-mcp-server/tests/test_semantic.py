@@ -0,0 +1,114 @@
+import os
+import sqlite3
+import threading
+
+import pytest
+
+pytest.importorskip("numpy")
+
+import semantic
+
+
+@pytest.fixture
+def index(messages_db, tmp_path):
+    return semantic.SemanticIndex(str(tmp_path / "semantic"), messages_db)
+
+
+def brute_force(db_path, word, limit):
+    """Score every message on its own: for one query term, the score is the term's weight in the message."""
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute("SELECT rowid, id, content FROM messages").fetchall()
+    finally:
+        conn.close()
+    target = semantic.feature(semantic.terms(word)[0])
+    scored = []
+    for rowid, message_id, content in rows:
+        features, _, weights = semantic.vectorize([content])
+        matching = weights[features == target]
+        if len(matching):
+            scored.append((round(float(matching[0]), 4), rowid, message_id))
+    scored.sort(key=lambda item: (-item[0], -item[1]))
+    return [(message_id, score) for score, _, message_id in scored[:limit]]
+
+
+def served(result):
+    return [(item["message"].id, item["score"]) for item in result["messages"]]
+
+
+def test_search_ranks_like_scoring_every_message(index, messages_db):
+    index.update(batch_size=400)
+    assert len(index.status()["segments"]) > 1
+    for word in ("invoice", "birthday", "tomorrow"):
+        assert served(index.search(word, limit=30)) == brute_force(messages_db, word, 30)
+
+
+def test_stems_accents_and_replaced_messages(index, store, messages_db):
+    chat = "120363000000000003@g.us"
+    store({"id": "a", "chat_jid": chat, "sender": "15550109999", "content": "Livraison du colis confirmée",
+           "timestamp": "2030-01-01 10:00:00+00:00"})
+    index.update()
+    assert [m.id for m in (item["message"] for item in index.search("livraisons confirmees")["messages"])][:1] == ["a"]
+
+    store({"id": "a", "chat_jid": chat, "sender": "15550109999", "content": "nothing to see",
+           "timestamp": "2030-01-01 10:00:00+00:00"})
+    index.update()
+    assert "a" not in [item["message"].id for item in index.search("livraison", chat_jid=chat)["messages"]]
+
+
+def test_search_waits_for_the_first_build(index):
+    with pytest.raises(semantic.IndexNotReady):
+        index.search("invoice")
+    index.update()
+    assert index.search("invoice")["messages"]
+
+
+def test_search_retries_when_a_merge_removed_its_segments(index, store, messages_db):
+    index.update(batch_size=500)
+    reader = semantic.SemanticIndex(index.directory, messages_db)
+    reader.search("invoice")
+    stale = reader._state
+
+    # A later update merges the segments the reader's state lists
+    store(*(
+        {"id": f"new-{n}", "chat_jid": "120363000000000004@g.us", "sender": "15550109999",
+         "content": f"invoice number {n}", "timestamp": "2030-01-02 10:00:00+00:00"}
+        for n in range(3000)
+    ))
+    index.update(batch_size=5000)
+    assert any(not os.path.exists(index._segment_dir(segment["name"])) for segment in stale["segments"])
+
+    # The reader read state.json just before the update replaced it
+    reader._segments.clear()
+    reader._state = stale
+    reader._state_mtime = os.stat(os.path.join(index.directory, "state.json")).st_mtime_ns
+    assert served(reader.search("invoice", limit=10)) == served(index.search("invoice", limit=10))
+
+
+def test_searches_during_updates_see_complete_states(index, store):
+    index.update()
+    failures = []
+    done = threading.Event()
+
+    def search():
+        while not done.is_set():
+            try:
+                index.search("invoice payment")
+            except Exception as e:
+                failures.append(e)
+                return
+
+    searcher = threading.Thread(target=search)
+    searcher.start()
+    try:
+        for batch in range(20):
+            store(*(
+                {"id": f"batch-{batch}-{n}", "chat_jid": "120363000000000005@g.us", "sender": "15550109999",
+                 "content": f"payment {batch} {n}", "timestamp": "2030-01-03 10:00:00+00:00"}
+                for n in range(50)
+            ))
+            index.update()
+    finally:
+        done.set()
+        searcher.join()
+    assert failures == []
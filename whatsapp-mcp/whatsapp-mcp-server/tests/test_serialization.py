@@ -0,0 +1,63 @@
+import json
+
+import serialization
+from whatsapp import Chat, Contact, Message, MessageContext
+
+
+def message(id, content="hello", media_type=None):
+    return Message("2025-03-01 10:00:00+00:00", "15550100001", content, 1, "15550100001@s.whatsapp.net", id,
+                   chat_name="Alice", media_type=media_type)
+
+
+def test_message_fields_and_booleans():
+    data = serialization.to_records(message("A"), compact=False)
+    assert data == {
+        "timestamp": "2025-03-01T10:00:00+00:00",
+        "sender": "15550100001",
+        "content": "hello",
+        "is_from_me": True,
+        "chat_jid": "15550100001@s.whatsapp.net",
+        "id": "A",
+        "chat_name": "Alice",
+        "media_type": None
+    }
+
+
+def test_compact_drops_null_fields():
+    data = serialization.to_records(message("A"), compact=True)
+    assert "media_type" not in data
+    assert data["is_from_me"] is True
+
+    contact = Contact("15550100001", None, "15550100001@s.whatsapp.net")
+    assert serialization.to_records(contact, compact=True) == {
+        "phone_number": "15550100001", "jid": "15550100001@s.whatsapp.net"
+    }
+
+
+def test_compact_drops_empty_optional_strings():
+    data = serialization.to_records(message("A", media_type=""), compact=True)
+    assert "media_type" not in data
+    assert serialization.to_records(message("A", media_type=""), compact=False)["media_type"] == ""
+    # Empty content is kept: it is what a media message without a caption carries
+    assert serialization.to_records(message("B", content="", media_type="image"), compact=True)["content"] == ""
+
+    chat = Chat("123@g.us", "", "2025-03-01 10:00:00+00:00", last_message="", last_sender="")
+    assert set(serialization.to_records(chat, compact=True)) == {"jid", "last_message_time", "is_group"}
+
+
+def test_nested_records_and_frozen_copies():
+    context = MessageContext(message("B"), [message("A")], [message("C", media_type="image")])
+    for record in (context, context.freeze()):
+        data = serialization.to_records(record, compact=True)
+        assert data["message"]["id"] == "B"
+        assert [m["id"] for m in data["before"]] == ["A"]
+        assert data["after"][0]["media_type"] == "image"
+
+
+def test_dumps_lists_and_dicts():
+    chat = Chat("123@g.us", "Group", "2025-03-01 10:00:00+00:00", last_is_from_me=0)
+    decoded = json.loads(serialization.dumps({"chats": [chat], "count": 1}, compact=False))
+    assert decoded["count"] == 1
+    assert decoded["chats"][0]["is_group"] is True
+    assert decoded["chats"][0]["last_is_from_me"] is False
+    assert json.loads(serialization.dumps_bytes([chat], compact=True))[0]["jid"] == "123@g.us"
@@ -0,0 +1,87 @@
+import random
+import sqlite3
+
+import pytest
+
+pytest.importorskip("numpy")
+
+import sessions
+
+
+@pytest.fixture
+def index(messages_db, tmp_path):
+    return sessions.SessionIndex(str(tmp_path / "sessions.db"), messages_db)
+
+
+def brute_force(db_path):
+    """Cut every chat's messages, in time order, wherever the gap is exceeded."""
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute("""
+            SELECT chat_jid, (julianday(timestamp) - 2440587.5) * 86400.0 AS seconds FROM messages
+            WHERE seconds IS NOT NULL ORDER BY chat_jid, seconds
+        """).fetchall()
+    finally:
+        conn.close()
+    cut = []
+    for chat_jid, seconds in rows:
+        if cut and cut[-1][0] == chat_jid and seconds - cut[-1][2] <= sessions.SESSION_GAP_SECONDS:
+            cut[-1][2] = seconds
+        else:
+            cut.append([chat_jid, seconds, seconds])
+    return sorted(tuple(session) for session in cut)
+
+
+def stored_sessions(index):
+    conn = sqlite3.connect(index.index_db_path)
+    try:
+        return sorted(conn.execute("SELECT chat_jid, start_seconds, end_seconds FROM sessions").fetchall())
+    finally:
+        conn.close()
+
+
+def test_incremental_sessions_match_a_full_segmentation(index, store, messages_db):
+    index.update(batch_size=250)
+    assert stored_sessions(index) == brute_force(messages_db)
+
+    # History sync: old messages arrive late, some bridging sessions, and known ones are stored again
+    rng = random.Random(3)
+    conn = sqlite3.connect(messages_db)
+    chats = [row[0] for row in conn.execute("SELECT jid FROM chats")]
+    replayed = conn.execute("SELECT id, chat_jid, sender, timestamp FROM messages ORDER BY random() LIMIT 50").fetchall()
+    conn.close()
+    store(*(
+        {"id": f"late-{n}", "chat_jid": rng.choice(chats), "sender": "15550109999",
+         "timestamp": f"2024-01-{rng.randint(1, 30):02d} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00+00:00"}
+        for n in range(300)
+    ))
+    store(*({"id": id_, "chat_jid": chat_jid, "sender": sender, "timestamp": timestamp}
+            for id_, chat_jid, sender, timestamp in replayed))
+    index.update(batch_size=100)
+    assert stored_sessions(index) == brute_force(messages_db)
+
+
+def test_conversation_returns_the_whole_session(index, store):
+    chat = "120363000000000006@g.us"
+    times = ["10:00", "10:40", "11:30", "13:00", "13:10"]
+    store(*({"id": f"m{n}", "chat_jid": chat, "sender": "15550109999", "timestamp": f"2030-01-01 {t}:00+00:00"}
+            for n, t in enumerate(times)))
+    index.update()
+    first = index.conversation("m1", chat)
+    assert [m.id for m in first["messages"]] == ["m0", "m1", "m2"]
+    assert first["next_start_time"] == "2030-01-01 13:00:00+00:00"
+    latest = index.conversation(chat_jid=chat)
+    assert [m.id for m in latest["messages"]] == ["m3", "m4"]
+    assert latest["previous_end_time"] == "2030-01-01 11:30:00+00:00"
+    assert [m.id for m in index.conversation(chat_jid=chat, at="2030-01-01T12:00:00+00:00")["messages"]] == ["m0", "m1", "m2"]
+    assert index.conversation("m3", chat, limit=1)["truncated"]
+
+
+def test_conversations_wait_for_the_first_build(index, messages_db):
+    conn = sqlite3.connect(messages_db)
+    message_id, chat_jid = conn.execute("SELECT id, chat_jid FROM messages LIMIT 1").fetchone()
+    conn.close()
+    with pytest.raises(sessions.IndexNotReady):
+        index.conversation(message_id, chat_jid)
+    index.update()
+    assert message_id in [m.id for m in index.conversation(message_id, chat_jid)["messages"]]
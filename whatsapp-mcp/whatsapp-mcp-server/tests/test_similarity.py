@@ -0,0 +1,88 @@
+import sqlite3
+
+import pytest
+
+pytest.importorskip("numpy")
+
+import similarity
+
+FORWARD = "Please share: the community pantry on Elm Street is open on {day} from 9 to 5, bring bags!"
+DAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday")
+
+
+@pytest.fixture
+def index(messages_db, tmp_path):
+    return similarity.SimilarityIndex(str(tmp_path / "similarity.db"), messages_db)
+
+
+@pytest.fixture
+def flood(store):
+    """A message forwarded to several chats with a different day in each."""
+    store(*(
+        {"id": f"flood-{n}", "chat_jid": f"12036300000000000{n}@g.us", "sender": "15550109999",
+         "content": FORWARD.format(day=day), "timestamp": f"2024-01-20 10:0{n}:00+00:00"}
+        for n, day in enumerate(DAYS)
+    ))
+
+
+def brute_force(db_path, message_id, chat_jid, threshold):
+    """Compare the message with the signature of every message."""
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute("SELECT chat_jid, id, content FROM messages").fetchall()
+    finally:
+        conn.close()
+    rows = [(jid, id_, text) for jid, id_, content in rows
+            if len(text := similarity.normalize(content)) >= similarity.MIN_CONTENT_LENGTH]
+    signatures = similarity.signatures([text for *_, text in rows])
+    target = signatures[[(jid, id_) for jid, id_, _ in rows].index((chat_jid, message_id))]
+    scores = (signatures == target).mean(axis=1)
+    return {
+        (jid, id_): round(float(score), 3) for (jid, id_, _), score in zip(rows, scores)
+        if score >= threshold and (jid, id_) != (chat_jid, message_id)
+    }
+
+
+def served(result):
+    return {(item["message"].chat_jid, item["message"].id): item["similarity"] for item in result["similar"]}
+
+
+def test_lsh_finds_what_comparing_every_signature_finds(index, flood, messages_db):
+    index.update()
+    result = index.similar_to("flood-0", "120363000000000000@g.us", threshold=0.5, limit=200)
+    expected = brute_force(messages_db, "flood-0", "120363000000000000@g.us", 0.5)
+    found = served(result)
+    # Every reported score is exact, and the near-duplicates are all found
+    assert all(expected[key] == score for key, score in found.items())
+    assert {key for key, score in expected.items() if score >= 0.8} <= set(found)
+    assert {f"flood-{n}" for n in range(1, len(DAYS))} <= {id_ for _, id_ in found}
+    assert result["candidates"] < 100
+
+
+def test_replaced_messages_are_indexed_again(index, flood, store, messages_db):
+    index.update()
+    store({"id": "flood-1", "chat_jid": "120363000000000001@g.us", "sender": "15550109999",
+           "content": "something else entirely, nothing like the pantry", "timestamp": "2024-01-20 10:01:00+00:00"})
+    assert index.update() == 1
+    found = served(index.similar_to("flood-0", "120363000000000000@g.us", limit=200))
+    assert ("120363000000000001@g.us", "flood-1") not in found
+    conn = sqlite3.connect(index.index_db_path)
+    assert conn.execute("SELECT COUNT(*) FROM signatures WHERE id = 'flood-1'").fetchone()[0] == 1
+    conn.close()
+
+
+def test_clusters_group_the_flood(index, flood):
+    index.update()
+    result = index.clusters(after="2024-01-20T09:00:00", before="2024-01-20T11:00:00")
+    assert result["clusters"][0]["size"] == len(DAYS)
+    assert result["clusters"][0]["chats"] == len(DAYS)
+
+
+def test_queries_wait_for_the_first_build(index, flood):
+    with pytest.raises(similarity.IndexNotReady):
+        index.similar_to("flood-0", "120363000000000000@g.us")
+    with pytest.raises(similarity.IndexNotReady):
+        index.clusters()
+    index.update()
+    with pytest.raises(ValueError):
+        index.similar_to("missing")
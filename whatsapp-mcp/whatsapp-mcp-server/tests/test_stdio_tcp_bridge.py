@@ -0,0 +1,45 @@
+import asyncio
+import sys
+import time
+
+from stdio_tcp_bridge import StdioTCPBridge
+
+SPAWN_SECONDS = 0.3
+
+
+class SlowSpawnBridge(StdioTCPBridge):
+    """Starts a process that waits on stdin, taking SPAWN_SECONDS to do so."""
+
+    def __init__(self):
+        super().__init__(warm_spare=True)
+        self.processes = []
+
+    async def spawn_mcp_process(self):
+        await asyncio.sleep(SPAWN_SECONDS)
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, "-c", "import sys; sys.stdin.read()",
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+        )
+        self.processes.append(process)
+        return process
+
+
+def test_connections_do_not_wait_for_the_next_spare():
+    async def run():
+        bridge = SlowSpawnBridge()
+        bridge.start_spare()
+        await asyncio.sleep(SPAWN_SECONDS * 2)
+        started = time.perf_counter()
+        process = await bridge.take_mcp_process()
+        took = time.perf_counter() - started
+        assert process is bridge.processes[0] and process.returncode is None
+        assert took < SPAWN_SECONDS / 2
+
+        # The spare is terminated when the bridge stops, even while it is still starting
+        await bridge.stop_spare()
+        spare = bridge.processes[1]
+        assert spare.returncode is not None
+        process.terminate()
+        await process.wait()
+
+    asyncio.run(run())
@@ -0,0 +1,121 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from changefeed import ChangeFeed
+from webhooks import WebhookDispatcher, group_by_chat
+from whatsapp import Message
+
+CHAT = "15550100001@s.whatsapp.net"
+
+
+def message(id, chat_jid=CHAT, content="hi"):
+    return {"id": id, "chat_jid": chat_jid, "sender": chat_jid.split("@")[0], "content": content,
+            "timestamp": "2025-03-01 10:00:00+00:00"}
+
+
+@pytest.fixture
+def endpoint():
+    """A webhook receiver answering with the statuses queued in endpoint.statuses (200 once they run out)."""
+    received, statuses = [], []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            status = statuses.pop(0) if statuses else 200
+            received.append((status, body))
+            self.send_response(status)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    server.url = f"http://127.0.0.1:{server.server_port}/hook"
+    server.received, server.statuses = received, statuses
+    yield server
+    server.shutdown()
+
+
+def dispatcher(endpoint, messages_db, tmp_path, **kwargs):
+    return WebhookDispatcher(
+        [endpoint.url],
+        cursor_path=str(tmp_path / "cursors.json"),
+        dead_letter_path=str(tmp_path / "dead_letters.jsonl"),
+        poll_interval=0.02,
+        idle_check_interval=0.1,
+        feed=ChangeFeed(messages_db),
+        **kwargs
+    )
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.02)
+
+
+def delivered_ids(endpoint):
+    return [m["id"] for status, body in endpoint.received if status == 200
+            for event in body["events"] for m in event["messages"]]
+
+
+def test_group_by_chat_keeps_latest_version():
+    def make(id, chat_jid, content):
+        return Message("2025-03-01 10:00:00+00:00", "1", content, False, chat_jid, id)
+
+    events = group_by_chat([(1, make("A", "x", "old")), (2, make("B", "y", "b")), (3, make("A", "x", "new"))])
+    assert [(e["chat_jid"], [(m.id, m.content) for m in e["messages"]]) for e in events] == [
+        ("y", [("B", "b")]), ("x", [("A", "new")])
+    ]
+
+
+def test_delivers_new_messages_in_order(endpoint, store, messages_db, tmp_path):
+    hooks = dispatcher(endpoint, messages_db, tmp_path)
+    hooks.start()
+    try:
+        time.sleep(0.2)
+        store(message("A"), message("B"))
+        wait_for(lambda: delivered_ids(endpoint) == ["A", "B"])
+    finally:
+        hooks.stop()
+    cursors = json.loads((tmp_path / "cursors.json").read_text())
+    assert cursors[endpoint.url] == endpoint.received[-1][1]["cursor"]
+
+
+def test_client_error_is_dead_lettered_and_delivery_moves_on(endpoint, store, messages_db, tmp_path):
+    endpoint.statuses.append(400)
+    hooks = dispatcher(endpoint, messages_db, tmp_path)
+    hooks.start()
+    try:
+        time.sleep(0.2)
+        store(message("rejected"))
+        wait_for(lambda: (tmp_path / "dead_letters.jsonl").exists())
+        store(message("next"))
+        wait_for(lambda: delivered_ids(endpoint) == ["next"])
+    finally:
+        hooks.stop()
+    assert [status for status, _ in endpoint.received] == [400, 200]
+    letter = json.loads((tmp_path / "dead_letters.jsonl").read_text())
+    assert letter["status"] == 400 and letter["attempts"] == 1
+    assert letter["payload"]["events"][0]["messages"][0]["id"] == "rejected"
+
+
+def test_server_errors_are_retried_up_to_the_limit(endpoint, store, messages_db, tmp_path):
+    endpoint.statuses.extend([503, 429, 503, 503])
+    hooks = dispatcher(endpoint, messages_db, tmp_path, max_retries=2, max_backoff=0.1)
+    hooks.start()
+    try:
+        time.sleep(0.2)
+        store(message("flaky"))
+        wait_for(lambda: (tmp_path / "dead_letters.jsonl").exists())
+    finally:
+        hooks.stop()
+    # 429 does not count against the limit of 5xx retries
+    assert [status for status, _ in endpoint.received] == [503, 429, 503, 503]
+    assert json.loads((tmp_path / "dead_letters.jsonl").read_text())["status"] == 503
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Push delivery of new WhatsApp messages to webhook URLs (e.g. n8n Webhook nodes).
+
+A watcher thread stats the database's WAL file and, when it changes, asks
+the change feed for the current rowid high-water mark. Each configured URL
+has its own delivery thread and its own cursor, so a slow or failing
+endpoint never holds back the others. Messages are delivered in rowid
+order in batches, grouped per chat. Cursors are persisted after every
+delivered batch, so delivery resumes where it stopped after a restart (at
+least once).
+
+A batch the endpoint cannot be reached for, or answers with 408 or 429, is
+retried with backoff until it goes through. A 5xx answer is retried up to
+WHATSAPP_WEBHOOK_MAX_RETRIES times. Any other answer, such as a 400 or 404,
+is final: retrying the same payload would fail the same way and hold back
+every later message. A batch that is given up on is appended to the
+dead-letter file, one JSON line per batch with the URL, the last status and
+the payload, and the cursor moves past it.
+
+Configuration (environment variables):
+    WHATSAPP_WEBHOOK_URLS              Comma-separated URLs to POST events to
+    WHATSAPP_WEBHOOK_CURSOR_PATH       Where delivery cursors are stored
+    WHATSAPP_WEBHOOK_DEAD_LETTER_PATH  Where undeliverable batches are appended
+    WHATSAPP_WEBHOOK_BATCH_SIZE        Maximum messages per POST (default 100)
+    WHATSAPP_WEBHOOK_MAX_RETRIES       Retries of a batch answered with 5xx (default 8)
+"""
+import json
+import os
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+import requests
+
+import whatsapp
+from changefeed import ChangeFeed
+from serialization import dumps_bytes
+
+DEFAULT_CURSOR_PATH = "/app/store/webhook_cursors.json"
+DEFAULT_DEAD_LETTER_PATH = "/app/store/webhook_dead_letters.jsonl"
+DEFAULT_MAX_RETRIES = 8
+# Client errors that say "not now" rather than "never"
+RETRYABLE_CLIENT_ERRORS = (408, 429)
+
+
+def group_by_chat(rows: List[tuple]) -> List[Dict]:
+    """Coalesce (rowid, Message) pairs into per-chat events in rowid order.
+
+    A message replaced several times within one batch is only sent once,
+    with its latest content, at the position of its latest version.
+    """
+    latest = {}
+    for rowid, message in rows:
+        latest[(message.chat_jid, message.id)] = (rowid, message)
+
+    events = {}
+    for rowid, message in sorted(latest.values(), key=lambda pair: pair[0]):
+        event = events.get(message.chat_jid)
+        if event is None:
+            event = events[message.chat_jid] = {
+                "chat_jid": message.chat_jid,
+                "chat_name": message.chat_name,
+                "messages": []
+            }
+        event["messages"].append(message)
+    return list(events.values())
+
+
+class WebhookDispatcher:
+    """Tail the messages table and POST batched events to webhook URLs."""
+
+    def __init__(
+        self,
+        urls: List[str],
+        cursor_path: str = DEFAULT_CURSOR_PATH,
+        batch_size: int = 100,
+        poll_interval: float = 0.2,
+        idle_check_interval: float = 5.0,
+        timeout: float = 10.0,
+        max_backoff: float = 60.0,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        dead_letter_path: str = DEFAULT_DEAD_LETTER_PATH,
+        feed: Optional[ChangeFeed] = None
+    ):
+        self.urls = urls
+        self.cursor_path = cursor_path
+        self.max_retries = max_retries
+        self.dead_letter_path = dead_letter_path
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.idle_check_interval = idle_check_interval
+        self.timeout = timeout
+        self.max_backoff = max_backoff
+        self.feed = feed or ChangeFeed()
+        self.session = requests.Session()
+        self._stop = threading.Event()
+        self._changed = threading.Condition()
+        self._cursor_lock = threading.Lock()
+        self._dead_letter_lock = threading.Lock()
+        self._cursors = self._load_cursors()
+        self._threads = []
+
+    def _load_cursors(self) -> Dict[str, int]:
+        try:
+            with open(self.cursor_path) as f:
+                return {url: int(cursor) for url, cursor in json.load(f).items()}
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable webhook cursor file {self.cursor_path}: {e}", file=sys.stderr)
+            return {}
+
+    def _save_cursor(self, url: str, cursor: int):
+        with self._cursor_lock:
+            self._cursors[url] = cursor
+            tmp_path = f"{self.cursor_path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self._cursors, f)
+            os.replace(tmp_path, self.cursor_path)
+
+    def _wal_signature(self):
+        db_path = self.feed.db_path or whatsapp.MESSAGES_DB_PATH
+        signature = []
+        for path in (f"{db_path}-wal", db_path):
+            try:
+                st = os.stat(path)
+                signature.append((st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    def _watch(self):
+        """Wake delivery threads when the database files change."""
+        last_signature = None
+        last_high_water = None
+        last_check = 0.0
+        while not self._stop.is_set():
+            signature = self._wal_signature()
+            now = time.monotonic()
+            if signature != last_signature or now - last_check >= self.idle_check_interval:
+                last_signature = signature
+                last_check = now
+                try:
+                    high_water = self.feed.high_water_mark()
+                except Exception as e:
+                    print(f"Webhook watcher could not read the database: {e}", file=sys.stderr)
+                    high_water = None
+                if high_water is not None and high_water != last_high_water:
+                    last_high_water = high_water
+                    with self._changed:
+                        self._changed.notify_all()
+            self._stop.wait(self.poll_interval)
+
+    def _post(self, url: str, payload: bytes) -> Optional[int]:
+        """POST a batch and return the response status, or None when there was no response."""
+        try:
+            response = self.session.post(
+                url,
+                data=payload,
+                headers={"Content-Type": "application/json"},
+                timeout=self.timeout
+            )
+        except requests.RequestException as e:
+            print(f"Webhook delivery to {url} failed: {e}", file=sys.stderr)
+            return None
+        if not 200 <= response.status_code < 300:
+            print(f"Webhook delivery to {url} failed: HTTP {response.status_code} {response.text[:200]}", file=sys.stderr)
+        return response.status_code
+
+    def _dead_letter(self, url: str, status: int, attempts: int, payload: bytes):
+        """Append a batch that will not be delivered to the dead-letter file."""
+        print(f"Giving up on a batch for {url} after {attempts} attempt(s) (HTTP {status}); "
+              f"writing it to {self.dead_letter_path}", file=sys.stderr)
+        record = dumps_bytes({
+            "url": url,
+            "status": status,
+            "attempts": attempts,
+            "failed_at": time.time(),
+            "payload": json.loads(payload)
+        })
+        try:
+            with self._dead_letter_lock, open(self.dead_letter_path, "ab") as f:
+                f.write(record + b"\n")
+        except OSError as e:
+            print(f"Could not write the dead-letter file {self.dead_letter_path}: {e}", file=sys.stderr)
+
+    def _deliver(self, url: str):
+        """Deliver every change after the URL's cursor, in order, forever."""
+        cursor = self._cursors.get(url)
+        if cursor is None:
+            # New endpoints start from the newest message rather than replaying history
+            cursor = self.feed.high_water_mark()
+            self._save_cursor(url, cursor)
+
+        while not self._stop.is_set():
+            rows = []
+            try:
+                if self.feed.high_water_mark() > cursor:
+                    rows = self.feed.fetch(cursor, self.batch_size)
+            except Exception as e:
+                print(f"Webhook delivery to {url} could not read changes: {e}", file=sys.stderr)
+
+            if not rows:
+                with self._changed:
+                    self._changed.wait(self.idle_check_interval)
+                continue
+
+            next_cursor = rows[-1][0]
+            payload = dumps_bytes({
+                "cursor": next_cursor,
+                "events": group_by_chat(rows)
+            })
+
+            backoff = 1.0
+            attempts = server_errors = 0
+            while True:
+                status = self._post(url, payload)
+                attempts += 1
+                if status is not None and 200 <= status < 300:
+                    break
+                if status is not None and status >= 500:
+                    server_errors += 1
+                final = status is not None and status < 500 and status not in RETRYABLE_CLIENT_ERRORS
+                exhausted = server_errors > self.max_retries
+                if final or exhausted:
+                    self._dead_letter(url, status, attempts, payload)
+                    break
+                if self._stop.wait(backoff):
+                    return
+                backoff = min(backoff * 2, self.max_backoff)
+
+            cursor = next_cursor
+            self._save_cursor(url, cursor)
+
+    def start(self):
+        """Start the watcher and one delivery thread per URL."""
+        self._stop.clear()
+        self._threads = [threading.Thread(target=self._watch, name="webhook-watcher", daemon=True)]
+        for url in self.urls:
+            self._threads.append(threading.Thread(target=self._deliver, args=(url,), name=f"webhook {url}", daemon=True))
+        for thread in self._threads:
+            thread.start()
+        print(f"Delivering new messages to {len(self.urls)} webhook(s)", file=sys.stderr)
+
+    def stop(self):
+        self._stop.set()
+        with self._changed:
+            self._changed.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=self.timeout + 1)
+
+
+def dispatcher_from_env() -> Optional[WebhookDispatcher]:
+    """Build a dispatcher from WHATSAPP_WEBHOOK_* variables, or None if no URLs are set."""
+    urls = [url.strip() for url in os.environ.get("WHATSAPP_WEBHOOK_URLS", "").split(",") if url.strip()]
+    if not urls:
+        return None
+    return WebhookDispatcher(
+        urls,
+        cursor_path=os.environ.get("WHATSAPP_WEBHOOK_CURSOR_PATH", DEFAULT_CURSOR_PATH),
+        batch_size=int(os.environ.get("WHATSAPP_WEBHOOK_BATCH_SIZE", "100")),
+        max_retries=int(os.environ.get("WHATSAPP_WEBHOOK_MAX_RETRIES", str(DEFAULT_MAX_RETRIES))),
+        dead_letter_path=os.environ.get("WHATSAPP_WEBHOOK_DEAD_LETTER_PATH", DEFAULT_DEAD_LETTER_PATH)
+    )
+
+
+if __name__ == "__main__":
+    dispatcher = dispatcher_from_env()
+    if dispatcher is None:
+        print("Set WHATSAPP_WEBHOOK_URLS to one or more comma-separated URLs", file=sys.stderr)
+        sys.exit(1)
+    dispatcher.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        dispatcher.stop()
@@ -1,19 +1,41 @@
 import sqlite3
+import csv
+import io
 from datetime import datetime
-from dataclasses import dataclass
-from typing import Optional, List, Tuple
+from typing import Optional, List, Tuple, Dict, Iterable, Iterator, Union
+import os
 import os.path
-import requests
 import json
-import audio
 import socket
 import sys
+import threading
+import time
+import contacts
+import metrics
+import readcache
+import replica
+from metrics import TrackedConnection
 
-MESSAGES_DB_PATH = "/app/store/messages.db"
+MESSAGES_DB_PATH = os.environ.get("WHATSAPP_DB_PATH", "/app/store/messages.db")
+
+# Indexes the read functions rely on. The bridge creates them in its schema;
+# databases written by an older bridge get them on first use only when
+# WHATSAPP_CREATE_INDEXES=1
+MESSAGE_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS messages_chat_timestamp ON messages (chat_jid, timestamp)",
+)
+_indexed_paths = set()
+_index_lock = threading.Lock()
+
+MAX_FACET_PAGE = 200
+MAX_FACET_VALUES = 100
+MAX_FACET_DAYS = 366
 
 # Try multiple ways to connect to the bridge
 def get_bridge_url():
     """Get the correct URL for the WhatsApp bridge with fallback options."""
+    import requests
+
     # Try hostname first (preferred)
     try:
         socket.gethostbyname('whatsapp-bridge')
@@ -35,127 +57,413 @@ def get_bridge_url():
     # Default fallback
     return "http://whatsapp-bridge:8080/api"
 
-# Initialize with dynamic detection
-WHATSAPP_API_BASE_URL = None
+# Initialize with dynamic detection unless the URL is configured
+WHATSAPP_API_BASE_URL = os.environ.get("WHATSAPP_API_URL") or None
+
+# Seconds to wait for the bridge; uploads and downloads of large media can be slow
+WHATSAPP_API_TIMEOUT = float(os.environ.get("WHATSAPP_API_TIMEOUT", "120"))
+
+# Reuse connections to the bridge across calls; created on first use so that
+# importing this module (and starting the server) does not import requests
+_api_session = None
+_api_session_lock = threading.Lock()
+_api_url_lock = threading.Lock()
+
 
 def get_api_url():
-    """Get the API URL, detecting it dynamically if needed."""
+    """Get the API URL, detecting it dynamically if needed.
+
+    Concurrent callers wait for a detection already in progress instead of
+    probing the network again.
+    """
     global WHATSAPP_API_BASE_URL
     if WHATSAPP_API_BASE_URL is None:
-        WHATSAPP_API_BASE_URL = get_bridge_url()
+        with _api_url_lock:
+            if WHATSAPP_API_BASE_URL is None:
+                WHATSAPP_API_BASE_URL = get_bridge_url()
     return WHATSAPP_API_BASE_URL
 
-@dataclass
-class Message:
-    timestamp: datetime
-    sender: str
-    content: str
-    is_from_me: bool
-    chat_jid: str
-    id: str
-    chat_name: Optional[str] = None
-    media_type: Optional[str] = None
-
-@dataclass
-class Chat:
-    jid: str
-    name: Optional[str]
-    last_message_time: Optional[datetime]
-    last_message: Optional[str] = None
-    last_sender: Optional[str] = None
-    last_is_from_me: Optional[bool] = None
+
+def _get_api_session():
+    global _api_session
+    if _api_session is None:
+        with _api_session_lock:
+            if _api_session is None:
+                import requests
+                _api_session = requests.Session()
+    return _api_session
+
+
+def check_bridge_in_background(timeout: float = 5.0) -> threading.Thread:
+    """Detect the bridge URL and check its health without delaying startup.
+
+    The result is only logged; tools that need the bridge call get_api_url()
+    themselves and wait for a detection still in progress.
+    """
+    def check():
+        try:
+            api_url = get_api_url()
+            response = _get_api_session().get(f"{api_url}/health", timeout=timeout)
+            print(f"API connection test: {response.status_code}", file=sys.stderr)
+        except Exception as api_e:
+            print(f"API connection failed: {api_e}", file=sys.stderr)
+
+    thread = threading.Thread(target=check, name="bridge-health-check", daemon=True)
+    thread.start()
+    return thread
+
+
+def connect_db(operation: str, db_path: Optional[str] = None, heavy: bool = False, **kwargs) -> sqlite3.Connection:
+    """Open the messages database; statements are recorded in metrics under operation.
+
+    Heavy reads (scans, searches and exports) open the read replica instead
+    while one is configured and within its staleness bound (see replica.py).
+    """
+    if db_path is None:
+        if MESSAGES_DB_PATH not in _indexed_paths:
+            ensure_indexes(MESSAGES_DB_PATH)
+        db_path = replica.read_path(MESSAGES_DB_PATH) if heavy else MESSAGES_DB_PATH
+    conn = sqlite3.connect(db_path, factory=TrackedConnection, **kwargs)
+    conn.operation = operation
+    return conn
+
+
+def ensure_indexes(db_path: str):
+    """Create MESSAGE_INDEXES in the messages database, once per database and process.
+
+    messages.db belongs to the bridge, which creates these indexes itself, so
+    this does nothing unless WHATSAPP_CREATE_INDEXES=1, for a database the
+    bridge created before it had them. The read replica picks the indexes up
+    on its next refresh.
+    """
+    with _index_lock:
+        if db_path in _indexed_paths:
+            return
+        if os.environ.get("WHATSAPP_CREATE_INDEXES", "0") != "1":
+            _indexed_paths.add(db_path)
+            return
+        try:
+            conn = sqlite3.connect(db_path, factory=TrackedConnection, timeout=30)
+            conn.operation = "ensure_indexes"
+            try:
+                for statement in MESSAGE_INDEXES:
+                    conn.execute(statement)
+                conn.commit()
+            finally:
+                conn.close()
+        except sqlite3.OperationalError as e:
+            if "no such table" in str(e):
+                return  # the bridge has not created its tables yet; try again later
+            print(f"Could not create indexes in {db_path}: {e}", file=sys.stderr)
+        _indexed_paths.add(db_path)
+
+
+def _bridge_post(endpoint: str, payload: Dict) -> "requests.Response":
+    """POST a JSON payload to a bridge API endpoint, recording its latency and status."""
+    url = f"{get_api_url()}/{endpoint}"
+    status = "error"
+    started = time.perf_counter()
+    try:
+        response = _get_api_session().post(url, json=payload, timeout=WHATSAPP_API_TIMEOUT)
+        status = str(response.status_code)
+        return response
+    finally:
+        metrics.record_bridge_request(endpoint, status, time.perf_counter() - started)
+
+_set_attr = object.__setattr__
+_intern = sys.intern
+
+
+def _frozen_setattr(self, name, value):
+    raise AttributeError(f"cannot assign to field '{name}' of frozen {type(self).__name__}")
+
+
+def _frozen_init(self, *args, **kwargs):
+    record = self._record_type(*args, **kwargs)
+    for name in self._record_type.__slots__:
+        _set_attr(self, name, getattr(record, name))
+
+
+class _Record:
+    """Base for the slotted records returned by this module.
+
+    Records keep their values in __slots__ instead of a per-instance
+    __dict__. Every record type gets an immutable Frozen variant, and
+    freeze() returns a frozen copy of an existing record.
+    """
+
+    __slots__ = ()
+    _fields: Tuple[str, ...] = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if "_record_type" in cls.__dict__:
+            return
+        cls._record_type = cls
+        cls.Frozen = type(f"Frozen{cls.__name__}", (cls,), {
+            "__slots__": (),
+            "__module__": cls.__module__,
+            "__qualname__": f"{cls.__qualname__}.Frozen",
+            "_record_type": cls,
+            "__init__": _frozen_init,
+            "__setattr__": _frozen_setattr,
+            "__delattr__": _frozen_setattr
+        })
+
+    def __repr__(self) -> str:
+        values = ", ".join(f"{name}={getattr(self, name)!r}" for name in self._fields)
+        return f"{type(self).__name__}({values})"
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, self._record_type):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self._fields)
+
+    __hash__ = None
+
+    def freeze(self):
+        """Return an immutable copy of this record."""
+        if type(self) is self.Frozen:
+            return self
+        frozen = object.__new__(self.Frozen)
+        for name in self._record_type.__slots__:
+            _set_attr(frozen, name, getattr(self, name))
+        return frozen
+
+
+def _iso_timestamp(raw: Optional[str], parsed: Optional[datetime]) -> Optional[str]:
+    """Return a timestamp as an ISO-8601 string, reusing the raw string when there is one."""
+    if raw is None:
+        return parsed.isoformat() if parsed is not None else None
+    if len(raw) > 10 and raw[10] == " ":
+        return f"{raw[:10]}T{raw[11:]}"
+    return raw
+
+
+class _LazyTimestamp:
+    """Timestamp field that keeps the raw SQLite string and parses it on first access."""
+
+    def __set_name__(self, owner, name):
+        self.raw_name = f"_{name}_raw"
+        self.parsed_name = f"_{name}"
+
+    def __get__(self, record, owner=None):
+        if record is None:
+            return self
+        value = getattr(record, self.parsed_name)
+        if value is None:
+            raw = getattr(record, self.raw_name)
+            if raw is None:
+                return None
+            value = datetime.fromisoformat(raw)
+            _set_attr(record, self.parsed_name, value)
+        return value
+
+    def __set__(self, record, value):
+        if isinstance(value, str):
+            _set_attr(record, self.raw_name, value)
+            _set_attr(record, self.parsed_name, None)
+        else:
+            _set_attr(record, self.raw_name, None)
+            _set_attr(record, self.parsed_name, value)
+
+
+class Message(_Record):
+    __slots__ = ("_timestamp_raw", "_timestamp", "sender", "content", "is_from_me", "chat_jid", "id", "chat_name", "media_type")
+    _fields = ("timestamp", "sender", "content", "is_from_me", "chat_jid", "id", "chat_name", "media_type")
+
+    timestamp = _LazyTimestamp()
+
+    def __init__(
+        self,
+        timestamp: Union[datetime, str],
+        sender: str,
+        content: str,
+        is_from_me: bool,
+        chat_jid: str,
+        id: str,
+        chat_name: Optional[str] = None,
+        media_type: Optional[str] = None
+    ):
+        if type(timestamp) is str:
+            self._timestamp_raw = timestamp
+            self._timestamp = None
+        else:
+            self._timestamp_raw = None
+            self._timestamp = timestamp
+        # Sender, chat and media type repeat across rows; share one string per value
+        self.sender = _intern(sender) if sender is not None else None
+        self.content = content
+        self.is_from_me = is_from_me
+        self.chat_jid = _intern(chat_jid) if chat_jid is not None else None
+        self.id = id
+        self.chat_name = _intern(chat_name) if chat_name is not None else None
+        self.media_type = _intern(media_type) if media_type is not None else None
+
+    @property
+    def timestamp_iso(self) -> Optional[str]:
+        return _iso_timestamp(self._timestamp_raw, self._timestamp)
+
+class Chat(_Record):
+    __slots__ = ("jid", "name", "_last_message_time_raw", "_last_message_time", "last_message", "last_sender", "last_is_from_me")
+    _fields = ("jid", "name", "last_message_time", "last_message", "last_sender", "last_is_from_me")
+
+    last_message_time = _LazyTimestamp()
+
+    def __init__(
+        self,
+        jid: str,
+        name: Optional[str],
+        last_message_time: Union[datetime, str, None],
+        last_message: Optional[str] = None,
+        last_sender: Optional[str] = None,
+        last_is_from_me: Optional[bool] = None
+    ):
+        self.jid = jid
+        self.name = name
+        if type(last_message_time) is str:
+            self._last_message_time_raw = last_message_time
+            self._last_message_time = None
+        else:
+            self._last_message_time_raw = None
+            self._last_message_time = last_message_time
+        self.last_message = last_message
+        self.last_sender = last_sender
+        self.last_is_from_me = last_is_from_me
+
+    @property
+    def last_message_time_iso(self) -> Optional[str]:
+        return _iso_timestamp(self._last_message_time_raw, self._last_message_time)
 
     @property
     def is_group(self) -> bool:
         """Determine if chat is a group based on JID pattern."""
         return self.jid.endswith("@g.us")
 
-@dataclass
-class Contact:
-    phone_number: str
-    name: Optional[str]
-    jid: str
+class Contact(_Record):
+    __slots__ = ("phone_number", "name", "jid")
+    _fields = __slots__
+
+    def __init__(self, phone_number: str, name: Optional[str], jid: str):
+        self.phone_number = phone_number
+        self.name = name
+        self.jid = jid
 
-@dataclass
-class MessageContext:
-    message: Message
-    before: List[Message]
-    after: List[Message]
+class MessageContext(_Record):
+    __slots__ = ("message", "before", "after")
+    _fields = __slots__
+
+    def __init__(self, message: Message, before: List[Message], after: List[Message]):
+        self.message = message
+        self.before = before
+        self.after = after
+
+    def freeze(self):
+        """Return an immutable copy with frozen messages and tuple windows."""
+        if type(self) is self.Frozen:
+            return self
+        return self.Frozen(
+            message=self.message.freeze(),
+            before=tuple(m.freeze() for m in self.before),
+            after=tuple(m.freeze() for m in self.after)
+        )
 
 def get_sender_name(sender_jid: str) -> str:
+    """Get a sender's display name from an exact JID, LID or phone number match."""
     try:
-        conn = sqlite3.connect(MESSAGES_DB_PATH)
-        cursor = conn.cursor()
-        
-        # First try matching by exact JID
-        cursor.execute("""
-            SELECT name
-            FROM chats
-            WHERE jid = ?
-            LIMIT 1
-        """, (sender_jid,))
-        
-        result = cursor.fetchone()
-        
-        # If no result, try looking for the number within JIDs
-        if not result:
-            # Extract the phone number part if it's a JID
-            if '@' in sender_jid:
-                phone_part = sender_jid.split('@')[0]
-            else:
-                phone_part = sender_jid
-                
-            cursor.execute("""
-                SELECT name
-                FROM chats
-                WHERE jid LIKE ?
-                LIMIT 1
-            """, (f"%{phone_part}%",))
-            
-            result = cursor.fetchone()
-        
-        if result and result[0]:
-            return result[0]
-        else:
-            return sender_jid
-        
+        contact = contacts.resolve(sender_jid)
     except sqlite3.Error as e:
-        print(f"Database error while getting sender name: {e}")
+        print(f"Database error while getting sender name: {e}", file=sys.stderr)
         return sender_jid
-    finally:
-        if 'conn' in locals():
-            conn.close()
+    if contact and contact[1]:
+        return contact[1]
+    return sender_jid
 
-def format_message(message: Message, show_chat_info: bool = True) -> None:
-    """Print a single message with consistent formatting."""
-    output = ""
-    
+def format_message(
+    message: Message,
+    show_chat_info: bool = True,
+    sender_names: Optional[Dict[str, str]] = None
+) -> str:
+    """Render a single message as one line of text.
+
+    Args:
+        message: The message to render
+        show_chat_info: Whether to prefix the line with the chat name
+        sender_names: Optional cache of sender JID to display name, shared across
+                      calls so each sender is only resolved once per rendering
+    """
+    parts = [f"[{message.timestamp:%Y-%m-%d %H:%M:%S}] "]
     if show_chat_info and message.chat_name:
-        output += f"[{message.timestamp:%Y-%m-%d %H:%M:%S}] Chat: {message.chat_name} "
+        parts.append(f"Chat: {message.chat_name} ")
+
+    if message.is_from_me:
+        sender_name = "Me"
+    elif sender_names is None:
+        sender_name = get_sender_name(message.sender)
     else:
-        output += f"[{message.timestamp:%Y-%m-%d %H:%M:%S}] "
-        
-    content_prefix = ""
-    if hasattr(message, 'media_type') and message.media_type:
-        content_prefix = f"[{message.media_type} - Message ID: {message.id} - Chat JID: {message.chat_jid}] "
-    
-    try:
-        sender_name = get_sender_name(message.sender) if not message.is_from_me else "Me"
-        output += f"From: {sender_name}: {content_prefix}{message.content}\n"
-    except Exception as e:
-        print(f"Error formatting message: {e}")
-    return output
+        sender_name = sender_names.get(message.sender)
+        if sender_name is None:
+            sender_name = sender_names[message.sender] = get_sender_name(message.sender)
+    parts.append(f"From: {sender_name}: ")
 
-def format_messages_list(messages: List[Message], show_chat_info: bool = True) -> None:
-    output = ""
-    if not messages:
-        output += "No messages to display."
-        return output
-    
+    if message.media_type:
+        parts.append(f"[{message.media_type} - Message ID: {message.id} - Chat JID: {message.chat_jid}] ")
+    parts.append(f"{message.content}\n")
+    return "".join(parts)
+
+def iter_formatted_messages(messages: Iterable[Message], show_chat_info: bool = True) -> Iterator[str]:
+    """Yield the rendered text of each message, resolving every sender name once."""
+    sender_names: Dict[str, str] = {}
     for message in messages:
-        output += format_message(message, show_chat_info)
-    return output
+        yield format_message(message, show_chat_info, sender_names)
+
+def format_messages_list(messages: List[Message], show_chat_info: bool = True) -> str:
+    """Render a list of messages as text, one line per message."""
+    if not messages:
+        return "No messages to display."
+    return "".join(iter_formatted_messages(messages, show_chat_info))
+
+def parse_time_filter(name: str, value: str) -> str:
+    """Validate an ISO-8601 filter argument and return it in the form stored by the bridge."""
+    try:
+        return datetime.fromisoformat(value).isoformat(" ")
+    except ValueError:
+        raise ValueError(f"Invalid date format for '{name}': {value}. Please use ISO-8601 format.")
+
+def _message_filters(
+    after: Optional[str],
+    before: Optional[str],
+    sender_phone_number: Optional[str],
+    chat_jid: Optional[str],
+    query: Optional[str]
+) -> Tuple[List[str], list]:
+    """The WHERE clauses and parameters of list_messages' filters."""
+    where_clauses = []
+    params = []
+
+    if after:
+        where_clauses.append("messages.timestamp > ?")
+        params.append(parse_time_filter("after", after))
 
+    if before:
+        where_clauses.append("messages.timestamp < ?")
+        params.append(parse_time_filter("before", before))
+
+    if sender_phone_number:
+        where_clauses.append("messages.sender = ?")
+        params.append(sender_phone_number)
+
+    if chat_jid:
+        where_clauses.append("messages.chat_jid = ?")
+        params.append(chat_jid)
+
+    if query:
+        where_clauses.append("LOWER(messages.content) LIKE LOWER(?)")
+        params.append(f"%{query}%")
+
+    return where_clauses, params
+
+@readcache.cached_read
 def list_messages(
     after: Optional[str] = None,
     before: Optional[str] = None,
@@ -168,47 +476,20 @@ def list_messages(
     context_before: int = 1,
     context_after: int = 1
 ) -> List[Message]:
-    """Get messages matching the specified criteria with optional context."""
+    """Get messages matching the specified criteria with optional context.
+
+    Returns the matching messages as structured records. When context is
+    requested, each match is surrounded by its neighbouring messages in a
+    single flat list. Use format_messages_list to render them as text.
+    """
     try:
-        conn = sqlite3.connect(MESSAGES_DB_PATH)
+        conn = connect_db("list_messages", heavy=True)
         cursor = conn.cursor()
         
         # Build base query
         query_parts = ["SELECT messages.timestamp, messages.sender, chats.name, messages.content, messages.is_from_me, chats.jid, messages.id, messages.media_type FROM messages"]
         query_parts.append("JOIN chats ON messages.chat_jid = chats.jid")
-        where_clauses = []
-        params = []
-        
-        # Add filters
-        if after:
-            try:
-                after = datetime.fromisoformat(after)
-            except ValueError:
-                raise ValueError(f"Invalid date format for 'after': {after}. Please use ISO-8601 format.")
-            
-            where_clauses.append("messages.timestamp > ?")
-            params.append(after)
-
-        if before:
-            try:
-                before = datetime.fromisoformat(before)
-            except ValueError:
-                raise ValueError(f"Invalid date format for 'before': {before}. Please use ISO-8601 format.")
-            
-            where_clauses.append("messages.timestamp < ?")
-            params.append(before)
-
-        if sender_phone_number:
-            where_clauses.append("messages.sender = ?")
-            params.append(sender_phone_number)
-            
-        if chat_jid:
-            where_clauses.append("messages.chat_jid = ?")
-            params.append(chat_jid)
-            
-        if query:
-            where_clauses.append("LOWER(messages.content) LIKE LOWER(?)")
-            params.append(f"%{query}%")
+        where_clauses, params = _message_filters(after, before, sender_phone_number, chat_jid, query)
             
         if where_clauses:
             query_parts.append("WHERE " + " AND ".join(where_clauses))
@@ -225,7 +506,7 @@ def list_messages(
         result = []
         for msg in messages:
             message = Message(
-                timestamp=datetime.fromisoformat(msg[0]),
+                timestamp=msg[0],
                 sender=msg[1],
                 chat_name=msg[2],
                 content=msg[3],
@@ -240,117 +521,203 @@ def list_messages(
             # Add context for each message
             messages_with_context = []
             for msg in result:
-                context = get_message_context(msg.id, context_before, context_after)
+                context = get_message_context(msg.id, context_before, context_after, msg.chat_jid)
                 messages_with_context.extend(context.before)
                 messages_with_context.append(context.message)
                 messages_with_context.extend(context.after)
             
-            return format_messages_list(messages_with_context, show_chat_info=True)
+            return messages_with_context
             
-        # Format and display messages without context
-        return format_messages_list(result, show_chat_info=True)    
+        return result
         
     except sqlite3.Error as e:
-        print(f"Database error: {e}")
+        print(f"Database error: {e}", file=sys.stderr)
         return []
     finally:
         if 'conn' in locals():
             conn.close()
 
 
+def search_facets(
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    sender_phone_number: Optional[str] = None,
+    chat_jid: Optional[str] = None,
+    query: Optional[str] = None,
+    limit: int = 20,
+    page: int = 0,
+    facet_limit: int = 10
+) -> Dict[str, object]:
+    """Get a page of messages matching list_messages' filters and where all matches are.
+
+    The matching messages are read once: the page and the counts per chat,
+    sender, media type and day all come from that one pass, so a search
+    needs one call instead of one per chat.
+
+    Returns:
+        A dictionary with the total number of matches, the page of messages
+        (newest first) and the facets: the facet_limit chats and senders
+        with the most matches, matches per media type (text messages are
+        not counted) and matches per day, newest first (at most
+        MAX_FACET_DAYS days)
+    """
+    limit = max(0, min(limit, MAX_FACET_PAGE))
+    facet_limit = max(0, min(facet_limit, MAX_FACET_VALUES))
+    where_clauses, params = _message_filters(after, before, sender_phone_number, chat_jid, query)
+    where = "WHERE " + " AND ".join(where_clauses) if where_clauses else ""
+
+    conn = connect_db("search_facets", heavy=True)
+    try:
+        # The CTE is materialized once; every facet and the page read it
+        rows = conn.execute(f"""
+            WITH hits AS MATERIALIZED (
+                SELECT rowid AS message_rowid, chat_jid, sender, media_type, timestamp
+                FROM messages {where}
+            )
+            SELECT 'total', NULL, COUNT(*) FROM hits
+            UNION ALL
+            SELECT * FROM (
+                SELECT 'page', message_rowid, NULL FROM hits
+                ORDER BY timestamp DESC LIMIT ? OFFSET ?
+            )
+            UNION ALL
+            SELECT * FROM (
+                SELECT 'chat', chat_jid, COUNT(*) AS n FROM hits
+                GROUP BY chat_jid ORDER BY n DESC LIMIT ?
+            )
+            UNION ALL
+            SELECT * FROM (
+                SELECT 'sender', sender, COUNT(*) AS n FROM hits
+                GROUP BY sender ORDER BY n DESC LIMIT ?
+            )
+            UNION ALL
+            SELECT 'media_type', media_type, COUNT(*) FROM hits
+            WHERE media_type != '' GROUP BY media_type
+            UNION ALL
+            SELECT * FROM (
+                SELECT 'day', substr(timestamp, 1, 10) AS day, COUNT(*) FROM hits
+                GROUP BY day ORDER BY day DESC LIMIT ?
+            )
+        """, (*params, limit, page * limit, facet_limit, facet_limit, MAX_FACET_DAYS)).fetchall()
+
+        facets: Dict[str, list] = {"total": [], "page": [], "chat": [], "sender": [], "media_type": [], "day": []}
+        for facet, value, count in rows:
+            facets[facet].append((value, count))
+
+        page_rowids = [rowid for rowid, _ in facets["page"]]
+        messages = []
+        if page_rowids:
+            by_rowid = {
+                row[0]: Message(*row[1:])
+                for row in conn.execute(f"""
+                    SELECT messages.rowid, messages.timestamp, messages.sender, messages.content,
+                        messages.is_from_me, messages.chat_jid, messages.id, chats.name, messages.media_type
+                    FROM messages LEFT JOIN chats ON messages.chat_jid = chats.jid
+                    WHERE messages.rowid IN ({", ".join("?" for _ in page_rowids)})
+                """, page_rowids)
+            }
+            messages = [by_rowid[rowid] for rowid in page_rowids if rowid in by_rowid]
+
+        chat_names = {}
+        chat_jids = [jid for jid, _ in facets["chat"]]
+        if chat_jids:
+            chat_names = dict(conn.execute(
+                f"SELECT jid, name FROM chats WHERE jid IN ({', '.join('?' for _ in chat_jids)})", chat_jids
+            ).fetchall())
+    finally:
+        conn.close()
+
+    return {
+        "total": facets["total"][0][1],
+        "messages": messages,
+        "facets": {
+            "chats": [
+                {"chat_jid": jid, "name": chat_names.get(jid), "messages": count}
+                for jid, count in facets["chat"]
+            ],
+            "senders": [
+                {"sender": sender, "name": get_sender_name(sender) if sender else None, "messages": count}
+                for sender, count in facets["sender"]
+            ],
+            "media_types": dict(facets["media_type"]),
+            "days": [{"day": day, "messages": count} for day, count in facets["day"]]
+        }
+    }
+
+@readcache.cached_read
 def get_message_context(
     message_id: str,
     before: int = 5,
-    after: int = 5
+    after: int = 5,
+    chat_jid: Optional[str] = None
 ) -> MessageContext:
-    """Get context around a specific message."""
+    """Get context around a specific message.
+
+    Message IDs are only unique within a chat; pass chat_jid to look the
+    message up by its full primary key. Without it, an ID found in more
+    than one chat is an error.
+    """
     try:
-        conn = sqlite3.connect(MESSAGES_DB_PATH)
+        conn = connect_db("get_message_context")
         cursor = conn.cursor()
         
-        # Get the target message first
-        cursor.execute("""
-            SELECT messages.timestamp, messages.sender, chats.name, messages.content, messages.is_from_me, chats.jid, messages.id, messages.chat_jid, messages.media_type
+        # Columns are in Message's argument order
+        target_query = """
+            SELECT messages.timestamp, messages.sender, messages.content, messages.is_from_me, messages.chat_jid, messages.id, chats.name, messages.media_type
             FROM messages
             JOIN chats ON messages.chat_jid = chats.jid
-            WHERE messages.id = ?
-        """, (message_id,))
-        msg_data = cursor.fetchone()
+        """
+        if chat_jid is None:
+            cursor.execute(target_query + "WHERE messages.id = ? LIMIT 2", (message_id,))
+        else:
+            cursor.execute(target_query + "WHERE messages.id = ? AND messages.chat_jid = ?", (message_id, chat_jid))
+        targets = cursor.fetchall()
         
-        if not msg_data:
+        if not targets:
             raise ValueError(f"Message with ID {message_id} not found")
-            
-        target_message = Message(
-            timestamp=datetime.fromisoformat(msg_data[0]),
-            sender=msg_data[1],
-            chat_name=msg_data[2],
-            content=msg_data[3],
-            is_from_me=msg_data[4],
-            chat_jid=msg_data[5],
-            id=msg_data[6],
-            media_type=msg_data[8]
-        )
+        if len(targets) > 1:
+            raise ValueError(f"Message ID {message_id} exists in several chats; pass chat_jid to choose one")
+        target = targets[0]
         
-        # Get messages before
+        # Both windows in one statement, each walking the (chat_jid,
+        # timestamp) index away from the target until its limit
         cursor.execute("""
-            SELECT messages.timestamp, messages.sender, chats.name, messages.content, messages.is_from_me, chats.jid, messages.id, messages.media_type
-            FROM messages
-            JOIN chats ON messages.chat_jid = chats.jid
-            WHERE messages.chat_jid = ? AND messages.timestamp < ?
-            ORDER BY messages.timestamp DESC
-            LIMIT ?
-        """, (msg_data[7], msg_data[0], before))
-        
-        before_messages = []
-        for msg in cursor.fetchall():
-            before_messages.append(Message(
-                timestamp=datetime.fromisoformat(msg[0]),
-                sender=msg[1],
-                chat_name=msg[2],
-                content=msg[3],
-                is_from_me=msg[4],
-                chat_jid=msg[5],
-                id=msg[6],
-                media_type=msg[7]
-            ))
+            SELECT * FROM (
+                SELECT 1, timestamp, sender, content, is_from_me, chat_jid, id, ?5, media_type
+                FROM messages
+                WHERE chat_jid = ?1 AND timestamp < ?2
+                ORDER BY timestamp DESC
+                LIMIT ?3
+            )
+            UNION ALL
+            SELECT * FROM (
+                SELECT 2, timestamp, sender, content, is_from_me, chat_jid, id, ?5, media_type
+                FROM messages
+                WHERE chat_jid = ?1 AND timestamp > ?2
+                ORDER BY timestamp ASC
+                LIMIT ?4
+            )
+        """, (target[4], target[0], before, after, target[6]))
         
-        # Get messages after
-        cursor.execute("""
-            SELECT messages.timestamp, messages.sender, chats.name, messages.content, messages.is_from_me, chats.jid, messages.id, messages.media_type
-            FROM messages
-            JOIN chats ON messages.chat_jid = chats.jid
-            WHERE messages.chat_jid = ? AND messages.timestamp > ?
-            ORDER BY messages.timestamp ASC
-            LIMIT ?
-        """, (msg_data[7], msg_data[0], after))
-        
-        after_messages = []
-        for msg in cursor.fetchall():
-            after_messages.append(Message(
-                timestamp=datetime.fromisoformat(msg[0]),
-                sender=msg[1],
-                chat_name=msg[2],
-                content=msg[3],
-                is_from_me=msg[4],
-                chat_jid=msg[5],
-                id=msg[6],
-                media_type=msg[7]
-            ))
+        windows = ([Message(*target)], [], [])
+        for row in cursor.fetchall():
+            windows[row[0]].append(Message(*row[1:]))
         
         return MessageContext(
-            message=target_message,
-            before=before_messages,
-            after=after_messages
+            message=windows[0][0],
+            before=windows[1],
+            after=windows[2]
         )
         
     except sqlite3.Error as e:
-        print(f"Database error: {e}")
+        print(f"Database error: {e}", file=sys.stderr)
         raise
     finally:
         if 'conn' in locals():
             conn.close()
 
 
+@readcache.cached_read
 def list_chats(
     query: Optional[str] = None,
     limit: int = 20,
@@ -360,7 +727,7 @@ def list_chats(
 ) -> List[Chat]:
     """Get chats matching the specified criteria."""
     try:
-        conn = sqlite3.connect(MESSAGES_DB_PATH)
+        conn = connect_db("list_chats", heavy=True)
         cursor = conn.cursor()
         
         # Build base query
@@ -408,7 +775,7 @@ def list_chats(
             chat = Chat(
                 jid=chat_data[0],
                 name=chat_data[1],
-                last_message_time=datetime.fromisoformat(chat_data[2]) if chat_data[2] else None,
+                last_message_time=chat_data[2] or None,
                 last_message=chat_data[3],
                 last_sender=chat_data[4],
                 last_is_from_me=chat_data[5]
@@ -418,81 +785,64 @@ def list_chats(
         return result
         
     except sqlite3.Error as e:
-        print(f"Database error: {e}")
+        print(f"Database error: {e}", file=sys.stderr)
         return []
     finally:
         if 'conn' in locals():
             conn.close()
 
 
+@readcache.cached_read
 def search_contacts(query: str) -> List[Contact]:
-    """Search contacts by name or phone number."""
+    """Search contacts by name or phone number.
+
+    Exact phone number, LID and JID matches come first, then contacts whose
+    name or number contains the query, then close matches by name.
+    """
     try:
-        conn = sqlite3.connect(MESSAGES_DB_PATH)
-        cursor = conn.cursor()
-        
-        # Split query into characters to support partial matching
-        search_pattern = '%' +query + '%'
-        
-        cursor.execute("""
-            SELECT DISTINCT 
-                jid,
-                name
-            FROM chats
-            WHERE 
-                (LOWER(name) LIKE LOWER(?) OR LOWER(jid) LIKE LOWER(?))
-                AND jid NOT LIKE '%@g.us'
-            ORDER BY name, jid
-            LIMIT 50
-        """, (search_pattern, search_pattern))
-        
-        contacts = cursor.fetchall()
-        
-        result = []
-        for contact_data in contacts:
-            contact = Contact(
-                phone_number=contact_data[0].split('@')[0],
-                name=contact_data[1],
-                jid=contact_data[0]
-            )
-            result.append(contact)
-            
-        return result
-        
+        matches = contacts.search(query, limit=50)
     except sqlite3.Error as e:
-        print(f"Database error: {e}")
+        print(f"Database error: {e}", file=sys.stderr)
         return []
-    finally:
-        if 'conn' in locals():
-            conn.close()
+    return [Contact(phone_number=jid.split('@')[0], name=name, jid=jid) for jid, name in matches]
 
 
+@readcache.cached_read
 def get_contact_chats(jid: str, limit: int = 20, page: int = 0) -> List[Chat]:
-    """Get all chats involving the contact.
+    """Get all chats involving the contact, one entry per chat.
     
     Args:
-        jid: The contact's JID to search for
+        jid: The contact's JID or phone number (or a group JID for the group itself)
         limit: Maximum number of chats to return (default 20)
         page: Page number for pagination (default 0)
     """
+    from chatstats import get_contact_chats as membership
+
     try:
-        conn = sqlite3.connect(MESSAGES_DB_PATH)
+        chats = membership(jid)
+        if not chats:
+            return []
+
+        conn = connect_db("get_contact_chats", heavy=True)
         cursor = conn.cursor()
         
-        cursor.execute("""
-            SELECT DISTINCT
+        # Each chat's last message is looked up by its primary key
+        values = ", ".join("(?, ?)" for _ in chats)
+        cursor.execute(f"""
+            WITH involved(jid, last_message_id) AS (VALUES {values})
+            SELECT
                 c.jid,
                 c.name,
                 c.last_message_time,
                 m.content as last_message,
                 m.sender as last_sender,
                 m.is_from_me as last_is_from_me
-            FROM chats c
-            JOIN messages m ON c.jid = m.chat_jid
-            WHERE m.sender = ? OR c.jid = ?
+            FROM involved i
+            JOIN chats c ON c.jid = i.jid
+            LEFT JOIN messages m ON m.id = i.last_message_id AND m.chat_jid = i.jid
             ORDER BY c.last_message_time DESC
             LIMIT ? OFFSET ?
-        """, (jid, jid, limit, page * limit))
+        """, tuple(value for chat in chats for value in chat) + (limit, page * limit))
         
         chats = cursor.fetchall()
         
@@ -501,7 +851,7 @@ def get_contact_chats(jid: str, limit: int = 20, page: int = 0) -> List[Chat]:
             chat = Chat(
                 jid=chat_data[0],
                 name=chat_data[1],
-                last_message_time=datetime.fromisoformat(chat_data[2]) if chat_data[2] else None,
+                last_message_time=chat_data[2] or None,
                 last_message=chat_data[3],
                 last_sender=chat_data[4],
                 last_is_from_me=chat_data[5]
@@ -511,17 +861,24 @@ def get_contact_chats(jid: str, limit: int = 20, page: int = 0) -> List[Chat]:
         return result
         
     except sqlite3.Error as e:
-        print(f"Database error: {e}")
+        print(f"Database error: {e}", file=sys.stderr)
         return []
     finally:
         if 'conn' in locals():
             conn.close()
 
 
+@readcache.cached_read
 def get_last_interaction(jid: str) -> str:
     """Get most recent message involving the contact."""
+    from chatstats import get_last_interaction as latest_membership
+
     try:
-        conn = sqlite3.connect(MESSAGES_DB_PATH)
+        latest = latest_membership(jid)
+        if not latest:
+            return None
+
+        conn = connect_db("get_last_interaction", heavy=True)
         cursor = conn.cursor()
         
         cursor.execute("""
@@ -536,10 +893,8 @@ def get_last_interaction(jid: str) -> str:
                 m.media_type
             FROM messages m
             JOIN chats c ON m.chat_jid = c.jid
-            WHERE m.sender = ? OR c.jid = ?
-            ORDER BY m.timestamp DESC
-            LIMIT 1
-        """, (jid, jid))
+            WHERE m.id = ? AND m.chat_jid = ?
+        """, (latest[1], latest[0]))
         
         msg_data = cursor.fetchone()
         
@@ -547,7 +902,7 @@ def get_last_interaction(jid: str) -> str:
             return None
             
         message = Message(
-            timestamp=datetime.fromisoformat(msg_data[0]),
+            timestamp=msg_data[0],
             sender=msg_data[1],
             chat_name=msg_data[2],
             content=msg_data[3],
@@ -560,17 +915,18 @@ def get_last_interaction(jid: str) -> str:
         return format_message(message)
         
     except sqlite3.Error as e:
-        print(f"Database error: {e}")
+        print(f"Database error: {e}", file=sys.stderr)
         return None
     finally:
         if 'conn' in locals():
             conn.close()
 
 
+@readcache.cached_read
 def get_chat(chat_jid: str, include_last_message: bool = True) -> Optional[Chat]:
     """Get chat metadata by JID."""
     try:
-        conn = sqlite3.connect(MESSAGES_DB_PATH)
+        conn = connect_db("get_chat")
         cursor = conn.cursor()
         
         query = """
@@ -601,24 +957,29 @@ def get_chat(chat_jid: str, include_last_message: bool = True) -> Optional[Chat]
         return Chat(
             jid=chat_data[0],
             name=chat_data[1],
-            last_message_time=datetime.fromisoformat(chat_data[2]) if chat_data[2] else None,
+            last_message_time=chat_data[2] or None,
             last_message=chat_data[3],
             last_sender=chat_data[4],
             last_is_from_me=chat_data[5]
         )
         
     except sqlite3.Error as e:
-        print(f"Database error: {e}")
+        print(f"Database error: {e}", file=sys.stderr)
         return None
     finally:
         if 'conn' in locals():
             conn.close()
 
 
+@readcache.cached_read
 def get_direct_chat_by_contact(sender_phone_number: str) -> Optional[Chat]:
-    """Get chat metadata by sender phone number."""
+    """Get chat metadata by sender phone number (or LID), matched exactly."""
     try:
-        conn = sqlite3.connect(MESSAGES_DB_PATH)
+        contact = contacts.resolve(sender_phone_number)
+        if not contact or contacts.is_group(contact[0]):
+            return None
+
+        conn = connect_db("get_direct_chat_by_contact")
         cursor = conn.cursor()
         
         cursor.execute("""
@@ -632,9 +993,9 @@ def get_direct_chat_by_contact(sender_phone_number: str) -> Optional[Chat]:
             FROM chats c
             LEFT JOIN messages m ON c.jid = m.chat_jid 
                 AND c.last_message_time = m.timestamp
-            WHERE c.jid LIKE ? AND c.jid NOT LIKE '%@g.us'
+            WHERE c.jid = ?
             LIMIT 1
-        """, (f"%{sender_phone_number}%",))
+        """, (contact[0],))
         
         chat_data = cursor.fetchone()
         
@@ -644,32 +1005,187 @@ def get_direct_chat_by_contact(sender_phone_number: str) -> Optional[Chat]:
         return Chat(
             jid=chat_data[0],
             name=chat_data[1],
-            last_message_time=datetime.fromisoformat(chat_data[2]) if chat_data[2] else None,
+            last_message_time=chat_data[2] or None,
             last_message=chat_data[3],
             last_sender=chat_data[4],
             last_is_from_me=chat_data[5]
         )
         
     except sqlite3.Error as e:
-        print(f"Database error: {e}")
+        print(f"Database error: {e}", file=sys.stderr)
         return None
     finally:
         if 'conn' in locals():
             conn.close()
 
+EXPORT_FORMATS = ("ndjson", "csv")
+EXPORT_CSV_FIELDS = ("timestamp", "sender", "is_from_me", "chat_jid", "id", "chat_name", "media_type", "content")
+EXPORT_BATCH_SIZE = 1000
+
+def iter_chat_messages(
+    chat_jid: str,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    sender_phone_number: Optional[str] = None,
+    batch_size: int = EXPORT_BATCH_SIZE
+) -> Iterator[List[Message]]:
+    """Yield a chat's messages in chronological order, in batches of at most batch_size.
+
+    Rows are pulled from an open cursor with fetchmany, so only one batch is
+    held in memory no matter how long the chat history is.
+
+    Args:
+        chat_jid: The JID of the chat to read
+        after: Optional ISO-8601 formatted string to only return messages after this date
+        before: Optional ISO-8601 formatted string to only return messages before this date
+        sender_phone_number: Optional phone number to only return messages from this sender
+        batch_size: Number of rows fetched per round trip (default 1000)
+    """
+    where_clauses = ["chat_jid = ?"]
+    params = [chat_jid]
+    if after:
+        where_clauses.append("timestamp > ?")
+        params.append(parse_time_filter("after", after))
+    if before:
+        where_clauses.append("timestamp < ?")
+        params.append(parse_time_filter("before", before))
+    if sender_phone_number:
+        where_clauses.append("sender = ?")
+        params.append(sender_phone_number)
+
+    conn = connect_db("iter_chat_messages", heavy=True)
+    try:
+        row = conn.execute("SELECT name FROM chats WHERE jid = ?", (chat_jid,)).fetchone()
+        chat_name = row[0] if row else None
+
+        cursor = conn.execute(f"""
+            SELECT timestamp, sender, content, is_from_me, id, media_type
+            FROM messages
+            WHERE {" AND ".join(where_clauses)}
+            ORDER BY timestamp, rowid
+        """, tuple(params))
+
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield [
+                Message(
+                    timestamp=row[0],
+                    sender=row[1],
+                    content=row[2],
+                    is_from_me=row[3],
+                    chat_jid=chat_jid,
+                    id=row[4],
+                    chat_name=chat_name,
+                    media_type=row[5]
+                )
+                for row in rows
+            ]
+    finally:
+        conn.close()
+
+def _encode_export_batch(messages: List[Message], format: str, include_header: bool) -> bytes:
+    from serialization import MESSAGE_SERIALIZER, dumps_bytes
+
+    if format == "ndjson":
+        return b"".join(dumps_bytes(m) + b"\n" for m in messages)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if include_header:
+        writer.writerow(EXPORT_CSV_FIELDS)
+    for m in messages:
+        record = MESSAGE_SERIALIZER.to_dict(m)
+        writer.writerow([record[field] for field in EXPORT_CSV_FIELDS])
+    return buffer.getvalue().encode("utf-8")
+
+def iter_export_chunks(
+    chat_jid: str,
+    format: str = "ndjson",
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    sender_phone_number: Optional[str] = None,
+    batch_size: int = EXPORT_BATCH_SIZE
+) -> Iterator[Tuple[int, bytes]]:
+    """Yield (message_count, data) chunks of a chat export encoded as NDJSON or CSV."""
+    if format not in EXPORT_FORMATS:
+        raise ValueError(f"Invalid export format: {format}. Use one of: {', '.join(EXPORT_FORMATS)}.")
+
+    first = True
+    for messages in iter_chat_messages(chat_jid, after, before, sender_phone_number, batch_size):
+        yield len(messages), _encode_export_batch(messages, format, include_header=first)
+        first = False
+
+    if first and format == "csv":
+        yield 0, _encode_export_batch([], format, include_header=True)
+
+def export_dir() -> str:
+    """Directory export_chat writes to: WHATSAPP_EXPORT_DIR, by default exports/ next to messages.db."""
+    return os.environ.get("WHATSAPP_EXPORT_DIR") or os.path.join(
+        os.path.dirname(os.path.abspath(MESSAGES_DB_PATH)), "exports"
+    )
+
+def resolve_export_path(output_path: str) -> str:
+    """Absolute path of output_path inside export_dir().
+
+    Raises ValueError for absolute paths and for relative ones that leave the
+    export directory (through ".." or a symlink), so callers of the tool
+    cannot overwrite files elsewhere.
+    """
+    if not output_path or os.path.isabs(output_path):
+        raise ValueError(f"output_path must be a file name relative to the export directory, got {output_path!r}")
+    base = os.path.realpath(export_dir())
+    path = os.path.realpath(os.path.join(base, output_path))
+    if path == base or os.path.commonpath([base, path]) != base:
+        raise ValueError(f"output_path {output_path!r} is outside the export directory")
+    return path
+
+def export_chat(
+    chat_jid: str,
+    output_path: str,
+    format: str = "ndjson",
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    sender_phone_number: Optional[str] = None
+) -> int:
+    """Write a chat's full message history to a file with constant memory use.
+
+    Args:
+        chat_jid: The JID of the chat to export
+        output_path: Path of the file to write, relative to the export directory
+            (see resolve_export_path)
+        format: "ndjson" (one JSON message per line) or "csv" (default "ndjson")
+        after: Optional ISO-8601 formatted string to only export messages after this date
+        before: Optional ISO-8601 formatted string to only export messages before this date
+        sender_phone_number: Optional phone number to only export messages from this sender
+
+    Returns:
+        The number of messages written
+    """
+    path = resolve_export_path(output_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    count = 0
+    with open(path, "wb") as f:
+        for batch_count, data in iter_export_chunks(chat_jid, format, after, before, sender_phone_number):
+            f.write(data)
+            count += batch_count
+    return count
+
 def send_message(recipient: str, message: str) -> Tuple[bool, str]:
+    import requests
+
     try:
         # Validate input
         if not recipient:
             return False, "Recipient must be provided"
         
-        url = f"{get_api_url()}/send"
         payload = {
             "recipient": recipient,
             "message": message,
         }
         
-        response = requests.post(url, json=payload)
+        response = _bridge_post("send", payload)
         
         # Check if the request was successful
         if response.status_code == 200:
@@ -686,6 +1202,8 @@ def send_message(recipient: str, message: str) -> Tuple[bool, str]:
         return False, f"Unexpected error: {str(e)}"
 
 def send_file(recipient: str, media_path: str) -> Tuple[bool, str]:
+    import requests
+
     try:
         # Validate input
         if not recipient:
@@ -697,13 +1215,12 @@ def send_file(recipient: str, media_path: str) -> Tuple[bool, str]:
         if not os.path.isfile(media_path):
             return False, f"Media file not found: {media_path}"
         
-        url = f"{get_api_url()}/send"
         payload = {
             "recipient": recipient,
             "media_path": media_path
         }
         
-        response = requests.post(url, json=payload)
+        response = _bridge_post("send", payload)
         
         # Check if the request was successful
         if response.status_code == 200:
@@ -720,6 +1237,8 @@ def send_file(recipient: str, media_path: str) -> Tuple[bool, str]:
         return False, f"Unexpected error: {str(e)}"
 
 def send_audio_message(recipient: str, media_path: str) -> Tuple[bool, str]:
+    import requests
+
     try:
         # Validate input
         if not recipient:
@@ -732,18 +1251,18 @@ def send_audio_message(recipient: str, media_path: str) -> Tuple[bool, str]:
             return False, f"Media file not found: {media_path}"
 
         if not media_path.endswith(".ogg"):
+            import audio
             try:
                 media_path = audio.convert_to_opus_ogg_temp(media_path)
             except Exception as e:
                 return False, f"Error converting file to opus ogg. You likely need to install ffmpeg: {str(e)}"
         
-        url = f"{get_api_url()}/send"
         payload = {
             "recipient": recipient,
             "media_path": media_path
         }
         
-        response = requests.post(url, json=payload)
+        response = _bridge_post("send", payload)
         
         # Check if the request was successful
         if response.status_code == 200:
@@ -769,34 +1288,35 @@ def download_media(message_id: str, chat_jid: str) -> Optional[str]:
     Returns:
         The local file path if download was successful, None otherwise
     """
+    import requests
+
     try:
-        url = f"{get_api_url()}/download"
         payload = {
             "message_id": message_id,
             "chat_jid": chat_jid
         }
         
-        response = requests.post(url, json=payload)
+        response = _bridge_post("download", payload)
         
         if response.status_code == 200:
             result = response.json()
             if result.get("success", False):
                 path = result.get("path")
-                print(f"Media downloaded successfully: {path}")
+                print(f"Media downloaded successfully: {path}", file=sys.stderr)
                 return path
             else:
-                print(f"Download failed: {result.get('message', 'Unknown error')}")
+                print(f"Download failed: {result.get('message', 'Unknown error')}", file=sys.stderr)
                 return None
         else:
-            print(f"Error: HTTP {response.status_code} - {response.text}")
+            print(f"Error: HTTP {response.status_code} - {response.text}", file=sys.stderr)
             return None
             
     except requests.RequestException as e:
-        print(f"Request error: {str(e)}")
+        print(f"Request error: {str(e)}", file=sys.stderr)
         return None
     except json.JSONDecodeError:
-        print(f"Error parsing response: {response.text}")
+        print(f"Error parsing response: {response.text}", file=sys.stderr)
         return None
     except Exception as e:
-        print(f"Unexpected error: {str(e)}")
+        print(f"Unexpected error: {str(e)}", file=sys.stderr)
         return None